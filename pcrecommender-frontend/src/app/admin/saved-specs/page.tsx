@@ -3,7 +3,7 @@
 
 import { useEffect, useState, useMemo } from 'react';
 import apiClient from '@/services/api';
-import type { SavedSpec, ComponentDetail, RecommendationBuild } from '@/lib/types';
+import type { SavedSpec, ComponentDetail, RecommendationBuild, CursorPage } from '@/lib/types';
 import {
   FiDatabase, FiLoader, FiAlertCircle, FiTrash2, FiSearch,
   FiChevronLeft, FiChevronRight, FiXCircle, FiCalendar, FiTag, FiEye, FiEyeOff
@@ -32,6 +32,8 @@ export default function ManageSavedSpecsPage() {
 
   const [currentPage, setCurrentPage] = useState(1);
   const [searchTerm, setSearchTerm] = useState('');
+  const [nextPageUrl, setNextPageUrl] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [expandedDetails, setExpandedDetails] = useState<Record<number, boolean>>({}); 
 
   const filteredSpecs = useMemo(() => {
@@ -43,7 +45,7 @@ export default function ManageSavedSpecsPage() {
       (spec.name && spec.name.toLowerCase().includes(lowerSearchTerm)) ||
       (spec.user && typeof spec.user === 'object' && spec.user.username && spec.user.username.toLowerCase().includes(lowerSearchTerm)) || 
       (spec.user && typeof spec.user === 'string' && spec.user.toLowerCase().includes(lowerSearchTerm)) || 
-      (spec.build_details.build_name && spec.build_details.build_name.toLowerCase().includes(lowerSearchTerm))
+      (spec.build_name && spec.build_name.toLowerCase().includes(lowerSearchTerm))
     );
   }, [allSavedSpecs, searchTerm]);
 
@@ -61,9 +63,9 @@ export default function ManageSavedSpecsPage() {
       setIsLoading(true);
       setPageError(null);
       try {
-        const response = await apiClient.get<SavedSpec[]>('/admin/saved-specs/');
-        console.log(response.data)
-        setAllSavedSpecs(response.data || []);
+        const response = await apiClient.get<CursorPage<SavedSpec>>('/admin/saved-specs/');
+        setAllSavedSpecs(response.data.results || []);
+        setNextPageUrl(response.data.next);
       } catch (err: any) {
         console.error("Failed to fetch saved specs:", err.response?.data || err.message);
         setPageError("ไม่สามารถโหลดข้อมูลสเปคที่บันทึกไว้ได้ โปรดลองอีกครั้ง");
@@ -75,6 +77,22 @@ export default function ManageSavedSpecsPage() {
     fetchSavedSpecs();
   }, []);
 
+  // API แบ่งหน้าแบบ cursor: โหลดหน้าถัดไปมาต่อท้ายรายการที่มีอยู่
+  const loadMoreSpecs = async () => {
+    if (!nextPageUrl) return;
+    setIsLoadingMore(true);
+    try {
+      const response = await apiClient.get<CursorPage<SavedSpec>>(nextPageUrl);
+      setAllSavedSpecs(prev => [...prev, ...(response.data.results || [])]);
+      setNextPageUrl(response.data.next);
+    } catch (err: any) {
+      console.error("Failed to fetch more saved specs:", err.response?.data || err.message);
+      setPageError("ไม่สามารถโหลดสเปคเพิ่มเติมได้ โปรดลองอีกครั้ง");
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const handleSearchChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     setSearchTerm(e.target.value);
     setCurrentPage(1);
@@ -110,7 +128,19 @@ export default function ManageSavedSpecsPage() {
     });
   };
 
-  const toggleDetails = (specId: number) => {
+  // รายการจาก list ไม่มี build_details: โหลดรายละเอียดเต็มเมื่อเปิดดูครั้งแรก
+  const toggleDetails = async (specId: number) => {
+    const spec = allSavedSpecs.find(s => s.id === specId);
+    if (spec && !spec.build_details && !expandedDetails[specId]) {
+      try {
+        const response = await apiClient.get<SavedSpec>(`/admin/saved-specs/${specId}/`);
+        setAllSavedSpecs(prev => prev.map(s => s.id === specId ? { ...s, ...response.data } : s));
+      } catch (err: any) {
+        console.error("Failed to fetch saved spec detail:", err.response?.data || err.message);
+        setPageError("ไม่สามารถโหลดรายละเอียดสเปคได้ โปรดลองอีกครั้ง");
+        return;
+      }
+    }
     setExpandedDetails(prev => ({ ...prev, [specId]: !prev[specId] }));
   };
 
@@ -165,7 +195,7 @@ export default function ManageSavedSpecsPage() {
               <tr key={spec.id} className="hover:bg-slate-700/40 transition-colors duration-150 text-base">
                 <td className="px-6 py-4 whitespace-nowrap text-slate-300">{spec.id}</td>
                 <td className="px-6 py-4 whitespace-nowrap font-medium text-white truncate max-w-xs" title={spec.name || undefined}>{spec.name || "-"}</td>
-                <td className="px-6 py-4 whitespace-nowrap text-slate-300 truncate max-w-xs" title={spec.build_details.build_name || undefined}>{spec.build_details.build_name || "-"}</td>
+                <td className="px-6 py-4 whitespace-nowrap text-slate-300 truncate max-w-xs" title={spec.build_name || undefined}>{spec.build_name || "-"}</td>
                 <td className="px-6 py-4 whitespace-nowrap text-sm text-sky-400">
                   {typeof spec.user === 'object' ? spec.user?.username : spec.user || '-'}
                 </td>
@@ -176,7 +206,7 @@ export default function ManageSavedSpecsPage() {
                   <button onClick={() => toggleDetails(spec.id)} title="ดูรายละเอียด" className="text-blue-400 hover:text-blue-300 p-1.5 rounded-md hover:bg-blue-500/10">
                     {expandedDetails[spec.id] ? <FiEyeOff size={20}/> : <FiEye size={20}/>}
                   </button>
-                  <button onClick={() => handleDeleteSpec(spec.id, spec.name || spec.build_details.build_name)} title="ลบสเปค" className="text-red-400 hover:text-red-300 p-1.5 rounded-md hover:bg-red-500/10"><FiTrash2 size={20}/></button>
+                  <button onClick={() => handleDeleteSpec(spec.id, spec.name || spec.build_name)} title="ลบสเปค" className="text-red-400 hover:text-red-300 p-1.5 rounded-md hover:bg-red-500/10"><FiTrash2 size={20}/></button>
                 </td>
               </tr>
             ))}
@@ -204,25 +234,34 @@ export default function ManageSavedSpecsPage() {
           </div>
       )}
 
+      {nextPageUrl && (
+          <div className="mt-8 flex justify-center">
+            <button onClick={loadMoreSpecs} disabled={isLoadingMore} className="px-6 py-3 bg-slate-700 hover:bg-sky-500 disabled:bg-slate-800 disabled:text-slate-600 disabled:cursor-not-allowed text-slate-200 rounded-lg transition-colors flex items-center text-base font-medium">
+                {isLoadingMore ? <FiLoader className="animate-spin mr-2" size={20}/> : null} โหลดสเปคเพิ่มเติม
+            </button>
+          </div>
+      )}
+
       {/* Modal or Section for Displaying Full Build Details when expanded (Optional) */}
       {Object.keys(expandedDetails).filter(key => expandedDetails[parseInt(key)]).map(key => {
           const specId = parseInt(key);
           const spec = allSavedSpecs.find(s => s.id === specId);
-          if (!spec) return null;
+          if (!spec || !spec.build_details) return null;
+          const buildDetails = spec.build_details;
           return (
             <div key={`details-${spec.id}`} className="fixed inset-0 bg-slate-900/80 backdrop-blur-sm flex items-center justify-center z-[100] p-4 animate-fadeIn" onClick={() => toggleDetails(spec.id)}>
                 <div className="bg-slate-800 p-6 md:p-8 rounded-2xl shadow-2xl max-w-2xl w-full max-h-[80vh] overflow-y-auto border border-slate-700" onClick={e => e.stopPropagation()}>
                     <div className="flex justify-between items-center mb-6">
-                        <h3 className="text-2xl font-bold text-sky-300">{spec.name || spec.build_details.build_name || `รายละเอียดสเปค ID: ${spec.id}`}</h3>
+                        <h3 className="text-2xl font-bold text-sky-300">{spec.name || buildDetails.build_name || `รายละเอียดสเปค ID: ${spec.id}`}</h3>
                         <button onClick={() => toggleDetails(spec.id)} className="text-slate-400 hover:text-white"><FiXCircle size={28}/></button>
                     </div>
                     <div className="space-y-3 text-base text-slate-200">
                         {(['cpu', 'gpu', 'ram', 'storage', 'motherboard', 'psu', 'cooler', 'case'] as const).map(partKey => {
-                            const component = spec.build_details[partKey];
+                            const component = buildDetails[partKey];
                             return component ? <p key={partKey}><strong className="text-slate-400">{partKey.toUpperCase()}:</strong> {getComponentName(component)} <span className="text-sky-400/90 text-sm">{getComponentPriceString(component)}</span></p> : null;
                         })}
-                        {spec.build_details.total_price_estimate_thb && <p className="font-semibold mt-3 pt-2 border-t border-slate-600 text-lg text-green-400">ราคารวมประมาณ: ฿{spec.build_details.total_price_estimate_thb.toLocaleString()}</p>}
-                        {spec.build_details.notes && <p className="mt-2 text-sm italic text-slate-300"><strong>AI Notes:</strong> {spec.build_details.notes}</p>}
+                        {buildDetails.total_price_estimate_thb && <p className="font-semibold mt-3 pt-2 border-t border-slate-600 text-lg text-green-400">ราคารวมประมาณ: ฿{buildDetails.total_price_estimate_thb.toLocaleString()}</p>}
+                        {buildDetails.notes && <p className="mt-2 text-sm italic text-slate-300"><strong>AI Notes:</strong> {buildDetails.notes}</p>}
                     </div>
                      {spec.source_prompt_details && (
                         <div className="mt-6 pt-4 border-t border-slate-700 text-sm">
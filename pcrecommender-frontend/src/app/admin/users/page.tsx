@@ -3,7 +3,7 @@
 
 import { useEffect, useState, useMemo } from 'react';
 import apiClient from '@/services/api';
-import type { User } from '@/lib/types'; 
+import type { User, CursorPage } from '@/lib/types'; 
 import {
   FiUsers, FiLoader, FiAlertCircle, FiTrash2,
   FiSearch, FiChevronLeft, FiChevronRight, FiUserCheck, FiUserX,
@@ -26,6 +26,8 @@ export default function ManageUsersPage() {
 
   const [currentPage, setCurrentPage] = useState(1);
   const [searchTerm, setSearchTerm] = useState('');
+  const [nextPageUrl, setNextPageUrl] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
 
   const filteredUsers = useMemo(() => {
     if (!searchTerm.trim()) {
@@ -51,8 +53,9 @@ export default function ManageUsersPage() {
     setIsLoading(true);
     setPageError(null);
     try {
-      const response = await apiClient.get<AdminUser[]>('/admin/users/');
-      setAllUsers(response.data || []);
+      const response = await apiClient.get<CursorPage<AdminUser>>('/admin/users/');
+      setAllUsers(response.data.results || []);
+      setNextPageUrl(response.data.next);
     } catch (err: any) {
       console.error("Failed to fetch users:", err.response?.data || err.message);
       setPageError("ไม่สามารถโหลดข้อมูลผู้ใช้งานได้ โปรดลองอีกครั้ง");
@@ -62,6 +65,22 @@ export default function ManageUsersPage() {
     }
   };
 
+  // API แบ่งหน้าแบบ cursor: โหลดหน้าถัดไปมาต่อท้ายรายการที่มีอยู่
+  const loadMoreUsers = async () => {
+    if (!nextPageUrl) return;
+    setIsLoadingMore(true);
+    try {
+      const response = await apiClient.get<CursorPage<AdminUser>>(nextPageUrl);
+      setAllUsers(prev => [...prev, ...(response.data.results || [])]);
+      setNextPageUrl(response.data.next);
+    } catch (err: any) {
+      console.error("Failed to fetch more users:", err.response?.data || err.message);
+      setPageError("ไม่สามารถโหลดข้อมูลผู้ใช้งานเพิ่มเติมได้ โปรดลองอีกครั้ง");
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchAllUsers(); 
   }, []);
@@ -252,6 +271,18 @@ export default function ManageUsersPage() {
             </button>
           </div>
       )}
+
+      {nextPageUrl && (
+          <div className="mt-8 flex justify-center">
+            <button
+                onClick={loadMoreUsers}
+                disabled={isLoadingMore}
+                className="px-6 py-3 bg-slate-700 hover:bg-sky-500 disabled:bg-slate-800 disabled:text-slate-600 disabled:cursor-not-allowed text-slate-200 rounded-lg transition-colors flex items-center text-base font-medium"
+            >
+                {isLoadingMore ? <FiLoader className="animate-spin mr-2" size={20}/> : null} โหลดผู้ใช้งานเพิ่มเติม
+            </button>
+          </div>
+      )}
     </div>
   );
 }
\ No newline at end of file
@@ -12,7 +12,7 @@ import {
 } from 'react-icons/fi'; 
 import Swal from 'sweetalert2';
 import 'sweetalert2/dist/sweetalert2.min.css'; 
-import type { SavedSpec, ComponentDetail } from '@/lib/types';
+import type { SavedSpec, ComponentDetail, CursorPage } from '@/lib/types';
 
 const getComponentName = (component: ComponentDetail | string | undefined): string => {
   if (!component) return 'N/A';
@@ -33,6 +33,8 @@ export default function FavoritesPage() {
   const [favorites, setFavorites] = useState<SavedSpec[]>([]);
   const [isLoadingData, setIsLoadingData] = useState(true);
   const [pageError, setPageError] = useState<string | null>(null); 
+  const [nextPageUrl, setNextPageUrl] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
 
   // State for editing notes
   const [editingNotesSpecId, setEditingNotesSpecId] = useState<number | null>(null);
@@ -58,8 +60,9 @@ export default function FavoritesPage() {
         setIsLoadingData(true);
         setPageError(null);
         try {
-          const { data } = await apiClient.get<SavedSpec[]>('/saved-specs/');
-          setFavorites(data);
+          const { data } = await apiClient.get<CursorPage<SavedSpec>>('/saved-specs/');
+          setFavorites(data.results);
+          setNextPageUrl(data.next);
         } catch (err: any) {
           setPageError(err.response?.data?.detail || 'ไม่สามารถโหลดรายการสเปคโปรดได้');
           console.error("Fetch Favorites Error:", err.response || err);
@@ -71,6 +74,22 @@ export default function FavoritesPage() {
     }
   }, [isAuthenticated]);
 
+  // API แบ่งหน้าแบบ cursor: โหลดหน้าถัดไปมาต่อท้ายรายการที่มีอยู่
+  const loadMoreFavorites = async () => {
+    if (!nextPageUrl) return;
+    setIsLoadingMore(true);
+    try {
+      const { data } = await apiClient.get<CursorPage<SavedSpec>>(nextPageUrl);
+      setFavorites(prev => [...prev, ...data.results]);
+      setNextPageUrl(data.next);
+    } catch (err: any) {
+      setPageError(err.response?.data?.detail || 'ไม่สามารถโหลดรายการสเปคโปรดเพิ่มเติมได้');
+      console.error("Fetch More Favorites Error:", err.response || err);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     if (editingSpecNameId !== null && nameInputRef.current) {
       nameInputRef.current.focus();
@@ -119,7 +138,7 @@ export default function FavoritesPage() {
       const { data: updatedSpec } = await apiClient.patch<SavedSpec>(`/saved-specs/${specId}/`, {
         user_notes: currentNotes,
       });
-      setFavorites(prev => prev.map(fav => fav.id === specId ? updatedSpec : fav));
+      setFavorites(prev => prev.map(fav => fav.id === specId ? { ...fav, ...updatedSpec } : fav));
       setEditingNotesSpecId(null);
       Swal.fire({ icon: 'success', title: 'บันทึกโน้ตสำเร็จ', showConfirmButton: false, timer: 1500, background: '#1f2937', color: '#e5e7eb', customClass: { popup: 'rounded-2xl shadow-xl border border-slate-700', title: 'text-green-300'} });
     } catch (err:any) {
@@ -152,7 +171,19 @@ export default function FavoritesPage() {
     }
   };
 
-  const toggleBuildDetails = (id: number) => {
+  // รายการจาก list ไม่มี build_details: โหลดรายละเอียดเต็มเมื่อผู้ใช้กดแสดงครั้งแรก
+  const toggleBuildDetails = async (id: number) => {
+    const spec = favorites.find(fav => fav.id === id);
+    if (spec && !spec.build_details && !expandedBuildDetails[id]) {
+      try {
+        const { data: detail } = await apiClient.get<SavedSpec>(`/saved-specs/${id}/`);
+        setFavorites(prev => prev.map(fav => fav.id === id ? { ...fav, ...detail } : fav));
+      } catch (err: any) {
+        setPageError(err.response?.data?.detail || 'ไม่สามารถโหลดรายละเอียดสเปคได้');
+        console.error("Fetch Spec Detail Error:", err.response || err);
+        return;
+      }
+    }
     setExpandedBuildDetails(prev => ({ ...prev, [id]: !prev[id] }));
   };
 
@@ -223,15 +254,15 @@ export default function FavoritesPage() {
                     {expandedBuildDetails[fav.id] ? <FiChevronUp size={22} /> : <FiChevronDown size={22} />}
                 </button>
 
-                {expandedBuildDetails[fav.id] && (
+                {expandedBuildDetails[fav.id] && fav.build_details && (
                     <div className="mb-6 space-y-3 max-h-72 overflow-y-auto bg-slate-700/40 p-5 rounded-xl text-base scrollbar-thin scrollbar-thumb-slate-600 scrollbar-track-slate-700/40 animate-fadeIn">
                         <h4 className="text-base md:text-lg font-semibold text-slate-300 uppercase mb-3">รายละเอียดสเปค:</h4>
                         {(['cpu', 'gpu', 'ram', 'storage', 'motherboard', 'psu', 'cooler', 'case'] as const).map(partKey => {
-                            const component = fav.build_details[partKey];
+                            const component = fav.build_details?.[partKey];
                             return component ? <p key={partKey} className="text-slate-100 flex justify-between items-center text-base md:text-lg"><span><strong className="text-slate-400 font-medium">{partKey.toUpperCase()}:</strong> {getComponentName(component)}</span> <span className="text-sky-300/90 text-sm font-medium">{getComponentPriceString(component)}</span></p> : null;
                         })}
-                        {fav.build_details.total_price_estimate_thb && <p className="text-green-300 font-semibold mt-4 pt-3 border-t border-slate-600 text-lg md:text-xl">ราคารวมประมาณ: ~฿{fav.build_details.total_price_estimate_thb.toLocaleString()}</p>}
-                        {fav.build_details.notes && <p className="text-slate-300 mt-3 text-sm italic">AI Notes: {fav.build_details.notes}</p>}
+                        {fav.build_details?.total_price_estimate_thb && <p className="text-green-300 font-semibold mt-4 pt-3 border-t border-slate-600 text-lg md:text-xl">ราคารวมประมาณ: ~฿{fav.build_details?.total_price_estimate_thb?.toLocaleString()}</p>}
+                        {fav.build_details?.notes && <p className="text-slate-300 mt-3 text-sm italic">AI Notes: {fav.build_details.notes}</p>}
                     </div>
                 )}
 
@@ -287,6 +318,18 @@ export default function FavoritesPage() {
           ))}
         </div>
       )}
+
+      {nextPageUrl && (
+        <div className="mt-12 flex justify-center">
+          <button
+            onClick={loadMoreFavorites}
+            disabled={isLoadingMore}
+            className="px-8 py-3.5 bg-slate-700 hover:bg-sky-500 disabled:bg-slate-800 disabled:text-slate-600 disabled:cursor-not-allowed text-slate-200 rounded-xl transition-colors flex items-center text-lg font-medium"
+          >
+            {isLoadingMore ? <FiLoader className="animate-spin mr-2.5" /> : null} โหลดสเปคเพิ่มเติม
+          </button>
+        </div>
+      )}
     </div>
   );
-}
\ No newline at end of file
+}
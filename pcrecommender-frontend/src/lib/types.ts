@@ -47,10 +47,16 @@ export interface RecommendationApiResponse {
   raw_ai_output_on_error?: any; 
 }
 
+// list endpoint ส่งเฉพาะ summary (build_name, total_price_thb) ส่วน build_details มีเฉพาะใน detail (GET /saved-specs/:id/)
 export interface SavedSpec {
   id: number;
   name?: string | null;
-  build_details: RecommendationBuild;
+  build_name?: string | null;
+  cpu_name?: string;
+  gpu_name?: string;
+  total_price_thb?: number | null;
+  budget_thb?: number;
+  build_details?: RecommendationBuild;
   source_prompt_details?: SourcePrompt | null;
   user_notes?: string | null;
   saved_at: string;
@@ -62,3 +68,10 @@ export interface AuthTokens {
   refresh: string;
   user: User;
 }
+
+// response ของ list endpoint ที่ใช้ cursor pagination (saved-specs, admin/users, admin/saved-specs)
+export interface CursorPage<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
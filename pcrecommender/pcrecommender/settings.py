@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'allauth.account',
     'allauth.socialaccount', 
     'rest_framework_simplejwt',      
+    'django_filters',
     'recommender_api', 
 ]
 
@@ -79,6 +80,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'pcrecommender.wsgi.application'
+ASGI_APPLICATION = 'pcrecommender.asgi.application'
 
 
 # Database
@@ -187,4 +189,159 @@ CORS_ALLOWED_ORIGINS = [
     "https://idonthavecpu-1.onrender.com"
 ]
 
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
\ No newline at end of file
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Recommendation cache (LRU ในแต่ละ worker + ตาราง RecommendationCacheEntry ที่แชร์กัน)
+RECOMMENDATION_CACHE_ENABLED = os.getenv('RECOMMENDATION_CACHE_ENABLED', 'true').lower() == 'true'
+RECOMMENDATION_CACHE_TTL_SECONDS = int(os.getenv('RECOMMENDATION_CACHE_TTL_SECONDS', 6 * 60 * 60))
+RECOMMENDATION_CACHE_LOCAL_TTL_SECONDS = int(os.getenv('RECOMMENDATION_CACHE_LOCAL_TTL_SECONDS', 5 * 60))
+RECOMMENDATION_CACHE_LOCAL_MAX_ENTRIES = int(os.getenv('RECOMMENDATION_CACHE_LOCAL_MAX_ENTRIES', 512))
+RECOMMENDATION_CACHE_BUDGET_BUCKET_THB = int(os.getenv('RECOMMENDATION_CACHE_BUDGET_BUCKET_THB', 1000))
+# entry ที่หมดอายุไม่เกิน STALE_WHILE_REVALIDATE ถูกตอบทันที (cache status STALE) พร้อม refresh เบื้องหลังครั้งละหนึ่งงานต่อ query
+# และถ้าเรียก LLM ล้มเหลว entry ที่หมดอายุไม่เกิน STALE_IF_ERROR ถูกใช้แทน error (STALE_IF_ERROR) 0 = ปิด
+RECOMMENDATION_CACHE_STALE_WHILE_REVALIDATE_SECONDS = int(os.getenv('RECOMMENDATION_CACHE_STALE_WHILE_REVALIDATE_SECONDS', 60 * 60))
+RECOMMENDATION_CACHE_STALE_IF_ERROR_SECONDS = int(os.getenv('RECOMMENDATION_CACHE_STALE_IF_ERROR_SECONDS', 3 * 24 * 60 * 60))
+RECOMMENDATION_CACHE_MAX_REVALIDATIONS = int(os.getenv('RECOMMENDATION_CACHE_MAX_REVALIDATIONS', 4))
+
+# Similar query matching (recommender_api/similarity.py): cache miss แล้วใช้ผลของ query ที่ใกล้ที่สุดแทนการเรียก LLM
+# ระยะ 0.05 ~ งบต่างกัน 5% โดยชิ้นส่วนและเกมต้องตรงกัน (ลดน้ำหนักเพื่อยอมให้ต่างกันได้บ้าง)
+SIMILAR_QUERY_ENABLED = os.getenv('SIMILAR_QUERY_ENABLED', 'true').lower() == 'true'
+SIMILAR_QUERY_MAX_DISTANCE = float(os.getenv('SIMILAR_QUERY_MAX_DISTANCE', 0.05))
+SIMILAR_QUERY_PART_WEIGHT = float(os.getenv('SIMILAR_QUERY_PART_WEIGHT', 1.0))
+SIMILAR_QUERY_GAME_WEIGHT = float(os.getenv('SIMILAR_QUERY_GAME_WEIGHT', 1.0))
+# build ที่ราคารวมเกินงบของผู้ใช้มากกว่าสัดส่วนนี้ถูกตัดออก
+SIMILAR_QUERY_PRICE_TOLERANCE = float(os.getenv('SIMILAR_QUERY_PRICE_TOLERANCE', 0.02))
+SIMILAR_QUERY_INDEX_REFRESH_SECONDS = float(os.getenv('SIMILAR_QUERY_INDEX_REFRESH_SECONDS', 30))
+
+# Cache warmer (manage.py warm_recommendation_cache): อุ่น query ยอดนิยมจาก RecommendationRequestLog
+# ก่อนหมดอายุ CACHE_WARMER_REFRESH_BEFORE_SECONDS โดยเรียก LLM ไม่เกิน CACHE_WARMER_MAX_LLM_CALLS ครั้งต่อรอบ
+CACHE_WARMER_MAX_LLM_CALLS = int(os.getenv('CACHE_WARMER_MAX_LLM_CALLS', 20))
+CACHE_WARMER_LOOKBACK_HOURS = float(os.getenv('CACHE_WARMER_LOOKBACK_HOURS', 7 * 24))
+CACHE_WARMER_TOP_QUERIES = int(os.getenv('CACHE_WARMER_TOP_QUERIES', 50))
+CACHE_WARMER_MIN_REQUESTS = int(os.getenv('CACHE_WARMER_MIN_REQUESTS', 3))
+CACHE_WARMER_REFRESH_BEFORE_SECONDS = int(os.getenv('CACHE_WARMER_REFRESH_BEFORE_SECONDS', 60 * 60))
+
+# Single-flight: รอผลจาก request ที่กำลังเรียก Gemini ด้วย query เดียวกันได้นานสุดกี่วินาที
+RECOMMENDATION_SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv('RECOMMENDATION_SINGLE_FLIGHT_WAIT_SECONDS', 30))
+
+# Fan-out ของ prompt แบบงบอย่างเดียว (recommender_api/fanout.py): เรียก LLM พร้อมกัน tier ละหนึ่ง build
+# รอทุก tier ไม่เกิน RECOMMENDATION_FANOUT_WAIT_SECONDS แล้วตอบด้วย tier ที่เสร็จแล้ว
+RECOMMENDATION_FANOUT_ENABLED = os.getenv('RECOMMENDATION_FANOUT_ENABLED', 'false').lower() == 'true'
+RECOMMENDATION_FANOUT_TIERS = [tier.strip() for tier in os.getenv('RECOMMENDATION_FANOUT_TIERS', 'value,balanced,performance').split(',') if tier.strip()]
+RECOMMENDATION_FANOUT_WAIT_SECONDS = float(os.getenv('RECOMMENDATION_FANOUT_WAIT_SECONDS', 20))
+RECOMMENDATION_FANOUT_MAX_THREADS = int(os.getenv('RECOMMENDATION_FANOUT_MAX_THREADS', 24))
+# ผลที่ขาดบาง tier (ตอบไม่ทัน/ล้มเหลว) ถูก cache แค่ช่วงสั้นๆ เพื่อให้ request ถัดไปได้ลองครบทุก tier (0 = ไม่ cache)
+RECOMMENDATION_FANOUT_PARTIAL_CACHE_TTL_SECONDS = int(os.getenv('RECOMMENDATION_FANOUT_PARTIAL_CACHE_TTL_SECONDS', 60))
+
+# Batch recommend-specs (POST recommend-specs/batch/ และ manage.py run_recommendation_batch)
+# query ที่ถูกปฏิเสธโดย admission control ถูกลองใหม่ได้ไม่เกิน RECOMMENDATION_BATCH_MAX_ATTEMPTS ครั้ง
+RECOMMENDATION_BATCH_MAX_QUERIES = int(os.getenv('RECOMMENDATION_BATCH_MAX_QUERIES', 1000))
+RECOMMENDATION_BATCH_CONCURRENCY = int(os.getenv('RECOMMENDATION_BATCH_CONCURRENCY', 4))
+RECOMMENDATION_BATCH_MAX_CONCURRENCY = int(os.getenv('RECOMMENDATION_BATCH_MAX_CONCURRENCY', 16))
+RECOMMENDATION_BATCH_MAX_ATTEMPTS = int(os.getenv('RECOMMENDATION_BATCH_MAX_ATTEMPTS', 3))
+
+# Component catalog / optimizer (จัดสเปคโดยไม่ใช้ LLM)
+# RECOMMENDATION_DEFAULT_SOURCE: "gemini" หรือ "catalog" (request ระบุ "source" เองได้)
+RECOMMENDATION_DEFAULT_SOURCE = os.getenv('RECOMMENDATION_DEFAULT_SOURCE', 'gemini')
+RECOMMENDATION_CATALOG_FALLBACK = os.getenv('RECOMMENDATION_CATALOG_FALLBACK', 'true').lower() == 'true'
+RECOMMENDATION_CATALOG_MAX_BUILDS = int(os.getenv('RECOMMENDATION_CATALOG_MAX_BUILDS', 3))
+RECOMMENDATION_CATALOG_CACHE_SECONDS = int(os.getenv('RECOMMENDATION_CATALOG_CACHE_SECONDS', 60))
+
+# Explanation cache (BuildExplanation ตาม content hash ของ build)
+EXPLANATION_CACHE_TTL_SECONDS = int(os.getenv('EXPLANATION_CACHE_TTL_SECONDS', 30 * 24 * 60 * 60))
+# สร้างคำอธิบายของ build ที่เพิ่งได้จาก LLM ไว้ล่วงหน้าเบื้องหลัง (ไม่เกิน MAX_BUILDS ชุดต่อ response)
+# งานที่รอ/กำลังทำเกิน MAX_PENDING ต่อ worker ถูกข้าม
+EXPLANATION_PREFETCH_ENABLED = os.getenv('EXPLANATION_PREFETCH_ENABLED', 'false').lower() == 'true'
+EXPLANATION_PREFETCH_MAX_BUILDS = int(os.getenv('EXPLANATION_PREFETCH_MAX_BUILDS', 3))
+EXPLANATION_PREFETCH_MAX_THREADS = int(os.getenv('EXPLANATION_PREFETCH_MAX_THREADS', 4))
+EXPLANATION_PREFETCH_MAX_PENDING = int(os.getenv('EXPLANATION_PREFETCH_MAX_PENDING', 32))
+
+# RecommendationRequestLog writer: "buffered" (bulk_create เป็นชุด) หรือ "sync" (เขียนทันที ทนทานกว่า)
+REQUEST_LOG_MODE = os.getenv('REQUEST_LOG_MODE', 'buffered')
+REQUEST_LOG_BATCH_SIZE = int(os.getenv('REQUEST_LOG_BATCH_SIZE', 50))
+REQUEST_LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv('REQUEST_LOG_FLUSH_INTERVAL_SECONDS', 5))
+# StatsRollupUser (ผู้ใช้ที่ถูกนับใน unique_users ของแต่ละ bucket แล้ว) เก็บไว้กี่วัน ต้องนานกว่าเวลาที่ log อาจค้างใน writer
+STATS_SEEN_USERS_RETENTION_DAYS = int(os.getenv('STATS_SEEN_USERS_RETENTION_DAYS', 3))
+
+# Cursor pagination ของ list endpoint (saved-specs, admin/users, admin/saved-specs)
+# client ขอขนาดหน้าเองได้ด้วย ?page_size= แต่ไม่เกิน API_MAX_PAGE_SIZE
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 20))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 100))
+
+# LLMCallLog (latency/token ของการเรียก Gemini แต่ละครั้ง) ใช้ writer แบบเดียวกับ request log
+LLM_CALL_LOG_MODE = os.getenv('LLM_CALL_LOG_MODE', 'buffered')
+LLM_CALL_LOG_BATCH_SIZE = int(os.getenv('LLM_CALL_LOG_BATCH_SIZE', 50))
+LLM_CALL_LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv('LLM_CALL_LOG_FLUSH_INTERVAL_SECONDS', 5))
+
+# LLM backend (recommender_api/llm_backends.py): "gemini", "replay", "record" หรือ "stub"
+# replay/stub ไม่ต้องใช้ API key หรือ network เหมาะกับ load test และ benchmark
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+GEMINI_MODEL_NAME = os.getenv('GEMINI_MODEL_NAME', 'gemini-1.5-flash-latest')
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+LLM_CASSETTE_DIR = os.getenv('LLM_CASSETTE_DIR', str(BASE_DIR / 'llm_cassettes'))
+LLM_REPLAY_SIMULATE_LATENCY = os.getenv('LLM_REPLAY_SIMULATE_LATENCY', 'false').lower() == 'true'
+LLM_STUB_LATENCY_MEDIAN_MS = float(os.getenv('LLM_STUB_LATENCY_MEDIAN_MS', 800))
+LLM_STUB_LATENCY_SIGMA = float(os.getenv('LLM_STUB_LATENCY_SIGMA', 0.5))
+LLM_STUB_FAILURE_RATE = float(os.getenv('LLM_STUB_FAILURE_RATE', 0))
+LLM_STUB_MALFORMED_RATE = float(os.getenv('LLM_STUB_MALFORMED_RATE', 0))
+LLM_STUB_SEED = int(os.getenv('LLM_STUB_SEED')) if os.getenv('LLM_STUB_SEED') else None
+
+# ความทนทานของการเรียก LLM (ดู recommender_api/llm_backends.py ResilientBackend)
+# LLM_REQUEST_DEADLINE_SECONDS: เวลาทั้งหมดที่ request หนึ่งรอ LLM ได้ (รวม retry) แต่ละ attempt ไม่เกิน LLM_ATTEMPT_TIMEOUT_SECONDS
+LLM_REQUEST_DEADLINE_SECONDS = float(os.getenv('LLM_REQUEST_DEADLINE_SECONDS', 45))
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv('LLM_ATTEMPT_TIMEOUT_SECONDS', 30))
+LLM_RETRY_MAX_ATTEMPTS = int(os.getenv('LLM_RETRY_MAX_ATTEMPTS', 2))
+LLM_RETRY_BACKOFF_BASE_SECONDS = float(os.getenv('LLM_RETRY_BACKOFF_BASE_SECONDS', 0.5))
+LLM_RETRY_BACKOFF_CAP_SECONDS = float(os.getenv('LLM_RETRY_BACKOFF_CAP_SECONDS', 4))
+# circuit breaker: open หลังล้มเหลวติดกัน N ครั้ง (0 = ปิด) แล้วลองใหม่หลัง LLM_CIRCUIT_RESET_SECONDS
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('LLM_CIRCUIT_FAILURE_THRESHOLD', 5))
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv('LLM_CIRCUIT_RESET_SECONDS', 30))
+# hedged request: ส่ง attempt ที่สองเมื่อรอเกิน p95 ของ operation นั้น (ไม่ต่ำกว่า LLM_HEDGE_MIN_DELAY_SECONDS)
+LLM_HEDGE_ENABLED = os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true'
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv('LLM_HEDGE_MIN_DELAY_SECONDS', 2))
+LLM_HEDGE_MAX_THREADS = int(os.getenv('LLM_HEDGE_MAX_THREADS', 16))
+
+# Admission control ของ endpoint ที่เรียก LLM (ดู recommender_api/admission.py)
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+# token bucket ต่อผู้ใช้ที่ login / ต่อ IP ของผู้ใช้ที่ไม่ได้ login (burst = ขนาด bucket, 0 = ไม่จำกัด)
+ADMISSION_USER_RATE_PER_MINUTE = float(os.getenv('ADMISSION_USER_RATE_PER_MINUTE', 10))
+ADMISSION_USER_BURST = int(os.getenv('ADMISSION_USER_BURST', 10))
+ADMISSION_ANON_RATE_PER_MINUTE = float(os.getenv('ADMISSION_ANON_RATE_PER_MINUTE', 3))
+ADMISSION_ANON_BURST = int(os.getenv('ADMISSION_ANON_BURST', 5))
+# จำนวน proxy หน้า Django ที่เติม X-Forwarded-For (0 = เปิดตรงสู่อินเทอร์เน็ต ใช้ REMOTE_ADDR)
+# ค่าเริ่มต้นบน Render (ตั้ง RENDER=true ให้ทุก service) คือ 1 ที่อื่นถ้าไม่ตั้งและ request มี X-Forwarded-For
+# จะไม่ rate limit ผู้ไม่ login เพราะ REMOTE_ADDR คือ proxy (ทุกคนจะใช้ bucket เดียวกัน)
+ADMISSION_TRUSTED_PROXY_COUNT = (
+    int(os.environ['ADMISSION_TRUSTED_PROXY_COUNT']) if os.getenv('ADMISSION_TRUSTED_PROXY_COUNT')
+    else 1 if os.getenv('RENDER') else None
+)
+# การเรียก LLM พร้อมกันสูงสุดทั้งระบบ (0 = ไม่จำกัด) และคิวรอต่อ worker
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 8))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 16))
+ADMISSION_MAX_QUEUE_WAIT_SECONDS = float(os.getenv('ADMISSION_MAX_QUEUE_WAIT_SECONDS', 10))
+# slot ที่ worker ตายระหว่างถือจะว่างเองหลังเวลานี้ (ต้องนานกว่า deadline ของการเรียก LLM ที่ยาวที่สุด)
+ADMISSION_SLOT_LEASE_SECONDS = float(os.getenv('ADMISSION_SLOT_LEASE_SECONDS', 300))
+ADMISSION_AUTHENTICATED_WEIGHT = float(os.getenv('ADMISSION_AUTHENTICATED_WEIGHT', 4))
+ADMISSION_RETRY_AFTER_SECONDS = float(os.getenv('ADMISSION_RETRY_AFTER_SECONDS', 5))
+
+# recommend-specs แบบ job ("mode": "job") ประมวลผลโดย manage.py run_recommendation_workers (ดู recommender_api/jobs.py)
+RECOMMENDATION_JOBS_ENABLED = os.getenv('RECOMMENDATION_JOBS_ENABLED', 'true').lower() == 'true'
+RECOMMENDATION_JOB_WORKERS = int(os.getenv('RECOMMENDATION_JOB_WORKERS', 2))
+RECOMMENDATION_JOB_DEADLINE_SECONDS = float(os.getenv('RECOMMENDATION_JOB_DEADLINE_SECONDS', 120))
+# worker ที่ถือ job นานเกิน lease ถือว่าตายแล้ว งานจะถูกคืนเข้าคิว (ต้องนานกว่า deadline)
+RECOMMENDATION_JOB_LEASE_SECONDS = float(os.getenv('RECOMMENDATION_JOB_LEASE_SECONDS', 300))
+RECOMMENDATION_JOB_MAX_ATTEMPTS = int(os.getenv('RECOMMENDATION_JOB_MAX_ATTEMPTS', 3))
+# worker ตรวจหา job ที่ lease หมดอายุทุกกี่วินาที (ทำแม้คิวไม่ว่าง)
+RECOMMENDATION_JOB_REQUEUE_INTERVAL_SECONDS = float(os.getenv('RECOMMENDATION_JOB_REQUEUE_INTERVAL_SECONDS', 30))
+# งานที่ถูก admission control ปฏิเสธรอก่อนถูกดึงใหม่ BACKOFF * 2^(attempts-1) วินาที (ไม่น้อยกว่า Retry-After)
+RECOMMENDATION_JOB_RETRY_BACKOFF_SECONDS = float(os.getenv('RECOMMENDATION_JOB_RETRY_BACKOFF_SECONDS', 5))
+RECOMMENDATION_JOB_RETRY_BACKOFF_CAP_SECONDS = float(os.getenv('RECOMMENDATION_JOB_RETRY_BACKOFF_CAP_SECONDS', 60))
+# long-poll ของ endpoint สถานะ (?wait=) รอได้ไม่เกินค่านี้ และตรวจฐานข้อมูลทุก POLL_INTERVAL วินาที
+RECOMMENDATION_JOB_MAX_WAIT_SECONDS = float(os.getenv('RECOMMENDATION_JOB_MAX_WAIT_SECONDS', 25))
+RECOMMENDATION_JOB_POLL_INTERVAL_SECONDS = float(os.getenv('RECOMMENDATION_JOB_POLL_INTERVAL_SECONDS', 0.5))
+RECOMMENDATION_JOB_RETENTION_SECONDS = int(os.getenv('RECOMMENDATION_JOB_RETENTION_SECONDS', 24 * 60 * 60))
+
+# ใส่ header X-DB-Query-Count/X-DB-Query-Time-Ms ในทุก response (ใช้กับ testing/benchmark_api.py)
+DB_QUERY_COUNT_HEADER = os.getenv('DB_QUERY_COUNT_HEADER', 'false').lower() == 'true'
+if DB_QUERY_COUNT_HEADER:
+    MIDDLEWARE.insert(0, 'recommender_api.middleware.QueryCountMiddleware')
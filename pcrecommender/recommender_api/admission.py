@@ -0,0 +1,417 @@
+# recommender_api/admission.py
+"""
+Admission control สำหรับ endpoint ที่เรียก LLM
+
+1. Rate limit ต่อผู้ใช้/ต่อ IP แบบ token bucket เก็บในตาราง RateLimitBucket (แชร์กันทุก worker)
+   หัก token ครั้งเดียวต่อ request ตอนจะเรียก LLM จริง (charge_rate_limit ใน services) -> 429 + Retry-After
+   cache hit / similar / stale / catalog จึงไม่เสีย token และ client ภายใน (rate_limited=False) ไม่ถูกหัก
+2. จำกัดจำนวนการเรียก LLM ที่กำลังทำงานพร้อมกันทั้งระบบ (llm_slots)
+   แต่ละ slot คือแถวใน LLMSlotLease ที่ถูกยืมพร้อมเวลาหมดอายุ (ว่างเองถ้า worker ตาย) จึงนับรวมทุก worker
+3. request ที่ยังไม่ได้ slot รอใน weighted fair queue ของ worker: แต่ละผู้ใช้/IP เป็น flow ของตัวเอง
+   และ flow ของผู้ใช้ที่ login มีน้ำหนักมากกว่า คิวเต็มหรือรอนานเกินไปจะโยน Overloaded ทันที (view ตอบ 429)
+cache hit ไม่ต้องใช้ slot เพราะ slot ถูกขอเฉพาะตอนจะเรียก LLM จริง (ใน services)
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from datetime import timedelta
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import LLMSlotLease, RateLimitBucket
+
+
+class Overloaded(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Client(NamedTuple):
+    key: str
+    authenticated: bool
+    rate_limited: bool = True  # False สำหรับงานภายใน (revalidate, prefetch, warmer, batch) ที่ไม่มี token bucket
+
+
+ANONYMOUS_CLIENT = Client("anonymous", False)
+
+
+def client_ip(request):
+    """
+    IP ของผู้ใช้ ถ้าอยู่หลัง proxy ให้ตั้ง ADMISSION_TRUSTED_PROXY_COUNT เป็นจำนวน proxy ที่เติม X-Forwarded-For
+    คืนค่า None ถ้ายังไม่ได้ตั้งค่าแต่ request ผ่าน proxy มา (REMOTE_ADDR เป็นของ proxy ไม่ใช่ของผู้ใช้)
+    """
+    proxies = settings.ADMISSION_TRUSTED_PROXY_COUNT
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    addresses = [address.strip() for address in forwarded.split(",") if address.strip()] if forwarded else []
+    if proxies is None and addresses:
+        _warn_unconfigured_proxy()
+        return None
+    if proxies and addresses:
+        return addresses[-min(proxies, len(addresses))]
+    return request.META.get("REMOTE_ADDR") or "unknown"
+
+
+_proxy_warning_lock = threading.Lock()
+_proxy_warning_shown = False
+
+
+def _warn_unconfigured_proxy():
+    global _proxy_warning_shown
+    with _proxy_warning_lock:
+        if _proxy_warning_shown:
+            return
+        _proxy_warning_shown = True
+    print("Warning: request has X-Forwarded-For but ADMISSION_TRUSTED_PROXY_COUNT is not set; "
+          "anonymous users are not rate limited until it is configured.")
+
+
+def client_for(request, user=None, rate_limited=True):
+    if user is not None and user.is_authenticated:
+        return Client(f"user:{user.pk}", True, rate_limited)
+    ip = client_ip(request)
+    if ip is None:
+        # ยังแยกผู้ใช้ไม่ได้: ไม่หัก token (ไม่ให้ทุกคนใช้ bucket ของ proxy ร่วมกัน) แต่ยังต่อคิว slot ใน flow ของ proxy
+        return Client(f"ip:{request.META.get('REMOTE_ADDR') or 'unknown'}", False, False)
+    return Client(f"ip:{ip}", False, rate_limited)
+
+
+# --- token bucket ---
+
+def bucket_limits(client):
+    if client.authenticated:
+        return settings.ADMISSION_USER_RATE_PER_MINUTE / 60, settings.ADMISSION_USER_BURST
+    return settings.ADMISSION_ANON_RATE_PER_MINUTE / 60, settings.ADMISSION_ANON_BURST
+
+
+def consume_token(key, rate_per_second, capacity):
+    """
+    หัก 1 token จาก bucket ของ key คืนค่า (allowed, retry_after_seconds)
+    แถวของ bucket ถูก lock (SELECT ... FOR UPDATE) ระหว่างคำนวณ จึงถูกต้องแม้หลาย worker เรียกพร้อมกัน
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        bucket, _ = RateLimitBucket.objects.select_for_update().get_or_create(
+            key=key, defaults={"tokens": capacity, "updated_at": now}
+        )
+        elapsed = max(0.0, (now - bucket.updated_at).total_seconds())
+        tokens = min(capacity, bucket.tokens + elapsed * rate_per_second)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        RateLimitBucket.objects.filter(pk=bucket.pk).update(tokens=tokens, updated_at=now)
+    retry_after = 0.0 if allowed else (1 - tokens) / rate_per_second if rate_per_second > 0 else 60.0
+    return allowed, retry_after
+
+
+def check_rate_limit(client):
+    """
+    คืนค่า (allowed, retry_after_seconds) ของ client ถ้าปิด admission control หรือฐานข้อมูลมีปัญหาจะอนุญาตเสมอ
+    """
+    if not settings.ADMISSION_ENABLED:
+        return True, 0.0
+    rate, capacity = bucket_limits(client)
+    if capacity <= 0:
+        return True, 0.0
+    try:
+        allowed, retry_after = consume_token(f"llm:{client.key}", rate, capacity)
+    except Exception as e:
+        print(f"Warning: rate limit check for {client.key} failed, allowing request: {e}")
+        return True, 0.0
+    if not allowed:
+        llm_slots.count("throttled")
+    return allowed, retry_after
+
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+def purge_stale_buckets(idle_seconds=24 * 60 * 60):
+    # bucket ที่ไม่ถูกใช้นานกว่าเวลาเติมเต็ม มีค่าเท่ากับ bucket ใหม่ ลบทิ้งได้
+    cutoff = timezone.now() - timedelta(seconds=idle_seconds)
+    deleted, _ = RateLimitBucket.objects.filter(updated_at__lt=cutoff).delete()
+    return deleted
+
+
+def charge_rate_limit(client):
+    """
+    หัก token ของ client ก่อนเรียก LLM โยน Overloaded (view ตอบ 429 + Retry-After) ถ้า bucket หมด
+    เรียกครั้งเดียวต่อ request (fan-out หลาย tier ก็หักครั้งเดียว) client=None คืองานภายในที่ไม่ผ่าน view
+    """
+    if client is None or not client.rate_limited:
+        return
+    allowed, retry_after = check_rate_limit(client)
+    if not allowed:
+        raise Overloaded("rate limit exceeded for this client", retry_after)
+
+
+# --- weighted fair queue + global slots ---
+
+class WeightedFairQueue:
+    """
+    คิวแบบ virtual finish time: request ใหม่ของ flow ได้ finish = max(virtual_time, finish ล่าสุดของ flow) + 1/weight
+    ตัวที่ finish น้อยที่สุดอยู่หัวคิว flow ที่ส่งมาถี่จึงไม่แซง flow อื่น และ flow น้ำหนักมากได้ส่วนแบ่งมากกว่า
+    """
+
+    def __init__(self, max_waiting):
+        self.max_waiting = max_waiting
+        self._condition = threading.Condition()
+        self._heap = []
+        self._virtual_time = 0.0
+        self._last_finish = {}
+        self._sequence = itertools.count()
+
+    def join(self, flow, weight):
+        with self._condition:
+            if len(self._heap) >= self.max_waiting:
+                return None
+            finish = max(self._virtual_time, self._last_finish.get(flow, 0.0)) + 1.0 / weight
+            self._last_finish[flow] = finish
+            ticket = (finish, next(self._sequence), flow)
+            heapq.heappush(self._heap, ticket)
+            return ticket
+
+    def is_head(self, ticket):
+        with self._condition:
+            return bool(self._heap) and self._heap[0] == ticket
+
+    def leave(self, ticket):
+        with self._condition:
+            if self._heap and self._heap[0] == ticket:
+                heapq.heappop(self._heap)
+                self._virtual_time = max(self._virtual_time, ticket[0])
+            else:
+                self._heap.remove(ticket)
+                heapq.heapify(self._heap)
+            if self._last_finish.get(ticket[2], 0.0) <= self._virtual_time:
+                self._last_finish.pop(ticket[2], None)
+            self._condition.notify_all()
+
+    def wait(self, timeout):
+        with self._condition:
+            self._condition.wait(timeout)
+
+    def notify(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._heap)
+
+
+class SlotLease(NamedTuple):
+    slot: int
+    holder: str
+
+
+# slot ของ try_acquire_nowait เมื่อปิด admission control (ไม่มีแถวให้คืน)
+UNLIMITED_SLOT = SlotLease(-1, "")
+
+
+class LLMSlots:
+    """
+    จำกัดการเรียก LLM พร้อมกันทั้งระบบไว้ที่ max_in_flight (ใช้ผ่าน acquire / acquire_async)
+    """
+
+    COUNTER_NAMES = ("admitted", "queued", "shed", "throttled")
+
+    def __init__(self, max_in_flight, max_waiting, max_wait_seconds, poll_interval=0.05):
+        self.max_in_flight = max_in_flight
+        self.max_wait_seconds = max_wait_seconds
+        self.poll_interval = poll_interval
+        self.queue = WeightedFairQueue(max_waiting)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rows_ready = False
+        self._counters = dict.fromkeys(self.COUNTER_NAMES, 0)
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "in_flight": self._in_flight, "waiting": len(self.queue),
+                    "max_in_flight": self.max_in_flight}
+
+    @staticmethod
+    def weight_for(client):
+        return settings.ADMISSION_AUTHENTICATED_WEIGHT if client.authenticated else 1
+
+    def _overloaded(self, reason):
+        self.count("shed")
+        return Overloaded(f"LLM capacity exhausted ({reason}); try again later", settings.ADMISSION_RETRY_AFTER_SECONDS)
+
+    def _give_up_at(self, deadline):
+        wait = self.max_wait_seconds if deadline is None else min(self.max_wait_seconds, deadline.remaining())
+        return time.monotonic() + wait
+
+    # slot: แถวของ LLMSlotLease ไม่ผูกกับ session ของ DB (ต่างจาก advisory lock ที่ lock ซ้ำใน session เดียวกันได้
+    # ซึ่ง async views ที่ใช้ connection เดียวกันผ่าน sync_to_async จะได้ slot เดียวกันหมด)
+
+    def _ensure_slot_rows(self):
+        if not self._rows_ready:
+            LLMSlotLease.objects.bulk_create([LLMSlotLease(slot=slot) for slot in range(self.max_in_flight)], ignore_conflicts=True)
+            self._rows_ready = True
+
+    def _claim_lease(self):
+        """
+        ยืม slot ว่าง (หรือที่ lease หมดอายุแล้ว) หนึ่งแถว คืนค่า SlotLease หรือ None
+        PostgreSQL ข้ามแถวที่ worker อื่นกำลังยืมด้วย SKIP LOCKED ส่วน UPDATE แบบมีเงื่อนไขกันไม่ให้สอง connection
+        ได้ slot เดียวกันบนฐานข้อมูลที่ไม่รองรับ SKIP LOCKED (SQLite)
+        """
+        self._ensure_slot_rows()
+        now = timezone.now()
+        free = LLMSlotLease.objects.filter(slot__lt=self.max_in_flight).filter(Q(expires_at__isnull=True) | Q(expires_at__lte=now))
+        holder = uuid.uuid4().hex
+        with transaction.atomic():
+            slot = free.select_for_update(skip_locked=True).order_by("slot").values_list("slot", flat=True).first()
+            if slot is None:
+                return None
+            claimed = free.filter(slot=slot).update(
+                holder=holder, expires_at=now + timedelta(seconds=settings.ADMISSION_SLOT_LEASE_SECONDS)
+            )
+        return SlotLease(slot, holder) if claimed else None
+
+    def _try_take_slot(self):
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                return None
+            self._in_flight += 1
+        lease = None
+        try:
+            lease = self._claim_lease()
+        finally:
+            if lease is None:
+                with self._lock:
+                    self._in_flight -= 1
+        return lease
+
+    def _release_slot(self, lease):
+        # คืนด้วย holder token: เรียกจาก thread/connection ไหนก็ได้ และไม่คืน slot ที่หมดอายุแล้วถูกคนอื่นยืมต่อ
+        try:
+            LLMSlotLease.objects.filter(slot=lease.slot, holder=lease.holder).update(holder="", expires_at=None)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self.queue.notify()
+
+    def _join_queue(self, client):
+        ticket = self.queue.join(client.key, self.weight_for(client))
+        if ticket is None:
+            raise self._overloaded("queue full")
+        self.count("queued")
+        return ticket
+
+    def _wait_for_slot(self, client, deadline):
+        ticket = self._join_queue(client)
+        give_up_at = self._give_up_at(deadline)
+        try:
+            while True:
+                if self.queue.is_head(ticket):
+                    slot = self._try_take_slot()
+                    if slot is not None:
+                        return slot
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    raise self._overloaded("queue wait timed out")
+                self.queue.wait(min(self.poll_interval, remaining))
+        finally:
+            self.queue.leave(ticket)
+
+    async def _wait_for_slot_async(self, client, deadline):
+        ticket = self._join_queue(client)
+        give_up_at = self._give_up_at(deadline)
+        try:
+            while True:
+                if self.queue.is_head(ticket):
+                    slot = await sync_to_async(self._try_take_slot)()
+                    if slot is not None:
+                        return slot
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    raise self._overloaded("queue wait timed out")
+                await asyncio.sleep(min(self.poll_interval, remaining))
+        finally:
+            self.queue.leave(ticket)
+
+    def _enabled(self):
+        return settings.ADMISSION_ENABLED and self.max_in_flight > 0
+
+    def try_acquire_nowait(self):
+        """
+        ยืม slot เพิ่มทันทีโดยไม่ต่อคิว (ใช้กับ hedged request) คืนค่า None ถ้าไม่มี slot ว่างหรือมีคนรอคิวอยู่
+        ถ้าปิด admission control คืน UNLIMITED_SLOT ต้องคืนด้วย release() เสมอ
+        """
+        if not self._enabled():
+            return UNLIMITED_SLOT
+        if len(self.queue):
+            return None
+        return self._try_take_slot()
+
+    def release(self, lease):
+        if lease is not UNLIMITED_SLOT:
+            self._release_slot(lease)
+
+    def renew(self, lease):
+        """
+        ต่ออายุ lease ของ slot ที่ถืออยู่นาน (เช่น stream) ไม่ให้หมดอายุแล้วถูก worker อื่นยืมซ้อน
+        คืนค่า False ถ้า slot หมดอายุและถูกยืมไปแล้ว
+        """
+        if lease is None or lease is UNLIMITED_SLOT:
+            return True
+        return bool(LLMSlotLease.objects.filter(slot=lease.slot, holder=lease.holder).update(
+            expires_at=timezone.now() + timedelta(seconds=settings.ADMISSION_SLOT_LEASE_SECONDS)
+        ))
+
+    @contextmanager
+    def acquire(self, client=None, deadline=None):
+        """
+        ถือ slot ไว้ตลอด block ถ้าไม่มีใครรอคิวอยู่จะลองเอา slot ว่างทันที ไม่เช่นนั้นต่อคิว
+        """
+        if not self._enabled():
+            yield None
+            return
+        slot = self._try_take_slot() if not len(self.queue) else None
+        if slot is None:
+            slot = self._wait_for_slot(client or ANONYMOUS_CLIENT, deadline)
+        self.count("admitted")
+        try:
+            yield slot
+        finally:
+            self._release_slot(slot)
+
+    @asynccontextmanager
+    async def acquire_async(self, client=None, deadline=None):
+        """
+        acquire สำหรับ async views: รอด้วย asyncio.sleep และยืม/คืน slot ผ่าน sync_to_async
+        """
+        if not self._enabled():
+            yield None
+            return
+        slot = await sync_to_async(self._try_take_slot)() if not len(self.queue) else None
+        if slot is None:
+            slot = await self._wait_for_slot_async(client or ANONYMOUS_CLIENT, deadline)
+        self.count("admitted")
+        try:
+            yield slot
+        finally:
+            await sync_to_async(self._release_slot)(slot)
+
+llm_slots = LLMSlots(
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    max_waiting=settings.ADMISSION_MAX_QUEUE,
+    max_wait_seconds=settings.ADMISSION_MAX_QUEUE_WAIT_SECONDS,
+)
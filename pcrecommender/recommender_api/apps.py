@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class RecommenderApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recommender_api'
+
+    def ready(self):
+        # ต่อ receiver ของ recommendations_generated (prefetch คำอธิบาย) และตัวนับสถิติ (post_save/post_delete)
+        # ในทุก process รวมถึง job worker และ command
+        from . import explanations, stats  # noqa: F401
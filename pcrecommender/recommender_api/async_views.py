@@ -0,0 +1,191 @@
+# recommender_api/async_views.py
+"""
+async views สำหรับ endpoint ที่ต้องรอ Gemini นาน (recommend-specs, explain-build)
+
+DRF 3.16 ยังไม่รองรับ async APIView จึงใช้ django.views.View ที่มี async handler แทน
+เมื่อรันผ่าน ASGI (pcrecommender/asgi.py + uvicorn worker) request ที่รอ Gemini
+จะรออยู่บน event loop เดียวกันโดยไม่กิน worker หรือ thread คนละตัว
+"""
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .services import get_recommendations_from_source_async, is_llm_configured
+from .explanations import get_build_explanation_async
+from .admission import client_for
+from .jobs import enqueue_recommendation_job, get_job_for, job_payload, wait_for_job_async
+from .views import (
+    AI_NOT_CONFIGURED_MESSAGE, RECOMMENDATION_SOURCES, ai_unavailable_for, apply_saved_spec, build_user_prompt_input,
+    elapsed_ms, extract_desired_parts, invalid_mode_message, invalid_request_payload, is_truthy, job_accepted_payload,
+    llm_error_headers, llm_error_status, log_recommendation_request, parse_explain_request, parse_wait_seconds,
+    request_deadline, resolve_recommendation_source, resolve_response_mode, set_cache_age_header,
+)
+
+
+class AsyncJSONView(View):
+    """
+    base class: ปิด CSRF แบบเดียวกับ DRF APIView, อ่าน JSON body และยืนยันตัวตนด้วย JWT
+    """
+    http_method_names = ['post', 'options']
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    @staticmethod
+    def parse_json_body(request):
+        try:
+            data = json.loads(request.body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+        return data if isinstance(data, dict) else None
+
+    @staticmethod
+    async def authenticate(request):
+        """
+        คืนค่า user ที่ login อยู่ (หรือ None ถ้าไม่ได้แนบ token) โยน AuthenticationFailed ถ้า token ไม่ถูกต้อง
+        """
+        user_auth_tuple = await sync_to_async(JWTAuthentication().authenticate)(request)
+        return user_auth_tuple[0] if user_auth_tuple else None
+
+
+class AsyncSpecsRecommendationView(AsyncJSONView):
+
+    async def post(self, request, *args, **kwargs):
+        deadline = request_deadline()
+        try:
+            user = await self.authenticate(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+
+        client = client_for(request, user)
+
+        data = self.parse_json_body(request)
+        if data is None:
+            return JsonResponse({"error": "Invalid JSON body"}, status=status.HTTP_400_BAD_REQUEST)
+
+        source = resolve_recommendation_source(data)
+        if source is None:
+            return JsonResponse({"error": f"Invalid source. Use one of: {', '.join(RECOMMENDATION_SOURCES)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if ai_unavailable_for(source):
+            return JsonResponse({"error": AI_NOT_CONFIGURED_MESSAGE}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        mode = resolve_response_mode(data)
+        if mode is None:
+            return JsonResponse({"error": invalid_mode_message()}, status=status.HTTP_400_BAD_REQUEST)
+
+        desired_parts_filtered = extract_desired_parts(data)
+        user_prompt_input, error_message = build_user_prompt_input(data, desired_parts_filtered)
+        if error_message:
+            await sync_to_async(log_recommendation_request)(
+                user, invalid_request_payload(data, desired_parts_filtered), "invalid"
+            )
+            return JsonResponse({"error": error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+        if mode == "job":
+            job = await sync_to_async(enqueue_recommendation_job)(user, client, user_prompt_input, source)
+            payload, status_url = job_accepted_payload(request, job, "async_recommend_specs_job")
+            return JsonResponse(payload, status=status.HTTP_202_ACCEPTED, headers={"Location": status_url})
+
+        started = time.perf_counter()
+        recommendations_data, cache_status = await get_recommendations_from_source_async(
+            budget=user_prompt_input["budget"],
+            currency=user_prompt_input["currency"],
+            desired_parts=desired_parts_filtered,
+            preferred_games=user_prompt_input["preferred_games"],
+            source=source,
+            deadline=deadline,
+            client=client,
+        )
+        await sync_to_async(log_recommendation_request)(
+            user, user_prompt_input, "error" if "error" in recommendations_data else "success",
+            cache_status, elapsed_ms(started)
+        )
+
+        if "error" in recommendations_data:
+            return JsonResponse(
+                recommendations_data, status=llm_error_status(recommendations_data),
+                headers=llm_error_headers(recommendations_data),
+            )
+
+        if "recommendations" in recommendations_data:
+            recommendations_data["source_prompt_for_saving"] = user_prompt_input
+
+        response = JsonResponse(recommendations_data, status=status.HTTP_200_OK)
+        response["X-Recommendation-Cache"] = cache_status
+        return set_cache_age_header(response, recommendations_data)
+
+
+class AsyncRecommendationJobView(AsyncJSONView):
+    """
+    สถานะของ recommend-specs job แบบ async: long-poll (?wait=) รอบน event loop โดยไม่ถือ thread ไว้
+    """
+    http_method_names = ['get', 'options']
+
+    async def get(self, request, job_id, *args, **kwargs):
+        try:
+            user = await self.authenticate(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+
+        wait_seconds = parse_wait_seconds(request.GET.get("wait"))
+        if wait_seconds is None:
+            return JsonResponse({"error": "Invalid 'wait' value."}, status=status.HTTP_400_BAD_REQUEST)
+        job = await sync_to_async(get_job_for)(job_id, user)
+        if job is None:
+            return JsonResponse({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+        if wait_seconds:
+            job = await wait_for_job_async(job, wait_seconds)
+        return JsonResponse(job_payload(job), status=status.HTTP_200_OK)
+
+
+class AsyncExplainBuildView(AsyncJSONView):
+
+    async def post(self, request, *args, **kwargs):
+        deadline = request_deadline()
+        if not is_llm_configured():
+            return JsonResponse({"error": AI_NOT_CONFIGURED_MESSAGE}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        try:
+            user = await self.authenticate(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+
+        client = client_for(request, user)
+
+        body = self.parse_json_body(request)
+        if body is None:
+            return JsonResponse({"error": "Invalid JSON body"}, status=status.HTTP_400_BAD_REQUEST)
+
+        saved_spec, data, error_message, error_status = await sync_to_async(apply_saved_spec)(body, user)
+        if error_message:
+            return JsonResponse({"error": error_message}, status=error_status)
+
+        selected_build, original_query, error_message = parse_explain_request(data)
+        if error_message:
+            return JsonResponse({"error": error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+        explanation_data, cache_status = await get_build_explanation_async(
+            selected_build, original_query,
+            refresh=is_truthy(body.get("refresh")),
+            saved_spec=saved_spec,
+            deadline=deadline,
+            client=client,
+        )
+
+        if "error" in explanation_data:
+            return JsonResponse(
+                explanation_data, status=llm_error_status(explanation_data), headers=llm_error_headers(explanation_data)
+            )
+
+        response = JsonResponse(explanation_data, status=status.HTTP_200_OK)
+        response["X-Explanation-Cache"] = cache_status
+        return response
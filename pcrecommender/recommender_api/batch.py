@@ -0,0 +1,152 @@
+# recommender_api/batch.py
+"""
+recommend-specs หลาย query ในครั้งเดียว (POST recommend-specs/batch/ และ manage.py run_recommendation_batch)
+
+- query ที่ canonical key และ source เดียวกันถูกสร้างครั้งเดียว ผลถูกส่งให้ทุกรายการที่ซ้ำกัน
+- สร้างพร้อมกันไม่เกิน concurrency query ผ่าน cache, single-flight และ admission slot เหมือน request ปกติ
+  (ทุก query ใช้ flow ของผู้เรียกใน admission queue จึงไม่แย่ง slot จากผู้ใช้อื่นเกินส่วน)
+- ผลถูกส่งออกทีละรายการตามลำดับที่เสร็จ (NDJSON) และไม่ถูกเก็บไว้ หน่วยความจำจึงไม่โตตามขนาด batch
+"""
+import copy
+import json
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .buffered_writer import request_log_writer
+from .cache import canonical_query_key, fit_to_budget
+from .models import RecommendationRequestLog
+from .resilience import Deadline
+from .services import get_recommendations_from_source
+
+
+class BatchItem(NamedTuple):
+    index: int
+    ref: object  # "id" ที่ client ส่งมากับ query (ถ้ามี) ส่งกลับในผลของรายการนั้น
+    query: Optional[dict]  # user_prompt_input ที่ตรวจแล้ว หรือ None ถ้าไม่ผ่าน
+    source: Optional[str]
+    error: Optional[str] = None
+
+
+def batch_key(item):
+    query = item.query
+    return item.source, canonical_query_key(query["budget"], query.get("desired_parts"), query.get("preferred_games"))
+
+
+def to_ndjson(line):
+    return json.dumps(line, ensure_ascii=False) + "\n"
+
+
+def _generate(item, client):
+    """
+    สร้างคำแนะนำของหนึ่ง query ถ้าถูก admission control ปฏิเสธจะรอตาม retry_after แล้วลองใหม่
+    """
+    query = item.query
+    for attempt in range(settings.RECOMMENDATION_BATCH_MAX_ATTEMPTS):
+        data, cache_status = get_recommendations_from_source(
+            budget=query["budget"],
+            currency=query.get("currency", "THB"),
+            desired_parts=query.get("desired_parts") or {},
+            preferred_games=query.get("preferred_games") or [],
+            source=item.source,
+            deadline=Deadline.after(settings.LLM_REQUEST_DEADLINE_SECONDS),
+            client=client,
+        )
+        if not data.get("overloaded") or attempt + 1 >= settings.RECOMMENDATION_BATCH_MAX_ATTEMPTS:
+            break
+        time.sleep(data.get("retry_after") or 1)
+    return data, cache_status
+
+
+def _run_query(item, client, user_id):
+    # ทำงานใน thread ของ batch: ปิด DB connection ของ thread เมื่อจบแต่ละ query
+    requested_at = timezone.now()
+    started = time.perf_counter()
+    try:
+        try:
+            data, cache_status = _generate(item, client)
+        except Exception as e:
+            print(f"Error running batch recommendation {item.index}: {e}")
+            data, cache_status = {"error": f"เกิดข้อผิดพลาดในการประมวลผลคำขอ: {e}"}, ""
+        request_log_writer.add(RecommendationRequestLog(
+            timestamp=requested_at,
+            user_id=user_id,
+            request_payload=item.query,
+            outcome="error" if "error" in data else "success",
+            cache_status=cache_status,
+            latency_ms=int((time.perf_counter() - started) * 1000),
+        ))
+        return data, cache_status
+    finally:
+        connection.close()
+
+
+def _result_line(item, data, cache_status, duplicate_of=None):
+    line = {"index": item.index, "id": item.ref, "status": "failed" if "error" in data else "succeeded", "cache_status": cache_status}
+    if duplicate_of is not None:
+        line["duplicate_of"] = duplicate_of
+    if "recommendations" in data and "error" not in data:
+        data = {**data, "budget_thb": float(item.query["budget"]), "source_prompt_for_saving": item.query}
+    line["result"] = data
+    return line
+
+
+def run_batch(items, concurrency, client=None, user=None):
+    """
+    generator ของผลแต่ละรายการ (dict หนึ่งบรรทัดของ NDJSON) ตามลำดับที่เสร็จ ปิดท้ายด้วย {"summary": {...}}
+    รายการที่ไม่ผ่านการตรวจถูกส่งออกก่อนทันที ถ้า consumer หยุดอ่านกลางทาง query ที่ยังไม่เริ่มจะถูกยกเลิก
+    """
+    started = time.perf_counter()
+    summary = {"queries": 0, "unique": 0, "succeeded": 0, "failed": 0, "invalid": 0}
+    groups = {}
+    for item in items:
+        summary["queries"] += 1
+        if item.error:
+            summary["invalid"] += 1
+            yield {"index": item.index, "id": item.ref, "status": "invalid", "error": item.error}
+            continue
+        groups.setdefault(batch_key(item), []).append(item)
+    summary["unique"] = len(groups)
+
+    user_id = user.pk if user is not None else None
+    keys = deque(groups)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="recommend-batch")
+    pending = {}
+
+    def submit_more():
+        while keys and len(pending) < concurrency:
+            key = keys.popleft()
+            pending[executor.submit(_run_query, groups[key][0], client, user_id)] = key
+
+    try:
+        # submit ทีละไม่เกิน concurrency งาน ที่เหลือรอในคิว (ไม่สร้าง future ค้างไว้ทั้ง batch)
+        submit_more()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                first, *duplicates = groups.pop(key)
+                data, cache_status = future.result()
+                summary["failed" if "error" in data else "succeeded"] += 1
+                yield _result_line(first, data, cache_status)
+                for item in duplicates:
+                    # รายการที่ซ้ำอาจมีงบต่ำกว่าภายใน budget bucket เดียวกัน: ใช้เฉพาะ build ที่อยู่ในงบของรายการนั้น
+                    shared = data if "error" in data else fit_to_budget(copy.deepcopy(data), item.query["budget"])
+                    if shared is None:
+                        groups[(*key, item.index)] = [item]
+                        keys.append((*key, item.index))
+                        summary["unique"] += 1
+                        continue
+                    summary["failed" if "error" in shared else "succeeded"] += 1
+                    yield _result_line(item, shared, cache_status, duplicate_of=first.index)
+                submit_more()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    summary["elapsed_ms"] = int((time.perf_counter() - started) * 1000)
+    yield {"summary": summary}
@@ -0,0 +1,126 @@
+# recommender_api/buffered_writer.py
+import atexit
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+from .models import LLMCallLog, RecommendationRequestLog
+from .stats import record_request_logs
+
+
+class BufferedWriter:
+    """
+    เก็บ model instance ไว้ในหน่วยความจำของ worker แล้วเขียนลงฐานข้อมูลทีละชุดด้วย bulk_create
+    - mode "sync": เขียนทันทีทุกครั้งที่ add (ทนทานที่สุด แต่มี DB round-trip ใน hot path)
+    - mode "buffered": flush เมื่อครบ batch_size หรือทุก flush_interval วินาที โดย thread เบื้องหลัง
+      และ flush ครั้งสุดท้ายตอน worker ปิดตัว (atexit) ถ้า worker ตายกะทันหัน entry ที่ค้างอยู่จะหายไป
+    ถ้าฐานข้อมูลมีปัญหา entry จะถูกเก็บไว้ลองใหม่ได้ไม่เกิน max_buffer รายการ (เก่าสุดถูกทิ้งก่อน)
+    on_flush (ถ้ามี) จะถูกเรียกด้วย list ของ instance ที่เขียนสำเร็จแล้ว เช่นเพื่ออัปเดต StatsRollup
+    """
+
+    def __init__(self, model, mode, batch_size, flush_interval, max_buffer, on_flush=None):
+        self.model = model
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.on_flush = on_flush
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher_pid = None
+        self._counters = {"written": 0, "dropped": 0, "flush_errors": 0}
+
+    def add(self, instance):
+        if self.mode == "sync":
+            instance.save()
+            with self._lock:
+                self._counters["written"] += 1
+            self._notify([instance])
+            return
+
+        with self._lock:
+            self._buffer.append(instance)
+            overflow = len(self._buffer) - self.max_buffer
+            if overflow > 0:
+                del self._buffer[:overflow]
+                self._counters["dropped"] += overflow
+            should_wake = len(self._buffer) >= self.batch_size
+        self._ensure_flusher()
+        if should_wake:
+            self._wakeup.set()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+            if not pending:
+                return 0
+            try:
+                self.model.objects.bulk_create(pending, batch_size=self.batch_size)
+            except Exception as e:
+                print(f"Warning: failed to flush {len(pending)} {self.model.__name__} rows: {e}")
+                with self._lock:
+                    self._buffer = (pending + self._buffer)[-self.max_buffer:]
+                    self._counters["flush_errors"] += 1
+                return 0
+            with self._lock:
+                self._counters["written"] += len(pending)
+            self._notify(pending)
+            return len(pending)
+
+    def _notify(self, written):
+        if self.on_flush is None:
+            return
+        try:
+            self.on_flush(written)
+        except Exception as e:
+            print(f"Warning: on_flush for {len(written)} {self.model.__name__} rows failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "buffered": len(self._buffer), "mode": self.mode}
+
+    def _ensure_flusher(self):
+        # gunicorn fork worker หลัง import: ต้องสร้าง thread ใหม่ในแต่ละ process
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._run_flusher, name=f"{self.model.__name__}-flusher", daemon=True).start()
+
+    def _run_flusher(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+    def _flush_at_exit(self):
+        if self.mode != "sync" and self._flusher_pid == os.getpid():
+            self.flush()
+
+
+def _build_writer(model, prefix, on_flush=None):
+    batch_size = getattr(settings, f"{prefix}_BATCH_SIZE")
+    writer = BufferedWriter(
+        model,
+        mode=getattr(settings, f"{prefix}_MODE"),
+        batch_size=batch_size,
+        flush_interval=getattr(settings, f"{prefix}_FLUSH_INTERVAL_SECONDS"),
+        max_buffer=batch_size * 20,
+        on_flush=on_flush,
+    )
+    atexit.register(writer._flush_at_exit)
+    return writer
+
+
+request_log_writer = _build_writer(RecommendationRequestLog, "REQUEST_LOG", on_flush=record_request_logs)
+llm_call_writer = _build_writer(LLMCallLog, "LLM_CALL_LOG")
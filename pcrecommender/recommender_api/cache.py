@@ -0,0 +1,232 @@
+# recommender_api/cache.py
+import copy
+import hashlib
+import json
+import math
+import threading
+from datetime import datetime, timedelta
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import RecommendationCacheEntry
+
+
+def _normalize_text(value):
+    return " ".join(str(value).split()).lower()
+
+
+def canonical_query(budget, desired_parts=None, preferred_games=None):
+    """
+    แปลง query ของผู้ใช้ให้อยู่ในรูปแบบมาตรฐาน เพื่อให้ query ที่ความหมายเหมือนกันได้ key เดียวกัน
+    - budget ถูกปัดลงเป็น bucket ตาม RECOMMENDATION_CACHE_BUDGET_BUCKET_THB (ปัดลงเพื่อไม่ให้ bucket มีงบที่สูงกว่างบของผู้ใช้)
+    - desired_parts เรียงตาม key และตัดค่าว่างทิ้ง
+    - preferred_games ตัดซ้ำและเรียงลำดับ
+    """
+    bucket_size = settings.RECOMMENDATION_CACHE_BUDGET_BUCKET_THB
+    budget_bucket = int(math.floor(float(budget) / bucket_size) * bucket_size) if bucket_size > 0 else float(budget)
+
+    parts = sorted(
+        (key, _normalize_text(value))
+        for key, value in (desired_parts or {}).items() if value
+    )
+    games = sorted({_normalize_text(game) for game in (preferred_games or []) if game})
+
+    return {
+        "budget_bucket": budget_bucket,
+        "desired_parts": [list(item) for item in parts],
+        "preferred_games": games,
+    }
+
+
+def canonical_query_key(budget, desired_parts=None, preferred_games=None):
+    query = canonical_query(budget, desired_parts, preferred_games)
+    encoded = json.dumps(query, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def build_within_budget(build, budget, tolerance=0.0):
+    try:
+        return float(build.get("total_price_estimate_thb")) <= float(budget) * (1 + tolerance)
+    except (TypeError, ValueError):
+        return False
+
+
+def fit_to_budget(data, budget, tolerance=0.0):
+    """
+    ผลที่ได้จาก cache ถูกสร้างด้วยงบของ request แรกใน bucket (อาจสูงกว่างบของผู้ใช้คนนี้)
+    ตัด build ที่เกินงบออกและแสดงงบของผู้ใช้ คืนค่า None ถ้าไม่เหลือ build ที่อยู่ในงบเลย
+    tolerance (สัดส่วนที่ยอมให้เกินงบ) ใช้เฉพาะกับผลจาก query ที่ใกล้เคียง ค่าเริ่มต้นคือห้ามเกินงบ
+    """
+    builds = [
+        build for build in data.get("recommendations") or []
+        if isinstance(build, dict) and build_within_budget(build, budget, tolerance)
+    ]
+    if not builds:
+        return None
+    data["recommendations"] = builds
+    data["budget_thb"] = float(budget)
+    return data
+
+
+def stale_retention_seconds():
+    # entry ที่หมดอายุแล้วยังถูกเก็บไว้ตอบแบบ stale-while-revalidate / stale-if-error
+    return max(settings.RECOMMENDATION_CACHE_STALE_WHILE_REVALIDATE_SECONDS, settings.RECOMMENDATION_CACHE_STALE_IF_ERROR_SECONDS)
+
+
+def response_age_seconds(data):
+    """
+    อายุของผลลัพธ์ (วินาทีนับจาก generated_at ที่ cache ใส่ไว้ตอน set) หรือ None ถ้าไม่ได้มาจาก cache
+    """
+    try:
+        generated_at = datetime.fromisoformat(data["generated_at"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return max(0, int((timezone.now() - generated_at).total_seconds()))
+
+
+def mark_stale(data, during_error=False):
+    """
+    ระบุใน response ว่าเป็นผลลัพธ์เก่าที่หมดอายุแล้ว (stale) และอายุเท่าไร
+    """
+    age = response_age_seconds(data) or 0
+    reason = "บริการ AI ขัดข้อง" if during_error else "กำลังสร้างคำแนะนำใหม่เบื้องหลัง"
+    data["stale"] = True
+    data["cache_age_seconds"] = age
+    data["analysis_notes"] = (
+        f"{data.get('analysis_notes', '')} (ข้อมูลจาก cache เมื่อประมาณ {age // 60} นาทีที่แล้ว "
+        f"ระหว่างที่{reason} ราคาอาจไม่เป็นปัจจุบัน)"
+    ).strip()
+    return data
+
+
+class RecommendationCache:
+    """
+    Cache สองชั้นสำหรับผลลัพธ์ get_specs_from_gemini
+    1. LRU + TTL ในหน่วยความจำของแต่ละ worker (เร็วที่สุด แต่ไม่แชร์กัน) เก็บ expires_at ของแถวไว้ด้วย
+       จึงไม่ตอบ entry ที่หมดอายุในตารางแล้วแม้ TTL ของหน่วยความจำยังไม่หมด
+    2. ตาราง RecommendationCacheEntry ใน Postgres (แชร์กันทุก worker และอยู่รอดหลัง restart)
+    entry ที่หมดอายุแล้วยังอยู่ในตารางอีก stale_retention_seconds() เพื่อให้ get_stale อ่านได้
+    """
+
+    COUNTER_NAMES = ("local_hits", "db_hits", "stale_hits", "misses", "stores")
+
+    def __init__(self, maxsize, local_ttl_seconds, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._local = TTLCache(maxsize=maxsize, ttl=local_ttl_seconds)
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.COUNTER_NAMES, 0)
+
+    def _incr(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key, count_miss=True):
+        now = timezone.now()
+        with self._lock:
+            cached = self._local.get(key)
+            if cached is not None and cached[0] <= now:
+                del self._local[key]
+                cached = None
+        if cached is not None:
+            self._incr("local_hits")
+            return copy.deepcopy(cached[1])
+
+        entry = RecommendationCacheEntry.objects.filter(
+            cache_key=key, expires_at__gt=now
+        ).only("response", "expires_at").first()
+        if entry is None:
+            if count_miss:
+                self._incr("misses")
+            return None
+
+        RecommendationCacheEntry.objects.filter(pk=entry.pk).update(hit_count=F("hit_count") + 1)
+        with self._lock:
+            self._local[key] = (entry.expires_at, entry.response)
+        self._incr("db_hits")
+        return copy.deepcopy(entry.response)
+
+    def get_stale(self, key, max_stale_seconds):
+        """
+        entry ที่หมดอายุไปแล้วไม่เกิน max_stale_seconds (อ่านจากตารางเท่านั้น) หรือ None
+        """
+        if max_stale_seconds <= 0:
+            return None
+        now = timezone.now()
+        entry = RecommendationCacheEntry.objects.filter(
+            cache_key=key, expires_at__lte=now, expires_at__gt=now - timedelta(seconds=max_stale_seconds)
+        ).only("response", "refreshed_at").first()
+        if entry is None:
+            return None
+        self._incr("stale_hits")
+        data = copy.deepcopy(entry.response)
+        data.setdefault("generated_at", entry.refreshed_at.isoformat())
+        return data
+
+    def set(self, key, query, response, ttl_seconds=None):
+        now = timezone.now()
+        stored = copy.deepcopy(response)
+        stored["generated_at"] = now.isoformat()
+        expires_at = now + timedelta(seconds=self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        RecommendationCacheEntry.objects.update_or_create(
+            cache_key=key,
+            defaults={
+                "query": query,
+                "response": stored,
+                "refreshed_at": now,
+                "expires_at": expires_at,
+            },
+        )
+        with self._lock:
+            self._local[key] = (expires_at, stored)
+        self._incr("stores")
+
+    def purge(self, key=None, expired_only=False):
+        """
+        ลบ entry ออกจากทั้งสองชั้น คืนค่าจำนวนแถวที่ถูกลบจากตาราง
+        (LRU ของ worker อื่นจะหมดอายุเองภายใน RECOMMENDATION_CACHE_LOCAL_TTL_SECONDS)
+        expired_only ลบเฉพาะ entry ที่หมดอายุนานเกินกว่าจะใช้ตอบแบบ stale ได้แล้ว
+        """
+        queryset = RecommendationCacheEntry.objects.all()
+        if key:
+            queryset = queryset.filter(cache_key=key)
+        if expired_only:
+            queryset = queryset.filter(expires_at__lte=timezone.now() - timedelta(seconds=stale_retention_seconds()))
+        deleted, _ = queryset.delete()
+
+        with self._lock:
+            if key:
+                self._local.pop(key, None)
+            elif not expired_only:
+                self._local.clear()
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            local_size = len(self._local)
+        lookups = counters["local_hits"] + counters["db_hits"] + counters["misses"]
+        # stale_hits ถูกนับใน misses ด้วย (อ่าน stale หลังจากหา entry ที่ยังไม่หมดอายุไม่เจอ)
+        hits = counters["local_hits"] + counters["db_hits"]
+        db_totals = RecommendationCacheEntry.objects.aggregate(total_db_hits=Sum("hit_count"))
+        return {
+            "worker": {
+                **counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else None,
+                "local_entries": local_size,
+            },
+            "shared": {
+                "entries": RecommendationCacheEntry.objects.count(),
+                "live_entries": RecommendationCacheEntry.objects.filter(expires_at__gt=timezone.now()).count(),
+                "total_db_hits": db_totals["total_db_hits"] or 0,
+            },
+        }
+
+
+recommendation_cache = RecommendationCache(
+    maxsize=settings.RECOMMENDATION_CACHE_LOCAL_MAX_ENTRIES,
+    local_ttl_seconds=settings.RECOMMENDATION_CACHE_LOCAL_TTL_SECONDS,
+    ttl_seconds=settings.RECOMMENDATION_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,276 @@
+# recommender_api/explanations.py
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .admission import Client
+from .cache import canonical_query
+from .models import BuildExplanation, SavedSpecification
+from .resilience import Deadline
+from .services import (
+    COMPONENT_KEYS_FOR_SUM, get_build_explanation_from_gemini, get_build_explanation_from_gemini_async,
+    recommendations_generated,
+)
+
+# flow แยกของ prefetch ใน admission queue น้ำหนักเท่าผู้ใช้ที่ไม่ได้ login จึงไม่แย่ง slot จากผู้ใช้ที่รออยู่
+PREFETCH_CLIENT = Client("prefetch", False, rate_limited=False)
+
+
+def _normalize_price(value):
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError):
+        return None
+
+
+def explanation_content_hash(selected_build, original_query):
+    """
+    hash ของเนื้อหาที่มีผลต่อคำอธิบาย: ชื่อ/ราคาของส่วนประกอบแต่ละชิ้น, งบของผู้ใช้ (เป็นบาทเต็ม
+    เพราะ prompt และคำอธิบายอ้างถึงตัวเลขงบจริง) และ canonical query (desired_parts, preferred_games)
+    ลำดับ key และช่องว่างในชื่อไม่มีผล
+    """
+    components = {}
+    for key in COMPONENT_KEYS_FOR_SUM:
+        component = selected_build.get(key)
+        if isinstance(component, dict):
+            components[key] = [" ".join(str(component.get("name", "")).split()).lower(), _normalize_price(component.get("price_thb"))]
+        elif component:
+            components[key] = [" ".join(str(component).split()).lower(), None]
+
+    try:
+        budget = float(original_query.get("budget") or 0)
+    except (TypeError, ValueError):
+        budget = 0
+    desired_parts = original_query.get("desired_parts") if isinstance(original_query.get("desired_parts"), dict) else {}
+    preferred_games = original_query.get("preferred_games") if isinstance(original_query.get("preferred_games"), list) else []
+
+    content = {
+        "components": components,
+        "budget": _normalize_price(budget),
+        "query": canonical_query(budget, desired_parts, preferred_games),
+    }
+    encoded = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def get_cached_explanation(content_hash):
+    entry = BuildExplanation.objects.filter(
+        content_hash=content_hash, expires_at__gt=timezone.now()
+    ).only("id", "explanation").first()
+    if entry is not None:
+        BuildExplanation.objects.filter(pk=entry.pk).update(hit_count=F("hit_count") + 1)
+    return entry
+
+
+def store_explanation(content_hash, explanation_text):
+    now = timezone.now()
+    entry, _ = BuildExplanation.objects.update_or_create(
+        content_hash=content_hash,
+        defaults={
+            "explanation": explanation_text,
+            "refreshed_at": now,
+            "expires_at": now + timedelta(seconds=settings.EXPLANATION_CACHE_TTL_SECONDS),
+        },
+    )
+    return entry
+
+
+def attach_to_saved_spec(saved_spec, entry):
+    if saved_spec is not None and entry is not None and saved_spec.explanation_id != entry.pk:
+        SavedSpecification.objects.filter(pk=saved_spec.pk).update(explanation=entry)
+
+
+class ExplanationPrefetcher:
+    """
+    สร้างคำอธิบายของ build ที่เพิ่งถูกแนะนำไว้ล่วงหน้าใน thread pool แล้วเก็บใน BuildExplanation
+    (UI มักเรียก explain-build ทันทีหลัง recommend-specs) explain-build ที่มาระหว่างที่กำลังสร้างจะรอผลของงานนั้น
+    แทนการเรียก Gemini ซ้ำ งานที่ค้างเกิน max_pending ถูกข้าม (explain-build จะสร้างเองตามปกติ)
+    """
+
+    COUNTER_NAMES = ("scheduled", "already_cached", "generated", "failed", "skipped", "joined")
+
+    def __init__(self, max_threads, max_pending):
+        self.max_threads = max_threads
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._executor = None
+        self._in_flight = {}
+        self._counters = dict.fromkeys(self.COUNTER_NAMES, 0)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="explain-prefetch")
+        return self._executor
+
+    def schedule(self, selected_build, original_query):
+        """
+        ไม่แตะ DB (เรียกจาก event loop ได้) การตรวจว่ามีคำอธิบายอยู่แล้วทำใน thread ของงาน
+        """
+        content_hash = explanation_content_hash(selected_build, original_query)
+        executor = self._get_executor()
+        with self._lock:
+            if content_hash in self._in_flight:
+                return False
+            if len(self._in_flight) >= self.max_pending:
+                self._counters["skipped"] += 1
+                return False
+            future = executor.submit(self._generate, content_hash, copy.deepcopy(selected_build), copy.deepcopy(original_query))
+            self._in_flight[content_hash] = future
+            self._counters["scheduled"] += 1
+        future.add_done_callback(lambda done: self._forget(content_hash, done))
+        return True
+
+    def _forget(self, content_hash, future):
+        with self._lock:
+            if self._in_flight.get(content_hash) is future:
+                del self._in_flight[content_hash]
+
+    def _generate(self, content_hash, selected_build, original_query):
+        """
+        คืนค่าข้อความคำอธิบาย หรือ None ถ้าสร้างไม่สำเร็จ
+        """
+        try:
+            entry = BuildExplanation.objects.filter(
+                content_hash=content_hash, expires_at__gt=timezone.now()
+            ).only("explanation").first()
+            if entry is not None:
+                self._count("already_cached")
+                return entry.explanation
+            explanation_data = get_build_explanation_from_gemini(
+                selected_build, original_query, Deadline.after(settings.LLM_REQUEST_DEADLINE_SECONDS), PREFETCH_CLIENT,
+            )
+            if "error" in explanation_data:
+                self._count("failed")
+                return None
+            store_explanation(content_hash, explanation_data["explanation"])
+            self._count("generated")
+            return explanation_data["explanation"]
+        except Exception as e:
+            print(f"Warning: explanation prefetch for {content_hash[:12]} failed: {e}")
+            self._count("failed")
+            return None
+        finally:
+            connection.close()
+
+    def _in_flight_future(self, content_hash):
+        with self._lock:
+            return self._in_flight.get(content_hash)
+
+    @staticmethod
+    def _join_timeout(deadline):
+        return (deadline or Deadline.after(settings.LLM_REQUEST_DEADLINE_SECONDS)).remaining()
+
+    def join(self, content_hash, deadline=None):
+        """
+        รอผลของงานที่กำลังสร้างคำอธิบายเดียวกันอยู่ (ไม่เกิน deadline) คืนค่าข้อความ หรือ None ถ้าไม่มีงาน/งานล้มเหลว
+        """
+        future = self._in_flight_future(content_hash)
+        if future is None:
+            return None
+        try:
+            explanation = future.result(timeout=self._join_timeout(deadline))
+        except FutureTimeoutError:
+            return None
+        if explanation is not None:
+            self._count("joined")
+        return explanation
+
+    async def join_async(self, content_hash, deadline=None):
+        future = self._in_flight_future(content_hash)
+        if future is None:
+            return None
+        try:
+            # shield: request ที่ถูกยกเลิกต้องไม่ยกเลิกงาน prefetch ที่ request อื่นอาจรออยู่
+            explanation = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self._join_timeout(deadline))
+        except asyncio.TimeoutError:
+            return None
+        if explanation is not None:
+            self._count("joined")
+        return explanation
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._in_flight)}
+
+
+explanation_prefetcher = ExplanationPrefetcher(
+    max_threads=settings.EXPLANATION_PREFETCH_MAX_THREADS,
+    max_pending=settings.EXPLANATION_PREFETCH_MAX_PENDING,
+)
+
+
+def prefetch_explanations(sender, recommendations, original_query, **kwargs):
+    if not settings.EXPLANATION_PREFETCH_ENABLED:
+        return
+    for build in recommendations[:settings.EXPLANATION_PREFETCH_MAX_BUILDS]:
+        if isinstance(build, dict):
+            explanation_prefetcher.schedule(build, original_query)
+
+
+recommendations_generated.connect(prefetch_explanations, dispatch_uid="explanation_prefetch")
+
+
+def get_build_explanation(selected_build, original_query, refresh=False, saved_spec=None, deadline=None, client=None):
+    """
+    ห่อ get_build_explanation_from_gemini ด้วย cache แบบ content-addressed ใน BuildExplanation
+    refresh=True จะเรียก Gemini ใหม่และเขียนทับ, saved_spec จะถูกผูกกับคำอธิบายที่ได้
+    คืนค่า (explanation_data, cache_status) โดย cache_status เป็น "HIT", "PREFETCH" (รอผลของ prefetch ที่กำลังสร้าง),
+    "MISS" หรือ "REFRESH"
+    """
+    content_hash = explanation_content_hash(selected_build, original_query)
+    if not refresh:
+        entry = get_cached_explanation(content_hash)
+        if entry is not None:
+            attach_to_saved_spec(saved_spec, entry)
+            return {"explanation": entry.explanation}, "HIT"
+        explanation = explanation_prefetcher.join(content_hash, deadline)
+        if explanation is not None:
+            attach_to_saved_spec(saved_spec, get_cached_explanation(content_hash))
+            return {"explanation": explanation}, "PREFETCH"
+
+    explanation_data = get_build_explanation_from_gemini(selected_build, original_query, deadline, client)
+    if "error" not in explanation_data:
+        entry = store_explanation(content_hash, explanation_data["explanation"])
+        attach_to_saved_spec(saved_spec, entry)
+    return explanation_data, "REFRESH" if refresh else "MISS"
+
+
+async def get_build_explanation_async(selected_build, original_query, refresh=False, saved_spec=None, deadline=None, client=None):
+    content_hash = explanation_content_hash(selected_build, original_query)
+    if not refresh:
+        entry = await sync_to_async(get_cached_explanation)(content_hash)
+        if entry is not None:
+            await sync_to_async(attach_to_saved_spec)(saved_spec, entry)
+            return {"explanation": entry.explanation}, "HIT"
+        explanation = await explanation_prefetcher.join_async(content_hash, deadline)
+        if explanation is not None:
+            entry = await sync_to_async(get_cached_explanation)(content_hash)
+            await sync_to_async(attach_to_saved_spec)(saved_spec, entry)
+            return {"explanation": explanation}, "PREFETCH"
+
+    explanation_data = await get_build_explanation_from_gemini_async(selected_build, original_query, deadline, client)
+    if "error" not in explanation_data:
+        entry = await sync_to_async(store_explanation)(content_hash, explanation_data["explanation"])
+        await sync_to_async(attach_to_saved_spec)(saved_spec, entry)
+    return explanation_data, "REFRESH" if refresh else "MISS"
+
+
+def purge_expired_explanations():
+    deleted, _ = BuildExplanation.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,166 @@
+# recommender_api/fanout.py
+"""
+แยก prompt แบบงบอย่างเดียว ("อย่างน้อย 3 แบบ") เป็น prompt ละหนึ่ง build ตาม tier แล้วเรียก LLM พร้อมกัน
+latency ของ LLM ขึ้นกับความยาวของ output เป็นหลัก request จึงช้าเท่ากับ call ที่ช้าที่สุดหนึ่ง call
+แทนการรอให้ LLM เขียนสาม build ต่อกันในคำตอบเดียว
+
+- รอทุก tier ไม่เกิน RECOMMENDATION_FANOUT_WAIT_SECONDS แล้วตอบด้วย tier ที่เสร็จแล้ว
+  ถ้ายังไม่มี tier ไหนได้ build เลยจะรอต่อจนได้หนึ่ง tier หรือหมด deadline ของ request
+- build ที่ซ้ำกัน (cpu และ gpu รุ่นเดียวกัน) ถูกรวมเหลือชุดแรกตามลำดับ tier
+"""
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connection
+
+from .resilience import Deadline
+
+# tier -> คำสั่งเพิ่มเติมใน prompt ของ tier นั้น
+BUILD_TIERS = {
+    "value": "จัดสเปคแบบคุ้มค่าที่สุด (value) ใช้งบประมาณราว 80-90% ของงบ โดยยังเล่นเกมและใช้งานทั่วไปได้ดี",
+    "balanced": "จัดสเปคแบบสมดุล (balanced) ระหว่างราคาและประสิทธิภาพ ใช้งบใกล้เคียงงบประมาณเต็มจำนวน",
+    "performance": "จัดสเปคที่ประสิทธิภาพสูงสุด (performance) ภายในงบประมาณ (ห้ามเกินงบ) โดยให้ความสำคัญกับ GPU และ CPU",
+}
+
+
+def fanout_tiers():
+    return [tier for tier in settings.RECOMMENDATION_FANOUT_TIERS if tier in BUILD_TIERS]
+
+
+def use_fanout(desired_parts, preferred_games):
+    """
+    fan-out ใช้เฉพาะ prompt แบบงบอย่างเดียว (prompt ที่ระบุชิ้นส่วน/เกมขอแค่ 1-2 build อยู่แล้ว)
+    """
+    is_budget_only = not (desired_parts and any(desired_parts.values())) and not preferred_games
+    return settings.RECOMMENDATION_FANOUT_ENABLED and is_budget_only and bool(fanout_tiers())
+
+
+def _component_name(build, key):
+    component = build.get(key)
+    name = component.get("name", "") if isinstance(component, dict) else component or ""
+    return " ".join(str(name).split()).lower()
+
+
+def build_identity(build):
+    return _component_name(build, "cpu"), _component_name(build, "gpu")
+
+
+def merge_tier_results(results, tiers):
+    """
+    results คือ {tier: response ของ build_specs_response} ของ tier ที่เสร็จแล้ว
+    คืนค่า (builds ตามลำดับ tier โดยตัดชุดซ้ำ, tier ที่ได้ build, จำนวน build ที่ซ้ำ)
+    """
+    builds = []
+    seen = set()
+    completed = []
+    duplicates = 0
+    for tier in tiers:
+        result = results.get(tier)
+        if not result or "error" in result or not result.get("recommendations"):
+            continue
+        completed.append(tier)
+        for build in result["recommendations"]:
+            identity = build_identity(build)
+            if identity in seen:
+                duplicates += 1
+                continue
+            seen.add(identity)
+            builds.append(build)
+    return builds, completed, duplicates
+
+
+def _has_builds(results):
+    return any("error" not in result and result.get("recommendations") for result in results.values())
+
+
+class FanOut:
+    """
+    เรียก call_tier(tier) ของทุก tier พร้อมกันใน thread pool (sync) หรือเป็น task (async)
+    tier ที่ไม่เสร็จทันทำงานต่อใน thread จนจบ (ยกเลิก thread ไม่ได้) ส่วนใน async จะถูกยกเลิก
+    """
+
+    COUNTER_NAMES = ("requests", "complete", "partial", "failed", "late_tiers", "duplicate_builds")
+
+    def __init__(self, max_threads):
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        self._executor = None
+        self._counters = dict.fromkeys(self.COUNTER_NAMES, 0)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="llm-fanout")
+        return self._executor
+
+    @staticmethod
+    def _wait_deadlines(deadline):
+        deadline = deadline or Deadline.after(settings.LLM_REQUEST_DEADLINE_SECONDS)
+        soft_deadline = Deadline(min(deadline.expires_at, Deadline.after(settings.RECOMMENDATION_FANOUT_WAIT_SECONDS).expires_at))
+        return soft_deadline, deadline
+
+    @staticmethod
+    def _run_in_thread(call_tier, tier):
+        try:
+            return call_tier(tier)
+        finally:
+            connection.close()
+
+    def _finish(self, results, tiers, late):
+        builds, completed, duplicates = merge_tier_results(results, tiers)
+        self._count("requests")
+        self._count("late_tiers", late)
+        self._count("duplicate_builds", duplicates)
+        self._count("failed" if not builds else "complete" if len(completed) == len(tiers) else "partial")
+        return builds, completed
+
+    def run(self, call_tier, tiers, deadline=None):
+        """
+        คืนค่า (results ของ tier ที่เสร็จทัน, builds ที่รวมแล้ว, tier ที่ได้ build)
+        """
+        soft_deadline, deadline = self._wait_deadlines(deadline)
+        executor = self._get_executor()
+        futures = {executor.submit(self._run_in_thread, call_tier, tier): tier for tier in tiers}
+        results = {}
+        pending = set(futures)
+        while pending:
+            limit = soft_deadline if _has_builds(results) else deadline
+            done, pending = wait(pending, timeout=limit.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                results[futures[future]] = future.result()
+        return (results, *self._finish(results, tiers, len(pending)))
+
+    async def run_async(self, call_tier, tiers, deadline=None):
+        soft_deadline, deadline = self._wait_deadlines(deadline)
+        tasks = {asyncio.ensure_future(call_tier(tier)): tier for tier in tiers}
+        results = {}
+        pending = set(tasks)
+        try:
+            while pending:
+                limit = soft_deadline if _has_builds(results) else deadline
+                done, pending = await asyncio.wait(pending, timeout=limit.remaining(), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    results[tasks[task]] = task.result()
+        finally:
+            # ยกเลิก tier ที่ไม่ทันเพื่อคืน admission slot ทันที
+            for task in pending:
+                task.cancel()
+        return (results, *self._finish(results, tiers, len(pending)))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+specs_fanout = FanOut(max_threads=settings.RECOMMENDATION_FANOUT_MAX_THREADS)
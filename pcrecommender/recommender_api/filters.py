@@ -0,0 +1,27 @@
+# recommender_api/filters.py
+import django_filters
+
+from .models import SavedSpecification
+
+# field ที่ ?ordering= ใช้ได้ (ทุกตัวมี index) เช่น ?ordering=total_price_thb หรือ ?ordering=-budget_thb
+SAVED_SPEC_ORDERING_FIELDS = ['saved_at', 'total_price_thb', 'budget_thb', 'build_name', 'cpu_name', 'gpu_name']
+
+
+class SavedSpecificationFilter(django_filters.FilterSet):
+    """
+    filter ฝั่งฐานข้อมูลบนคอลัมน์ที่ดึงออกมาจาก build_details
+    เช่น ?min_price=20000&max_price=40000&gpu=4060
+    """
+    min_price = django_filters.NumberFilter(field_name='total_price_thb', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='total_price_thb', lookup_expr='lte')
+    min_budget = django_filters.NumberFilter(field_name='budget_thb', lookup_expr='gte')
+    max_budget = django_filters.NumberFilter(field_name='budget_thb', lookup_expr='lte')
+    cpu = django_filters.CharFilter(field_name='cpu_name', lookup_expr='icontains')
+    gpu = django_filters.CharFilter(field_name='gpu_name', lookup_expr='icontains')
+    build_name = django_filters.CharFilter(field_name='build_name', lookup_expr='icontains')
+    saved_after = django_filters.IsoDateTimeFilter(field_name='saved_at', lookup_expr='gte')
+    saved_before = django_filters.IsoDateTimeFilter(field_name='saved_at', lookup_expr='lt')
+
+    class Meta:
+        model = SavedSpecification
+        fields = ['user']
@@ -0,0 +1,210 @@
+# recommender_api/jobs.py
+"""
+recommend-specs แบบ job (ไม่ถือ HTTP connection ระหว่างรอ Gemini)
+
+view บันทึก RecommendationJob สถานะ queued แล้วตอบ 202 + job id ทันที
+worker (manage.py run_recommendation_workers) ดึงงานด้วย SELECT ... FOR UPDATE SKIP LOCKED
+แล้วเรียก get_recommendations_from_source (ผ่าน cache, single-flight และ admission slot เหมือน request ปกติ
+token bucket ของผู้ส่งถูกหักตอน worker จะเรียก LLM)
+client ถามสถานะที่ recommend-specs/jobs/<id>/ (long-poll ได้ด้วย ?wait=<วินาที>)
+
+งานที่ worker ตายระหว่างทำจะถูกคืนเข้าคิวเมื่อ lease หมดอายุ (ไม่เกิน RECOMMENDATION_JOB_MAX_ATTEMPTS ครั้ง)
+ฐานข้อมูลที่ไม่รองรับ SKIP LOCKED (SQLite) ใช้ UPDATE แบบมีเงื่อนไขกันไม่ให้สอง worker ได้งานเดียวกัน
+"""
+import asyncio
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .admission import Client
+from .buffered_writer import request_log_writer
+from .models import RecommendationJob, RecommendationRequestLog
+from .resilience import Deadline
+from .services import get_recommendations_from_source
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+
+def enqueue_recommendation_job(user, client, user_prompt_input, source):
+    return RecommendationJob.objects.create(
+        user=user,
+        client_key=client.key,
+        rate_limited=client.rate_limited,
+        source=source,
+        request_payload=user_prompt_input,
+    )
+
+
+def get_job_for(job_id, user):
+    """
+    job ของผู้ใช้ที่ login ดูได้เฉพาะเจ้าของ job ของผู้ใช้ที่ไม่ได้ login ดูได้ด้วย job id (UUID สุ่ม)
+    """
+    try:
+        job = RecommendationJob.objects.filter(pk=job_id).first()
+    except (TypeError, ValueError):
+        return None
+    if job is None or (job.user_id is not None and (user is None or job.user_id != user.pk)):
+        return None
+    return job
+
+
+def wait_for_job(job, wait_seconds):
+    """
+    long-poll: รอจน job เสร็จหรือครบ wait_seconds (ไม่เกิน RECOMMENDATION_JOB_MAX_WAIT_SECONDS) แล้วคืนค่า job ล่าสุด
+    """
+    give_up_at = time.monotonic() + min(wait_seconds, settings.RECOMMENDATION_JOB_MAX_WAIT_SECONDS)
+    while job.status not in FINISHED_STATUSES and time.monotonic() < give_up_at:
+        time.sleep(min(settings.RECOMMENDATION_JOB_POLL_INTERVAL_SECONDS, max(0.0, give_up_at - time.monotonic())))
+        if RecommendationJob.objects.filter(pk=job.pk, status__in=FINISHED_STATUSES).exists():
+            job.refresh_from_db()
+    return job
+
+
+async def wait_for_job_async(job, wait_seconds):
+    give_up_at = time.monotonic() + min(wait_seconds, settings.RECOMMENDATION_JOB_MAX_WAIT_SECONDS)
+    finished = RecommendationJob.objects.filter(pk=job.pk, status__in=FINISHED_STATUSES)
+    while job.status not in FINISHED_STATUSES and time.monotonic() < give_up_at:
+        await asyncio.sleep(min(settings.RECOMMENDATION_JOB_POLL_INTERVAL_SECONDS, max(0.0, give_up_at - time.monotonic())))
+        if await finished.aexists():
+            await sync_to_async(job.refresh_from_db)()
+    return job
+
+
+def job_payload(job):
+    payload = {
+        "job_id": str(job.id),
+        "status": job.status,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "attempts": job.attempts,
+        "not_before": job.not_before.isoformat() if job.status == "queued" and job.not_before else None,
+    }
+    if job.status in FINISHED_STATUSES:
+        payload["cache_status"] = job.cache_status
+        payload["result"] = job.result
+    return payload
+
+
+# --- worker side ---
+
+def requeue_expired_jobs():
+    """
+    คืนงาน running ที่ lease หมดอายุ (worker ตายหรือค้าง) เข้าคิว ถ้าลองครบจำนวนครั้งแล้วให้ failed
+    """
+    now = timezone.now()
+    expired = RecommendationJob.objects.filter(status="running", lease_expires_at__lt=now)
+    failed = expired.filter(attempts__gte=settings.RECOMMENDATION_JOB_MAX_ATTEMPTS).update(
+        status="failed", finished_at=now, lease_expires_at=None,
+        result={"error": "งานถูกยกเลิกเพราะ worker หยุดทำงานระหว่างประมวลผลหลายครั้ง กรุณาลองใหม่อีกครั้ง"},
+    )
+    requeued = expired.update(status="queued", worker="", lease_expires_at=None)
+    return requeued, failed
+
+
+def claim_job(worker_name):
+    """
+    ดึงงาน queued ที่เก่าที่สุดหนึ่งงาน (ที่ไม่ได้ถูกเลื่อนไว้ด้วย not_before) แล้วเปลี่ยนเป็น running คืนค่า None ถ้าไม่มีงาน
+    PostgreSQL: แถวที่ worker อื่นกำลัง lock อยู่ถูกข้ามไป (SKIP LOCKED) จึงไม่ต้องรอกัน
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            RecommendationJob.objects.select_for_update(skip_locked=True)
+            .filter(status="queued").filter(Q(not_before__isnull=True) | Q(not_before__lte=now))
+            .order_by("created_at").first()
+        )
+        if job is None:
+            return None
+        claimed = RecommendationJob.objects.filter(pk=job.pk, status="queued").update(
+            status="running",
+            worker=worker_name,
+            attempts=F("attempts") + 1,
+            started_at=now,
+            lease_expires_at=now + timedelta(seconds=settings.RECOMMENDATION_JOB_LEASE_SECONDS),
+        )
+    if not claimed:
+        return None
+    job.refresh_from_db()
+    return job
+
+
+def retry_delay_seconds(job, retry_after=None):
+    """
+    เวลาที่งานที่ถูก admission control ปฏิเสธต้องรอก่อนถูกดึงใหม่: exponential ตามจำนวนครั้งที่ลอง ไม่น้อยกว่า Retry-After
+    (ไม่เช่นนั้นงานเก่าสุดจะถูกดึงกลับทันทีและวนชนคิวเต็มซ้ำจนหมด attempts)
+    """
+    backoff = settings.RECOMMENDATION_JOB_RETRY_BACKOFF_SECONDS * (2 ** max(0, job.attempts - 1))
+    return max(retry_after or 0.0, min(settings.RECOMMENDATION_JOB_RETRY_BACKOFF_CAP_SECONDS, backoff))
+
+
+def _finish_job(job, **fields):
+    # เงื่อนไข worker กันไม่ให้ worker ที่ lease หมดไปแล้วเขียนทับผลของ worker ที่ดึงงานต่อ
+    return RecommendationJob.objects.filter(pk=job.pk, status="running", worker=job.worker).update(**fields)
+
+
+def run_job(job):
+    """
+    สร้างคำแนะนำของ job แล้วบันทึกผล คืนค่าสถานะใหม่ ("succeeded", "failed" หรือ "queued" ถ้าถูก admission control
+    ปฏิเสธและยังลองใหม่ได้)
+    """
+    payload = job.request_payload
+    started = time.perf_counter()
+    try:
+        recommendations_data, cache_status = get_recommendations_from_source(
+            budget=payload["budget"],
+            currency=payload.get("currency", "THB"),
+            desired_parts=payload.get("desired_parts") or {},
+            preferred_games=payload.get("preferred_games") or [],
+            source=job.source,
+            deadline=Deadline.after(settings.RECOMMENDATION_JOB_DEADLINE_SECONDS),
+            client=Client(job.client_key, job.user_id is not None, job.rate_limited),
+        )
+    except Exception as e:
+        print(f"Error running recommendation job {job.id}: {e}")
+        recommendations_data, cache_status = {"error": f"เกิดข้อผิดพลาดในการประมวลผลคำขอ: {e}"}, ""
+    latency_ms = int((time.perf_counter() - started) * 1000)
+
+    if recommendations_data.get("overloaded") and job.attempts < settings.RECOMMENDATION_JOB_MAX_ATTEMPTS:
+        delay = retry_delay_seconds(job, recommendations_data.get("retry_after"))
+        _finish_job(job, status="queued", worker="", lease_expires_at=None, not_before=timezone.now() + timedelta(seconds=delay))
+        return "queued"
+
+    if "recommendations" in recommendations_data:
+        recommendations_data["source_prompt_for_saving"] = payload
+    new_status = "failed" if "error" in recommendations_data else "succeeded"
+    _finish_job(
+        job, status=new_status, result=recommendations_data, cache_status=cache_status,
+        finished_at=timezone.now(), lease_expires_at=None,
+    )
+    # เวลาของ log คือเวลาที่ client ส่ง request (ตอนสร้าง job) ไม่ใช่เวลาที่ worker ทำเสร็จหรือ writer flush
+    request_log_writer.add(RecommendationRequestLog(
+        timestamp=job.created_at,
+        user_id=job.user_id,
+        request_payload=payload,
+        outcome="error" if new_status == "failed" else "success",
+        cache_status=cache_status,
+        latency_ms=latency_ms,
+    ))
+    return new_status
+
+
+def purge_finished_jobs(retention_seconds=None):
+    retention_seconds = settings.RECOMMENDATION_JOB_RETENTION_SECONDS if retention_seconds is None else retention_seconds
+    cutoff = timezone.now() - timedelta(seconds=retention_seconds)
+    deleted, _ = RecommendationJob.objects.filter(status__in=FINISHED_STATUSES, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def job_queue_stats():
+    counts = dict(RecommendationJob.objects.values_list("status").annotate(count=Count("id")).order_by())
+    oldest = RecommendationJob.objects.filter(status="queued").order_by("created_at").values_list("created_at", flat=True).first()
+    return {
+        **{name: counts.get(name, 0) for name, _ in RecommendationJob.STATUS_CHOICES},
+        "oldest_queued_seconds": (timezone.now() - oldest).total_seconds() if oldest else None,
+    }
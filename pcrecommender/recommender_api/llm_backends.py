@@ -0,0 +1,735 @@
+# recommender_api/llm_backends.py
+"""
+ชั้น backend ของ LLM เลือกด้วย settings.LLM_BACKEND:
+- "gemini": เรียก Google Gemini จริง (ค่าเริ่มต้น)
+- "replay": ตอบจาก cassette ที่บันทึกไว้ (ไฟล์ JSON ใน LLM_CASSETTE_DIR ตั้งชื่อตาม sha256 ของ prompt)
+- "record": เรียก Gemini แล้วบันทึก cassette ไว้ใช้กับ "replay"
+- "stub": สร้างคำตอบสังเคราะห์ พร้อม latency แบบ log-normal และอัตราการล้มเหลวที่ตั้งค่าได้
+ทั้ง replay และ stub ไม่ต้องใช้ API key หรือ network จึงใช้ทำ load test / benchmark ได้
+
+get_llm_backend() คืน backend ที่ห่อด้วย ResilientBackend เสมอ: deadline ต่อ request, timeout ต่อ attempt,
+retry แบบ jitter, circuit breaker ที่ใช้ร่วมกันทั้ง worker และ hedged request (ถ้าเปิด LLM_HEDGE_ENABLED)
+
+response ที่ได้มีหน้าตาเหมือนของ google-generativeai: .text, .usage_metadata, .prompt_feedback
+และ generate_stream คืนค่า object ที่ iterate ได้เป็น chunk ที่มี .text
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from .admission import llm_slots
+from .optimizer import CATEGORY_KEYS
+from .resilience import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, LatencyTracker, backoff_delay
+
+
+class LLMBackendError(Exception):
+    pass
+
+
+class CassetteNotFound(LLMBackendError):
+    pass
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def _sleep_within(delay, timeout):
+    # backend สังเคราะห์จำลอง timeout แบบเดียวกับ request_options={"timeout": ...} ของ Gemini
+    if timeout is not None and delay > timeout:
+        time.sleep(timeout)
+        raise DeadlineExceeded(f"LLM call timed out after {timeout:.2f}s")
+    time.sleep(delay)
+
+
+async def _async_sleep_within(delay, timeout):
+    if timeout is not None and delay > timeout:
+        await asyncio.sleep(timeout)
+        raise DeadlineExceeded(f"LLM call timed out after {timeout:.2f}s")
+    await asyncio.sleep(delay)
+
+
+def _usage(prompt_tokens, response_tokens):
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=response_tokens,
+        total_token_count=(prompt_tokens or 0) + (response_tokens or 0),
+    )
+
+
+class SyntheticResponse:
+    """
+    response ที่ไม่ได้มาจาก Gemini (replay/stub) ใช้ได้ทั้งแบบปกติและแบบ stream (iterate เป็น chunk)
+    """
+
+    def __init__(self, text, usage_metadata=None, chunk_size=200, chunk_delay=0.0):
+        self.text = text
+        self.usage_metadata = usage_metadata
+        self.prompt_feedback = None
+        self._chunk_size = chunk_size
+        self._chunk_delay = chunk_delay
+
+    def __iter__(self):
+        for start in range(0, len(self.text), self._chunk_size):
+            if self._chunk_delay:
+                time.sleep(self._chunk_delay)
+            yield SimpleNamespace(text=self.text[start:start + self._chunk_size])
+
+
+class LLMBackend:
+    name = "base"
+    model_name = ""
+
+    def is_configured(self):
+        return True
+
+    def generate(self, prompt, operation, timeout=None):
+        raise NotImplementedError
+
+    async def generate_async(self, prompt, operation, timeout=None):
+        raise NotImplementedError
+
+    def generate_stream(self, prompt, operation, timeout=None):
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, api_key, model_name):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def is_configured(self):
+        return bool(self.api_key)
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(model_name=self.model_name)
+        return self._model
+
+    @staticmethod
+    def _generation_config():
+        from google.generativeai.types import GenerationConfig
+        return GenerationConfig(response_mime_type="application/json")
+
+    @staticmethod
+    def _request_options(timeout):
+        return {"timeout": timeout} if timeout else None
+
+    def generate(self, prompt, operation, timeout=None):
+        return self._get_model().generate_content(
+            prompt, generation_config=self._generation_config(), request_options=self._request_options(timeout)
+        )
+
+    async def generate_async(self, prompt, operation, timeout=None):
+        return await self._get_model().generate_content_async(
+            prompt, generation_config=self._generation_config(), request_options=self._request_options(timeout)
+        )
+
+    def generate_stream(self, prompt, operation, timeout=None):
+        return self._get_model().generate_content(
+            prompt, generation_config=self._generation_config(), stream=True,
+            request_options=self._request_options(timeout),
+        )
+
+
+class ReplayBackend(LLMBackend):
+    """
+    cassette: {"operation": ..., "text": ..., "prompt_tokens": ..., "response_tokens": ..., "latency_ms": ...}
+    ถ้า simulate_latency=True จะหน่วงเวลาเท่ากับ latency_ms ที่บันทึกไว้
+    """
+    name = "replay"
+
+    def __init__(self, cassette_dir, simulate_latency=False):
+        self.cassette_dir = cassette_dir
+        self.simulate_latency = simulate_latency
+        self.model_name = "replay"
+
+    def _load(self, prompt):
+        path = os.path.join(self.cassette_dir, f"{prompt_hash(prompt)}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise CassetteNotFound(f"No cassette for prompt {prompt_hash(prompt)[:12]} in {self.cassette_dir}")
+
+    def _response(self, cassette):
+        return SyntheticResponse(
+            cassette["text"], _usage(cassette.get("prompt_tokens"), cassette.get("response_tokens"))
+        )
+
+    def _delay_seconds(self, cassette):
+        return (cassette.get("latency_ms") or 0) / 1000 if self.simulate_latency else 0
+
+    def generate(self, prompt, operation, timeout=None):
+        cassette = self._load(prompt)
+        _sleep_within(self._delay_seconds(cassette), timeout)
+        return self._response(cassette)
+
+    async def generate_async(self, prompt, operation, timeout=None):
+        cassette = self._load(prompt)
+        await _async_sleep_within(self._delay_seconds(cassette), timeout)
+        return self._response(cassette)
+
+    def generate_stream(self, prompt, operation, timeout=None):
+        cassette = self._load(prompt)
+        response = self._response(cassette)
+        chunks = max(1, len(response.text) // response._chunk_size)
+        response._chunk_delay = self._delay_seconds(cassette) / chunks
+        return response
+
+
+class RecordingBackend(LLMBackend):
+    """
+    เรียก backend จริงแล้วเขียน cassette ให้ ReplayBackend (ไม่รองรับ stream เพราะต้องรอข้อความครบ)
+    """
+    name = "record"
+
+    def __init__(self, inner, cassette_dir):
+        self.inner = inner
+        self.cassette_dir = cassette_dir
+        self.model_name = inner.model_name
+
+    def is_configured(self):
+        return self.inner.is_configured()
+
+    def _save(self, prompt, operation, response, started):
+        usage = getattr(response, "usage_metadata", None)
+        cassette = {
+            "operation": operation,
+            "text": response.text,
+            "prompt_tokens": getattr(usage, "prompt_token_count", None),
+            "response_tokens": getattr(usage, "candidates_token_count", None),
+            "latency_ms": int((time.monotonic() - started) * 1000),
+        }
+        os.makedirs(self.cassette_dir, exist_ok=True)
+        with open(os.path.join(self.cassette_dir, f"{prompt_hash(prompt)}.json"), "w", encoding="utf-8") as f:
+            json.dump(cassette, f, ensure_ascii=False, indent=2)
+
+    def generate(self, prompt, operation, timeout=None):
+        started = time.monotonic()
+        response = self.inner.generate(prompt, operation, timeout=timeout)
+        self._save(prompt, operation, response, started)
+        return response
+
+    async def generate_async(self, prompt, operation, timeout=None):
+        started = time.monotonic()
+        response = await self.inner.generate_async(prompt, operation, timeout=timeout)
+        self._save(prompt, operation, response, started)
+        return response
+
+    def generate_stream(self, prompt, operation, timeout=None):
+        return self.generate(prompt, operation, timeout=timeout)
+
+
+class StubBackend(LLMBackend):
+    """
+    คำตอบสังเคราะห์ที่ parse ได้จริง: 3 build ที่ราคารวมใกล้งบใน prompt (build เดียวตาม tier สำหรับ "specs_tier")
+    หรือคำอธิบายสั้นๆ
+    latency สุ่มแบบ log-normal (median, sigma) และล้มเหลวตาม failure_rate / ตอบ JSON เสียตาม malformed_rate
+    """
+    name = "stub"
+    model_name = "stub"
+    BUDGET_PATTERN = re.compile(r"งบประมาณ\s*([\d,]+(?:\.\d+)?)")
+    PRICE_SHARES = {
+        "cpu": 0.20, "gpu": 0.35, "ram": 0.08, "storage": 0.08,
+        "motherboard": 0.12, "psu": 0.07, "case": 0.05, "cooler": 0.05,
+    }
+    BUILD_VARIANTS = [("ชุดสมดุล (Stub)", 0.95), ("ชุดประหยัด (Stub)", 0.80), ("ชุดเน้นการ์ดจอ (Stub)", 1.0)]
+    # คำใน prompt ของแต่ละ tier (fanout.BUILD_TIERS) -> index ใน BUILD_VARIANTS
+    TIER_MARKERS = {"(balanced)": 0, "(value)": 1, "(performance)": 2}
+
+    def __init__(self, latency_median_ms, latency_sigma, failure_rate, malformed_rate, seed=None):
+        self.latency_median_ms = latency_median_ms
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            delay = self._random.lognormvariate(0, self.latency_sigma) * self.latency_median_ms / 1000 if self.latency_median_ms > 0 else 0
+            fails = self._random.random() < self.failure_rate
+            malformed = self._random.random() < self.malformed_rate
+        return delay, fails, malformed
+
+    def _budget_from(self, prompt):
+        match = self.BUDGET_PATTERN.search(prompt)
+        try:
+            return float(match.group(1).replace(",", "")) if match else 30000.0
+        except ValueError:
+            return 30000.0
+
+    def _text(self, prompt, operation, malformed):
+        if operation == "explanation":
+            text = json.dumps({"explanation": "คำอธิบายสังเคราะห์จาก stub backend สำหรับทดสอบระบบ"}, ensure_ascii=False)
+        else:
+            budget = self._budget_from(prompt)
+            variants = self.BUILD_VARIANTS
+            if operation == "specs_tier":
+                index = next((index for marker, index in self.TIER_MARKERS.items() if marker in prompt), 0)
+                variants = variants[index:index + 1]
+            builds = []
+            for build_name, ratio in variants:
+                build = {"build_name": build_name}
+                for key in CATEGORY_KEYS:
+                    build[key] = {"name": f"Stub {key.upper()} {int(budget * ratio)}", "price_thb": round(budget * ratio * self.PRICE_SHARES[key])}
+                build["total_price_estimate_thb"] = sum(build[key]["price_thb"] for key in CATEGORY_KEYS)
+                build["notes"] = "build สังเคราะห์จาก stub backend"
+                builds.append(build)
+            text = json.dumps(builds, ensure_ascii=False)
+        return text[: len(text) // 2] if malformed else text
+
+    def _response(self, prompt, operation, fails, malformed, chunk_delay=0.0):
+        if fails:
+            raise LLMBackendError("Synthetic failure from stub LLM backend")
+        text = self._text(prompt, operation, malformed)
+        return SyntheticResponse(text, _usage(len(prompt) // 4, len(text) // 4), chunk_delay=chunk_delay)
+
+    def generate(self, prompt, operation, timeout=None):
+        delay, fails, malformed = self._draw()
+        _sleep_within(delay, timeout)
+        return self._response(prompt, operation, fails, malformed)
+
+    async def generate_async(self, prompt, operation, timeout=None):
+        delay, fails, malformed = self._draw()
+        await _async_sleep_within(delay, timeout)
+        return self._response(prompt, operation, fails, malformed)
+
+    def generate_stream(self, prompt, operation, timeout=None):
+        delay, fails, malformed = self._draw()
+        _sleep_within(delay / 4, timeout)  # time to first chunk ส่วนที่เหลือกระจายไปตาม chunk
+        response = self._response(prompt, operation, fails, malformed)
+        chunks = max(1, len(response.text) // response._chunk_size)
+        response._chunk_delay = delay * 3 / 4 / chunks
+        return response
+
+
+def is_retryable(error):
+    """
+    error ที่น่าจะเป็นปัญหาชั่วคราวของบริการ (timeout, 429, 5xx, network) ซึ่งควร retry และนับเป็นความล้มเหลวของ circuit
+    error อื่น (เช่น prompt ไม่ถูกต้อง, cassette ไม่มี) แสดงว่าบริการยังตอบได้ จึงไม่ retry
+    """
+    if isinstance(error, CassetteNotFound):
+        return False
+    if isinstance(error, (DeadlineExceeded, LLMBackendError, TimeoutError, ConnectionError)):
+        return True
+    try:
+        from google.api_core import exceptions as google_exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (
+        google_exceptions.TooManyRequests, google_exceptions.InternalServerError,
+        google_exceptions.ServiceUnavailable, google_exceptions.GatewayTimeout, google_exceptions.DeadlineExceeded,
+    ))
+
+
+class _MonitoredStream:
+    """
+    ห่อ response แบบ stream เพื่อรายงานผลให้ circuit breaker เมื่อ iterate จบหรือเกิด error ระหว่างทาง
+    attribute อื่น (usage_metadata, prompt_feedback) อ่านจาก response เดิม
+    """
+
+    def __init__(self, response, backend, operation, started):
+        self._response = response
+        self._backend = backend
+        self._operation = operation
+        self._started = started
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __iter__(self):
+        try:
+            yield from self._response
+        except Exception as e:
+            self._backend._record_failure(e)
+            raise
+        self._backend._record_success(self._operation, self._started)
+
+
+class ResilientBackend(LLMBackend):
+    """
+    ห่อ backend จริงด้วย:
+    - deadline ที่ view ส่งลงมา (หรือ LLM_REQUEST_DEADLINE_SECONDS) แต่ละ attempt ได้เวลาไม่เกิน attempt_timeout
+    - retry ไม่เกิน max_attempts ครั้ง เฉพาะ error ชั่วคราว รอด้วย backoff แบบ full jitter และไม่เกิน deadline
+    - circuit breaker ระดับ worker: เมื่อ open การเรียกล้มเหลวทันทีด้วย CircuitOpenError
+      (services จะตอบจาก cache หรือ fallback ไปที่ catalog แทน)
+    - hedged request: ถ้ายังไม่ได้คำตอบหลังเวลา p95 ของ operation นั้น (ไม่ต่ำกว่า hedge_min_delay)
+      จะส่ง attempt ที่สองคู่ขนานแล้วใช้คำตอบที่มาถึงก่อน (ไม่ใช้กับ stream)
+      attempt ที่สองใช้ admission slot ของตัวเอง ถ้าไม่มี slot ว่างจะไม่ hedge และรอ attempt แรกต่อ
+    """
+
+    def __init__(self, inner, breaker, latency, default_deadline, attempt_timeout, max_attempts,
+                 backoff_base, backoff_cap, hedge_enabled=False, hedge_min_delay=1.0, hedge_max_threads=16):
+        self.inner = inner
+        self.breaker = breaker
+        self.latency = latency
+        self.default_deadline = default_deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_threads = hedge_max_threads
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._counters = {"retries": 0, "hedges": 0, "hedge_wins": 0, "hedges_skipped": 0, "timeouts": 0}
+
+    @property
+    def name(self):
+        return self.inner.name
+
+    @property
+    def model_name(self):
+        return self.inner.model_name
+
+    def is_configured(self):
+        return self.inner.is_configured()
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return {"backend": self.name, "circuit": self.breaker.stats(), **counters}
+
+    def _count(self, key):
+        with self._counters_lock:
+            self._counters[key] += 1
+
+    def _record_success(self, operation, started):
+        self.breaker.record_success()
+        self.latency.observe(operation, time.monotonic() - started)
+
+    def _record_failure(self, error):
+        if isinstance(error, DeadlineExceeded):
+            self._count("timeouts")
+        if is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+
+    def _hedge_delay(self, operation, deadline):
+        if not self.hedge_enabled:
+            return None
+        p95 = self.latency.percentile(operation, 0.95)
+        if p95 is None:
+            return None
+        delay = max(self.hedge_min_delay, p95)
+        return delay if delay < deadline.remaining() else None
+
+    def _retry_delay(self, error, attempt, deadline, operation):
+        """
+        คืนค่าเวลาที่ต้องรอก่อน retry หรือ None ถ้าไม่ควร retry
+        """
+        if isinstance(error, CircuitOpenError) or not is_retryable(error) or attempt + 1 >= self.max_attempts:
+            return None
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+        if delay >= deadline.remaining():
+            return None
+        self._count("retries")
+        print(f"Warning: LLM {operation} attempt {attempt + 1} failed ({error}); retrying in {delay:.2f}s")
+        return delay
+
+    # --- sync (WSGI) ---
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.hedge_max_threads, thread_name_prefix="llm-hedge")
+        return self._executor
+
+    def _call(self, prompt, operation, deadline, discarded=None):
+        timeout = deadline.timeout(self.attempt_timeout)
+        self.breaker.check()
+        started = time.monotonic()
+        try:
+            response = self.inner.generate(prompt, operation, timeout=timeout)
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        if discarded is not None and discarded.is_set():
+            # attempt ที่แพ้ hedge: ไม่มีใครใช้คำตอบนี้แล้ว จึงไม่นับเป็น latency/success ของ operation
+            self.breaker.release()
+            return None
+        self._record_success(operation, started)
+        return response
+
+    def _hedge_attempt(self, prompt, operation, deadline, discarded, hedge_slot):
+        # ทำงานใน thread ของ hedge: แจ้ง hedge_slot เมื่อจบ และปิด DB connection ที่ใช้คืน slot
+        try:
+            return self._call(prompt, operation, deadline, discarded)
+        finally:
+            if hedge_slot.settle():
+                connection.close()
+
+    def _hedged_call(self, prompt, operation, deadline, hedge_delay):
+        executor = self._get_executor()
+        discarded = threading.Event()
+        hedge_slot = _HedgeSlot()
+        primary = executor.submit(self._hedge_attempt, prompt, operation, deadline, discarded, hedge_slot)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        lease = llm_slots.try_acquire_nowait()
+        if lease is None or not hedge_slot.attach(lease):
+            if lease is not None:
+                llm_slots.release(lease)  # attempt แรกเสร็จพอดีระหว่างยืม slot
+            else:
+                self._count("hedges_skipped")
+            done, _ = wait([primary], timeout=deadline.remaining())
+            if not done:
+                discarded.set()
+                raise DeadlineExceeded(f"LLM {operation} did not finish before the request deadline")
+            return primary.result()
+
+        self._count("hedges")
+        hedge = executor.submit(self._hedge_attempt, prompt, operation, deadline, discarded, hedge_slot)
+        pending = {primary, hedge}
+        first_error = None
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded(f"LLM {operation} did not finish before the request deadline")
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            self._count("hedge_wins")
+                        return future.result()
+                    first_error = first_error or future.exception()
+            raise first_error
+        finally:
+            # attempt ที่แพ้และยังไม่เริ่มถูกยกเลิก ที่เริ่มแล้วทำต่อใน thread (ยกเลิก thread ไม่ได้)
+            # แต่ผลถูกทิ้ง และ slot ของ hedge ถูกถือไว้จนกว่าจะจบจริง
+            discarded.set()
+            for future in pending:
+                if future.cancel():
+                    hedge_slot.settle()
+
+    def generate(self, prompt, operation, deadline=None):
+        deadline = deadline or Deadline.after(self.default_deadline)
+        attempt = 0
+        while True:
+            try:
+                hedge_delay = self._hedge_delay(operation, deadline)
+                if hedge_delay is None:
+                    return self._call(prompt, operation, deadline)
+                return self._hedged_call(prompt, operation, deadline, hedge_delay)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline, operation)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    # --- async (ASGI) ---
+
+    async def _call_async(self, prompt, operation, deadline):
+        timeout = deadline.timeout(self.attempt_timeout)
+        self.breaker.check()
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(self.inner.generate_async(prompt, operation, timeout=timeout), timeout)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            error = DeadlineExceeded(f"LLM call timed out after {timeout:.2f}s")
+            self._record_failure(error)
+            raise error
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        self._record_success(operation, started)
+        return response
+
+    async def _hedged_call_async(self, prompt, operation, deadline, hedge_delay):
+        primary = asyncio.ensure_future(self._call_async(prompt, operation, deadline))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        lease = await sync_to_async(llm_slots.try_acquire_nowait)()
+        if lease is not None and primary.done():
+            await sync_to_async(llm_slots.release)(lease)  # attempt แรกเสร็จพอดีระหว่างยืม slot
+            return primary.result()
+        if lease is None:
+            self._count("hedges_skipped")
+            try:
+                return await asyncio.wait_for(primary, deadline.remaining())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"LLM {operation} did not finish before the request deadline")
+
+        self._count("hedges")
+        hedge = asyncio.ensure_future(self._call_async(prompt, operation, deadline))
+        pending = {primary, hedge}
+        first_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded(f"LLM {operation} did not finish before the request deadline")
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count("hedge_wins")
+                        return task.result()
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            # attempt ที่แพ้ถูกยกเลิกทันที จึงคืน slot ของ hedge ได้เลย
+            for task in pending:
+                task.cancel()
+            await sync_to_async(llm_slots.release)(lease)
+
+    async def generate_async(self, prompt, operation, deadline=None):
+        deadline = deadline or Deadline.after(self.default_deadline)
+        attempt = 0
+        while True:
+            try:
+                hedge_delay = self._hedge_delay(operation, deadline)
+                if hedge_delay is None:
+                    return await self._call_async(prompt, operation, deadline)
+                return await self._hedged_call_async(prompt, operation, deadline, hedge_delay)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline, operation)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    # --- stream: ไม่ retry/hedge เพราะ chunk อาจถูกส่งให้ผู้ใช้ไปแล้ว ---
+
+    def generate_stream(self, prompt, operation, deadline=None):
+        deadline = deadline or Deadline.after(self.default_deadline)
+        timeout = deadline.timeout(self.attempt_timeout)
+        self.breaker.check()
+        started = time.monotonic()
+        try:
+            response = self.inner.generate_stream(prompt, operation, timeout=timeout)
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        return _MonitoredStream(response, self, operation, started)
+
+
+class _HedgeSlot:
+    """
+    admission slot ที่สองของ hedged request (sync) คืนเมื่อ attempt ทั้งสองจบจริง
+    เพราะ attempt ที่แพ้ยังเรียก provider อยู่ใน thread ของมัน
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = 1  # attempt แรก
+        self._lease = None
+
+    def attach(self, lease):
+        # คืนค่า False ถ้า attempt แรกจบไปแล้ว (ไม่ต้อง hedge)
+        with self._lock:
+            if self._running == 0:
+                return False
+            self._lease = lease
+            self._running += 1
+            return True
+
+    def settle(self):
+        """
+        attempt หนึ่งจบ (หรือถูกยกเลิกก่อนเริ่ม) คืนค่า True ถ้าเป็นตัวสุดท้ายและได้คืน slot
+        """
+        with self._lock:
+            self._running -= 1
+            lease = self._lease if self._running == 0 else None
+            if lease is not None:
+                self._lease = None
+        if lease is None:
+            return False
+        llm_slots.release(lease)
+        return True
+
+
+def build_resilient_backend(inner):
+    return ResilientBackend(
+        inner,
+        breaker=CircuitBreaker(
+            f"llm-{inner.name}",
+            failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+            reset_seconds=settings.LLM_CIRCUIT_RESET_SECONDS,
+        ),
+        latency=LatencyTracker(),
+        default_deadline=settings.LLM_REQUEST_DEADLINE_SECONDS,
+        attempt_timeout=settings.LLM_ATTEMPT_TIMEOUT_SECONDS,
+        max_attempts=settings.LLM_RETRY_MAX_ATTEMPTS,
+        backoff_base=settings.LLM_RETRY_BACKOFF_BASE_SECONDS,
+        backoff_cap=settings.LLM_RETRY_BACKOFF_CAP_SECONDS,
+        hedge_enabled=settings.LLM_HEDGE_ENABLED,
+        hedge_min_delay=settings.LLM_HEDGE_MIN_DELAY_SECONDS,
+        hedge_max_threads=settings.LLM_HEDGE_MAX_THREADS,
+    )
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def build_llm_backend(name=None):
+    name = name or settings.LLM_BACKEND
+    if name == "gemini":
+        return GeminiBackend(settings.GEMINI_API_KEY, settings.GEMINI_MODEL_NAME)
+    if name == "replay":
+        return ReplayBackend(settings.LLM_CASSETTE_DIR, settings.LLM_REPLAY_SIMULATE_LATENCY)
+    if name == "record":
+        return RecordingBackend(GeminiBackend(settings.GEMINI_API_KEY, settings.GEMINI_MODEL_NAME), settings.LLM_CASSETTE_DIR)
+    if name == "stub":
+        return StubBackend(
+            latency_median_ms=settings.LLM_STUB_LATENCY_MEDIAN_MS,
+            latency_sigma=settings.LLM_STUB_LATENCY_SIGMA,
+            failure_rate=settings.LLM_STUB_FAILURE_RATE,
+            malformed_rate=settings.LLM_STUB_MALFORMED_RATE,
+            seed=settings.LLM_STUB_SEED,
+        )
+    raise ValueError(f"Unknown LLM_BACKEND '{name}'. Use gemini, replay, record or stub.")
+
+
+def get_llm_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = build_resilient_backend(build_llm_backend())
+    return _backend
+
+
+def set_llm_backend(backend):
+    """
+    เปลี่ยน backend ของ process นี้ (ใช้ใน benchmark/script) ส่ง None เพื่อให้สร้างใหม่จาก settings
+    backend ที่ส่งมาจะถูกห่อด้วย ResilientBackend ถ้ายังไม่ได้ห่อ
+    """
+    global _backend
+    if backend is not None and not isinstance(backend, ResilientBackend):
+        backend = build_resilient_backend(backend)
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,156 @@
+# recommender_api/llm_metrics.py
+"""
+บันทึกและสรุปผลการเรียก LLM (LLMCallLog): latency, token usage, ผลการ parse และจำนวนครั้งที่ราคารวมถูกแก้
+"""
+import json
+import time
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Aggregate, Avg, Count, FloatField, Q
+from django.utils import timezone
+
+from .admission import Overloaded
+from .buffered_writer import llm_call_writer
+from .models import LLMCallLog
+from .resilience import CircuitOpenError, DeadlineExceeded
+
+PERCENTILES = (50, 95, 99)
+SUMMARY_WINDOWS = {
+    "1h": timedelta(hours=1),
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+}
+
+
+def prompt_variant_for(desired_parts, preferred_games):
+    return "parts_games" if desired_parts or preferred_games else "budget_only"
+
+
+def _usage_counts(response):
+    usage = getattr(response, "usage_metadata", None) if response is not None else None
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+
+
+def _outcome(result, error, response):
+    if error is None:
+        return "bad_structure" if "error" in result else "ok"
+    if isinstance(error, json.JSONDecodeError):
+        return "parse_error"
+    if isinstance(error, DeadlineExceeded):
+        return "timeout"
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, Overloaded):
+        return "shed"
+    if response is not None and getattr(response, "prompt_feedback", None):
+        return "blocked"
+    return "api_error"
+
+
+def count_price_overrides(result):
+    return sum(
+        1 for build in result.get("recommendations") or []
+        if isinstance(build, dict) and build.get("price_calculation_note")
+    )
+
+
+def record_llm_call(operation, variant, model_name, started, response, result, error=None):
+    """
+    เรียกหลังการเรียก LLM เสร็จ (ทั้งสำเร็จและล้มเหลว) started คือค่า time.monotonic() ก่อนเรียก
+    """
+    prompt_tokens, response_tokens = _usage_counts(response)
+    try:
+        llm_call_writer.add(LLMCallLog(
+            operation=operation,
+            prompt_variant=variant,
+            model_name=model_name,
+            outcome=_outcome(result, error, response),
+            latency_ms=int((time.monotonic() - started) * 1000),
+            prompt_tokens=prompt_tokens,
+            response_tokens=response_tokens,
+            price_overrides=count_price_overrides(result),
+        ))
+    except Exception as e:
+        print(f"Warning: failed to record LLM call metrics: {e}")
+
+
+class PercentileCont(Aggregate):
+    # PostgreSQL ordered-set aggregate: percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms)
+    function = "percentile_cont"
+    template = "%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def _percentile(sorted_values, fraction):
+    # linear interpolation แบบเดียวกับ percentile_cont
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _summarize_postgres(queryset):
+    aggregates = {
+        "calls": Count("id"),
+        "errors": Count("id", filter=~Q(outcome="ok")),
+        "price_overrides": Count("id", filter=Q(price_overrides__gt=0)),
+        "avg_prompt_tokens": Avg("prompt_tokens"),
+        "avg_response_tokens": Avg("response_tokens"),
+    }
+    for p in PERCENTILES:
+        aggregates[f"latency_p{p}_ms"] = PercentileCont("latency_ms", p / 100)
+        aggregates[f"response_tokens_p{p}"] = PercentileCont("response_tokens", p / 100)
+    return {row.pop("operation"): row for row in queryset.values("operation").annotate(**aggregates)}
+
+
+def _summarize_python(queryset):
+    grouped = {}
+    rows = queryset.values_list("operation", "outcome", "latency_ms", "prompt_tokens", "response_tokens", "price_overrides")
+    for operation, outcome, latency, prompt_tokens, response_tokens, overrides in rows.iterator():
+        group = grouped.setdefault(operation, {"outcomes": [], "latency": [], "prompt": [], "response": [], "overrides": 0})
+        group["outcomes"].append(outcome)
+        group["latency"].append(latency)
+        if prompt_tokens is not None:
+            group["prompt"].append(prompt_tokens)
+        if response_tokens is not None:
+            group["response"].append(response_tokens)
+        group["overrides"] += 1 if overrides else 0
+
+    summary = {}
+    for operation, group in grouped.items():
+        latency = sorted(group["latency"])
+        response_tokens = sorted(group["response"])
+        row = {
+            "calls": len(latency),
+            "errors": sum(1 for outcome in group["outcomes"] if outcome != "ok"),
+            "price_overrides": group["overrides"],
+            "avg_prompt_tokens": sum(group["prompt"]) / len(group["prompt"]) if group["prompt"] else None,
+            "avg_response_tokens": sum(response_tokens) / len(response_tokens) if response_tokens else None,
+        }
+        for p in PERCENTILES:
+            row[f"latency_p{p}_ms"] = _percentile(latency, p / 100)
+            row[f"response_tokens_p{p}"] = _percentile(response_tokens, p / 100)
+        summary[operation] = row
+    return summary
+
+
+def summarize_llm_calls(windows=None):
+    """
+    คืนค่า {window: {operation: {...}}} ของแต่ละช่วงเวลาใน SUMMARY_WINDOWS
+    PostgreSQL คำนวณ percentile ในฐานข้อมูล ฐานข้อมูลอื่นคำนวณใน Python
+    """
+    now = timezone.now()
+    summarize = _summarize_postgres if connection.vendor == "postgresql" else _summarize_python
+    result = {}
+    for name in windows or SUMMARY_WINDOWS:
+        queryset = LLMCallLog.objects.filter(timestamp__gte=now - SUMMARY_WINDOWS[name])
+        result[name] = summarize(queryset)
+    return result
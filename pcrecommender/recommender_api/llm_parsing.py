@@ -0,0 +1,306 @@
+# recommender_api/llm_parsing.py
+"""
+แปลงข้อความจาก LLM เป็นรายการ build มาตรฐานโดยไม่ต้องเรียก LLM ซ้ำเมื่อ JSON เสียเล็กน้อย
+
+1. ซ่อมข้อความ: ตัด code fence (```json) และข้อความอื่นก่อน/หลัง JSON, ลบ trailing comma
+   ถ้า JSON ถูกตัดกลางทาง (เช่นหมด output token) จะเก็บเฉพาะ build ที่ปิดวงเล็บครบแล้วใน array แรก
+2. หา build list จากโครงสร้างที่พอเดาได้ (list, build เดี่ยว, {"recommendations"/"builds"/...: [...]},
+   object ที่ห่ออีกชั้น หรือ {"build1": {...}, "build2": {...}})
+3. ตรวจแต่ละ build ด้วย pydantic schema (ตรวจใน pydantic-core ที่ compile แล้ว): ราคาเป็นตัวเลข
+   ("12,900 บาท" -> 12900, "1.2k" -> 1200), ชิ้นส่วนที่เป็น string -> {"name": ...} build ที่ไม่มีชิ้นส่วนหลักเลยถูกทิ้ง
+
+ตัวนับ parse_stats (ต่อ worker) แยกผลลัพธ์ clean / repaired / salvaged / normalized / failed
+ผลรวมของ repaired, salvaged และ normalized คือจำนวนครั้งที่เดิมจะเป็น error และผู้ใช้ต้องเรียกใหม่
+"""
+import json
+import re
+import threading
+from typing import NamedTuple, Optional
+
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator, model_validator
+
+from .streaming import BUILD_LIST_KEYS, IncrementalBuildParser
+
+ESSENTIAL_COMPONENT_KEYS = ("cpu", "gpu")
+NOTES_KEYS = ("analysis_notes", "analysis", "summary")
+CANONICAL_SHAPES = ("list", "build", "recommendations", "builds")
+
+CODE_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)\s*```", re.DOTALL)
+# ตัวเลขพร้อมหน่วยย่อ: "1.2k" / "12K" / "1.5 หมื่น" (k ต้องไม่ตามด้วยตัวอักษร เช่น "kg")
+NUMBER = re.compile(r"(-?\d+(?:\.\d+)?)\s*(k(?![a-z])|พัน|หมื่น)?", re.IGNORECASE)
+NUMBER_MULTIPLIERS = {"k": 1000, "พัน": 1000, "หมื่น": 10000}
+
+
+class ParsedSpecs(NamedTuple):
+    builds: list
+    analysis_notes: Optional[str]
+    shape: str
+    repairs: tuple
+    dropped_builds: int
+
+
+# --- schema ---
+
+def _to_number(value):
+    # "12,900 บาท" -> 12900.0, "1.2k" -> 1200.0 ค่าที่อ่านเป็นตัวเลขไม่ได้กลายเป็น None (reconcile_build_prices ข้ามไปเอง)
+    if isinstance(value, bool):
+        return None
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        match = NUMBER.search(value.replace(",", ""))
+        if match:
+            multiplier = NUMBER_MULTIPLIERS[match.group(2).lower()] if match.group(2) else 1
+            return float(match.group(1)) * multiplier
+    return None
+
+
+class ComponentSchema(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    name: str = ""
+    price_thb: Optional[float] = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def _from_string(cls, value):
+        return {"name": value} if isinstance(value, str) else value
+
+    @field_validator("price_thb", mode="before")
+    @classmethod
+    def _price(cls, value):
+        return _to_number(value)
+
+
+class BuildSchema(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    build_name: str
+    total_price_estimate_thb: Optional[float] = None
+    cpu: Optional[ComponentSchema] = None
+    gpu: Optional[ComponentSchema] = None
+    ram: Optional[ComponentSchema] = None
+    storage: Optional[ComponentSchema] = None
+    motherboard: Optional[ComponentSchema] = None
+    psu: Optional[ComponentSchema] = None
+    case: Optional[ComponentSchema] = None
+    cooler: Optional[ComponentSchema] = None
+
+    @field_validator("total_price_estimate_thb", mode="before")
+    @classmethod
+    def _total(cls, value):
+        return _to_number(value)
+
+    @model_validator(mode="after")
+    def _has_essential_parts(self):
+        if not any(getattr(self, key) is not None for key in ESSENTIAL_COMPONENT_KEYS):
+            raise ValueError("build has neither cpu nor gpu")
+        return self
+
+
+def normalize_build(build, index=0):
+    """
+    คืนค่า build ที่ผ่าน schema แล้ว (dict, key เดิมครบ) หรือ None ถ้าใช้ไม่ได้
+    """
+    if not isinstance(build, dict):
+        return None
+    if not isinstance(build.get("build_name"), str) or not build.get("build_name").strip():
+        build = {**build, "build_name": str(build.get("name") or f"ชุดที่ {index + 1}")}
+    try:
+        return BuildSchema.model_validate(build).model_dump(exclude_unset=True)
+    except ValidationError as e:
+        print(f"Warning: dropping build '{build.get('build_name')}' that failed schema validation: {e.error_count()} errors")
+        return None
+
+
+# --- text repair ---
+
+def _scan(text):
+    """
+    คืนค่า (ตำแหน่งที่ JSON value แรกจบ หรือ None ถ้ายังไม่ปิด, list ของตำแหน่ง trailing comma)
+    """
+    stack = []
+    in_string = escape = False
+    trailing_commas = []
+    last_comma = None
+    for pos, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+            last_comma = None
+        elif ch in "[{":
+            stack.append(ch)
+            last_comma = None
+        elif ch in "]}":
+            if last_comma is not None:
+                trailing_commas.append(last_comma)
+                last_comma = None
+            if stack:
+                stack.pop()
+            if not stack:
+                return pos + 1, trailing_commas
+        elif ch == ",":
+            last_comma = pos
+        elif not ch.isspace():
+            last_comma = None
+    return None, trailing_commas
+
+
+def repair_json_text(text):
+    """
+    คืนค่า (parsed, repairs) โดย repairs เป็น tuple ของการซ่อมที่ใช้ ("fence", "prose", "trailing_comma", "truncated")
+    โยน json.JSONDecodeError ถ้าซ่อมไม่ได้
+    """
+    try:
+        return json.loads(text), ()
+    except json.JSONDecodeError as original_error:
+        error = original_error
+
+    repairs = []
+    candidate = text.strip()
+    fenced = CODE_FENCE.search(candidate)
+    if fenced:
+        candidate = fenced.group(1)
+        repairs.append("fence")
+    starts = [pos for pos in (candidate.find("{"), candidate.find("[")) if pos >= 0]
+    if not starts:
+        raise error
+    start = min(starts)
+    end, trailing_commas = _scan(candidate[start:])
+    if start > 0 or (end is not None and candidate[start + end:].strip()):
+        repairs.append("prose")
+    body = candidate[start:start + end] if end is not None else candidate[start:]
+    if trailing_commas:
+        skipped = set(trailing_commas)
+        body = "".join(ch for pos, ch in enumerate(body) if pos not in skipped)
+        repairs.append("trailing_comma")
+
+    if end is not None:
+        try:
+            return json.loads(body), tuple(repairs)
+        except json.JSONDecodeError:
+            raise error
+
+    # ถูกตัดกลางทาง: เก็บ build ที่ครบแล้ว (parser ข้าม comma ที่ค้างอยู่ได้เพราะ parse ทีละ object)
+    salvaged = IncrementalBuildParser().feed(body)
+    if not salvaged:
+        raise error
+    return salvaged, tuple(repairs + ["truncated"])
+
+
+# --- shape normalization ---
+
+def _notes_from(parsed):
+    for key in NOTES_KEYS:
+        if isinstance(parsed.get(key), str):
+            return parsed[key]
+    return None
+
+
+def extract_build_list(parsed, depth=0):
+    """
+    คืนค่า (builds, analysis_notes, shape) shape บอกว่าเจอ build list จากโครงสร้างแบบไหน (None ถ้าไม่เจอ)
+    """
+    if isinstance(parsed, list):
+        if parsed and all(isinstance(item, list) for item in parsed):
+            return [build for item in parsed for build in item], None, "nested_list"
+        return parsed, None, "list"
+    if not isinstance(parsed, dict):
+        return [], None, None
+    if "build_name" in parsed or any(key in parsed for key in ESSENTIAL_COMPONENT_KEYS):
+        return [parsed], None, "build"
+    notes = _notes_from(parsed)
+    for key in BUILD_LIST_KEYS:
+        value = parsed.get(key)
+        if isinstance(value, list):
+            return value, notes, key if key in CANONICAL_SHAPES else "named_list"
+        if isinstance(value, dict):
+            return [value], notes, "named_build"
+    builds_by_name = [value for value in parsed.values() if isinstance(value, dict) and "build_name" in value]
+    if builds_by_name:
+        return builds_by_name, notes, "keyed_builds"
+    if depth == 0:
+        # {"data": {...}} / {"response": [...]}: ลงไปอีกหนึ่งชั้น
+        for value in parsed.values():
+            if isinstance(value, (dict, list)):
+                builds, inner_notes, shape = extract_build_list(value, depth + 1)
+                if shape:
+                    return builds, notes or inner_notes, "wrapped"
+    return [], notes, None
+
+
+class ParseStats:
+    OUTCOMES = ("clean", "repaired", "salvaged", "normalized", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.OUTCOMES + ("dropped_builds",), 0)
+
+    def record(self, outcome, dropped_builds=0):
+        with self._lock:
+            self._counters[outcome] += 1
+            self._counters["dropped_builds"] += dropped_builds
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters["saved_round_trips"] = counters["repaired"] + counters["salvaged"] + counters["normalized"]
+        return counters
+
+
+parse_stats = ParseStats()
+
+
+def _outcome(repairs, shape):
+    if "truncated" in repairs:
+        return "salvaged"
+    if repairs:
+        return "repaired"
+    return "clean" if shape in CANONICAL_SHAPES else "normalized"
+
+
+def parse_specs_output(text):
+    """
+    ข้อความจาก LLM -> ParsedSpecs (builds ผ่าน schema แล้ว) โยน json.JSONDecodeError ถ้าซ่อมไม่ได้
+    builds ว่างหมายถึงหา build ที่ใช้ได้ไม่เจอ (ผู้เรียกตอบ error เอง)
+    """
+    try:
+        parsed, repairs = repair_json_text(text)
+    except json.JSONDecodeError:
+        parse_stats.record("failed")
+        raise
+    raw_builds, notes, shape = extract_build_list(parsed)
+    builds = [build for build in (normalize_build(item, index) for index, item in enumerate(raw_builds)) if build]
+    dropped = len(raw_builds) - len(builds)
+    parse_stats.record(_outcome(repairs, shape) if builds else "failed", dropped)
+    return ParsedSpecs(builds, notes, shape or type(parsed).__name__, repairs, dropped)
+
+
+def parse_explanation_output(text):
+    """
+    คืนค่า dict ที่มี "explanation" (string) หรือ None ถ้าไม่พบ ข้อความที่ไม่ใช่ JSON เลยถูกใช้เป็นคำอธิบายตรงๆ
+    """
+    try:
+        parsed, repairs = repair_json_text(text)
+    except json.JSONDecodeError:
+        plain = CODE_FENCE.sub(lambda match: match.group(1), text).strip()
+        if plain and plain[0] not in "{[":
+            parse_stats.record("normalized")
+            return {"explanation": plain}
+        parse_stats.record("failed")
+        raise
+    if isinstance(parsed, dict) and isinstance(parsed.get("explanation"), str):
+        parse_stats.record("repaired" if repairs else "clean")
+        return parsed
+    if isinstance(parsed, str) and parsed.strip():
+        parse_stats.record("normalized")
+        return {"explanation": parsed}
+    parse_stats.record("failed")
+    return None
@@ -0,0 +1,44 @@
+# recommender_api/management/commands/backfill_saved_spec_columns.py
+from django.core.management.base import BaseCommand
+
+from recommender_api.models import SavedSpecification
+
+
+class Command(BaseCommand):
+    help = (
+        "เติมคอลัมน์ build_name/cpu_name/gpu_name/total_price_thb/budget_thb ของ SavedSpecification จาก JSON "
+        "ทีละชุดตาม id ถ้าหยุดกลางทางให้รันต่อด้วย --start-id ที่พิมพ์ไว้ล่าสุด"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--start-id', type=int, default=0, help="เริ่มจากแถวที่ id มากกว่าค่านี้")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = options['start_id']
+        updated = 0
+
+        while True:
+            batch = list(
+                SavedSpecification.objects.filter(pk__gt=last_id).order_by('pk')
+                .only('id', 'build_details', 'source_prompt_details', *SavedSpecification.BUILD_COLUMNS)[:batch_size]
+            )
+            if not batch:
+                break
+
+            changed = []
+            for spec in batch:
+                columns = SavedSpecification.build_columns_from(spec.build_details, spec.source_prompt_details)
+                if any(getattr(spec, field) != value for field, value in columns.items()):
+                    for field, value in columns.items():
+                        setattr(spec, field, value)
+                    changed.append(spec)
+            if changed:
+                SavedSpecification.objects.bulk_update(changed, SavedSpecification.BUILD_COLUMNS)
+
+            updated += len(changed)
+            last_id = batch[-1].pk
+            self.stdout.write(f"Processed up to id {last_id} ({updated} rows updated so far).")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. {updated} saved specs updated."))
@@ -0,0 +1,62 @@
+# recommender_api/management/commands/backfill_stats_rollups.py
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from recommender_api.models import RecommendationRequestLog, SavedSpecification
+from recommender_api.stats import PERIODS, TOTAL_COUNTERS, bucket_start, rebuild_rollups, rebuild_total
+
+
+class Command(BaseCommand):
+    help = (
+        "สร้าง StatsRollup ใหม่จาก RecommendationRequestLog และ SavedSpecification ทีละวัน และนับตัวนับรวม (StatsCounter) ใหม่ "
+        "(ใช้ครั้งแรกหลัง deploy หรือเมื่อสงสัยว่าตัวนับเพี้ยน รันซ้ำได้อย่างปลอดภัย)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="วันเริ่มต้น YYYY-MM-DD (ค่าเริ่มต้น: วันที่มีข้อมูลเก่าสุด)")
+        parser.add_argument('--end', help="วันสุดท้าย YYYY-MM-DD รวมวันนี้ด้วย (ค่าเริ่มต้น: วันนี้)")
+        parser.add_argument('--granularity', choices=sorted(PERIODS), help="สร้างเฉพาะ hour หรือ day (ค่าเริ่มต้น: ทั้งคู่)")
+
+    def handle(self, *args, **options):
+        totals = {name: rebuild_total(name) for name in TOTAL_COUNTERS}
+        self.stdout.write(f"Recounted totals: {totals}.")
+
+        start = self._parse_date(options['start']) or self._earliest_day()
+        end = self._parse_date(options['end']) or bucket_start(timezone.now(), 'day')
+        if start is None:
+            self.stdout.write("No request logs or saved specs to backfill.")
+            return
+        if start > end:
+            raise CommandError("--start must not be after --end.")
+
+        periods = [options['granularity']] if options['granularity'] else None
+        day = start
+        written = 0
+        while day <= end:
+            written += rebuild_rollups(day, day + timedelta(days=1), periods)
+            day += timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {written} rollup rows from {start.date()} to {end.date()}."
+        ))
+
+    @staticmethod
+    def _parse_date(value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+
+    @staticmethod
+    def _earliest_day():
+        candidates = [
+            RecommendationRequestLog.objects.aggregate(first=Min('timestamp'))['first'],
+            SavedSpecification.objects.aggregate(first=Min('saved_at'))['first'],
+        ]
+        candidates = [value for value in candidates if value is not None]
+        return bucket_start(min(candidates), 'day') if candidates else None
@@ -0,0 +1,95 @@
+# recommender_api/management/commands/load_components.py
+import csv
+import decimal
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recommender_api.models import Component
+
+UPDATE_FIELDS = ['price_thb', 'socket', 'chipset', 'memory_type', 'tdp_watts', 'performance_score', 'in_stock']
+VALID_CATEGORIES = {choice for choice, _ in Component.CATEGORY_CHOICES}
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value is None or str(value).strip() == '':
+        return True
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'n')
+
+
+class Command(BaseCommand):
+    help = (
+        "โหลด component catalog จากไฟล์ CSV หรือ JSON (upsert ตาม category + name) "
+        "คอลัมน์: category, name, price_thb, socket, chipset, memory_type, tdp_watts, performance_score, in_stock"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="ไฟล์ .csv หรือ .json (JSON เป็น array ของ object)")
+        parser.add_argument('--format', choices=['csv', 'json'], help="ระบุรูปแบบไฟล์ (ค่าเริ่มต้นดูจากนามสกุล)")
+        parser.add_argument('--replace', action='store_true', help="ลบ catalog เดิมทั้งหมดก่อนโหลด")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f"File not found: {path}")
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+
+        if file_format == 'csv':
+            with path.open(newline='', encoding='utf-8-sig') as f:
+                rows = list(csv.DictReader(f))
+        elif file_format == 'json':
+            with path.open(encoding='utf-8') as f:
+                rows = json.load(f)
+            if not isinstance(rows, list):
+                raise CommandError("JSON catalog must be an array of objects.")
+        else:
+            raise CommandError(f"Unsupported format '{file_format}'. Use --format csv or --format json.")
+
+        components = [self._build_component(index, row) for index, row in enumerate(rows, start=1)]
+
+        with transaction.atomic():
+            if options['replace']:
+                deleted, _ = Component.objects.all().delete()
+                self.stdout.write(f"Deleted {deleted} existing components.")
+            Component.objects.bulk_create(
+                components,
+                batch_size=options['batch_size'],
+                update_conflicts=True,
+                unique_fields=['category', 'name'],
+                update_fields=UPDATE_FIELDS,
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Loaded {len(components)} components from {path}."))
+
+    def _build_component(self, index, row):
+        category = str(row.get('category', '')).strip().lower()
+        name = str(row.get('name', '')).strip()
+        if category not in VALID_CATEGORIES:
+            raise CommandError(f"Row {index}: invalid category '{category}'.")
+        if not name:
+            raise CommandError(f"Row {index}: name is required.")
+
+        try:
+            price = decimal.Decimal(str(row.get('price_thb')))
+            tdp = row.get('tdp_watts')
+            tdp = int(float(tdp)) if tdp not in (None, '') else None
+            score = float(row.get('performance_score') or 0)
+        except (ValueError, TypeError, decimal.InvalidOperation) as e:
+            raise CommandError(f"Row {index} ({name}): invalid number. Error: {e}")
+
+        return Component(
+            category=category,
+            name=name,
+            price_thb=price,
+            socket=str(row.get('socket') or '').strip(),
+            chipset=str(row.get('chipset') or '').strip(),
+            memory_type=str(row.get('memory_type') or '').strip().upper(),
+            tdp_watts=tdp,
+            performance_score=score,
+            in_stock=_parse_bool(row.get('in_stock', True)),
+        )
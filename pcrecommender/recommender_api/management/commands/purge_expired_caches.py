@@ -0,0 +1,26 @@
+# recommender_api/management/commands/purge_expired_caches.py
+from django.core.management.base import BaseCommand
+
+from recommender_api.admission import purge_stale_buckets
+from recommender_api.cache import recommendation_cache
+from recommender_api.explanations import purge_expired_explanations
+from recommender_api.jobs import purge_finished_jobs
+from recommender_api.stats import purge_seen_users
+
+
+class Command(BaseCommand):
+    help = (
+        "ลบ entry ที่หมดอายุแล้วของ recommendation cache, explanation cache, rate limit bucket ที่ไม่ถูกใช้, "
+        "recommendation job ที่เสร็จนานแล้ว และ StatsRollupUser ที่เก่ากว่าช่วงเก็บ (ควรตั้งเป็น cron รายวัน)"
+    )
+
+    def handle(self, *args, **options):
+        recommendations = recommendation_cache.purge(expired_only=True)
+        explanations = purge_expired_explanations()
+        buckets = purge_stale_buckets()
+        jobs = purge_finished_jobs()
+        seen_users = purge_seen_users()
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {recommendations} recommendation cache entries, {explanations} explanations, "
+            f"{buckets} rate limit buckets, {jobs} finished jobs and {seen_users} stats seen-user rows."
+        ))
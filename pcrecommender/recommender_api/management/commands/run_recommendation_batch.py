@@ -0,0 +1,72 @@
+import json
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recommender_api.admission import Client
+from recommender_api.batch import run_batch, to_ndjson
+from recommender_api.buffered_writer import llm_call_writer, request_log_writer
+from recommender_api.views import RECOMMENDATION_SOURCES, parse_batch_item
+
+# flow แยกของ batch ใน admission queue น้ำหนักเท่าผู้ใช้ที่ไม่ได้ login จึงไม่แย่ง slot จากผู้ใช้ที่ login
+BATCH_CLIENT = Client("batch", False, rate_limited=False)
+
+
+def read_queries(stream):
+    """
+    รับได้ทั้ง JSON array และ NDJSON (หนึ่ง query ต่อบรรทัด)
+    """
+    text = stream.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "สร้างคำแนะนำสเปคของหลาย query จากไฟล์ (JSON array หรือ NDJSON ที่มี budget, desired_*, preferred_games, id) "
+        "query ที่ซ้ำกันถูกสร้างครั้งเดียว และเขียนผลเป็น NDJSON ทีละบรรทัดตามลำดับที่เสร็จ"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="ไฟล์ query (ใช้ - สำหรับ stdin)")
+        parser.add_argument('--output', default='-', help="ไฟล์ผลลัพธ์ NDJSON (ค่าเริ่มต้น stdout)")
+        parser.add_argument('--concurrency', type=int, default=settings.RECOMMENDATION_BATCH_CONCURRENCY,
+                            help="จำนวน query ที่สร้างพร้อมกัน")
+        parser.add_argument('--source', choices=RECOMMENDATION_SOURCES, default=None,
+                            help="source ของ query ที่ไม่ได้ระบุ (ค่าเริ่มต้น RECOMMENDATION_DEFAULT_SOURCE)")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] <= 0:
+            raise CommandError("--concurrency must be positive.")
+        try:
+            if options['input'] == '-':
+                queries = read_queries(sys.stdin)
+            else:
+                with open(options['input'], encoding='utf-8') as stream:
+                    queries = read_queries(stream)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read queries from {options['input']}: {e}")
+        if not isinstance(queries, list):
+            raise CommandError("Input must be a JSON array or one JSON object per line.")
+
+        items = [parse_batch_item(index, item, options['source']) for index, item in enumerate(queries)]
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8')
+        summary = None
+        try:
+            for line in run_batch(items, options['concurrency'], BATCH_CLIENT):
+                if "summary" in line:
+                    summary = line["summary"]
+                output.write(to_ndjson(line))
+                output.flush()
+        finally:
+            if output is not sys.stdout:
+                output.close()
+            request_log_writer.flush()
+            llm_call_writer.flush()
+
+        self.stderr.write(self.style.SUCCESS(
+            f"{summary['queries']} queries ({summary['unique']} unique): {summary['succeeded']} succeeded, "
+            f"{summary['failed']} failed, {summary['invalid']} invalid in {summary['elapsed_ms'] / 1000:.1f}s."
+        ))
@@ -0,0 +1,109 @@
+# recommender_api/management/commands/run_recommendation_workers.py
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection, connections
+
+from recommender_api.buffered_writer import llm_call_writer, request_log_writer
+from recommender_api.jobs import claim_job, requeue_expired_jobs, run_job
+
+
+def _run_worker(poll_interval, once):
+    """
+    วนดึงงานจนกว่าจะได้ SIGTERM/SIGINT (งานที่กำลังทำอยู่จะทำต่อจนเสร็จก่อนออก)
+    """
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    worker_name = f"{socket.gethostname()}:{os.getpid()}"
+    processed = 0
+    # คืนงานที่ lease หมดอายุตามเวลา ไม่ใช่เฉพาะตอนคิวว่าง (คิวที่ไม่เคยว่างจะทำให้งานของ worker ที่ตายค้างตลอด)
+    next_requeue_at = 0.0
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                if time.monotonic() >= next_requeue_at:
+                    requeue_expired_jobs()
+                    next_requeue_at = time.monotonic() + settings.RECOMMENDATION_JOB_REQUEUE_INTERVAL_SECONDS
+                job = claim_job(worker_name)
+            except DatabaseError as e:
+                print(f"Warning: worker {worker_name} failed to claim a job: {e}")
+                connection.close()
+                stop.wait(poll_interval)
+                continue
+            if job is None:
+                if once:
+                    break
+                stop.wait(poll_interval)
+                continue
+            run_job(job)
+            processed += 1
+    finally:
+        request_log_writer.flush()
+        llm_call_writer.flush()
+        connection.close()
+    return processed
+
+
+class Command(BaseCommand):
+    help = (
+        "รัน worker สำหรับ recommend-specs แบบ job (\"mode\": \"job\") ดึงงานจากตาราง RecommendationJob "
+        "(PostgreSQL ใช้ SELECT ... FOR UPDATE SKIP LOCKED) แยก scale จาก web worker ได้ เช่น รันบนเครื่องอื่น"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.RECOMMENDATION_JOB_WORKERS,
+            help="จำนวน worker process (ค่าเริ่มต้น RECOMMENDATION_JOB_WORKERS)"
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="วินาทีที่รอเมื่อคิวว่างก่อนถามใหม่")
+        parser.add_argument('--once', action='store_true', help="ทำงานที่ค้างอยู่ให้หมดแล้วออก (เช่นใช้กับ cron)")
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        if processes < 1:
+            raise CommandError("--processes must be at least 1.")
+        poll_interval, once = options['poll_interval'], options['once']
+
+        if processes == 1:
+            processed = _run_worker(poll_interval, once)
+            self.stdout.write(self.style.SUCCESS(f"Worker stopped after {processed} jobs."))
+            return
+
+        # fork: process ลูกใช้ Django ที่ setup แล้ว ต้องปิด connection ก่อนเพื่อไม่ให้ลูกใช้ socket เดียวกัน
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        stopping = threading.Event()
+        children = []
+
+        def start_child():
+            child = context.Process(target=_run_worker, args=(poll_interval, once), daemon=False)
+            child.start()
+            return child
+
+        def shutdown(*_):
+            stopping.set()
+            for child in children:
+                if child.is_alive():
+                    os.kill(child.pid, signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        children.extend(start_child() for _ in range(processes))
+        self.stdout.write(f"Started {processes} recommendation workers: {', '.join(str(c.pid) for c in children)}")
+
+        while any(child.is_alive() for child in children):
+            for index, child in enumerate(children):
+                child.join(timeout=poll_interval / max(1, processes))
+                # worker ที่ตายผิดปกติ (เช่น OOM) ถูกสร้างใหม่ งานที่ค้างอยู่จะกลับเข้าคิวเมื่อ lease หมดอายุ
+                if not child.is_alive() and child.exitcode not in (0, None) and not stopping.is_set() and not once:
+                    print(f"Warning: recommendation worker {child.pid} exited with {child.exitcode}; restarting")
+                    children[index] = start_child()
+        self.stdout.write(self.style.SUCCESS("All recommendation workers stopped."))
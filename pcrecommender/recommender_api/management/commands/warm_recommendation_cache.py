@@ -0,0 +1,67 @@
+# recommender_api/management/commands/warm_recommendation_cache.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from recommender_api.warmer import warm_recommendation_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "สร้าง/ต่ออายุ recommendation cache ของ query ที่ถูกขอบ่อยที่สุดใน RecommendationRequestLog "
+        "ก่อนหมดอายุ (ตั้งเป็น cron ทุกชั่วโมง หรือใช้ --interval ให้รันวนเป็น worker)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-calls', type=int, default=settings.CACHE_WARMER_MAX_LLM_CALLS,
+                            help="จำนวนการเรียก LLM สูงสุดต่อรอบ")
+        parser.add_argument('--lookback-hours', type=float, default=settings.CACHE_WARMER_LOOKBACK_HOURS,
+                            help="นับ request ย้อนหลังกี่ชั่วโมง")
+        parser.add_argument('--top', type=int, default=settings.CACHE_WARMER_TOP_QUERIES,
+                            help="พิจารณาเฉพาะ query ยอดนิยม N อันดับแรก")
+        parser.add_argument('--min-requests', type=int, default=settings.CACHE_WARMER_MIN_REQUESTS,
+                            help="ข้าม query ที่ถูกขอน้อยกว่านี้")
+        parser.add_argument('--refresh-before', type=int, default=settings.CACHE_WARMER_REFRESH_BEFORE_SECONDS,
+                            help="สร้างใหม่ถ้า entry จะหมดอายุภายในกี่วินาที")
+        parser.add_argument('--interval', type=float, default=0,
+                            help="รันซ้ำทุกกี่วินาที (0 = รันรอบเดียว)")
+        parser.add_argument('--dry-run', action='store_true', help="แสดง query ที่จะถูกอุ่นโดยไม่เรียก LLM")
+
+    def handle(self, *args, **options):
+        if not settings.RECOMMENDATION_CACHE_ENABLED:
+            raise CommandError("RECOMMENDATION_CACHE_ENABLED is false; nothing to warm.")
+        if options['max_calls'] < 0:
+            raise CommandError("--max-calls must not be negative.")
+
+        while True:
+            report = warm_recommendation_cache(
+                max_calls=options['max_calls'],
+                lookback_seconds=options['lookback_hours'] * 60 * 60,
+                top=options['top'],
+                min_requests=options['min_requests'],
+                refresh_before_seconds=options['refresh_before'],
+                dry_run=options['dry_run'],
+            )
+            self._write_report(report, options['dry_run'])
+            if not options['interval'] or options['dry_run']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def _write_report(self, report, dry_run):
+        for item in report["planned"]:
+            self.stdout.write(
+                f"  would warm {item['key']} ({item['requests']} requests): budget {item['budget_bucket']}, "
+                f"parts {item['desired_parts'] or '-'}, games {item['preferred_games'] or '-'}"
+            )
+        for item in report["failed"]:
+            self.stdout.write(self.style.WARNING(f"  failed {item['key']}: {item['error']}"))
+        if report["stopped"]:
+            self.stdout.write(self.style.WARNING(f"Stopped early, LLM unavailable: {report['stopped']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Planned' if dry_run else 'Warmed'} {len(report['planned'] if dry_run else report['warmed'])} of "
+            f"{report['hot_queries']} hot queries ({report['fresh']} already fresh, {report['llm_calls']} LLM calls, "
+            f"{len(report['failed'])} failed, {report['locked']} in progress elsewhere, {report['over_budget']} over budget)."
+        ))
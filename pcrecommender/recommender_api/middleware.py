@@ -0,0 +1,33 @@
+# recommender_api/middleware.py
+import time
+
+from django.db import connection
+
+
+class QueryCountMiddleware:
+    """
+    ใส่ header X-DB-Query-Count และ X-DB-Query-Time-Ms (จำนวนและเวลารวมของ SQL ใน request นี้)
+    เปิดด้วย DB_QUERY_COUNT_HEADER=true (ใช้กับ benchmark) query ที่เกิดหลังส่ง header
+    เช่นระหว่าง StreamingHttpResponse หรือใน thread เบื้องหลังจะไม่ถูกนับ
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = {"count": 0, "seconds": 0.0}
+
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats["count"] += 1
+                stats["seconds"] += time.perf_counter() - started
+
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+
+        response["X-DB-Query-Count"] = str(stats["count"])
+        response["X-DB-Query-Time-Ms"] = f"{stats['seconds'] * 1000:.1f}"
+        return response
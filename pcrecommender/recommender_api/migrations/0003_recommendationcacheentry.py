@@ -0,0 +1,32 @@
+# Generated by Django 4.2.21 on 2026-10-17 15:41
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0002_recommendationrequestlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(help_text='sha256 ของ canonical query (budget bucket, desired_parts, preferred_games)', max_length=64, unique=True)),
+                ('query', models.JSONField(help_text='canonical query ที่ใช้สร้าง cache_key')),
+                ('response', models.JSONField(help_text='ผลลัพธ์จาก get_specs_from_gemini ที่สำเร็จแล้ว')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('refreshed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Recommendation Cache Entry',
+                'verbose_name_plural': 'Recommendation Cache Entries',
+                'ordering': ['-refreshed_at'],
+            },
+        ),
+    ]
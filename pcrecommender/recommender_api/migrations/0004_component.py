@@ -0,0 +1,37 @@
+# Generated by Django 4.2.21 on 2026-10-17 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0003_recommendationcacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Component',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('cpu', 'CPU'), ('gpu', 'GPU'), ('ram', 'RAM'), ('storage', 'Storage'), ('motherboard', 'Motherboard'), ('psu', 'PSU'), ('case', 'Case'), ('cooler', 'Cooler')], max_length=20)),
+                ('name', models.CharField(max_length=200)),
+                ('price_thb', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('socket', models.CharField(blank=True, default='', help_text='CPU/Motherboard: socket เดียว (เช่น AM5) / Cooler: รายการ socket คั่นด้วย , (ว่าง = ใช้ได้ทุก socket)', max_length=100)),
+                ('chipset', models.CharField(blank=True, default='', help_text='ชิปเซ็ตของ Motherboard (เช่น B650)', max_length=50)),
+                ('memory_type', models.CharField(blank=True, default='', help_text='DDR4/DDR5 สำหรับ RAM และ Motherboard', max_length=10)),
+                ('tdp_watts', models.PositiveIntegerField(blank=True, help_text='CPU/GPU: กำลังไฟที่ใช้ / PSU: กำลังไฟสูงสุดที่จ่ายได้', null=True)),
+                ('performance_score', models.FloatField(default=0, help_text='คะแนนประสิทธิภาพเทียบกันภายในหมวดเดียวกัน')),
+                ('in_stock', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['category', 'price_thb'],
+                'indexes': [models.Index(fields=['category', 'in_stock', 'price_thb'], name='component_category_price_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='component',
+            constraint=models.UniqueConstraint(fields=('category', 'name'), name='unique_component_category_name'),
+        ),
+    ]
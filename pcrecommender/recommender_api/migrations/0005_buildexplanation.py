@@ -0,0 +1,37 @@
+# Generated by Django 4.2.21 on 2026-10-17 15:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0004_component'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildExplanation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('explanation', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('refreshed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Build Explanation',
+                'verbose_name_plural': 'Build Explanations',
+                'ordering': ['-refreshed_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='savedspecification',
+            name='explanation',
+            field=models.ForeignKey(blank=True, help_text='คำอธิบายจาก explain-build ที่ผูกกับสเปคนี้ (ถ้ามี)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='saved_specs', to='recommender_api.buildexplanation'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.21 on 2026-10-17 15:50
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0005_buildexplanation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationrequestlog',
+            name='cache_status',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='recommendationrequestlog',
+            name='latency_ms',
+            field=models.PositiveIntegerField(blank=True, help_text='เวลาที่ใช้สร้างคำแนะนำ (Gemini/cache/catalog) เป็นมิลลิวินาที', null=True),
+        ),
+        migrations.AddField(
+            model_name='recommendationrequestlog',
+            name='outcome',
+            field=models.CharField(choices=[('success', 'Success'), ('invalid', 'Invalid request'), ('error', 'Error')], default='success', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='recommendationrequestlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.21 on 2026-10-17 15:52
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0006_requestlog_outcome_latency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('unique_users', models.PositiveIntegerField(default=0, help_text='จำนวนผู้ใช้ที่ login แล้วและขอคำแนะนำในช่วงนี้')),
+                ('saves', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['period', 'bucket_start'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='recommendationrequestlog',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddConstraint(
+            model_name='statsrollup',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket_start'), name='unique_stats_rollup_bucket'),
+        ),
+    ]
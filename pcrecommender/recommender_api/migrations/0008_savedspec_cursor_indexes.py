@@ -0,0 +1,27 @@
+# Generated by Django 4.2.21 on 2026-10-17 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('recommender_api', '0007_statsrollup_requestlog_timestamp_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='savedspecification',
+            index=models.Index(fields=['user', '-saved_at', '-id'], name='savedspec_user_saved_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='savedspecification',
+            index=models.Index(fields=['-saved_at', '-id'], name='savedspec_saved_at_idx'),
+        ),
+        # auth_user เป็นตารางของ django.contrib.auth จึงสร้าง index สำหรับ UserCursorPagination ด้วย SQL ตรงๆ
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS auth_user_date_joined_idx ON auth_user (date_joined DESC, id DESC);",
+            reverse_sql="DROP INDEX IF EXISTS auth_user_date_joined_idx;",
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.21 on 2026-10-17 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0008_savedspec_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='savedspecification',
+            name='budget_thb',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='savedspecification',
+            name='build_name',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='savedspecification',
+            name='cpu_name',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='savedspecification',
+            name='gpu_name',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='savedspecification',
+            name='total_price_thb',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=12),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# GIN indexes สำหรับ recommender_api/search.py (PostgreSQL เท่านั้น ฐานข้อมูลอื่นจะข้าม migration นี้)
+# expression ต้องตรงกับที่ search.py ใช้ใน query ไม่เช่นนั้น planner จะไม่ใช้ index
+
+from django.db import migrations
+
+SAVED_SPEC_DOCUMENT = (
+    "coalesce(name, '') || ' ' || build_name || ' ' || cpu_name"
+    " || ' ' || gpu_name || ' ' || coalesce(user_notes, '')"
+)
+
+INDEXES = {
+    'savedspec_search_tsv_idx': (
+        'recommender_api_savedspecification',
+        "gin (to_tsvector('simple', " + SAVED_SPEC_DOCUMENT + "))",
+    ),
+    'savedspec_search_trgm_idx': (
+        'recommender_api_savedspecification',
+        "gin ((" + SAVED_SPEC_DOCUMENT + ") gin_trgm_ops)",
+    ),
+    'requestlog_search_tsv_idx': (
+        'recommender_api_recommendationrequestlog',
+        """gin (jsonb_to_tsvector('simple', request_payload, '["string", "numeric"]'))""",
+    ),
+    'requestlog_search_trgm_idx': (
+        'recommender_api_recommendationrequestlog',
+        "gin (((request_payload)::text) gin_trgm_ops)",
+    ),
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    for name, (table, definition) in INDEXES.items():
+        # CONCURRENTLY: ไม่ lock ตารางระหว่างสร้าง index (migration นี้จึงต้องเป็น non-atomic)
+        schema_editor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING {definition};")
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('recommender_api', '0009_savedspec_build_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
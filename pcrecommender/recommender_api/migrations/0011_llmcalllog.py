@@ -0,0 +1,33 @@
+# Generated by Django 4.2.21 on 2026-10-17 15:59
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0010_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCallLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('operation', models.CharField(choices=[('specs', 'Recommend specs'), ('specs_stream', 'Recommend specs (stream)'), ('explanation', 'Explain build')], max_length=16)),
+                ('prompt_variant', models.CharField(choices=[('budget_only', 'Budget only'), ('parts_games', 'Budget with desired parts/games'), ('explanation', 'Build explanation')], max_length=16)),
+                ('model_name', models.CharField(max_length=64)),
+                ('outcome', models.CharField(choices=[('ok', 'OK'), ('bad_structure', 'Unexpected JSON structure'), ('parse_error', 'Invalid JSON'), ('blocked', 'Blocked by safety filter'), ('api_error', 'API error')], max_length=16)),
+                ('latency_ms', models.PositiveIntegerField()),
+                ('prompt_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('response_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('price_overrides', models.PositiveSmallIntegerField(default=0, help_text='จำนวน build ที่ราคารวมถูกคำนวณใหม่เพราะไม่ตรงกับผลรวมของส่วนประกอบ')),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['operation', 'timestamp'], name='llmcall_operation_ts_idx')],
+            },
+        ),
+    ]
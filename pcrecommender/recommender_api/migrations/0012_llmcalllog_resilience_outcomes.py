@@ -0,0 +1,18 @@
+# Generated by Django 4.2.21 on 2026-10-17 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0011_llmcalllog'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='llmcalllog',
+            name='outcome',
+            field=models.CharField(choices=[('ok', 'OK'), ('bad_structure', 'Unexpected JSON structure'), ('parse_error', 'Invalid JSON'), ('blocked', 'Blocked by safety filter'), ('api_error', 'API error'), ('timeout', 'Deadline exceeded'), ('circuit_open', 'Rejected by open circuit')], max_length=16),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.21 on 2026-10-17 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0012_llmcalllog_resilience_outcomes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=128, unique=True)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='llmcalllog',
+            name='outcome',
+            field=models.CharField(choices=[('ok', 'OK'), ('bad_structure', 'Unexpected JSON structure'), ('parse_error', 'Invalid JSON'), ('blocked', 'Blocked by safety filter'), ('api_error', 'API error'), ('timeout', 'Deadline exceeded'), ('circuit_open', 'Rejected by open circuit'), ('shed', 'Shed by admission control')], max_length=16),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.21 on 2026-10-17 16:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recommender_api', '0013_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('client_key', models.CharField(help_text='client ของ admission control เช่น user:12 หรือ ip:1.2.3.4', max_length=128)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('source', models.CharField(default='gemini', max_length=16)),
+                ('request_payload', models.JSONField(help_text='user_prompt_input ที่ผ่านการตรวจสอบแล้ว')),
+                ('result', models.JSONField(blank=True, help_text='response ของ recommend-specs (รวมกรณี error)', null=True)),
+                ('cache_status', models.CharField(blank=True, default='', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('lease_expires_at', models.DateTimeField(blank=True, help_text='ถ้า worker ตายระหว่างทำงาน งานจะถูกดึงใหม่หลังเวลานี้', null=True)),
+                ('finished_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='recjob_status_created_idx')],
+            },
+        ),
+    ]
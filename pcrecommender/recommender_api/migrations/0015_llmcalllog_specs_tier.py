@@ -0,0 +1,18 @@
+# Generated by Django 4.2.21 on 2026-10-17 17:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0014_recommendationjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='llmcalllog',
+            name='operation',
+            field=models.CharField(choices=[('specs', 'Recommend specs'), ('specs_stream', 'Recommend specs (stream)'), ('specs_tier', 'Recommend specs (one tier of a fan-out)'), ('explanation', 'Explain build')], max_length=16),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.21 on 2026-10-17 17:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def seed_counters(apps, schema_editor):
+    StatsCounter = apps.get_model('recommender_api', 'StatsCounter')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    SavedSpecification = apps.get_model('recommender_api', 'SavedSpecification')
+    StatsCounter.objects.bulk_create([
+        StatsCounter(name='users', value=User.objects.count()),
+        StatsCounter(name='saved_specs', value=SavedSpecification.objects.count()),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recommender_api', '0015_llmcalllog_specs_tier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatsRollupUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket_start', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='statsrollupuser',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket_start', 'user'), name='unique_stats_rollup_user'),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
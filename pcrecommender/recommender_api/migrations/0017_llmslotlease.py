@@ -0,0 +1,22 @@
+# Generated by Django 4.2.21 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0016_stats_counters_seen_users'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMSlotLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField(unique=True)),
+                ('holder', models.CharField(blank=True, default='', max_length=64)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.21 on 2026-10-17 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0017_llmslotlease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationjob',
+            name='not_before',
+            field=models.DateTimeField(blank=True, help_text='งานที่ถูก admission control ปฏิเสธจะถูกดึงใหม่หลังเวลานี้', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.21 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender_api', '0018_recommendationjob_not_before'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationjob',
+            name='rate_limited',
+            field=models.BooleanField(default=True, help_text='False = client ที่ไม่ถูกหัก token bucket (เช่น งาน batch/warmer)'),
+        ),
+    ]
@@ -1,6 +1,10 @@
 # recommender_api/models.py
+import uuid
+from decimal import Decimal, InvalidOperation
+
 from django.db import models
 from django.conf import settings 
+from django.utils import timezone
 
 class SavedSpecification(models.Model):
     user = models.ForeignKey(
@@ -29,8 +33,65 @@ class SavedSpecification(models.Model):
     )
     saved_at = models.DateTimeField(auto_now_add=True)
 
+    # คอลัมน์ที่ดึงออกมาจาก build_details/source_prompt_details เพื่อ filter/เรียงลำดับในฐานข้อมูลได้
+    # เติมโดย serializer ตอนบันทึก และ backfill แถวเก่าด้วย backfill_saved_spec_columns
+    build_name = models.CharField(max_length=200, blank=True, default='', db_index=True)
+    cpu_name = models.CharField(max_length=200, blank=True, default='', db_index=True)
+    gpu_name = models.CharField(max_length=200, blank=True, default='', db_index=True)
+    total_price_thb = models.DecimalField(max_digits=12, decimal_places=2, default=0, db_index=True)
+    budget_thb = models.DecimalField(max_digits=12, decimal_places=2, default=0, db_index=True)
+    explanation = models.ForeignKey(
+        'BuildExplanation',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='saved_specs',
+        help_text="คำอธิบายจาก explain-build ที่ผูกกับสเปคนี้ (ถ้ามี)"
+    )
+
     class Meta:
         ordering = ['-saved_at']
+        indexes = [
+            # สำหรับ cursor pagination: รายการของผู้ใช้แต่ละคน และรายการทั้งหมดของ admin
+            models.Index(fields=['user', '-saved_at', '-id'], name='savedspec_user_saved_at_idx'),
+            models.Index(fields=['-saved_at', '-id'], name='savedspec_saved_at_idx'),
+        ]
+
+    BUILD_COLUMNS = ['build_name', 'cpu_name', 'gpu_name', 'total_price_thb', 'budget_thb']
+
+    @staticmethod
+    def build_columns_from(build_details, source_prompt_details):
+        """
+        คืนค่า dict ของคอลัมน์ใน BUILD_COLUMNS ที่ดึงจาก JSON (ค่าที่หาไม่ได้จะเป็น '' หรือ 0)
+        """
+        build_details = build_details if isinstance(build_details, dict) else {}
+        source_prompt_details = source_prompt_details if isinstance(source_prompt_details, dict) else {}
+
+        def component_name(key):
+            component = build_details.get(key)
+            if isinstance(component, dict):
+                component = component.get('name')
+            return str(component or '').strip()[:200]
+
+        def to_decimal(*values):
+            for value in values:
+                try:
+                    amount = Decimal(str(value)).quantize(Decimal('0.01'))
+                except (InvalidOperation, TypeError, ValueError):
+                    continue
+                if amount.is_finite() and abs(amount) < Decimal('1e10'):
+                    return amount
+            return Decimal('0')
+
+        return {
+            'build_name': str(build_details.get('build_name') or '').strip()[:200],
+            'cpu_name': component_name('cpu'),
+            'gpu_name': component_name('gpu'),
+            'total_price_thb': to_decimal(
+                build_details.get('calculated_total_price_thb'), build_details.get('total_price_estimate_thb')
+            ),
+            'budget_thb': to_decimal(source_prompt_details.get('budget')),
+        }
 
     def __str__(self):
         display_name = self.name if self.name else f"Spec saved on {self.saved_at.strftime('%Y-%m-%d')}"
@@ -44,8 +105,21 @@ class RecommendationRequestLog(models.Model):
         blank=True,
         related_name='recommendation_logs'
     )
-    timestamp = models.DateTimeField(auto_now_add=True)
+    OUTCOME_CHOICES = [
+        ('success', 'Success'),
+        ('invalid', 'Invalid request'),
+        ('error', 'Error'),
+    ]
+
+    # ใช้ default แทน auto_now_add เพราะ log ถูกเขียนแบบ bulk_create ภายหลัง (เวลาต้องเป็นเวลาที่ request เข้ามา)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
     request_payload = models.JSONField(null=True, blank=True) 
+    outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES, default='success')
+    cache_status = models.CharField(max_length=20, blank=True, default="")
+    latency_ms = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="เวลาที่ใช้สร้างคำแนะนำ (Gemini/cache/catalog) เป็นมิลลิวินาที"
+    )
 
     class Meta:
         ordering = ['-timestamp']
@@ -54,4 +128,271 @@ class RecommendationRequestLog(models.Model):
 
     def __str__(self):
         user_str = self.user.username if self.user else "Anonymous"
-        return f"Request by {user_str} at {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"Request by {user_str} at {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+class RecommendationCacheEntry(models.Model):
+    """
+    tier ที่สองของ recommendation cache (แชร์กันทุก gunicorn worker และอยู่รอดหลัง restart)
+    """
+    cache_key = models.CharField(
+        max_length=64,
+        unique=True,
+        help_text="sha256 ของ canonical query (budget bucket, desired_parts, preferred_games)"
+    )
+    query = models.JSONField(help_text="canonical query ที่ใช้สร้าง cache_key")
+    response = models.JSONField(help_text="ผลลัพธ์จาก get_specs_from_gemini ที่สำเร็จแล้ว")
+    created_at = models.DateTimeField(auto_now_add=True)
+    refreshed_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+    hit_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-refreshed_at']
+        verbose_name = "Recommendation Cache Entry"
+        verbose_name_plural = "Recommendation Cache Entries"
+
+    def __str__(self):
+        return f"{self.cache_key[:12]} (hits: {self.hit_count}, expires {self.expires_at.strftime('%Y-%m-%d %H:%M')})"
+
+
+class Component(models.Model):
+    """
+    catalog ส่วนประกอบคอมพิวเตอร์พร้อมราคา ใช้กับ optimizer เพื่อจัดสเปคโดยไม่ต้องเรียก LLM
+    """
+    CATEGORY_CHOICES = [
+        ('cpu', 'CPU'),
+        ('gpu', 'GPU'),
+        ('ram', 'RAM'),
+        ('storage', 'Storage'),
+        ('motherboard', 'Motherboard'),
+        ('psu', 'PSU'),
+        ('case', 'Case'),
+        ('cooler', 'Cooler'),
+    ]
+
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
+    name = models.CharField(max_length=200)
+    price_thb = models.DecimalField(max_digits=10, decimal_places=2)
+    socket = models.CharField(
+        max_length=100, blank=True, default="",
+        help_text="CPU/Motherboard: socket เดียว (เช่น AM5) / Cooler: รายการ socket คั่นด้วย , (ว่าง = ใช้ได้ทุก socket)"
+    )
+    chipset = models.CharField(max_length=50, blank=True, default="", help_text="ชิปเซ็ตของ Motherboard (เช่น B650)")
+    memory_type = models.CharField(max_length=10, blank=True, default="", help_text="DDR4/DDR5 สำหรับ RAM และ Motherboard")
+    tdp_watts = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="CPU/GPU: กำลังไฟที่ใช้ / PSU: กำลังไฟสูงสุดที่จ่ายได้"
+    )
+    performance_score = models.FloatField(default=0, help_text="คะแนนประสิทธิภาพเทียบกันภายในหมวดเดียวกัน")
+    in_stock = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['category', 'price_thb']
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'name'], name='unique_component_category_name'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'in_stock', 'price_thb'], name='component_category_price_idx'),
+        ]
+
+    def __str__(self):
+        return f"[{self.category}] {self.name} (฿{self.price_thb:,.0f})"
+
+
+class BuildExplanation(models.Model):
+    """
+    คำอธิบายจาก explain-build เก็บตาม hash ของ build ที่ normalize แล้ว + ส่วนที่เกี่ยวข้องของ original_query
+    build เดียวกันที่ถูกขอคำอธิบายซ้ำ (เปิด saved spec เดิม, แชร์ลิงก์) จะไม่ต้องเรียก Gemini อีก
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    explanation = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    refreshed_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+    hit_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-refreshed_at']
+        verbose_name = "Build Explanation"
+        verbose_name_plural = "Build Explanations"
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} (hits: {self.hit_count})"
+
+
+class StatsRollup(models.Model):
+    """
+    ตัวนับสถิติที่รวมไว้ล่วงหน้าเป็นรายชั่วโมง/รายวัน (UTC) สำหรับ AdminStatsView
+    อัปเดตแบบ incremental เมื่อ log ถูก flush และเมื่อมีการบันทึกสเปค / สร้างใหม่ทั้งหมดด้วย backfill_stats_rollups
+    """
+    PERIOD_CHOICES = [
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField()
+    requests = models.PositiveIntegerField(default=0)
+    unique_users = models.PositiveIntegerField(default=0, help_text="จำนวนผู้ใช้ที่ login แล้วและขอคำแนะนำในช่วงนี้")
+    saves = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['period', 'bucket_start']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket_start'], name='unique_stats_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.bucket_start.strftime('%Y-%m-%d %H:%M')}: {self.requests} requests"
+
+
+class StatsRollupUser(models.Model):
+    """
+    ผู้ใช้ที่ถูกนับใน unique_users ของ rollup bucket แล้ว ใช้นับ unique_users แบบ incremental
+    (เก็บไว้ STATS_SEEN_USERS_RETENTION_DAYS วัน แถวเก่าถูกลบโดย purge_expired_caches)
+    """
+    period = models.CharField(max_length=4, choices=StatsRollup.PERIOD_CHOICES)
+    bucket_start = models.DateTimeField(db_index=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket_start', 'user'], name='unique_stats_rollup_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.bucket_start.strftime('%Y-%m-%d %H:%M')}: user {self.user_id}"
+
+
+class StatsCounter(models.Model):
+    """
+    ตัวนับรวมทั้งระบบ (เช่น users, saved_specs) ที่อัปเดตด้วย signal ตอนสร้าง/ลบแถว
+    AdminStatsView จึงไม่ต้อง COUNT ทั้งตาราง
+    """
+    name = models.CharField(max_length=32, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class LLMCallLog(models.Model):
+    """
+    บันทึกการเรียก LLM หนึ่งครั้ง (latency, token usage, ผลการ parse) เขียนเป็นชุดผ่าน llm_call_writer
+    """
+    OPERATION_CHOICES = [
+        ('specs', 'Recommend specs'),
+        ('specs_stream', 'Recommend specs (stream)'),
+        ('specs_tier', 'Recommend specs (one tier of a fan-out)'),
+        ('explanation', 'Explain build'),
+    ]
+    PROMPT_VARIANT_CHOICES = [
+        ('budget_only', 'Budget only'),
+        ('parts_games', 'Budget with desired parts/games'),
+        ('explanation', 'Build explanation'),
+    ]
+    OUTCOME_CHOICES = [
+        ('ok', 'OK'),
+        ('bad_structure', 'Unexpected JSON structure'),
+        ('parse_error', 'Invalid JSON'),
+        ('blocked', 'Blocked by safety filter'),
+        ('api_error', 'API error'),
+        ('timeout', 'Deadline exceeded'),
+        ('circuit_open', 'Rejected by open circuit'),
+        ('shed', 'Shed by admission control'),
+    ]
+
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+    operation = models.CharField(max_length=16, choices=OPERATION_CHOICES)
+    prompt_variant = models.CharField(max_length=16, choices=PROMPT_VARIANT_CHOICES)
+    model_name = models.CharField(max_length=64)
+    outcome = models.CharField(max_length=16, choices=OUTCOME_CHOICES)
+    latency_ms = models.PositiveIntegerField()
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    response_tokens = models.PositiveIntegerField(null=True, blank=True)
+    price_overrides = models.PositiveSmallIntegerField(
+        default=0, help_text="จำนวน build ที่ราคารวมถูกคำนวณใหม่เพราะไม่ตรงกับผลรวมของส่วนประกอบ"
+    )
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['operation', 'timestamp'], name='llmcall_operation_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.operation} {self.outcome} {self.latency_ms}ms @ {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
+
+
+class RateLimitBucket(models.Model):
+    """
+    token bucket ของ admission control หนึ่งแถวต่อผู้ใช้/IP (key เช่น "llm:user:12" หรือ "llm:ip:1.2.3.4")
+    tokens ถูกเติมตามเวลาที่ผ่านไปตอนอ่าน จึงไม่ต้องมีงานเบื้องหลังเติมให้
+    """
+    key = models.CharField(max_length=128, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f} tokens"
+
+
+class LLMSlotLease(models.Model):
+    """
+    slot ของการเรียก LLM พร้อมกันทั้งระบบ (admission control) หนึ่งแถวต่อ slot
+    slot ถูกยืมด้วย UPDATE แบบมีเงื่อนไข (ว่างหรือ lease หมดอายุแล้ว) และคืนด้วย holder token จึงใช้ได้จากทุก connection/thread
+    ถ้า worker ตายระหว่างถือ slot แถวจะว่างเองเมื่อ expires_at ผ่านไป
+    """
+    slot = models.PositiveSmallIntegerField(unique=True)
+    holder = models.CharField(max_length=64, blank=True, default="")
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"slot {self.slot}: {self.holder or 'free'}"
+
+
+class RecommendationJob(models.Model):
+    """
+    คำขอ recommend-specs แบบ job: view บันทึกแถวสถานะ queued แล้วตอบ job id ทันที
+    worker (manage.py run_recommendation_workers) ดึงงานด้วย SELECT ... FOR UPDATE SKIP LOCKED แล้วเก็บผลไว้ที่ result
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='recommendation_jobs'
+    )
+    client_key = models.CharField(max_length=128, help_text="client ของ admission control เช่น user:12 หรือ ip:1.2.3.4")
+    rate_limited = models.BooleanField(default=True, help_text="False = client ที่ไม่ถูกหัก token bucket (เช่น งาน batch/warmer)")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    source = models.CharField(max_length=16, default='gemini')
+    request_payload = models.JSONField(help_text="user_prompt_input ที่ผ่านการตรวจสอบแล้ว")
+    result = models.JSONField(null=True, blank=True, help_text="response ของ recommend-specs (รวมกรณี error)")
+    cache_status = models.CharField(max_length=20, blank=True, default="")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=64, blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True, help_text="ถ้า worker ตายระหว่างทำงาน งานจะถูกดึงใหม่หลังเวลานี้")
+    not_before = models.DateTimeField(null=True, blank=True, help_text="งานที่ถูก admission control ปฏิเสธจะถูกดึงใหม่หลังเวลานี้")
+    finished_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='recjob_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
@@ -0,0 +1,253 @@
+# recommender_api/optimizer.py
+"""
+จัดสเปคจาก Component catalog แบบ deterministic โดยไม่ต้องเรียก LLM
+
+แนวคิด: ตัดส่วนประกอบที่ "แพงกว่าแต่ไม่แรงกว่า" ทิ้ง (Pareto frontier) แล้วลองทุกคู่ CPU x GPU
+เติมส่วนที่เหลือด้วยชิ้นที่ถูกที่สุดที่เข้ากันได้ (motherboard, cooler, psu, case)
+และใช้เงินที่เหลือกับ RAM/Storage ที่ดีที่สุด ให้คะแนนแบบถ่วงน้ำหนักแล้วเลือกชุดที่ดีที่สุด
+"""
+import re
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from .models import Component
+
+# tdp = กำลังไฟที่ชิ้นนั้นใช้ (CPU/GPU), wattage = กำลังไฟสูงสุดที่จ่ายได้ (เฉพาะ PSU)
+Part = namedtuple('Part', ['name', 'price', 'socket', 'chipset', 'memory_type', 'tdp', 'score', 'wattage'])
+
+CATEGORY_KEYS = ['cpu', 'gpu', 'ram', 'storage', 'motherboard', 'psu', 'case', 'cooler']
+DEFAULT_WEIGHTS = {"cpu": 0.30, "gpu": 0.45, "ram": 0.10, "storage": 0.10, "motherboard": 0.05}
+GAMING_WEIGHTS = {"cpu": 0.25, "gpu": 0.55, "ram": 0.10, "storage": 0.05, "motherboard": 0.05}
+BASE_SYSTEM_WATTS = 75
+PSU_HEADROOM = 1.3
+
+
+class CatalogSnapshot:
+    """
+    สำเนา catalog (เฉพาะของที่มีสินค้า) ในหน่วยความจำ โหลดใหม่ทุก RECOMMENDATION_CATALOG_CACHE_SECONDS
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._parts = None
+
+    def get(self):
+        with self._lock:
+            if self._parts is None or time.monotonic() - self._loaded_at > settings.RECOMMENDATION_CATALOG_CACHE_SECONDS:
+                self._parts = self._load()
+                self._loaded_at = time.monotonic()
+            return self._parts
+
+    def invalidate(self):
+        with self._lock:
+            self._parts = None
+
+    @staticmethod
+    def _load():
+        parts = {key: [] for key in CATEGORY_KEYS}
+        rows = Component.objects.filter(in_stock=True).values_list(
+            'category', 'name', 'price_thb', 'socket', 'chipset', 'memory_type', 'tdp_watts', 'performance_score'
+        )
+        for category, name, price, socket, chipset, memory_type, tdp, score in rows:
+            parts[category].append(_make_part(category, name, price, socket, chipset, memory_type, tdp, score))
+        for items in parts.values():
+            items.sort(key=lambda part: (part.price, -part.score))
+        return parts
+
+
+catalog_snapshot = CatalogSnapshot()
+
+
+def _make_part(category, name, price, socket, chipset, memory_type, tdp_watts, score):
+    """
+    แปลงแถวจาก catalog เป็น Part คอลัมน์ tdp_watts ของ PSU คือกำลังไฟที่จ่ายได้ (ถ้าว่างให้อ่านจากชื่อ เช่น "650W")
+    """
+    if category == 'psu':
+        return Part(name, float(price), socket, chipset, memory_type, 0, score, tdp_watts or _parse_watts(name))
+    return Part(name, float(price), socket, chipset, memory_type, tdp_watts or 0, score, 0)
+
+
+def _pareto_frontier(parts):
+    """
+    เก็บเฉพาะชิ้นที่แรงกว่าทุกชิ้นที่ถูกกว่า (parts ต้องเรียงตามราคาแล้ว)
+    """
+    frontier = []
+    best_score = float('-inf')
+    for part in parts:
+        if part.score > best_score:
+            frontier.append(part)
+            best_score = part.score
+    return frontier
+
+
+def _matches_text(text, wanted):
+    wanted_tokens = re.findall(r"[a-z0-9]+", str(wanted).lower())
+    text = (text or "").lower()
+    return bool(wanted_tokens) and all(token in text for token in wanted_tokens)
+
+
+def _prefer_matching(parts, wanted, field='name'):
+    """
+    ถ้าผู้ใช้ระบุชิ้นส่วนที่ต้องการและมีใน catalog ให้ใช้เฉพาะชิ้นที่ตรง ถ้าไม่มีให้ใช้ทั้งหมด
+    field คือ attribute ของ Part ที่ใช้เทียบ (เช่น chipset ของ motherboard)
+    """
+    if not wanted:
+        return parts, True
+    matching = [part for part in parts if _matches_text(getattr(part, field), wanted)]
+    return (matching, True) if matching else (parts, False)
+
+
+def _socket_list(socket_field):
+    return {socket.strip().lower() for socket in socket_field.split(',') if socket.strip()}
+
+
+def _parse_watts(value):
+    match = re.search(r"\d+", str(value or ""))
+    return int(match.group()) if match else 0
+
+
+def _normalizer(parts):
+    max_score = max((part.score for part in parts), default=0)
+    return (lambda score: score / max_score) if max_score > 0 else (lambda score: 0.0)
+
+
+def _build_dict(build_name, chosen, budget, score):
+    build = {"build_name": build_name}
+    total = 0.0
+    for key in CATEGORY_KEYS:
+        part = chosen[key]
+        build[key] = {"name": part.name, "price_thb": part.price}
+        total += part.price
+    build["total_price_estimate_thb"] = total
+    build["calculated_total_price_thb"] = total
+    build["notes"] = (
+        f"จัดจาก component catalog ภายในระบบ คะแนนประสิทธิภาพรวม {score * 100:.0f}/100 "
+        f"ใช้งบ {total / budget * 100:.0f}% ของ {budget:,.0f} บาท"
+    )
+    return build
+
+
+def optimize_builds(budget, desired_parts=None, preferred_games=None, parts=None, max_builds=None):
+    """
+    คืนค่า (builds, notes) โดย builds เรียงจากชุดที่คะแนนสูงสุด ราคาไม่เกิน budget และทุกชิ้นเข้ากันได้
+    """
+    desired_parts = desired_parts or {}
+    parts = parts if parts is not None else catalog_snapshot.get()
+    max_builds = max_builds or settings.RECOMMENDATION_CATALOG_MAX_BUILDS
+    weights = GAMING_WEIGHTS if preferred_games else DEFAULT_WEIGHTS
+    notes = []
+
+    if any(not parts[key] for key in CATEGORY_KEYS):
+        missing = [key for key in CATEGORY_KEYS if not parts[key]]
+        return [], [f"catalog ยังไม่มีส่วนประกอบหมวด: {', '.join(missing)}"]
+
+    normalize = {key: _normalizer(parts[key]) for key in CATEGORY_KEYS}
+
+    candidate_parts = {}
+    for key, wanted, field in (("cpu", desired_parts.get("cpu"), 'name'), ("gpu", desired_parts.get("gpu"), 'name'),
+                               ("ram", desired_parts.get("ram"), 'name'),
+                               ("motherboard", desired_parts.get("motherboard_chipset"), 'chipset')):
+        candidate_parts[key], matched = _prefer_matching(parts[key], wanted, field)
+        if not matched:
+            notes.append(f"ไม่พบ {key.upper()} '{wanted}' ใน catalog จึงเลือกรุ่นที่ใกล้เคียงแทน")
+
+    storage_wanted = " ".join(filter(None, [desired_parts.get("storage_type"), desired_parts.get("storage_size")]))
+    candidate_parts["storage"], matched = _prefer_matching(parts["storage"], storage_wanted)
+    if not matched:
+        notes.append(f"ไม่พบ Storage '{storage_wanted}' ใน catalog จึงเลือกรุ่นที่ใกล้เคียงแทน")
+
+    min_psu_watts = _parse_watts(desired_parts.get("psu_wattage"))
+    cpus = _pareto_frontier(candidate_parts["cpu"])
+    gpus = _pareto_frontier(candidate_parts["gpu"])
+    storages = _pareto_frontier(candidate_parts["storage"])
+    cheapest_storage = storages[0]
+    cheapest_case = parts["case"][0]
+
+    candidates = []
+    for cpu in cpus:
+        cpu_socket = cpu.socket.lower()
+        motherboard = next(
+            (mb for mb in candidate_parts["motherboard"] if mb.socket.lower() == cpu_socket), None
+        )
+        cooler = next(
+            (c for c in parts["cooler"] if not c.socket or cpu_socket in _socket_list(c.socket)), None
+        )
+        if motherboard is None or cooler is None:
+            continue
+        rams = _pareto_frontier([
+            ram for ram in candidate_parts["ram"]
+            if not motherboard.memory_type or not ram.memory_type or ram.memory_type == motherboard.memory_type
+        ])
+        if not rams:
+            continue
+
+        for gpu in gpus:
+            required_watts = max(min_psu_watts, (cpu.tdp + gpu.tdp + BASE_SYSTEM_WATTS) * PSU_HEADROOM)
+            psu = next((p for p in parts["psu"] if p.wattage >= required_watts), None)
+            if psu is None:
+                continue
+
+            fixed_cost = cpu.price + gpu.price + motherboard.price + cooler.price + psu.price + cheapest_case.price
+            remainder = budget - fixed_cost
+            if remainder < rams[0].price + cheapest_storage.price:
+                continue
+
+            ram = next(r for r in reversed(rams) if r.price + cheapest_storage.price <= remainder)
+            storage = next(s for s in reversed(storages) if s.price <= remainder - ram.price)
+
+            chosen = {
+                "cpu": cpu, "gpu": gpu, "ram": ram, "storage": storage,
+                "motherboard": motherboard, "psu": psu, "case": cheapest_case, "cooler": cooler,
+            }
+            score = sum(weight * normalize[key](chosen[key].score) for key, weight in weights.items())
+            total = fixed_cost + ram.price + storage.price
+            candidates.append((score, total, chosen))
+
+    if not candidates:
+        notes.append("ไม่พบชุดที่เข้ากันได้ภายใต้งบประมาณนี้ใน catalog")
+        return [], notes
+
+    candidates.sort(key=lambda item: (-item[0], item[1]))
+    selections = [("ชุดประสิทธิภาพสูงสุดในงบ (Catalog)", candidates[0])]
+    used_gpus = {candidates[0][2]["gpu"].name}
+
+    value_candidates = [c for c in candidates if c[2]["gpu"].name not in used_gpus]
+    if value_candidates and len(selections) < max_builds:
+        best_value = max(value_candidates, key=lambda item: item[0] / item[1])
+        selections.append(("ชุดคุ้มค่าที่สุด (Catalog)", best_value))
+        used_gpus.add(best_value[2]["gpu"].name)
+
+    for candidate in candidates:
+        if len(selections) >= max_builds:
+            break
+        if candidate[2]["gpu"].name not in used_gpus:
+            selections.append((f"ชุดทางเลือก {len(selections) - 1} (Catalog)", candidate))
+            used_gpus.add(candidate[2]["gpu"].name)
+
+    builds = [_build_dict(name, chosen, budget, score) for name, (score, _total, chosen) in selections]
+    return builds, notes
+
+
+def recommend_from_catalog(budget, desired_parts=None, preferred_games=None):
+    """
+    คืน response รูปแบบเดียวกับ get_specs_from_gemini แต่จัดสเปคจาก catalog (ใช้เวลาระดับมิลลิวินาที)
+    """
+    builds, notes = optimize_builds(float(budget), desired_parts, preferred_games)
+    analysis_notes = "จัดสเปคจาก component catalog ภายในระบบ (ไม่ได้ใช้ AI) ราคาอ้างอิงตามข้อมูลล่าสุดใน catalog"
+    if notes:
+        analysis_notes += " หมายเหตุ: " + " / ".join(notes)
+
+    response = {
+        "budget_thb": float(budget),
+        "currency_provided_to_ai": "THB",
+        "recommendations": builds,
+        "analysis_notes": analysis_notes,
+        "source": "catalog",
+    }
+    if not builds:
+        response["error"] = "ไม่สามารถจัดสเปคจาก catalog ได้: " + " / ".join(notes)
+    return response
@@ -0,0 +1,35 @@
+# recommender_api/pagination.py
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class BoundedCursorPagination(CursorPagination):
+    """
+    Cursor pagination (keyset) ที่ใช้ index แทน OFFSET ทำให้ทุกหน้าเร็วเท่ากันแม้ตารางจะโตขึ้น
+    ขนาดหน้าเริ่มต้น API_PAGE_SIZE ปรับได้ด้วย ?page_size= แต่ไม่เกิน API_MAX_PAGE_SIZE
+    response: {"next": <url|null>, "previous": <url|null>, "results": [...]}
+    """
+    page_size = settings.API_PAGE_SIZE
+    max_page_size = settings.API_MAX_PAGE_SIZE
+    page_size_query_param = 'page_size'
+
+    def get_ordering(self, request, queryset, view):
+        # ?q= (search.py) เรียงตามความเกี่ยวข้องแทน ordering ปกติ search_key ไม่ซ้ำกันเลย cursor จึงไม่ข้าม/ซ้ำแถว
+        # แม้ rank จะเท่ากันหลายแถว (SQLite ทุกแถวเป็น 0)
+        if 'search_key' in queryset.query.annotations:
+            return ('-search_key',)
+        return super().get_ordering(request, queryset, view)
+
+
+class SavedSpecCursorPagination(BoundedCursorPagination):
+    # ใช้ index (user, -saved_at, -id) และ (-saved_at, -id) ของ SavedSpecification
+    ordering = ('-saved_at', '-id')
+
+
+class UserCursorPagination(BoundedCursorPagination):
+    # ใช้ index auth_user_date_joined_idx ที่สร้างใน migration 0008
+    ordering = ('-date_joined', '-id')
+
+
+class RequestLogCursorPagination(BoundedCursorPagination):
+    ordering = ('-timestamp', '-id')
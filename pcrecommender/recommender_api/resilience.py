@@ -0,0 +1,141 @@
+# recommender_api/resilience.py
+"""
+เครื่องมือสำหรับเรียกบริการภายนอก (LLM) ให้ไม่ค้าง: deadline ต่อ request, circuit breaker,
+ตัวเก็บ latency สำหรับคำนวณ p95 (ใช้ตั้งเวลา hedged request) และ backoff แบบสุ่ม (full jitter)
+ทั้งหมดใช้ได้ทั้งใน thread (WSGI) และ event loop (ASGI) สถานะอยู่ในหน่วยความจำของแต่ละ worker
+"""
+import random
+import threading
+import time
+from collections import deque
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class Deadline:
+    """
+    เวลาสิ้นสุดของ request (time.monotonic) ที่ view สร้างแล้วส่งต่อลงไปถึงการเรียก LLM
+    """
+
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds):
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap=None):
+        """
+        เวลาที่ให้ attempt หนึ่งได้ (ไม่เกิน cap) โยน DeadlineExceeded ถ้าหมดเวลาแล้ว
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded before the call was made")
+        return min(remaining, cap) if cap else remaining
+
+
+class CircuitBreaker:
+    """
+    closed -> open เมื่อล้มเหลวติดกัน failure_threshold ครั้ง ระหว่าง open ทุกการเรียกล้มเหลวทันที (CircuitOpenError)
+    หลัง reset_seconds เข้าสู่ half_open ให้ probe ผ่านได้ทีละหนึ่ง สำเร็จแล้วกลับเป็น closed ล้มเหลวก็ open ใหม่
+    """
+
+    def __init__(self, name, failure_threshold, reset_seconds):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._counters = {"opened": 0, "rejected": 0}
+
+    def allow(self):
+        """
+        คืนค่า True ถ้าเรียกได้ ผู้เรียกต้องรายงานผลด้วย record_success/record_failure ทุกครั้งที่ได้ True
+        """
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = "half_open"
+                self._probe_in_flight = False
+            if self._state == "closed":
+                return True
+            if self._state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._counters["rejected"] += 1
+            return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open; failing fast")
+
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == "half_open" or (self._state == "closed" and self._failures >= self.failure_threshold):
+                if self._state != "open":
+                    self._counters["opened"] += 1
+                    print(f"Warning: circuit '{self.name}' opened after {self._failures} consecutive failures")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """
+        ใช้เมื่อ attempt ที่ได้รับอนุญาตถูกยกเลิกโดยไม่รู้ผล (เช่น hedged attempt ที่แพ้)
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {"state": self._state, "consecutive_failures": self._failures, **self._counters}
+
+
+class LatencyTracker:
+    """
+    เก็บ latency ของการเรียกที่สำเร็จล่าสุด window รายการต่อ key แล้วคำนวณ percentile
+    """
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key, fraction, min_samples=20):
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def backoff_delay(attempt, base_seconds, cap_seconds):
+    # full jitter: สุ่มระหว่าง 0 ถึง base * 2^attempt (ไม่เกิน cap) เพื่อไม่ให้ทุก worker retry พร้อมกัน
+    return random.uniform(0, min(cap_seconds, base_seconds * (2 ** attempt)))
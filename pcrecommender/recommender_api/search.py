@@ -0,0 +1,101 @@
+# recommender_api/search.py
+"""
+ค้นหา saved specs และ request logs สำหรับ Admin (?q=)
+
+บน PostgreSQL ใช้ GIN index สองแบบที่สร้างใน migration 0010 บน expression เดียวกับที่ query ใช้
+(ถ้าแก้ expression ในไฟล์นี้ต้องสร้าง migration ใหม่สำหรับ index ด้วย):
+- tsvector ('simple' config เพราะข้อมูลมีทั้งไทยและอังกฤษ) สำหรับการค้นหาเป็นคำ เช่น "rtx 4060"
+- pg_trgm (gin_trgm_ops) สำหรับ ILIKE '%...%' ซึ่งครอบคลุมคำบางส่วนและข้อความภาษาไทยที่ไม่มีช่องว่าง
+ผลลัพธ์ถูกเรียงด้วย search_rank = ts_rank + similarity
+ฐานข้อมูลอื่น (เช่น SQLite ตอนพัฒนา) ใช้ icontains ธรรมดาและ search_rank เป็น 0
+
+cursor pagination ต้องการค่าที่ไม่ซ้ำกัน จึงเรียงด้วย search_key = search_rank (ปัด 6 ตำแหน่ง) x 10^12 + id
+(ตัวเลข numeric แบบ exact ไม่มีปัญหาปัดเศษ float ตอนแปลง cursor และไม่ต้องใช้ offset เมื่อ rank เท่ากันหลายแถว)
+"""
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import BooleanField, DecimalField, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Round
+
+from .models import RecommendationRequestLog, SavedSpecification
+
+SEARCH_CONFIG = 'simple'
+MAX_QUERY_LENGTH = 200
+SEARCH_KEY_ID_SPAN = Decimal(10 ** 12)
+
+
+def saved_spec_document_sql(table=''):
+    prefix = f'{table}.' if table else ''
+    return (
+        f"(coalesce({prefix}name, '') || ' ' || {prefix}build_name || ' ' || {prefix}cpu_name"
+        f" || ' ' || {prefix}gpu_name || ' ' || coalesce({prefix}user_notes, ''))"
+    )
+
+
+def request_log_document_sql(table=''):
+    prefix = f'{table}.' if table else ''
+    return f"({prefix}request_payload)::text"
+
+
+def request_log_tsvector_sql(table=''):
+    prefix = f'{table}.' if table else ''
+    return f"jsonb_to_tsvector('{SEARCH_CONFIG}', {prefix}request_payload, '[\"string\", \"numeric\"]')"
+
+
+def _like_pattern(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _postgres_search(queryset, query, tsvector_sql, document_sql):
+    match = RawSQL(
+        f"({tsvector_sql} @@ plainto_tsquery('{SEARCH_CONFIG}', %s) OR {document_sql} ILIKE %s)",
+        [query, _like_pattern(query)],
+        output_field=BooleanField(),
+    )
+    rank = RawSQL(
+        f"(ts_rank({tsvector_sql}, plainto_tsquery('{SEARCH_CONFIG}', %s)) + similarity({document_sql}, %s))",
+        [query, query],
+        output_field=FloatField(),
+    )
+    return queryset.annotate(search_match=match, search_rank=rank).filter(search_match=True)
+
+
+def _with_search_key(queryset):
+    key_field = DecimalField(max_digits=32, decimal_places=6)
+    rank = Round(Cast('search_rank', DecimalField(max_digits=20, decimal_places=6)), 6)
+    return queryset.annotate(
+        search_key=Cast(rank * Value(SEARCH_KEY_ID_SPAN, output_field=key_field) + F('id'), key_field)
+    )
+
+
+def normalize_query(raw_query):
+    return " ".join(str(raw_query or "").split())[:MAX_QUERY_LENGTH]
+
+
+def search_saved_specs(queryset, raw_query):
+    query = normalize_query(raw_query)
+    if connection.vendor != 'postgresql':
+        lookups = Q()
+        for field in ('name', 'build_name', 'cpu_name', 'gpu_name', 'user_notes'):
+            lookups |= Q(**{f'{field}__icontains': query})
+        return _with_search_key(queryset.filter(lookups).annotate(search_rank=Value(0.0, output_field=FloatField())))
+
+    table = connection.ops.quote_name(SavedSpecification._meta.db_table)
+    document = saved_spec_document_sql(table)
+    return _with_search_key(_postgres_search(queryset, query, f"to_tsvector('{SEARCH_CONFIG}', {document})", document))
+
+
+def search_request_logs(queryset, raw_query):
+    query = normalize_query(raw_query)
+    if connection.vendor != 'postgresql':
+        return _with_search_key(queryset.filter(request_payload__icontains=query).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        ))
+
+    table = connection.ops.quote_name(RecommendationRequestLog._meta.db_table)
+    return _with_search_key(
+        _postgres_search(queryset, query, request_log_tsvector_sql(table), request_log_document_sql(table))
+    )
@@ -1,16 +1,36 @@
 # recommender_api/serializers.py
 from rest_framework import serializers
 from django.contrib.auth.models import User 
-from .models import SavedSpecification
+from .models import SavedSpecification, RecommendationRequestLog
+
+class SparseFieldsetMixin:
+    """
+    รองรับ ?fields=id,name,... ให้ client ขอเฉพาะ field ที่ต้องใช้ (ชื่อ field ที่ไม่รู้จักจะถูกข้าม)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = getattr(request, 'query_params', {}).get('fields') if request is not None else None
+        if not requested:
+            return
+        wanted = {name.strip() for name in requested.split(',')} & set(self.fields)
+        if wanted:
+            for field_name in set(self.fields) - wanted:
+                self.fields.pop(field_name)
+
 
 class UserSerializer(serializers.ModelSerializer): 
     class Meta:
         model = User
         fields = ['id', 'pk', 'username', 'email', 'first_name', 'last_name', 'is_staff', 'is_superuser'] 
 
-class SavedSpecificationSerializer(serializers.ModelSerializer):
+class SavedSpecificationSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     # (Optional) ถ้าต้องการแสดง username ของ user ใน response
     # user = serializers.StringRelatedField(read_only=True)
+    explanation_text = serializers.CharField(source='explanation.explanation', read_only=True, default=None)
+    total_price_thb = serializers.FloatField(read_only=True)
+    budget_thb = serializers.FloatField(read_only=True)
 
     class Meta:
         model = SavedSpecification
@@ -21,13 +41,55 @@ class SavedSpecificationSerializer(serializers.ModelSerializer):
             'build_details',
             'source_prompt_details',
             'user_notes',
-            'saved_at'
+            'saved_at',
+            'explanation_text',
+            'build_name',
+            'cpu_name',
+            'gpu_name',
+            'total_price_thb',
+            'budget_thb',
         ]
-        read_only_fields = ['user', 'saved_at'] 
+        read_only_fields = ['user', 'saved_at', *SavedSpecification.BUILD_COLUMNS]
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
+        validated_data.update(SavedSpecification.build_columns_from(
+            validated_data.get('build_details'), validated_data.get('source_prompt_details')
+        ))
         return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        if 'build_details' in validated_data or 'source_prompt_details' in validated_data:
+            validated_data.update(SavedSpecification.build_columns_from(
+                validated_data.get('build_details', instance.build_details),
+                validated_data.get('source_prompt_details', instance.source_prompt_details),
+            ))
+        return super().update(instance, validated_data)
+
+
+class SavedSpecificationSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    ใช้กับ list: ไม่มี build_details ทั้งก้อน ใช้คอลัมน์ที่ดึงออกมาแล้ว (build_name, total_price_thb, ...)
+    รายละเอียดเต็มดูได้จาก retrieve
+    """
+    total_price_thb = serializers.FloatField(read_only=True)
+    budget_thb = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SavedSpecification
+        fields = [
+            'id',
+            'name',
+            'build_name',
+            'cpu_name',
+            'gpu_name',
+            'total_price_thb',
+            'budget_thb',
+            'source_prompt_details',
+            'user_notes',
+            'saved_at',
+        ]
+        read_only_fields = fields
     
 class AdminUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -37,7 +99,7 @@ class AdminUserSerializer(serializers.ModelSerializer):
                   'date_joined', 'last_login']
         read_only_fields = ['date_joined', 'last_login'] 
 
-class AdminSavedSpecSerializer(serializers.ModelSerializer):
+class AdminSavedSpecSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField() 
     build_name_preview = serializers.SerializerMethodField()
 
@@ -51,4 +113,25 @@ class AdminSavedSpecSerializer(serializers.ModelSerializer):
         if isinstance(obj.build_details, dict) and obj.build_details.get('build_name'):
             name = obj.build_details.get('build_name', '')
             return name[:50] + '...' if len(name) > 50 else name
-        return "-"
\ No newline at end of file
+        return "-"
+
+
+class AdminSavedSpecSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    user = serializers.StringRelatedField()
+    total_price_thb = serializers.FloatField(read_only=True)
+    budget_thb = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SavedSpecification
+        fields = ['id', 'user', 'name', 'build_name', 'cpu_name', 'gpu_name',
+                  'total_price_thb', 'budget_thb', 'user_notes', 'saved_at']
+        read_only_fields = fields
+
+
+class AdminRequestLogSerializer(serializers.ModelSerializer):
+    user = serializers.StringRelatedField()
+
+    class Meta:
+        model = RecommendationRequestLog
+        fields = ['id', 'user', 'timestamp', 'request_payload', 'outcome', 'cache_status', 'latency_ms']
+        read_only_fields = fields
@@ -1,29 +1,60 @@
 # recommender_api/services.py
-import google.generativeai as genai
-import os
 import json
-from dotenv import load_dotenv
 import decimal 
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.dispatch import Signal
 
-load_dotenv()
+from .cache import canonical_query, canonical_query_key, fit_to_budget, mark_stale, recommendation_cache
+from .similarity import find_similar_recommendation
+from .singleflight import advisory_lock, async_advisory_lock, async_recommendation_flight, recommendation_flight, recommendation_refresher
+from .streaming import IncrementalBuildParser
+from .llm_parsing import normalize_build, parse_explanation_output, parse_specs_output
+from .optimizer import recommend_from_catalog
+from .fanout import BUILD_TIERS, fanout_tiers, specs_fanout, use_fanout
+from .llm_metrics import prompt_variant_for, record_llm_call
+from .llm_backends import get_llm_backend
+from .resilience import CircuitOpenError, Deadline, DeadlineExceeded
+from .admission import Client, Overloaded, charge_rate_limit, llm_slots
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
+def is_llm_configured():
+    return get_llm_backend().is_configured()
+
+
+if not is_llm_configured():
     print("Warning: GEMINI_API_KEY is not set in .env file. AI recommendations will not work.")
 
 
-def generate_prompt(budget, currency="THB", desired_parts=None, preferred_games=None):
+# ส่งทุกครั้งที่ LLM สร้าง build ใหม่ได้สำเร็จ (kwargs: recommendations, original_query)
+# explanations.py ใช้ pre-generate คำอธิบายของแต่ละ build (EXPLANATION_PREFETCH_ENABLED)
+recommendations_generated = Signal()
+
+
+def announce_recommendations(result, budget, currency, desired_parts, preferred_games):
+    if "error" in result or not result.get("recommendations"):
+        return
+    original_query = {
+        "budget": float(budget),
+        "currency": currency,
+        "desired_parts": desired_parts or {},
+        "preferred_games": preferred_games or [],
+    }
+    recommendations_generated.send(sender=None, recommendations=result["recommendations"], original_query=original_query)
+
+
+def generate_prompt(budget, currency="THB", desired_parts=None, preferred_games=None, tier=None):
     """
     สร้าง prompt สำหรับ Gemini API โดยเน้นราคาในประเทศไทย และความถูกต้องของราคารวม
+    tier (ดู fanout.BUILD_TIERS) ใช้กับ prompt แบบงบอย่างเดียว: ขอ build เดียวของ tier นั้นแทน "อย่างน้อย 3 แบบ"
     """
     if not desired_parts:
         desired_parts = {}
 
+    intro = "โปรดทำหน้าที่เป็นผู้เชี่ยวชาญในการจัดสเปคคอมพิวเตอร์ โดยอ้างอิงราคาจากในเว็บ JIB, Advice, Banana IT (Thailand) เป็นหลัก ณ เวลาปัจจุบัน"
     prompt_lines = [
-        "โปรดทำหน้าที่เป็นผู้เชี่ยวชาญในการจัดสเปคคอมพิวเตอร์ โดยอ้างอิงราคาจากในเว็บ JIB, Advice, Banana IT (Thailand) เป็นหลัก ณ เวลาปัจจุบัน อย่างน้อย 3 แบบหรือมากกว่าที่แตกต่างกัน",
+        intro if tier else f"{intro} อย่างน้อย 3 แบบหรือมากกว่าที่แตกต่างกัน",
         f"ผู้ใช้มีงบประมาณ {budget:,.0f} บาทไทย (THB).",
         "กรุณาพิจารณาราคาตลาดปัจจุบันของส่วนประกอบต่างๆ ที่มีจำหน่ายในประเทศไทยอย่างละเอียด"
     ]
@@ -75,7 +106,12 @@ def generate_prompt(budget, currency="THB", desired_parts=None, preferred_games=
 
     is_budget_only_scenario = not (desired_parts and any(desired_parts.values())) and not preferred_games
     
-    if is_budget_only_scenario:
+    if is_budget_only_scenario and tier:
+        prompt_lines.append(BUILD_TIERS[tier])
+        prompt_lines.extend(json_output_format_details)
+        prompt_lines.append("ส่งผลลัพธ์เป็น JSON object หนึ่งชุดเท่านั้น (สเปคเดียว) ตามรูปแบบที่ระบุข้างต้น ราคาทั้งหมดเป็นบาทไทย (THB) และราคารวมต้องตรงกับผลบวกของส่วนประกอบ")
+        prompt_lines.append(example_json_object)
+    elif is_budget_only_scenario:
         prompt_lines.extend([
             "ช่วยแนะนำสเปคคอมพิวเตอร์ที่คุ้มค่าที่สุดสำหรับงบประมาณนี้ โดยเน้นความคุ้มค่า ณ เวลาปัจจุบันของราคาในประเทศไทย",
         ])
@@ -113,124 +149,534 @@ def generate_prompt(budget, currency="THB", desired_parts=None, preferred_games=
     return "\n".join(prompt_lines)
 
 
-def get_specs_from_gemini(budget, currency="THB", desired_parts=None, preferred_games=None):
-    if not GEMINI_API_KEY:
-        return {"error": "Gemini API key not configured.", "recommendations": []}
+COMPONENT_KEYS_FOR_SUM = ['cpu', 'gpu', 'ram', 'storage', 'motherboard', 'psu', 'case', 'cooler']
 
-    model_currency = "THB"
-    prompt = generate_prompt(budget, model_currency, desired_parts, preferred_games)
-    model = genai.GenerativeModel(model_name="gemini-1.5-flash-latest")
 
-    raw_gemini_text_output = ""
-    try:
-        from google.generativeai.types import GenerationConfig
-        generation_config = GenerationConfig(
-            response_mime_type="application/json",
-        )
-        response = model.generate_content(prompt, generation_config=generation_config)
-        raw_gemini_text_output = response.text
-        parsed_json = json.loads(raw_gemini_text_output)
+def reconcile_build_prices(build):
+    """
+    คำนวณ calculated_total_price_thb จากราคาส่วนประกอบ และแก้ total_price_estimate_thb
+    ถ้าราคารวมที่ Gemini ให้มาไม่ตรงกับผลรวมจริง (แก้ไข build ในที่และคืนค่า build เดิม)
+    """
+    calculated_sum = decimal.Decimal(0)
+
+    for key in COMPONENT_KEYS_FOR_SUM:
+        component_details = build.get(key)
+        if isinstance(component_details, dict) and "price_thb" in component_details:
+            try:
+                price_val = component_details.get("price_thb")
+                if price_val is not None:
+                    calculated_sum += decimal.Decimal(str(price_val))
+            except (ValueError, TypeError, decimal.InvalidOperation) as e:
+                print(f"Warning: Invalid price_thb for {key} in build '{build.get('build_name', 'Unknown Build')}': '{component_details.get('price_thb')}'. Error: {e}")
+
+    build["calculated_total_price_thb"] = float(calculated_sum)
+
+    gemini_total_str = build.get("total_price_estimate_thb")
+    if gemini_total_str is not None:
+        try:
+            gemini_total_decimal = decimal.Decimal(str(gemini_total_str))
+            if abs(gemini_total_decimal - calculated_sum) > decimal.Decimal('1.00'): 
+                print(f"PRICE MISMATCH for build '{build.get('build_name', 'Unknown Build')}': Gemini total: {gemini_total_decimal}, Calculated: {calculated_sum}. OVERRIDING WITH CALCULATED VALUE.")
+                build["total_price_estimate_thb"] = float(calculated_sum)
+                build["price_calculation_note"] = "Total price was recalculated from components for accuracy."
+            else:
+                build["total_price_estimate_thb"] = float(gemini_total_decimal)
+        except (ValueError, TypeError, decimal.InvalidOperation):
+            print(f"Warning: Gemini total_price_estimate_thb '{gemini_total_str}' is not a valid number for build '{build.get('build_name', 'Unknown Build')}'. USING CALCULATED VALUE.")
+            build["total_price_estimate_thb"] = float(calculated_sum)
+            build["price_calculation_note"] = "Gemini total price was invalid, recalculated from components."
+    else:
+        print(f"Info: Gemini did not provide total_price_estimate_thb for build '{build.get('build_name', 'Unknown Build')}'. CALCULATING AND ADDING.")
+        build["total_price_estimate_thb"] = float(calculated_sum)
+        build["price_calculation_note"] = "Total price calculated from components as it was missing."
+    return build
 
-        final_response = {
-            "budget_thb": float(budget),
-            "currency_provided_to_ai": model_currency,
-            "recommendations": [],
-            "analysis_notes": "การวิเคราะห์ AI เสร็จสมบูรณ์ อ้างอิงราคาในประเทศไทย ณ พฤษภาคม 2025"
-        }
 
-        recommendations_list = []
-        if isinstance(parsed_json, list):
-            recommendations_list = parsed_json
-        elif isinstance(parsed_json, dict) and "build_name" in parsed_json:
-            recommendations_list = [parsed_json]
-        elif isinstance(parsed_json, dict) and "recommendations" in parsed_json and isinstance(parsed_json["recommendations"], list):
-            recommendations_list = parsed_json["recommendations"]
-            if "analysis_notes" in parsed_json and isinstance(parsed_json["analysis_notes"], str):
-                 final_response["analysis_notes"] = parsed_json["analysis_notes"]
-        elif isinstance(parsed_json, dict) and "builds" in parsed_json and isinstance(parsed_json["builds"], list):
-            recommendations_list = parsed_json["builds"]
-            final_response["analysis_notes"] += " (โครงสร้าง 'builds' จาก AI ถูกใช้โดยตรง)"
-            if "analysis_notes" in parsed_json and isinstance(parsed_json["analysis_notes"], str):
-                final_response["analysis_notes"] = parsed_json["analysis_notes"]
-        
-        processed_recommendations = []
-        if recommendations_list:
-            for build in recommendations_list:
-                if not isinstance(build, dict):
-                    print(f"Warning: Skipping non-dict item in recommendations_list: {build}")
-                    continue
-
-                calculated_sum = decimal.Decimal(0)
-                component_keys_for_sum = ['cpu', 'gpu', 'ram', 'storage', 'motherboard', 'psu', 'case', 'cooler']
-                
-                for key in component_keys_for_sum:
-                    component_details = build.get(key)
-                    if isinstance(component_details, dict) and "price_thb" in component_details:
-                        try:
-                            price_val = component_details.get("price_thb")
-                            if price_val is not None:
-                                calculated_sum += decimal.Decimal(str(price_val))
-                        except (ValueError, TypeError, decimal.InvalidOperation) as e:
-                            print(f"Warning: Invalid price_thb for {key} in build '{build.get('build_name', 'Unknown Build')}': '{component_details.get('price_thb')}'. Error: {e}")
-                
-                build["calculated_total_price_thb"] = float(calculated_sum)
-
-                gemini_total_str = build.get("total_price_estimate_thb")
-                if gemini_total_str is not None:
-                    try:
-                        gemini_total_decimal = decimal.Decimal(str(gemini_total_str))
-                        if abs(gemini_total_decimal - calculated_sum) > decimal.Decimal('1.00'): 
-                            print(f"PRICE MISMATCH for build '{build.get('build_name', 'Unknown Build')}': Gemini total: {gemini_total_decimal}, Calculated: {calculated_sum}. OVERRIDING WITH CALCULATED VALUE.")
-                            build["total_price_estimate_thb"] = float(calculated_sum)
-                            build["price_calculation_note"] = "Total price was recalculated from components for accuracy."
-                        else:
-                            build["total_price_estimate_thb"] = float(gemini_total_decimal)
-                    except (ValueError, TypeError, decimal.InvalidOperation):
-                        print(f"Warning: Gemini total_price_estimate_thb '{gemini_total_str}' is not a valid number for build '{build.get('build_name', 'Unknown Build')}'. USING CALCULATED VALUE.")
-                        build["total_price_estimate_thb"] = float(calculated_sum)
-                        build["price_calculation_note"] = "Gemini total price was invalid, recalculated from components."
-                else:
-                    print(f"Info: Gemini did not provide total_price_estimate_thb for build '{build.get('build_name', 'Unknown Build')}'. CALCULATING AND ADDING.")
-                    build["total_price_estimate_thb"] = float(calculated_sum)
-                    build["price_calculation_note"] = "Total price calculated from components as it was missing."
-                
-                processed_recommendations.append(build)
-            final_response["recommendations"] = processed_recommendations
-        
-        else: 
-            if not final_response.get("error"): 
-                error_detail_msg = f"Gemini returned JSON in an unhandled top-level structure: {type(parsed_json)}"
-                print(f"Warning: {error_detail_msg}")
-                print(f"Raw parsed_json from Gemini for debugging (services.py): {parsed_json}")
-                final_response["error"] = error_detail_msg
-                final_response["raw_ai_output_on_error"] = parsed_json if isinstance(parsed_json, (dict, list)) else raw_gemini_text_output
-                final_response["recommendations"] = []
-
-        return final_response
-
-    except json.JSONDecodeError as e:
+def build_specs_response(raw_gemini_text_output, budget, model_currency="THB"):
+    """
+    แปลงข้อความ JSON จาก Gemini เป็น response มาตรฐานของ recommend-specs
+    JSON ที่เสียเล็กน้อยและโครงสร้างที่ไม่ตรงแบบถูกซ่อมใน llm_parsing ก่อน
+    (โยน json.JSONDecodeError ถ้าซ่อมไม่ได้)
+    """
+    parsed = parse_specs_output(raw_gemini_text_output)
+
+    final_response = {
+        "budget_thb": float(budget),
+        "currency_provided_to_ai": model_currency,
+        "recommendations": [],
+        "analysis_notes": parsed.analysis_notes or "การวิเคราะห์ AI เสร็จสมบูรณ์ อ้างอิงราคาในประเทศไทย ณ พฤษภาคม 2025"
+    }
+
+    if parsed.builds:
+        final_response["recommendations"] = [reconcile_build_prices(build) for build in parsed.builds]
+    else:
+        error_detail_msg = f"Gemini returned JSON without any usable build (structure: {parsed.shape})"
+        print(f"Warning: {error_detail_msg}")
+        print(f"Raw output from Gemini for debugging (services.py): {raw_gemini_text_output}")
+        final_response["error"] = error_detail_msg
+        final_response["raw_ai_output_on_error"] = raw_gemini_text_output
+
+    return final_response
+
+
+def _unavailable_error_response(e):
+    """
+    LLM ไม่พร้อม (circuit open หรือหมด deadline): view ตอบ 503 แทน 500
+    """
+    print(f"LLM unavailable (services.py): {e}")
+    return {"error": f"บริการ AI ไม่พร้อมใช้งานชั่วคราว: {e}", "ai_unavailable": True}
+
+
+def _overloaded_error_response(e):
+    """
+    admission control ไม่ให้เรียก LLM (คิวเต็ม/รอนานเกินไป): view ตอบ 429 พร้อม Retry-After
+    """
+    return {"error": f"ระบบมีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้ง: {e}", "overloaded": True, "retry_after": e.retry_after}
+
+
+def _specs_error_response(e, budget, raw_gemini_text_output, response=None):
+    if isinstance(e, Overloaded):
+        return {**_overloaded_error_response(e), "recommendations": [], "budget_thb": float(budget)}
+    if isinstance(e, (CircuitOpenError, DeadlineExceeded)):
+        return {**_unavailable_error_response(e), "recommendations": [], "budget_thb": float(budget)}
+    if isinstance(e, json.JSONDecodeError):
         error_message = f"เกิดข้อผิดพลาดในการแปลง JSON จาก Gemini: {e}. การตอบกลับดิบ: {raw_gemini_text_output}"
         print(error_message)
         return {
             "error": error_message, "recommendations": [], "budget_thb": float(budget),
             "raw_ai_output_on_error": raw_gemini_text_output
         }
-    except Exception as e:
-        error_detail = str(e)
-        raw_text_for_error = raw_gemini_text_output if raw_gemini_text_output else None
-        prompt_feedback_text = None
-        if 'response' in locals() and hasattr(response, 'prompt_feedback') and response.prompt_feedback:
-            prompt_feedback_text = str(response.prompt_feedback)
-            print(f"Prompt Feedback (services.py): {prompt_feedback_text}")
-            error_detail = f"AI request was blocked or failed. Feedback: {prompt_feedback_text}"
-        else:
-            print(f"เกิดข้อผิดพลาดที่ไม่คาดคิด (services.py): {e}")
+
+    error_detail = str(e)
+    raw_text_for_error = raw_gemini_text_output if raw_gemini_text_output else None
+    prompt_feedback_text = None
+    if response is not None and hasattr(response, 'prompt_feedback') and response.prompt_feedback:
+        prompt_feedback_text = str(response.prompt_feedback)
+        print(f"Prompt Feedback (services.py): {prompt_feedback_text}")
+        error_detail = f"AI request was blocked or failed. Feedback: {prompt_feedback_text}"
+    else:
+        print(f"เกิดข้อผิดพลาดที่ไม่คาดคิด (services.py): {e}")
+    return {
+        "error": error_detail, "recommendations": [], "budget_thb": float(budget),
+        "raw_ai_output_on_error": raw_text_for_error,
+        "prompt_feedback_on_error": prompt_feedback_text
+    }
+
+
+def _fanout_response(results, builds, completed, tiers, budget, model_currency):
+    """
+    รวมผลของแต่ละ tier เป็น response เดียว ถ้าไม่มี tier ไหนได้ build เลยคืน error ของ tier แรกที่ล้มเหลว
+    """
+    if not builds:
+        failed = [results[tier] for tier in tiers if tier in results]
+        if failed:
+            return failed[0]
         return {
-            "error": error_detail, "recommendations": [], "budget_thb": float(budget),
-            "raw_ai_output_on_error": raw_text_for_error,
-            "prompt_feedback_on_error": prompt_feedback_text
+            **_unavailable_error_response(DeadlineExceeded("No build tier finished before the request deadline")),
+            "recommendations": [], "budget_thb": float(budget),
         }
 
+    analysis_notes = "การวิเคราะห์ AI เสร็จสมบูรณ์ อ้างอิงราคาในประเทศไทย ณ พฤษภาคม 2025"
+    missing = [tier for tier in tiers if tier not in completed]
+    if missing:
+        analysis_notes += f" (ไม่มีสเปคแบบ {', '.join(missing)} เนื่องจาก AI ตอบไม่ทันหรือล้มเหลว)"
+    return {
+        "budget_thb": float(budget),
+        "currency_provided_to_ai": model_currency,
+        "recommendations": builds,
+        "analysis_notes": analysis_notes,
+        "tiers": completed,
+        **({"missing_tiers": missing} if missing else {}),
+    }
+
+
+def _generate_specs(backend, prompt, operation, variant, budget, model_currency, deadline, client):
+    response = None
+    raw_gemini_text_output = ""
+    error = None
+    started = time.monotonic()
+    try:
+        with llm_slots.acquire(client, deadline):
+            response = backend.generate(prompt, operation, deadline=deadline)
+        raw_gemini_text_output = response.text
+        result = build_specs_response(raw_gemini_text_output, budget, model_currency)
+    except Exception as e:
+        error = e
+        result = _specs_error_response(e, budget, raw_gemini_text_output, response)
+    record_llm_call(operation, variant, backend.model_name, started, response, result, error)
+    return result
+
+
+def get_specs_from_gemini(budget, currency="THB", desired_parts=None, preferred_games=None, deadline=None, client=None):
+    backend = get_llm_backend()
+    if not backend.is_configured():
+        return {"error": "Gemini API key not configured.", "recommendations": []}
+    try:
+        charge_rate_limit(client)
+    except Overloaded as e:
+        return _specs_error_response(e, budget, "")
+
+    model_currency = "THB"
+    variant = prompt_variant_for(desired_parts, preferred_games)
+    if use_fanout(desired_parts, preferred_games):
+        tiers = fanout_tiers()
+        results, builds, completed = specs_fanout.run(
+            lambda tier: _generate_specs(
+                backend, generate_prompt(budget, model_currency, tier=tier), "specs_tier", variant,
+                budget, model_currency, deadline, client,
+            ),
+            tiers, deadline,
+        )
+        result = _fanout_response(results, builds, completed, tiers, budget, model_currency)
+    else:
+        prompt = generate_prompt(budget, model_currency, desired_parts, preferred_games)
+        result = _generate_specs(backend, prompt, "specs", variant, budget, model_currency, deadline, client)
+    announce_recommendations(result, budget, currency, desired_parts, preferred_games)
+    return result
+
+
+async def get_specs_from_gemini_async(budget, currency="THB", desired_parts=None, preferred_games=None, deadline=None, client=None):
+    """
+    เหมือน get_specs_from_gemini แต่ใช้ generate_content_async เพื่อไม่ block event loop (ใช้กับ async views)
+    """
+    backend = get_llm_backend()
+    if not backend.is_configured():
+        return {"error": "Gemini API key not configured.", "recommendations": []}
+    try:
+        await sync_to_async(charge_rate_limit)(client)
+    except Overloaded as e:
+        return _specs_error_response(e, budget, "")
+
+    model_currency = "THB"
+    variant = prompt_variant_for(desired_parts, preferred_games)
+    if use_fanout(desired_parts, preferred_games):
+        tiers = fanout_tiers()
+        results, builds, completed = await specs_fanout.run_async(
+            lambda tier: _generate_specs_async(
+                backend, generate_prompt(budget, model_currency, tier=tier), "specs_tier", variant,
+                budget, model_currency, deadline, client,
+            ),
+            tiers, deadline,
+        )
+        result = _fanout_response(results, builds, completed, tiers, budget, model_currency)
+    else:
+        prompt = generate_prompt(budget, model_currency, desired_parts, preferred_games)
+        result = await _generate_specs_async(backend, prompt, "specs", variant, budget, model_currency, deadline, client)
+    # receiver แค่ส่งงานเข้า thread pool จึงเรียกใน event loop ได้
+    announce_recommendations(result, budget, currency, desired_parts, preferred_games)
+    return result
+
+
+async def _generate_specs_async(backend, prompt, operation, variant, budget, model_currency, deadline, client):
+    response = None
+    raw_gemini_text_output = ""
+    error = None
+    started = time.monotonic()
+    try:
+        async with llm_slots.acquire_async(client, deadline):
+            response = await backend.generate_async(prompt, operation, deadline=deadline)
+        raw_gemini_text_output = response.text
+        result = build_specs_response(raw_gemini_text_output, budget, model_currency)
+    except Exception as e:
+        error = e
+        result = _specs_error_response(e, budget, raw_gemini_text_output, response)
+    await sync_to_async(record_llm_call)(operation, variant, backend.model_name, started, response, result, error)
+    return result
+
+def stream_specs_from_gemini(budget, currency="THB", desired_parts=None, preferred_games=None, deadline=None, client=None):
+    """
+    generator ของ (event, data) สำหรับ SSE: เรียก Gemini แบบ stream=True และส่ง "build" ทีละชุด
+    ทันทีที่ JSON ของ build นั้นครบ (ผ่าน reconcile_build_prices แล้ว) ปิดท้ายด้วย "done" หรือ "error"
+    """
+    backend = get_llm_backend()
+    if not backend.is_configured():
+        yield "error", {"error": "Gemini API key not configured.", "recommendations": []}
+        return
+
+    model_currency = "THB"
+    prompt = generate_prompt(budget, model_currency, desired_parts, preferred_games)
+
+    parser = IncrementalBuildParser()
+    streamed_count = 0
+    response = None
+    variant = prompt_variant_for(desired_parts, preferred_games)
+    started = time.monotonic()
+    try:
+        # slot ถูกถือไว้จนกว่า stream จะจบ (หรือ client ตัดการเชื่อมต่อ) จึงต่ออายุ lease ทุกครึ่งหนึ่งของ
+        # ADMISSION_SLOT_LEASE_SECONDS ระหว่างรับ chunk ไม่ให้หมดอายุกลาง stream
+        with llm_slots.acquire(client, deadline) as lease:
+            renew_at = time.monotonic() + settings.ADMISSION_SLOT_LEASE_SECONDS / 2
+            response = backend.generate_stream(prompt, "specs_stream", deadline=deadline)
+            for chunk in response:
+                if time.monotonic() >= renew_at:
+                    if not llm_slots.renew(lease):
+                        print("Warning: LLM slot lease expired during stream and was taken by another request")
+                    renew_at = time.monotonic() + settings.ADMISSION_SLOT_LEASE_SECONDS / 2
+                for build in parser.feed(chunk.text):
+                    build = normalize_build(build, streamed_count)
+                    if build is None:
+                        continue
+                    streamed_count += 1
+                    yield "build", reconcile_build_prices(build)
+        final_response = build_specs_response(parser.text, budget, model_currency)
+    except Exception as e:
+        error_response = _specs_error_response(e, budget, parser.text, response)
+        record_llm_call("specs_stream", variant, backend.model_name, started, response, error_response, e)
+        yield "error", error_response
+        return
+
+    record_llm_call("specs_stream", variant, backend.model_name, started, response, final_response)
+    if "error" in final_response:
+        yield "error", final_response
+        return
+    announce_recommendations(final_response, budget, currency, desired_parts, preferred_games)
+
+    # build ที่ parser จับระหว่าง stream ไม่ได้ (เช่น Gemini ตอบเป็น object เดี่ยว) จะถูกส่งตอนท้าย
+    for build in final_response["recommendations"][streamed_count:]:
+        yield "build", build
+    yield "done", final_response
+
+
+def cache_recommendations(cache_key, query, data):
+    """
+    เก็บผลที่ได้ build ลง recommendation cache คืนค่า True ถ้าเก็บ
+    ผล fan-out ที่ขาดบาง tier เก็บแค่ RECOMMENDATION_FANOUT_PARTIAL_CACHE_TTL_SECONDS (0 = ไม่เก็บ) ไม่ใช่ TTL เต็ม
+    """
+    if "error" in data or not data.get("recommendations"):
+        return False
+    ttl_seconds = settings.RECOMMENDATION_FANOUT_PARTIAL_CACHE_TTL_SECONDS if data.get("missing_tiers") else None
+    if ttl_seconds is not None and ttl_seconds <= 0:
+        return False
+    recommendation_cache.set(cache_key, query, data, ttl_seconds)
+    return True
+
+
+# refresh เบื้องหลังของ stale-while-revalidate ใช้ flow แยกใน admission queue (ไม่ผูกกับผู้ใช้ที่บังเอิญได้ stale)
+REVALIDATION_CLIENT = Client("revalidate", False, rate_limited=False)
+
+
+def _revalidate(cache_key, budget, currency, desired_parts, preferred_games):
+    data = get_specs_from_gemini(
+        budget, currency, desired_parts, preferred_games,
+        Deadline.after(settings.LLM_REQUEST_DEADLINE_SECONDS), REVALIDATION_CLIENT,
+    )
+    return cache_recommendations(cache_key, canonical_query(budget, desired_parts, preferred_games), data)
+
+
+def serve_stale_while_revalidate(cache_key, budget, currency, desired_parts, preferred_games):
+    """
+    entry ที่เพิ่งหมดอายุ (ไม่เกิน RECOMMENDATION_CACHE_STALE_WHILE_REVALIDATE_SECONDS) พร้อม schedule refresh เบื้องหลัง
+    คืนค่า None ถ้าไม่มี
+    """
+    stale_data = recommendation_cache.get_stale(cache_key, settings.RECOMMENDATION_CACHE_STALE_WHILE_REVALIDATE_SECONDS)
+    if stale_data is None or fit_to_budget(stale_data, budget) is None:
+        return None
+    recommendation_refresher.schedule(
+        cache_key,
+        lambda: _revalidate(cache_key, budget, currency, desired_parts, preferred_games),
+        lock_name=f"recommendation:{cache_key}",
+    )
+    return mark_stale(stale_data)
+
+
+def serve_stale_if_error(cache_key, budget):
+    stale_data = recommendation_cache.get_stale(cache_key, settings.RECOMMENDATION_CACHE_STALE_IF_ERROR_SECONDS)
+    if stale_data is None or fit_to_budget(stale_data, budget) is None:
+        return None
+    return mark_stale(stale_data, during_error=True)
+
+
+def get_recommendations(budget, currency="THB", desired_parts=None, preferred_games=None, deadline=None, client=None):
+    """
+    ห่อ get_specs_from_gemini ด้วย recommendation cache และ single-flight
+    คืนค่า (recommendations_data, cache_status) โดย cache_status เป็น
+    "HIT", "STALE" (หมดอายุแล้ว กำลัง refresh เบื้องหลัง), "SIMILAR" (ผลของ query ที่ใกล้เคียง ดู similarity.py), "MISS",
+    "COALESCED" (ได้ผลจาก request อื่นที่กำลังเรียก Gemini อยู่), "STALE_IF_ERROR" (LLM ล้มเหลวจึงใช้ entry ที่หมดอายุแล้ว)
+    หรือ "BYPASS"
+    """
+    if not settings.RECOMMENDATION_CACHE_ENABLED:
+        return get_specs_from_gemini(budget, currency, desired_parts, preferred_games, deadline, client), "BYPASS"
+
+    cache_key = canonical_query_key(budget, desired_parts, preferred_games)
+    cached_data = recommendation_cache.get(cache_key)
+    # entry ถูกสร้างด้วยงบของ request แรกใน budget bucket เดียวกัน: ใช้เฉพาะ build ที่อยู่ในงบของผู้ใช้คนนี้
+    if cached_data is not None and fit_to_budget(cached_data, budget) is not None:
+        return cached_data, "HIT"
+
+    stale_data = serve_stale_while_revalidate(cache_key, budget, currency, desired_parts, preferred_games)
+    if stale_data is not None:
+        return stale_data, "STALE"
+
+    similar_data = find_similar_recommendation(budget, desired_parts, preferred_games)
+    if similar_data is not None:
+        return similar_data, "SIMILAR"
+
+    def load():
+        wait_seconds = settings.RECOMMENDATION_SINGLE_FLIGHT_WAIT_SECONDS
+        with advisory_lock(f"recommendation:{cache_key}", timeout=wait_seconds) as lock:
+            if lock.waited:
+                # worker อื่นเพิ่งเรียก Gemini ด้วย query เดียวกันเสร็จ ลองอ่านจาก cache ก่อน
+                shared_data = recommendation_cache.get(cache_key, count_miss=False)
+                if shared_data is not None and fit_to_budget(shared_data, budget) is not None:
+                    return shared_data, "COALESCED"
+            if not lock.acquired:
+                print(f"Warning: advisory lock for {cache_key[:12]} not acquired within {wait_seconds}s. Calling Gemini directly.")
+
+            data = get_specs_from_gemini(budget, currency, desired_parts, preferred_games, deadline, client)
+            cache_recommendations(cache_key, canonical_query(budget, desired_parts, preferred_games), data)
+            return data, "MISS"
+
+    (recommendations_data, cache_status), shared = recommendation_flight.do(
+        cache_key,
+        load,
+        timeout=settings.RECOMMENDATION_SINGLE_FLIGHT_WAIT_SECONDS,
+        is_failure=lambda result: "error" in result[0],
+    )
+    if shared:
+        cache_status = "COALESCED"
+        if "error" not in recommendations_data and fit_to_budget(recommendations_data, budget) is None:
+            # leader อยู่ใน bucket เดียวกันแต่งบสูงกว่า จนไม่มี build ไหนอยู่ในงบของผู้ใช้คนนี้
+            recommendations_data = get_specs_from_gemini(budget, currency, desired_parts, preferred_games, deadline, client)
+            cache_status = "MISS"
+    if "error" in recommendations_data:
+        stale_data = serve_stale_if_error(cache_key, budget)
+        if stale_data is not None:
+            return stale_data, "STALE_IF_ERROR"
+    recommendations_data["budget_thb"] = float(budget)
+    return recommendations_data, cache_status
+
+def _catalog_fallback(failed_data, budget, desired_parts, preferred_games):
+    # request ที่ถูก admission control ปฏิเสธได้ 429 + Retry-After แทน เพื่อให้ client ถอยออกไปจริงๆ
+    if not settings.RECOMMENDATION_CATALOG_FALLBACK or failed_data.get("overloaded"):
+        return None
+    fallback_data = recommend_from_catalog(budget, desired_parts, preferred_games)
+    if "error" in fallback_data:
+        return None
+    fallback_data["analysis_notes"] += " (บริการ AI ไม่พร้อมใช้งานในขณะนี้ จึงใช้ข้อมูลจาก catalog แทน)"
+    fallback_data["ai_error"] = failed_data.get("error")
+    return fallback_data
+
+
+def get_recommendations_from_source(budget, currency="THB", desired_parts=None, preferred_games=None, source="gemini", deadline=None, client=None):
+    """
+    เลือกแหล่งคำแนะนำ: "catalog" จัดจาก Component catalog ทันที (ไม่เรียก LLM)
+    "gemini" ผ่าน cache/Gemini และถ้าล้มเหลวจะ fallback ไปที่ catalog (ถ้าเปิด RECOMMENDATION_CATALOG_FALLBACK)
+    คืนค่า (recommendations_data, cache_status) โดย cache_status เพิ่ม "CATALOG" และ "FALLBACK"
+    """
+    if source == "catalog":
+        return recommend_from_catalog(budget, desired_parts, preferred_games), "CATALOG"
+
+    recommendations_data, cache_status = get_recommendations(budget, currency, desired_parts, preferred_games, deadline, client)
+    if "error" in recommendations_data:
+        fallback_data = _catalog_fallback(recommendations_data, budget, desired_parts, preferred_games)
+        if fallback_data is not None:
+            return fallback_data, "FALLBACK"
+    return recommendations_data, cache_status
+
+
+def stream_recommendations(budget, currency="THB", desired_parts=None, preferred_games=None, deadline=None, client=None):
+    """
+    stream_specs_from_gemini ที่ผ่าน recommendation cache: ถ้า hit จะส่ง build จาก cache ทันที
+    event แรกคือ "meta" ที่บอก cache_status ยกเว้นถูก rate limit ก่อนเรียก LLM (event แรกเป็น "error")
+    """
+    cache_key = None
+    if settings.RECOMMENDATION_CACHE_ENABLED:
+        cache_key = canonical_query_key(budget, desired_parts, preferred_games)
+        cached_data = recommendation_cache.get(cache_key)
+        if cached_data is not None and fit_to_budget(cached_data, budget) is not None:
+            yield "meta", {"cache_status": "HIT", "budget_thb": float(budget)}
+            for build in cached_data["recommendations"]:
+                yield "build", build
+            yield "done", cached_data
+            return
+        served_data, served_status = serve_stale_while_revalidate(cache_key, budget, currency, desired_parts, preferred_games), "STALE"
+        if served_data is None:
+            served_data, served_status = find_similar_recommendation(budget, desired_parts, preferred_games), "SIMILAR"
+        if served_data is not None:
+            yield "meta", {"cache_status": served_status, "budget_thb": float(budget)}
+            for build in served_data["recommendations"]:
+                yield "build", build
+            yield "done", served_data
+            return
+
+    # หัก token ก่อน "meta" เพื่อให้ view ที่อ่าน event แรกตอบ 429 ได้ก่อนเริ่ม stream
+    try:
+        charge_rate_limit(client)
+    except Overloaded as e:
+        yield "error", _specs_error_response(e, budget, "")
+        return
+    yield "meta", {"cache_status": "MISS" if cache_key else "BYPASS", "budget_thb": float(budget)}
+    for event, data in stream_specs_from_gemini(budget, currency, desired_parts, preferred_games, deadline, client):
+        if event == "done" and cache_key:
+            cache_recommendations(cache_key, canonical_query(budget, desired_parts, preferred_games), data)
+        yield event, data
+
+
+async def get_recommendations_async(budget, currency="THB", desired_parts=None, preferred_games=None, deadline=None, client=None):
+    """
+    get_recommendations สำหรับ async views: อ่าน/เขียน cache ผ่าน sync_to_async และเรียก Gemini แบบ async
+    รวม request ภายใน event loop ของ worker ด้วย async_recommendation_flight และข้าม worker ด้วย async_advisory_lock
+    (lock เดียวกับ get_recommendations ถือบน connection แยกของ request ที่เรียก Gemini)
+    """
+    if not settings.RECOMMENDATION_CACHE_ENABLED:
+        return await get_specs_from_gemini_async(budget, currency, desired_parts, preferred_games, deadline, client), "BYPASS"
+
+    cache_key = canonical_query_key(budget, desired_parts, preferred_games)
+    cached_data = await sync_to_async(recommendation_cache.get)(cache_key)
+    if cached_data is not None and fit_to_budget(cached_data, budget) is not None:
+        return cached_data, "HIT"
+
+    stale_data = await sync_to_async(serve_stale_while_revalidate)(cache_key, budget, currency, desired_parts, preferred_games)
+    if stale_data is not None:
+        return stale_data, "STALE"
+
+    similar_data = await sync_to_async(find_similar_recommendation)(budget, desired_parts, preferred_games)
+    if similar_data is not None:
+        return similar_data, "SIMILAR"
+
+    async def load():
+        wait_seconds = settings.RECOMMENDATION_SINGLE_FLIGHT_WAIT_SECONDS
+        async with async_advisory_lock(f"recommendation:{cache_key}", timeout=wait_seconds) as lock:
+            if lock.waited:
+                shared_data = await sync_to_async(recommendation_cache.get)(cache_key, count_miss=False)
+                if shared_data is not None and fit_to_budget(shared_data, budget) is not None:
+                    return shared_data, "COALESCED"
+            if not lock.acquired:
+                print(f"Warning: advisory lock for {cache_key[:12]} not acquired within {wait_seconds}s. Calling Gemini directly.")
+
+            data = await get_specs_from_gemini_async(budget, currency, desired_parts, preferred_games, deadline, client)
+            await sync_to_async(cache_recommendations)(cache_key, canonical_query(budget, desired_parts, preferred_games), data)
+            return data, "MISS"
+
+    (recommendations_data, cache_status), shared = await async_recommendation_flight.do(
+        cache_key,
+        load,
+        timeout=settings.RECOMMENDATION_SINGLE_FLIGHT_WAIT_SECONDS,
+        is_failure=lambda result: "error" in result[0],
+    )
+    if shared:
+        cache_status = "COALESCED"
+        if "error" not in recommendations_data and fit_to_budget(recommendations_data, budget) is None:
+            recommendations_data = await get_specs_from_gemini_async(budget, currency, desired_parts, preferred_games, deadline, client)
+            cache_status = "MISS"
+    if "error" in recommendations_data:
+        stale_data = await sync_to_async(serve_stale_if_error)(cache_key, budget)
+        if stale_data is not None:
+            return stale_data, "STALE_IF_ERROR"
+    recommendations_data["budget_thb"] = float(budget)
+    return recommendations_data, cache_status
+
+async def get_recommendations_from_source_async(budget, currency="THB", desired_parts=None, preferred_games=None, source="gemini", deadline=None, client=None):
+    if source == "catalog":
+        return await sync_to_async(recommend_from_catalog)(budget, desired_parts, preferred_games), "CATALOG"
+
+    recommendations_data, cache_status = await get_recommendations_async(budget, currency, desired_parts, preferred_games, deadline, client)
+    if "error" in recommendations_data:
+        fallback_data = await sync_to_async(_catalog_fallback)(recommendations_data, budget, desired_parts, preferred_games)
+        if fallback_data is not None:
+            return fallback_data, "FALLBACK"
+    return recommendations_data, cache_status
+
 def generate_build_explanation_prompt(selected_build: dict, original_query: dict):
     prompt_lines = [
         "โปรดทำหน้าที่เป็นผู้เชี่ยวชาญด้านการจัดสเปคคอมพิวเตอร์และอธิบายเหตุผล",
@@ -297,14 +743,10 @@ def generate_build_explanation_prompt(selected_build: dict, original_query: dict
     ])
     return "\n".join(prompt_lines)
 
-def get_build_explanation_from_gemini(selected_build: dict, original_query: dict):
-    if not GEMINI_API_KEY:
-        return {"error": "Gemini API key not configured."}
-
+def _ensure_calculated_total(selected_build):
     if "calculated_total_price_thb" not in selected_build:
         calculated_sum_for_selected_build = decimal.Decimal(0)
-        component_keys_for_sum = ['cpu', 'gpu', 'ram', 'storage', 'motherboard', 'psu', 'case', 'cooler']
-        for key in component_keys_for_sum:
+        for key in COMPONENT_KEYS_FOR_SUM:
             component_details = selected_build.get(key)
             if isinstance(component_details, dict) and "price_thb" in component_details:
                 try:
@@ -314,31 +756,81 @@ def get_build_explanation_from_gemini(selected_build: dict, original_query: dict
                 except (ValueError, TypeError, decimal.InvalidOperation): pass
         selected_build["calculated_total_price_thb"] = float(calculated_sum_for_selected_build)
 
+
+def _build_explanation_response(raw_explanation_text):
+    parsed_json = parse_explanation_output(raw_explanation_text)
+    if parsed_json is None:
+        print(f"Warning: Gemini explanation response missing 'explanation' string: {raw_explanation_text}")
+        return {"error": "AI did not provide an explanation in the expected format.", "raw_ai_output": raw_explanation_text}
+    return parsed_json
+
+
+def _explanation_error_response(e, raw_explanation_text, response=None):
+    if isinstance(e, Overloaded):
+        return _overloaded_error_response(e)
+    if isinstance(e, (CircuitOpenError, DeadlineExceeded)):
+        return _unavailable_error_response(e)
+    if isinstance(e, json.JSONDecodeError):
+        error_message = f"Error decoding explanation JSON from Gemini: {e}. Raw: {raw_explanation_text}"
+        print(error_message)
+        return {"error": error_message, "raw_ai_output": raw_explanation_text}
+
+    error_detail = str(e)
+    prompt_feedback_text = None
+    if response is not None and hasattr(response, 'prompt_feedback') and response.prompt_feedback:
+        prompt_feedback_text = str(response.prompt_feedback)
+        print(f"Prompt Feedback for Explanation: {prompt_feedback_text}")
+        error_detail = f"AI explanation request blocked/failed. Feedback: {prompt_feedback_text}"
+    else:
+        print(f"Error getting explanation from Gemini: {e}")
+    return {"error": error_detail, "raw_ai_output_on_error": raw_explanation_text, "prompt_feedback_on_error": prompt_feedback_text}
+
+
+def get_build_explanation_from_gemini(selected_build: dict, original_query: dict, deadline=None, client=None):
+    backend = get_llm_backend()
+    if not backend.is_configured():
+        return {"error": "Gemini API key not configured."}
+
+    _ensure_calculated_total(selected_build)
     prompt = generate_build_explanation_prompt(selected_build, original_query)
-    model = genai.GenerativeModel(model_name="gemini-1.5-flash-latest")
 
+    response = None
     raw_explanation_text = ""
+    error = None
+    started = time.monotonic()
     try:
-        from google.generativeai.types import GenerationConfig
-        generation_config = GenerationConfig( response_mime_type="application/json" )
-        response = model.generate_content(prompt, generation_config=generation_config)
+        charge_rate_limit(client)
+        with llm_slots.acquire(client, deadline):
+            response = backend.generate(prompt, "explanation", deadline=deadline)
         raw_explanation_text = response.text
-        parsed_json = json.loads(raw_explanation_text)
-        if "explanation" not in parsed_json or not isinstance(parsed_json["explanation"], str):
-            print(f"Warning: Gemini explanation response missing 'explanation' string: {parsed_json}")
-            return {"error": "AI did not provide an explanation in the expected format.", "raw_ai_output": parsed_json}
-        return parsed_json
-    except json.JSONDecodeError as e:
-        error_message = f"Error decoding explanation JSON from Gemini: {e}. Raw: {raw_explanation_text}"
-        print(error_message)
-        return {"error": error_message, "raw_ai_output": raw_explanation_text}
+        result = _build_explanation_response(raw_explanation_text)
     except Exception as e:
-        error_detail = str(e)
-        prompt_feedback_text = None
-        if 'response' in locals() and hasattr(response, 'prompt_feedback') and response.prompt_feedback:
-            prompt_feedback_text = str(response.prompt_feedback)
-            print(f"Prompt Feedback for Explanation: {prompt_feedback_text}")
-            error_detail = f"AI explanation request blocked/failed. Feedback: {prompt_feedback_text}"
-        else:
-            print(f"Error getting explanation from Gemini: {e}")
-        return {"error": error_detail, "raw_ai_output_on_error": raw_explanation_text, "prompt_feedback_on_error": prompt_feedback_text}
\ No newline at end of file
+        error = e
+        result = _explanation_error_response(e, raw_explanation_text, response)
+    record_llm_call("explanation", "explanation", backend.model_name, started, response, result, error)
+    return result
+
+
+async def get_build_explanation_from_gemini_async(selected_build: dict, original_query: dict, deadline=None, client=None):
+    backend = get_llm_backend()
+    if not backend.is_configured():
+        return {"error": "Gemini API key not configured."}
+
+    _ensure_calculated_total(selected_build)
+    prompt = generate_build_explanation_prompt(selected_build, original_query)
+
+    response = None
+    raw_explanation_text = ""
+    error = None
+    started = time.monotonic()
+    try:
+        await sync_to_async(charge_rate_limit)(client)
+        async with llm_slots.acquire_async(client, deadline):
+            response = await backend.generate_async(prompt, "explanation", deadline=deadline)
+        raw_explanation_text = response.text
+        result = _build_explanation_response(raw_explanation_text)
+    except Exception as e:
+        error = e
+        result = _explanation_error_response(e, raw_explanation_text, response)
+    await sync_to_async(record_llm_call)("explanation", "explanation", backend.model_name, started, response, result, error)
+    return result
@@ -0,0 +1,215 @@
+# recommender_api/similarity.py
+"""
+จับคู่ query ที่ "ใกล้พอ" กับผลลัพธ์ใน recommendation cache (เช่น งบ 25,000 กับ 25,500 บาทที่เล่นเกมเดียวกัน)
+
+แต่ละ query ถูกแปลงเป็นเวกเตอร์: log(งบ), one-hot ของ desired parts และ bag of games (ชื่อผ่าน canonical_query แล้ว)
+เวกเตอร์ของ entry ที่ยังไม่หมดอายุเก็บเป็น NumPy matrix ในหน่วยความจำของแต่ละ worker
+และโหลดเพิ่มเฉพาะ entry ที่ถูกสร้าง/ต่ออายุหลังรอบก่อน (refreshed_at) ทุก SIMILAR_QUERY_INDEX_REFRESH_SECONDS
+
+ระยะห่างคือ Euclidean: งบต่างกัน x% ให้ระยะประมาณ x/100 ชิ้นส่วนหรือเกมที่ไม่ตรงกันเพิ่มระยะตามน้ำหนักของมัน
+ค่าเริ่มต้นจึงจับคู่เฉพาะ query ที่ชิ้นส่วนและเกมตรงกันทุกอย่างและงบต่างกันไม่เกิน SIMILAR_QUERY_MAX_DISTANCE
+build ที่ราคารวมเกินงบของผู้ใช้ (เกิน SIMILAR_QUERY_PRICE_TOLERANCE) ถูกตัดออกก่อนตอบ
+"""
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .cache import canonical_query, fit_to_budget, recommendation_cache
+from .models import RecommendationCacheEntry
+
+BUDGET_COLUMN = "budget"
+
+
+def query_features(budget, desired_parts=None, preferred_games=None):
+    """
+    คืนค่า (ค่าของคอลัมน์งบ, [(token, น้ำหนัก), ...]) ของ query
+    """
+    query = canonical_query(budget, desired_parts, preferred_games)
+    features = [(f"part:{slot}={value}", settings.SIMILAR_QUERY_PART_WEIGHT) for slot, value in query["desired_parts"]]
+    features += [(f"game:{game}", settings.SIMILAR_QUERY_GAME_WEIGHT) for game in query["preferred_games"]]
+    return math.log(max(float(budget), 1.0)), features
+
+
+def _canonical_features(query, budget):
+    # query ที่เก็บใน RecommendationCacheEntry เป็น canonical แล้ว (desired_parts เป็น list ของ [slot, value])
+    return query_features(budget, dict(query.get("desired_parts") or []), query.get("preferred_games"))
+
+
+class SimilarQueryIndex:
+    """
+    nearest-neighbour index ของ RecommendationCacheEntry (ไม่เก็บ response ไว้ในหน่วยความจำ อ่านผ่าน recommendation_cache)
+    การแก้ไขสร้าง array ใหม่ทุกครั้ง (copy-on-write) thread ที่กำลังค้นหาจึงเห็น snapshot ที่สอดคล้องกันเสมอ
+    """
+
+    COUNTER_NAMES = ("lookups", "matches", "price_rejected", "stale_rows")
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._columns = {BUDGET_COLUMN: 0}
+        self._keys = []
+        self._rows = {}
+        self._matrix = np.zeros((0, 1), dtype=np.float32)
+        self._budgets = np.zeros(0)
+        self._expires = np.zeros(0)
+        self._watermark = None
+        self._next_refresh = 0.0
+        self._counters = dict.fromkeys(self.COUNTER_NAMES, 0)
+
+    def count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def refresh(self, force=False):
+        """
+        โหลด entry ที่ถูกสร้าง/ต่ออายุตั้งแต่รอบก่อน ถ้ามี thread อื่นกำลังโหลดอยู่จะข้ามไปใช้ index เดิม
+        """
+        if not force and time.monotonic() < self._next_refresh:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            queryset = RecommendationCacheEntry.objects.filter(expires_at__gt=timezone.now())
+            if self._watermark is not None:
+                queryset = queryset.filter(refreshed_at__gte=self._watermark)
+            rows = list(
+                queryset.order_by("refreshed_at")
+                .values_list("cache_key", "query", "response__budget_thb", "refreshed_at", "expires_at")
+            )
+            if rows:
+                self._add(rows)
+                self._watermark = rows[-1][3]
+            self._compact()
+            self._next_refresh = time.monotonic() + self.refresh_interval
+        finally:
+            self._refresh_lock.release()
+
+    def _add(self, rows):
+        with self._lock:
+            columns = dict(self._columns)
+            keys = list(self._keys)
+            positions = dict(self._rows)
+        encoded = []
+        for cache_key, query, budget, _, expires_at in rows:
+            budget = budget if isinstance(budget, (int, float)) else (query or {}).get("budget_bucket")
+            if not budget:
+                continue
+            budget_value, features = _canonical_features(query or {}, budget)
+            for token, _ in features:
+                columns.setdefault(token, len(columns))
+            encoded.append((cache_key, float(budget), budget_value, features, expires_at.timestamp()))
+
+        with self._lock:
+            matrix = np.zeros((len(keys) + len(encoded), len(columns)), dtype=np.float32)
+            matrix[:self._matrix.shape[0], :self._matrix.shape[1]] = self._matrix
+            budgets = np.concatenate([self._budgets, np.zeros(len(encoded))])
+            expires = np.concatenate([self._expires, np.zeros(len(encoded))])
+            used = len(keys)
+            for cache_key, budget, budget_value, features, expires_ts in encoded:
+                row = positions.get(cache_key)
+                if row is None:
+                    row = positions[cache_key] = used
+                    keys.append(cache_key)
+                    used += 1
+                matrix[row] = 0
+                matrix[row, 0] = budget_value
+                for token, weight in features:
+                    matrix[row, columns[token]] = weight
+                budgets[row] = budget
+                expires[row] = expires_ts
+            self._columns, self._keys, self._rows = columns, keys, positions
+            self._matrix, self._budgets, self._expires = matrix[:used], budgets[:used], expires[:used]
+
+    def _compact(self):
+        # ตัดแถวที่หมดอายุทิ้งเมื่อมีมากกว่าครึ่ง (คอลัมน์ของ token ที่ไม่ถูกใช้แล้วเก็บไว้ ไม่มีผลกับระยะ)
+        with self._lock:
+            live = self._expires > time.time()
+            if live.all() or live.sum() * 2 > len(live):
+                return
+            self._keys = [key for key, keep in zip(self._keys, live) if keep]
+            self._rows = {key: row for row, key in enumerate(self._keys)}
+            self._matrix, self._budgets, self._expires = self._matrix[live], self._budgets[live], self._expires[live]
+
+    def discard(self, cache_key):
+        with self._lock:
+            row = self._rows.get(cache_key)
+            if row is not None:
+                expires = self._expires.copy()
+                expires[row] = 0
+                self._expires = expires
+                self._counters["stale_rows"] += 1
+
+    def nearest(self, budget, desired_parts, preferred_games, max_distance, limit=3):
+        """
+        คืนค่า [(cache_key, distance, budget ของ entry นั้น), ...] ที่ห่างไม่เกิน max_distance เรียงจากใกล้ที่สุด
+        """
+        self.refresh()
+        self.count("lookups")
+        with self._lock:
+            columns, keys, matrix = self._columns, self._keys, self._matrix
+            budgets, expires = self._budgets, self._expires
+        if not keys:
+            return []
+
+        budget_value, features = query_features(budget, desired_parts, preferred_games)
+        vector = np.zeros(matrix.shape[1], dtype=np.float32)
+        vector[0] = budget_value
+        unseen = 0.0
+        for token, weight in features:
+            column = columns.get(token)
+            if column is None or column >= matrix.shape[1]:
+                # token ที่ไม่มี entry ไหนมี: ระยะเพิ่มเท่ากันทุกแถว
+                unseen += weight ** 2
+            else:
+                vector[column] = weight
+        distances = np.sqrt(np.square(matrix - vector).sum(axis=1, dtype=np.float64) + unseen)
+        distances[expires <= time.time()] = np.inf
+        candidates = np.flatnonzero(distances <= max_distance)
+        ordered = candidates[np.argsort(distances[candidates])][:limit]
+        return [(keys[row], float(distances[row]), float(budgets[row])) for row in ordered]
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                "entries": len(self._keys),
+                "live_entries": int((self._expires > time.time()).sum()),
+                "features": len(self._columns),
+            }
+
+
+def find_similar_recommendation(budget, desired_parts=None, preferred_games=None):
+    """
+    ผลลัพธ์ใน cache ของ query ที่ใกล้ที่สุด (ตัด build ที่เกินงบออกแล้ว) หรือ None ถ้าไม่มีที่ใกล้พอ
+    """
+    if not settings.SIMILAR_QUERY_ENABLED:
+        return None
+    try:
+        candidates = similar_query_index.nearest(
+            budget, desired_parts, preferred_games, settings.SIMILAR_QUERY_MAX_DISTANCE
+        )
+    except Exception as e:
+        print(f"Warning: similar query lookup failed: {e}")
+        return None
+
+    for cache_key, distance, matched_budget in candidates:
+        data = recommendation_cache.get(cache_key, count_miss=False)
+        if data is None:
+            similar_query_index.discard(cache_key)
+            continue
+        data = fit_to_budget(data, budget, settings.SIMILAR_QUERY_PRICE_TOLERANCE)
+        if data is None:
+            similar_query_index.count("price_rejected")
+            continue
+        similar_query_index.count("matches")
+        data["similar_query"] = {"budget_thb": matched_budget, "distance": round(distance, 4)}
+        return data
+    return None
+
+
+similar_query_index = SimilarQueryIndex(refresh_interval=settings.SIMILAR_QUERY_INDEX_REFRESH_SECONDS)
@@ -0,0 +1,298 @@
+# recommender_api/singleflight.py
+import asyncio
+import copy
+import hashlib
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    รวม request ที่มี key เดียวกันและกำลังทำงานพร้อมกันใน worker เดียว ให้เหลือการเรียกจริงครั้งเดียว
+    thread แรกเป็น leader ส่วน thread ที่ตามมาจะรอผลของ leader ได้ไม่เกิน timeout วินาที
+    ถ้า leader ล้มเหลวหรือช้าเกินไป waiter จะเลือก leader ใหม่หรือเรียก fn เองเป็น fallback
+    """
+
+    COUNTER_NAMES = ("leaders", "coalesced", "leader_failures", "timeouts")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = dict.fromkeys(self.COUNTER_NAMES, 0)
+
+    def _incr(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def do(self, key, fn, timeout, is_failure=None):
+        """
+        คืนค่า (result, shared) โดย shared เป็น True เมื่อผลลัพธ์มาจาก leader ตัวอื่น
+        is_failure(result) ใช้ตัดสินว่าผลลัพธ์ของ leader ไม่ควรแชร์ (เช่น dict ที่มี "error")
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                is_leader = call is None
+                if is_leader:
+                    call = _Call()
+                    self._calls[key] = call
+
+            if is_leader:
+                self._incr("leaders")
+                try:
+                    call.result = fn()
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        self._calls.pop(key, None)
+                    call.done.set()
+                return copy.deepcopy(call.result), False
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not call.done.wait(remaining):
+                self._incr("timeouts")
+                print(f"Warning: single-flight wait for {key[:12]} timed out after {timeout}s. Calling directly.")
+                return fn(), False
+
+            if call.error is None and not (is_failure and is_failure(call.result)):
+                self._incr("coalesced")
+                return copy.deepcopy(call.result), True
+
+            # leader ล้มเหลว: วนกลับไปเลือก leader ใหม่จาก waiter ที่เหลือ (ภายใน deadline เดิม)
+            self._incr("leader_failures")
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight สำหรับ async views: coroutine ที่ขอ key เดียวกันบน event loop เดียวกันจะรอ task ของ leader
+    task ของ leader ถูก shield ไว้ ถ้า client ของ leader ตัดการเชื่อมต่อ waiter คนอื่นยังได้ผลลัพธ์
+    """
+
+    COUNTER_NAMES = SingleFlight.COUNTER_NAMES
+
+    def __init__(self):
+        self._tasks = {}
+        self._counters = dict.fromkeys(self.COUNTER_NAMES, 0)
+
+    async def do(self, key, fn, timeout, is_failure=None):
+        loop_key = (id(asyncio.get_running_loop()), key)
+        deadline = time.monotonic() + timeout
+        while True:
+            task = self._tasks.get(loop_key)
+            if task is None or task.done():
+                self._counters["leaders"] += 1
+                task = asyncio.ensure_future(fn())
+                self._tasks[loop_key] = task
+                task.add_done_callback(lambda done_task: self._forget(loop_key, done_task))
+                result = await asyncio.shield(task)
+                return copy.deepcopy(result), False
+
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                result = await asyncio.wait_for(asyncio.shield(task), remaining)
+            except asyncio.TimeoutError:
+                self._counters["timeouts"] += 1
+                print(f"Warning: async single-flight wait for {key[:12]} timed out after {timeout}s. Calling directly.")
+                return await fn(), False
+            except Exception:
+                self._counters["leader_failures"] += 1
+                continue
+
+            if is_failure and is_failure(result):
+                self._counters["leader_failures"] += 1
+                continue
+            self._counters["coalesced"] += 1
+            return copy.deepcopy(result), True
+
+    def _forget(self, loop_key, done_task):
+        if self._tasks.get(loop_key) is done_task:
+            del self._tasks[loop_key]
+
+    def stats(self):
+        return {**self._counters, "in_flight": len(self._tasks)}
+
+
+class AdvisoryLockResult:
+    def __init__(self):
+        self.acquired = False
+        self.waited = False
+
+
+def _advisory_lock_id(name):
+    digest = hashlib.sha256(name.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+@contextmanager
+def advisory_lock(name, timeout, poll_interval=0.1):
+    """
+    Postgres session-level advisory lock สำหรับกันไม่ให้หลาย gunicorn worker ทำงานเดียวกันพร้อมกัน
+    รอได้ไม่เกิน timeout วินาที ถ้ายังไม่ได้ lock จะ yield โดย acquired=False ให้ผู้เรียกตัดสินใจเอง
+    บนฐานข้อมูลที่ไม่ใช่ Postgres จะถือว่าได้ lock ทันที (ไม่มีการป้องกันข้าม process)
+    """
+    result = AdvisoryLockResult()
+    if connection.vendor != "postgresql":
+        result.acquired = True
+        yield result
+        return
+
+    lock_id = _advisory_lock_id(name)
+    deadline = time.monotonic() + timeout
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [lock_id])
+            if cursor.fetchone()[0]:
+                result.acquired = True
+                break
+            result.waited = True
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+
+    try:
+        yield result
+    finally:
+        if result.acquired:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [lock_id])
+
+
+def dedicated_connection():
+    """
+    connection ใหม่ที่ไม่ผูกกับ thread ใด (เรียกผ่าน sync_to_async(thread_sensitive=False) จาก thread ไหนก็ได้)
+    ผู้เรียกต้อง close() เอง
+    """
+    wrapper = connections.create_connection(DEFAULT_DB_ALIAS)
+    wrapper.inc_thread_sharing()
+    return wrapper
+
+
+class DedicatedAdvisoryLock:
+    """
+    advisory lock บน connection ของตัวเอง (ไม่ใช่ connection ของ thread ที่เรียก)
+    advisory lock ของ Postgres ผูกกับ session และ lock ซ้ำใน session เดียวกันได้เสมอ ถ้าใช้ connection ของ thread
+    ใน async views (sync_to_async แบบ thread_sensitive ส่งทุก request ไป thread เดียวกัน) ทุก request จะได้ lock พร้อมกันหมด
+    lock ถูกปล่อยด้วยการปิด connection
+    """
+
+    def __init__(self, lock_id):
+        self.lock_id = lock_id
+        self._connection = None
+
+    def try_acquire(self):
+        if self._connection is None:
+            self._connection = dedicated_connection()
+        with self._connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [self.lock_id])
+            return cursor.fetchone()[0]
+
+    def release(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            finally:
+                self._connection = None
+
+
+@asynccontextmanager
+async def async_advisory_lock(name, timeout, poll_interval=0.1):
+    """
+    advisory_lock สำหรับ async views: รอด้วย asyncio.sleep และถือ lock บน DedicatedAdvisoryLock
+    (key เดียวกับ advisory_lock จึงรวม request ได้ทั้งกับ worker แบบ sync และ async)
+    """
+    result = AdvisoryLockResult()
+    if connection.vendor != "postgresql":
+        result.acquired = True
+        yield result
+        return
+
+    lock = DedicatedAdvisoryLock(_advisory_lock_id(name))
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            if await sync_to_async(lock.try_acquire, thread_sensitive=False)():
+                result.acquired = True
+                break
+            result.waited = True
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(poll_interval)
+        yield result
+    finally:
+        await sync_to_async(lock.release, thread_sensitive=False)()
+
+
+class BackgroundRefresher:
+    """
+    ทำงาน refresh ของแต่ละ key ใน thread เบื้องหลัง (เช่น stale-while-revalidate) โดย
+    - key เดียวกันมีได้ครั้งละหนึ่งงานใน worker และข้าม worker ด้วย advisory lock (ถ้ามีคนถือ lock อยู่ก็ข้ามไป)
+    - งานพร้อมกันไม่เกิน max_concurrent ที่เกินจะถูกข้าม (request ถัดไปที่ได้ stale จะ schedule ใหม่เอง)
+    fn ต้องคืนค่า True เมื่อ refresh สำเร็จ
+    """
+
+    COUNTER_NAMES = ("scheduled", "skipped", "locked_elsewhere", "succeeded", "failed")
+
+    def __init__(self, max_concurrent):
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._running = set()
+        self._counters = dict.fromkeys(self.COUNTER_NAMES, 0)
+
+    def _incr(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def schedule(self, key, fn, lock_name=None):
+        with self._lock:
+            if key in self._running or len(self._running) >= self.max_concurrent:
+                self._counters["skipped"] += 1
+                return False
+            self._running.add(key)
+            self._counters["scheduled"] += 1
+        threading.Thread(target=self._run, args=(key, fn, lock_name or key), daemon=True, name="cache-refresh").start()
+        return True
+
+    def _run(self, key, fn, lock_name):
+        try:
+            with advisory_lock(lock_name, timeout=0) as lock:
+                if not lock.acquired:
+                    self._incr("locked_elsewhere")
+                    return
+                self._incr("succeeded" if fn() else "failed")
+        except Exception as e:
+            print(f"Warning: background refresh of {key[:12]} failed: {e}")
+            self._incr("failed")
+        finally:
+            with self._lock:
+                self._running.discard(key)
+            connection.close()
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "running": len(self._running)}
+
+
+recommendation_flight = SingleFlight()
+async_recommendation_flight = AsyncSingleFlight()
+recommendation_refresher = BackgroundRefresher(max_concurrent=settings.RECOMMENDATION_CACHE_MAX_REVALIDATIONS)
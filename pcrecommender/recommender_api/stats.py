@@ -0,0 +1,217 @@
+# recommender_api/stats.py
+from collections import Counter, defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import RecommendationRequestLog, SavedSpecification, StatsCounter, StatsRollup, StatsRollupUser
+
+PERIODS = {
+    "hour": (timedelta(hours=1), TruncHour),
+    "day": (timedelta(days=1), TruncDay),
+}
+COUNTER_FIELDS = ["requests", "unique_users", "saves", "errors"]
+
+
+def bucket_start(moment, period):
+    moment = timezone.localtime(moment, dt_timezone.utc)
+    if period == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _increment(period, start, **increments):
+    rollup, _ = StatsRollup.objects.get_or_create(period=period, bucket_start=start)
+    updates = {field: F(field) + value for field, value in increments.items() if value}
+    if updates:
+        StatsRollup.objects.filter(pk=rollup.pk).update(**updates)
+
+
+def _decrement(period, start, field):
+    StatsRollup.objects.filter(period=period, bucket_start=start, **{f"{field}__gt": 0}).update(**{field: F(field) - 1})
+
+
+def _record_unique_users(period, start, user_ids):
+    """
+    บวก unique_users ของ bucket ตามจำนวนผู้ใช้ที่ยังไม่เคยถูกนับใน bucket นี้ (StatsRollupUser)
+    get_or_create อาศัย unique constraint จึงนับถูกแม้หลาย worker flush ผู้ใช้คนเดียวกันพร้อมกัน
+    """
+    seen = set(StatsRollupUser.objects.filter(
+        period=period, bucket_start=start, user_id__in=user_ids
+    ).values_list('user_id', flat=True))
+    added = 0
+    for user_id in user_ids - seen:
+        _, created = StatsRollupUser.objects.get_or_create(period=period, bucket_start=start, user_id=user_id)
+        added += created
+    if added:
+        _increment(period, start, unique_users=added)
+
+
+def record_request_logs(logs):
+    """
+    เรียกหลังจาก RecommendationRequestLog ชุดหนึ่งถูกเขียนลงฐานข้อมูลแล้ว (on_flush ของ request_log_writer)
+    requests/errors บวกเพิ่มตรงๆ ส่วน unique_users บวกเฉพาะผู้ใช้ที่ยังไม่เคยเห็นใน bucket นั้น (ไม่สแกน log)
+    """
+    for period in PERIODS:
+        requests = Counter()
+        errors = Counter()
+        users = defaultdict(set)
+        for log in logs:
+            start = bucket_start(log.timestamp, period)
+            requests[start] += 1
+            if log.outcome == 'error':
+                errors[start] += 1
+            if log.user_id is not None:
+                users[start].add(log.user_id)
+
+        for start, count in requests.items():
+            _increment(period, start, requests=count, errors=errors[start])
+        for start, user_ids in users.items():
+            _record_unique_users(period, start, user_ids)
+
+
+def record_saved_spec(saved_spec):
+    for period in PERIODS:
+        _increment(period, bucket_start(saved_spec.saved_at, period), saves=1)
+
+
+def record_deleted_spec(saved_spec):
+    for period in PERIODS:
+        _decrement(period, bucket_start(saved_spec.saved_at, period), 'saves')
+
+
+def seen_users_cutoff():
+    return bucket_start(timezone.now() - timedelta(days=settings.STATS_SEEN_USERS_RETENTION_DAYS), 'day')
+
+
+def purge_seen_users():
+    deleted, _ = StatsRollupUser.objects.filter(bucket_start__lt=seen_users_cutoff()).delete()
+    return deleted
+
+
+# --- ตัวนับรวม (StatsCounter) ---
+
+TOTAL_COUNTERS = {
+    "users": lambda: get_user_model().objects.count(),
+    "saved_specs": lambda: SavedSpecification.objects.count(),
+}
+
+
+def rebuild_total(name):
+    value = TOTAL_COUNTERS[name]()
+    StatsCounter.objects.update_or_create(name=name, defaults={"value": value})
+    return value
+
+
+def _adjust_total(name, amount):
+    if not StatsCounter.objects.filter(name=name).update(value=F("value") + amount):
+        # ยังไม่มีแถว (เช่นฐานข้อมูลที่สร้างก่อน migration): นับจากตาราง ซึ่งรวมแถวที่เพิ่งสร้าง/ลบแล้ว
+        rebuild_total(name)
+
+
+def get_totals():
+    totals = dict(StatsCounter.objects.filter(name__in=TOTAL_COUNTERS).values_list('name', 'value'))
+    for name in TOTAL_COUNTERS:
+        if name not in totals:
+            totals[name] = rebuild_total(name)
+    return totals
+
+
+def _update_quietly(update, *args):
+    # ตัวนับที่เพี้ยนแก้ได้ด้วย backfill_stats_rollups แต่ต้องไม่ทำให้การบันทึก/ลบแถวล้มเหลว
+    # (savepoint กันไม่ให้ error ของ query ทำให้ transaction ของผู้เรียกใช้ต่อไม่ได้)
+    try:
+        with transaction.atomic():
+            update(*args)
+    except Exception as e:
+        print(f"Warning: failed to update stats ({update.__name__}): {e}")
+
+
+@receiver(post_save, sender=SavedSpecification, dispatch_uid="stats_saved_spec_created")
+def _saved_spec_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _update_quietly(record_saved_spec, instance)
+        _update_quietly(_adjust_total, "saved_specs", 1)
+
+
+# รวมการลบผ่าน admin และ cascade ตอนลบผู้ใช้ (Django ส่ง post_delete ทีละแถวเมื่อมี receiver)
+@receiver(post_delete, sender=SavedSpecification, dispatch_uid="stats_saved_spec_deleted")
+def _saved_spec_deleted(sender, instance, **kwargs):
+    _update_quietly(record_deleted_spec, instance)
+    _update_quietly(_adjust_total, "saved_specs", -1)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL, dispatch_uid="stats_user_created")
+def _user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _update_quietly(_adjust_total, "users", 1)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL, dispatch_uid="stats_user_deleted")
+def _user_deleted(sender, instance, **kwargs):
+    _update_quietly(_adjust_total, "users", -1)
+
+
+def rebuild_rollups(start, end, periods=None):
+    """
+    สร้าง rollup ใหม่จากตารางดิบในช่วง [start, end) (start/end ควรอยู่บนขอบวัน) ใช้โดย backfill_stats_rollups
+    คืนค่าจำนวนแถว rollup ที่เขียน
+    """
+    written = 0
+    for period in periods or PERIODS:
+        _, trunc = PERIODS[period]
+        rows = {}
+
+        log_buckets = RecommendationRequestLog.objects.filter(
+            timestamp__gte=start, timestamp__lt=end
+        ).annotate(bucket=trunc('timestamp')).values('bucket').annotate(
+            requests=Count('id'),
+            errors=Count('id', filter=Q(outcome='error')),
+            unique_users=Count('user', distinct=True),
+        )
+        for row in log_buckets:
+            rows[row['bucket']] = StatsRollup(
+                period=period, bucket_start=row['bucket'],
+                requests=row['requests'], errors=row['errors'], unique_users=row['unique_users'],
+            )
+
+        save_buckets = SavedSpecification.objects.filter(
+            saved_at__gte=start, saved_at__lt=end
+        ).annotate(bucket=trunc('saved_at')).values('bucket').annotate(saves=Count('id'))
+        for row in save_buckets:
+            rows.setdefault(row['bucket'], StatsRollup(period=period, bucket_start=row['bucket'])).saves = row['saves']
+
+        # StatsRollupUser ของ bucket ที่ยังอยู่ในช่วงเก็บ เพื่อให้ unique_users นับต่อจากค่าที่สร้างใหม่ได้ถูกต้อง
+        seen_start = max(start, seen_users_cutoff())
+        seen_rows = []
+        if seen_start < end:
+            seen_pairs = RecommendationRequestLog.objects.filter(
+                timestamp__gte=seen_start, timestamp__lt=end, user__isnull=False
+            ).annotate(bucket=trunc('timestamp')).values_list('bucket', 'user').distinct()
+            seen_rows = [StatsRollupUser(period=period, bucket_start=bucket, user_id=user_id) for bucket, user_id in seen_pairs]
+
+        with transaction.atomic():
+            StatsRollup.objects.filter(period=period, bucket_start__gte=start, bucket_start__lt=end).delete()
+            StatsRollup.objects.bulk_create(rows.values())
+            StatsRollupUser.objects.filter(period=period, bucket_start__gte=start, bucket_start__lt=end).delete()
+            StatsRollupUser.objects.bulk_create(seen_rows, ignore_conflicts=True)
+        written += len(rows)
+    return written
+
+
+def get_stats_series(start, end, period):
+    """
+    คืนค่า (series, totals) ของ rollup ในช่วง [start, end)
+    totals ไม่มี unique_users เพราะผู้ใช้คนเดียวกันอาจถูกนับในหลาย bucket
+    """
+    queryset = StatsRollup.objects.filter(period=period, bucket_start__gte=start, bucket_start__lt=end)
+    series = list(queryset.order_by('bucket_start').values('bucket_start', *COUNTER_FIELDS))
+    totals = queryset.aggregate(requests=Sum('requests'), saves=Sum('saves'), errors=Sum('errors'))
+    return series, {key: value or 0 for key, value in totals.items()}
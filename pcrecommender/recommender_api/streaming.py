@@ -0,0 +1,90 @@
+# recommender_api/streaming.py
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+# key ของ object ที่ค่าเป็นรายการ build (ใช้ร่วมกับ llm_parsing.extract_build_list)
+BUILD_LIST_KEYS = ("recommendations", "builds", "pc_builds", "options", "configurations", "specs", "results")
+
+
+class IncrementalBuildParser:
+    """
+    อ่านข้อความ JSON จาก Gemini ทีละ chunk และคืน object ของแต่ละ build ทันทีที่ปิดวงเล็บครบ
+    build คือ object ที่เป็นสมาชิกของ array ระดับบนสุด [ {...}, ... ] หรือ array ที่เป็นค่าของ key ใน BUILD_LIST_KEYS
+    เช่น {"recommendations": [ {...}, ... ]} array อื่นที่มาก่อน (เช่น "notes": [...]) จะถูกข้าม
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._last_key_depth = None
+        self._items_depth = None
+        self._items_closed = False
+        self._item_start = None
+
+    def _is_build_list(self):
+        if not self._stack:
+            return True
+        return (self._stack[-1] == "{" and self._last_key_depth == len(self._stack)
+                and self._last_key in BUILD_LIST_KEYS)
+
+    def feed(self, chunk):
+        self.text += chunk
+        completed_items = []
+        text = self.text
+        while self._pos < len(text):
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._stack and self._stack[-1] == "{":
+                        # string สุดท้ายใน object ก่อน "[" คือ key ของ array นั้น
+                        self._last_key = text[self._string_start + 1:self._pos]
+                        self._last_key_depth = len(self._stack)
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch in "[{":
+                if ch == "{" and not self._items_closed and len(self._stack) == self._items_depth:
+                    self._item_start = self._pos
+                if ch == "[" and self._items_depth is None and self._is_build_list():
+                    self._items_depth = len(self._stack) + 1
+                self._stack.append(ch)
+            elif ch in "]}" and self._stack:
+                self._stack.pop()
+                if ch == "}" and self._item_start is not None and len(self._stack) == self._items_depth:
+                    try:
+                        completed_items.append(json.loads(text[self._item_start:self._pos + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._item_start = None
+                elif ch == "]" and self._items_depth is not None and len(self._stack) == self._items_depth - 1:
+                    self._items_closed = True  # array อื่นหลังรายการ build ไม่ใช่ build
+            self._pos += 1
+        return completed_items
+
+
+def format_sse(event, data):
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    ให้ DRF ยอมรับ Accept: text/event-stream และส่ง Response ปกติ (เช่น 400/503) กลับเป็น event "error"
+    """
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_sse("error", data).encode(self.charset)
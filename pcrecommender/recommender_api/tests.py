@@ -1,3 +1,1411 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .admission import (
+    Client, LLMSlots, Overloaded, WeightedFairQueue, charge_rate_limit, client_for, consume_token, retry_after_header,
+)
+from . import services
+from .batch import BatchItem, run_batch
+from .buffered_writer import BufferedWriter, llm_call_writer
+from .cache import RecommendationCache, canonical_query, canonical_query_key, fit_to_budget, recommendation_cache
+from .explanations import PREFETCH_CLIENT, ExplanationPrefetcher, explanation_content_hash, store_explanation
+from .streaming import IncrementalBuildParser
+from .jobs import _finish_job, claim_job, enqueue_recommendation_job, requeue_expired_jobs, run_job
+from .management.commands.run_recommendation_workers import _run_worker
+from .llm_metrics import record_llm_call, summarize_llm_calls
+from .llm_parsing import extract_build_list, normalize_build, parse_specs_output, repair_json_text
+from .services import _fanout_response, cache_recommendations, get_specs_from_gemini, stream_specs_from_gemini
+from .llm_backends import (
+    CassetteNotFound, LLMBackendError, ReplayBackend, ResilientBackend, StubBackend, build_llm_backend, is_retryable,
+    prompt_hash, set_llm_backend,
+)
+from .resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, LatencyTracker, backoff_delay
+from .models import BuildExplanation, Component, LLMCallLog, LLMSlotLease, RateLimitBucket, RecommendationCacheEntry, RecommendationJob, RecommendationRequestLog, SavedSpecification, StatsRollup
+from .optimizer import CATEGORY_KEYS, catalog_snapshot, optimize_builds, recommend_from_catalog
+from .similarity import SimilarQueryIndex, find_similar_recommendation
+from .pagination import SavedSpecCursorPagination
+from .singleflight import AsyncSingleFlight, BackgroundRefresher, SingleFlight, async_advisory_lock
+from .stats import bucket_start, get_totals, record_request_logs
+from .warmer import WARMER_CLIENT, find_hot_queries, warm_recommendation_cache
+
+
+@override_settings(RECOMMENDATION_CACHE_BUDGET_BUCKET_THB=1000)
+class RecommendationCacheTests(TestCase):
+    def test_budget_is_floored_into_bucket(self):
+        self.assertEqual(canonical_query(24600)["budget_bucket"], 24000)
+        self.assertEqual(canonical_query(24999.99)["budget_bucket"], 24000)
+        self.assertEqual(canonical_query(25000)["budget_bucket"], 25000)
+
+    def test_fit_to_budget_drops_builds_over_budget(self):
+        data = {"recommendations": [{"total_price_estimate_thb": 24900}, {"total_price_estimate_thb": 24100}]}
+        fitted = fit_to_budget(data, 24500)
+        self.assertEqual(fitted["recommendations"], [{"total_price_estimate_thb": 24100}])
+        self.assertEqual(fitted["budget_thb"], 24500.0)
+        self.assertIsNone(fit_to_budget({"recommendations": [{"total_price_estimate_thb": 24900}]}, 24000))
+
+    @override_settings(SIMILAR_QUERY_PRICE_TOLERANCE=0.05)
+    def test_exact_bucket_hits_ignore_similar_query_tolerance(self):
+        self.assertIsNone(fit_to_budget({"recommendations": [{"total_price_estimate_thb": 24100}]}, 24000))
+        fitted = fit_to_budget({"recommendations": [{"total_price_estimate_thb": 24100}]}, 24000, tolerance=0.05)
+        self.assertEqual(fitted["budget_thb"], 24000.0)
+
+    def test_local_entry_is_capped_by_row_expiry(self):
+        cache = RecommendationCache(maxsize=10, local_ttl_seconds=300, ttl_seconds=60)
+        cache.set("key", {"budget_bucket": 24000}, {"recommendations": [{"total_price_estimate_thb": 1}]})
+        self.assertIsNotNone(cache.get("key"))
+
+        RecommendationCacheEntry.objects.filter(cache_key="key").update(expires_at=timezone.now() - timedelta(seconds=1))
+        cache._local["key"] = (timezone.now() - timedelta(seconds=1), cache._local["key"][1])
+        self.assertIsNone(cache.get("key"))
+        self.assertNotIn("key", cache._local)
+
+
+@override_settings(RECOMMENDATION_FANOUT_PARTIAL_CACHE_TTL_SECONDS=60)
+class FanoutCachingTests(TestCase):
+    tiers = ["value", "balanced", "performance"]
+    build = {"build_name": "A", "cpu": {"name": "Ryzen 5 7600"}, "gpu": {"name": "RTX 4060"}, "total_price_estimate_thb": 29000}
+
+    def fanout_response(self, completed):
+        results = {tier: {"recommendations": [{**self.build, "build_name": tier}]} for tier in completed}
+        builds = [build for tier in completed for build in results[tier]["recommendations"]]
+        return _fanout_response(results, builds, completed, self.tiers, 30000, "THB")
+
+    def seconds_until_expiry(self, key):
+        return (RecommendationCacheEntry.objects.get(cache_key=key).expires_at - timezone.now()).total_seconds()
+
+    def test_complete_result_gets_full_ttl(self):
+        data = self.fanout_response(self.tiers)
+        self.assertNotIn("missing_tiers", data)
+        self.assertTrue(cache_recommendations("fanout-full", canonical_query(30000), data))
+        self.assertGreater(self.seconds_until_expiry("fanout-full"), 3000)
+
+    def test_partial_result_gets_short_ttl(self):
+        data = self.fanout_response(["value"])
+        self.assertEqual(data["missing_tiers"], ["balanced", "performance"])
+        self.assertTrue(cache_recommendations("fanout-partial", canonical_query(30000), data))
+        self.assertLessEqual(self.seconds_until_expiry("fanout-partial"), 60)
+
+    def test_partial_result_is_not_cached_when_disabled(self):
+        with self.settings(RECOMMENDATION_FANOUT_PARTIAL_CACHE_TTL_SECONDS=0):
+            self.assertFalse(cache_recommendations("fanout-off", canonical_query(30000), self.fanout_response(["value"])))
+        self.assertFalse(RecommendationCacheEntry.objects.filter(cache_key="fanout-off").exists())
+
+
+class ExplanationHashTests(TestCase):
+    build = {"cpu": {"name": "Ryzen 5  7600", "price_thb": 7000}, "gpu": {"name": "RTX 4060", "price_thb": 10500}}
+
+    def test_exact_budget_changes_hash(self):
+        self.assertNotEqual(
+            explanation_content_hash(self.build, {"budget": 24100}),
+            explanation_content_hash(self.build, {"budget": 24900}),
+        )
+
+    def test_formatting_does_not_change_hash(self):
+        reordered = {"gpu": {"price_thb": "10500", "name": "rtx 4060"}, "cpu": {"name": "Ryzen 5 7600", "price_thb": 7000.2}}
+        self.assertEqual(
+            explanation_content_hash(self.build, {"budget": 24100, "preferred_games": ["Valorant", "valorant "]}),
+            explanation_content_hash(reordered, {"budget": "24100", "preferred_games": ["VALORANT"]}),
+        )
+
+
+class IncrementalBuildParserTests(SimpleTestCase):
+    builds = [
+        {"build_name": "A", "cpu": {"name": "Ryzen 5 7600", "price_thb": 7000}, "notes": "มี \"quote\" และ [วงเล็บ] {x}"},
+        {"build_name": "B", "gpu": {"name": "RTX 4060", "price_thb": 10500}},
+    ]
+
+    def feed_all(self, text, size):
+        parser = IncrementalBuildParser()
+        builds = []
+        for start in range(0, len(text), size):
+            builds.extend(parser.feed(text[start:start + size]))
+        return builds
+
+    def test_leading_array_is_not_taken_as_builds(self):
+        text = json.dumps({"notes": ["งบจำกัด", {"tip": "x"}], "recommendations": self.builds}, ensure_ascii=False)
+        self.assertEqual(self.feed_all(text, len(text)), self.builds)
+
+    def test_top_level_array(self):
+        text = json.dumps(self.builds, ensure_ascii=False)
+        self.assertEqual(self.feed_all(text, len(text)), self.builds)
+
+    def test_chunks_split_mid_token(self):
+        text = json.dumps({"notes": [{"a": 1}], "builds": self.builds, "tail": [{"b": 2}]}, ensure_ascii=False)
+        for size in (1, 2, 3, 7):
+            with self.subTest(size=size):
+                self.assertEqual(self.feed_all(text, size), self.builds)
+
+    def test_builds_are_returned_as_soon_as_they_close(self):
+        parser = IncrementalBuildParser()
+        first = json.dumps(self.builds[0], ensure_ascii=False)
+        self.assertEqual(parser.feed('{"recommendations": [' + first[:-1]), [])
+        self.assertEqual(parser.feed(first[-1] + ', {"build_'), [self.builds[0]])
+
+
+class LLMParsingTests(SimpleTestCase):
+    build = {"build_name": "A", "cpu": {"name": "Ryzen 5 7600", "price_thb": 7000}, "gpu": "RTX 4060"}
+
+    def test_repairs_fence_prose_and_trailing_comma(self):
+        text = 'นี่คือสเปค:\n```json\n[{"build_name": "A", "cpu": "Ryzen 5",},]\n```\nขอให้สนุก'
+        parsed, repairs = repair_json_text(text)
+        self.assertEqual(parsed, [{"build_name": "A", "cpu": "Ryzen 5"}])
+        self.assertEqual(repairs, ("fence", "trailing_comma"))
+
+        parsed, repairs = repair_json_text('Here you go: {"builds": []} hope it helps')
+        self.assertEqual((parsed, repairs), ({"builds": []}, ("prose",)))
+
+    def test_clean_json_needs_no_repair(self):
+        self.assertEqual(repair_json_text('[{"cpu": "x"}]'), ([{"cpu": "x"}], ()))
+
+    def test_truncated_array_keeps_complete_builds(self):
+        text = json.dumps({"recommendations": [self.build, self.build]})[:-30]
+        parsed, repairs = repair_json_text(text)
+        self.assertEqual(parsed, [self.build])
+        self.assertIn("truncated", repairs)
+
+    def test_unrepairable_text_raises(self):
+        for text in ("no json here", '{"cpu": '):
+            with self.assertRaises(json.JSONDecodeError):
+                repair_json_text(text)
+
+    def test_extract_build_list_shapes(self):
+        cases = [
+            ([self.build], "list"),
+            ([[self.build], [self.build]], "nested_list"),
+            (self.build, "build"),
+            ({"recommendations": [self.build], "analysis_notes": "ok"}, "recommendations"),
+            ({"pc_builds": [self.build]}, "named_list"),
+            ({"options": self.build}, "named_build"),
+            ({"build1": self.build, "build2": {**self.build, "build_name": "B"}}, "keyed_builds"),
+            ({"data": {"builds": [self.build]}}, "wrapped"),
+            ({"message": "sorry"}, None),
+        ]
+        for parsed, shape in cases:
+            with self.subTest(shape=shape):
+                self.assertEqual(extract_build_list(parsed)[2], shape)
+        self.assertEqual(extract_build_list({"recommendations": [], "analysis_notes": "ok"})[1], "ok")
+
+    def test_prices_are_parsed_from_text(self):
+        build = normalize_build({
+            "cpu": {"name": "a", "price_thb": "12,900 บาท"},
+            "gpu": {"name": "b", "price_thb": "1.2k"},
+            "ram": {"name": "c", "price_thb": "1.5 หมื่น"},
+            "psu": {"name": "d", "price_thb": "ราคาไม่แน่นอน"},
+            "case": {"name": "e", "price_thb": 2500},
+        })
+        prices = {key: build[key]["price_thb"] for key in ("cpu", "gpu", "ram", "psu", "case")}
+        self.assertEqual(prices, {"cpu": 12900.0, "gpu": 1200.0, "ram": 15000.0, "psu": None, "case": 2500})
+
+    def test_builds_without_cpu_and_gpu_are_dropped(self):
+        parsed = parse_specs_output(json.dumps([self.build, {"build_name": "empty", "ram": "16GB"}]))
+        self.assertEqual([build["build_name"] for build in parsed.builds], ["A"])
+        self.assertEqual(parsed.dropped_builds, 1)
+
+
+class RequestLogWriterTests(TestCase):
+    def test_buffered_log_keeps_request_time(self):
+        writer = BufferedWriter(
+            RecommendationRequestLog, mode="buffered", batch_size=10, flush_interval=60, max_buffer=100,
+            on_flush=record_request_logs,
+        )
+        writer._flusher_pid = os.getpid()  # flush เองในเทสต์ ไม่ต้องมี flusher thread
+        requested_at = timezone.now() - timedelta(hours=2)
+        writer.add(RecommendationRequestLog(timestamp=requested_at, outcome="success"))
+        self.assertEqual(writer.flush(), 1)
+
+        self.assertEqual(RecommendationRequestLog.objects.get().timestamp, requested_at)
+        rollup = StatsRollup.objects.get(period="hour", bucket_start=bucket_start(requested_at, "hour"))
+        self.assertEqual(rollup.requests, 1)
+
+
+class StatsRollupTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+
+    def day_rollup(self, moment):
+        return StatsRollup.objects.get(period="day", bucket_start=bucket_start(moment, "day"))
+
+    def test_unique_users_are_counted_once_per_bucket(self):
+        now = timezone.now()
+        record_request_logs([RecommendationRequestLog(user=self.alice, timestamp=now), RecommendationRequestLog(timestamp=now)])
+        record_request_logs([
+            RecommendationRequestLog(user=self.alice, timestamp=now),
+            RecommendationRequestLog(user=self.bob, timestamp=now, outcome="error"),
+        ])
+        rollup = self.day_rollup(now)
+        self.assertEqual((rollup.requests, rollup.unique_users, rollup.errors), (4, 2, 1))
+
+    def test_saves_and_totals_follow_creates_and_deletes(self):
+        spec = SavedSpecification.objects.create(user=self.alice, build_details={})
+        SavedSpecification.objects.create(user=self.bob, build_details={})
+        self.assertEqual(self.day_rollup(spec.saved_at).saves, 2)
+        self.assertEqual(get_totals(), {"users": 2, "saved_specs": 2})
+
+        spec.delete()
+        self.assertEqual(self.day_rollup(spec.saved_at).saves, 1)
+        self.bob.delete()  # cascade ลบสเปคของ bob ด้วย
+        self.assertEqual(self.day_rollup(spec.saved_at).saves, 0)
+        self.assertEqual(get_totals(), {"users": 1, "saved_specs": 0})
+
+
+@override_settings(ADMISSION_ENABLED=True, ADMISSION_ANON_BURST=1, ADMISSION_ANON_RATE_PER_MINUTE=1)
+class RateLimitTests(TestCase):
+    def test_token_is_charged_only_for_rate_limited_clients(self):
+        charge_rate_limit(Client("ip:10.0.0.1", False))
+        with self.assertRaises(Overloaded) as raised:
+            charge_rate_limit(Client("ip:10.0.0.1", False))
+        self.assertGreater(raised.exception.retry_after, 0)
+        for _ in range(3):
+            charge_rate_limit(Client("warmer", False, rate_limited=False))
+        self.assertFalse(RateLimitBucket.objects.filter(key="llm:warmer").exists())
+
+    def test_client_ip_follows_trusted_proxy_count(self):
+        request = RequestFactory().post("/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="1.2.3.4, 5.6.7.8")
+        with self.settings(ADMISSION_TRUSTED_PROXY_COUNT=1):
+            self.assertEqual(client_for(request), Client("ip:5.6.7.8", False, True))
+        with self.settings(ADMISSION_TRUSTED_PROXY_COUNT=0):
+            self.assertEqual(client_for(request), Client("ip:10.0.0.1", False, True))
+        with self.settings(ADMISSION_TRUSTED_PROXY_COUNT=None):
+            # ยังไม่ได้ตั้งค่า proxy: ไม่ให้ผู้ไม่ login ทุกคนใช้ bucket ของ proxy ร่วมกัน
+            self.assertFalse(client_for(request).rate_limited)
+            direct = RequestFactory().post("/", REMOTE_ADDR="10.0.0.2")
+            self.assertEqual(client_for(direct), Client("ip:10.0.0.2", False, True))
+
+    def test_cache_hits_do_not_spend_tokens(self):
+        query = canonical_query(30000)
+        recommendation_cache.set(
+            canonical_query_key(30000), query, {"recommendations": [{"total_price_estimate_thb": 29000}]}
+        )
+        client = APIClient()
+        for _ in range(3):
+            response = client.post(reverse("recommend_specs"), {"budget": 30000}, format="json")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-Recommendation-Cache"], "HIT")
+        self.assertFalse(RateLimitBucket.objects.exists())
+
+
+class TokenBucketTests(TestCase):
+    def test_bucket_refills_at_rate(self):
+        self.assertEqual(consume_token("k", 1.0, 2), (True, 0.0))
+        self.assertEqual(consume_token("k", 1.0, 2), (True, 0.0))
+        allowed, retry_after = consume_token("k", 1.0, 2)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 1.0, places=1)
+
+        # ผ่านไป 1.5 วินาที = เติม 1.5 token ใช้ได้หนึ่งครั้ง เหลือ 0.5
+        RateLimitBucket.objects.update(updated_at=timezone.now() - timedelta(seconds=1.5))
+        self.assertTrue(consume_token("k", 1.0, 2)[0])
+        self.assertAlmostEqual(RateLimitBucket.objects.get().tokens, 0.5, places=1)
+
+    def test_bucket_never_exceeds_capacity(self):
+        consume_token("k", 1.0, 2)
+        RateLimitBucket.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        consume_token("k", 1.0, 2)
+        self.assertAlmostEqual(RateLimitBucket.objects.get().tokens, 1.0, places=1)
+
+    def test_retry_after_header_rounds_up_to_whole_seconds(self):
+        self.assertEqual(retry_after_header(0.2), "1")
+        self.assertEqual(retry_after_header(2.1), "3")
+        self.assertEqual(retry_after_header(0), "1")
+
+
+class WeightedFairQueueTests(SimpleTestCase):
+    @staticmethod
+    def drain(queue):
+        order = []
+        while len(queue):
+            ticket = queue._heap[0]
+            order.append(ticket[2])
+            queue.leave(ticket)
+        return order
+
+    def test_busy_flow_does_not_starve_others(self):
+        queue = WeightedFairQueue(max_waiting=10)
+        for _ in range(3):
+            queue.join("busy", 1)
+        queue.join("quiet", 1)
+        self.assertEqual(self.drain(queue), ["busy", "quiet", "busy", "busy"])
+
+    def test_heavier_flow_gets_larger_share(self):
+        queue = WeightedFairQueue(max_waiting=10)
+        for _ in range(2):
+            queue.join("anon", 1)
+        for _ in range(3):
+            queue.join("user", 4)
+        self.assertEqual(self.drain(queue), ["user", "user", "user", "anon", "anon"])
+
+    def test_full_queue_rejects(self):
+        queue = WeightedFairQueue(max_waiting=1)
+        self.assertIsNotNone(queue.join("a", 1))
+        self.assertIsNone(queue.join("b", 1))
+
+
+@override_settings(
+    ADMISSION_ENABLED=True, ADMISSION_TRUSTED_PROXY_COUNT=0, RECOMMENDATION_FANOUT_ENABLED=False,
+    ADMISSION_ANON_BURST=1, ADMISSION_ANON_RATE_PER_MINUTE=6,
+)
+class RateLimitResponseTests(TestCase):
+    def setUp(self):
+        set_llm_backend(StubBackend(latency_median_ms=0, latency_sigma=0, failure_rate=0, malformed_rate=0, seed=1))
+        self.addCleanup(set_llm_backend, None)
+        RateLimitBucket.objects.create(key="llm:ip:127.0.0.1", tokens=0, updated_at=timezone.now())
+
+    def assert_throttled(self, response):
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "10")
+        self.assertTrue(response.json()["overloaded"])
+
+    def test_recommend_specs_maps_rate_limit_to_429(self):
+        self.assert_throttled(APIClient().post(reverse("recommend_specs"), {"budget": 31000}, format="json"))
+
+    def test_stream_answers_429_before_streaming(self):
+        self.assert_throttled(APIClient().post(reverse("recommend_specs_stream"), {"budget": 31000}, format="json"))
+
+    def test_explain_build_maps_rate_limit_to_429(self):
+        build = {"cpu": {"name": "Ryzen 5 7600", "price_thb": 7000}, "gpu": {"name": "RTX 4060", "price_thb": 10500}}
+        response = APIClient().post(
+            reverse("explain_build"), {"selected_build": build, "original_query": {"budget": 20000}}, format="json"
+        )
+        self.assert_throttled(response)
+
+
+@override_settings(ADMISSION_ENABLED=True, ADMISSION_SLOT_LEASE_SECONDS=60)
+class LLMSlotsTests(TransactionTestCase):
+    @staticmethod
+    def make_slots(max_in_flight=1):
+        return LLMSlots(max_in_flight=max_in_flight, max_waiting=4, max_wait_seconds=0.3, poll_interval=0.01)
+
+    def hold_concurrently(self, slots_per_request):
+        async def hold(slots, index):
+            async with slots.acquire_async(Client(f"ip:10.0.0.{index}", False)):
+                await asyncio.sleep(0.5)
+
+        async def scenario():
+            return await asyncio.gather(
+                *(hold(slots, index) for index, slots in enumerate(slots_per_request)), return_exceptions=True
+            )
+
+        return asyncio.run(scenario())
+
+    def test_concurrent_async_acquires_cannot_share_a_slot(self):
+        slots = self.make_slots()
+        results = self.hold_concurrently([slots, slots])
+        self.assertEqual(sum(isinstance(result, Overloaded) for result in results), 1)
+
+    def test_slot_is_shared_across_workers(self):
+        # LLMSlots สองตัวแทนสอง worker: ต้องนับจากตาราง ไม่ใช่ตัวนับในหน่วยความจำ
+        results = self.hold_concurrently([self.make_slots(), self.make_slots()])
+        self.assertEqual(sum(isinstance(result, Overloaded) for result in results), 1)
+        self.assertFalse(LLMSlotLease.objects.exclude(holder="").exists())
+
+    def test_expired_lease_can_be_reclaimed(self):
+        crashed, alive = self.make_slots(), self.make_slots()
+        self.assertIsNotNone(crashed._try_take_slot())
+        self.assertIsNone(alive._try_take_slot())
+        LLMSlotLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        lease = alive._try_take_slot()
+        self.assertIsNotNone(lease)
+        alive._release_slot(lease)
+        self.assertEqual(alive.stats()["in_flight"], 0)
+
+    def test_renew_extends_lease_until_it_is_taken(self):
+        crashed, alive = self.make_slots(), self.make_slots()
+        lease = crashed._try_take_slot()
+        LLMSlotLease.objects.update(expires_at=timezone.now() + timedelta(seconds=1))
+        self.assertTrue(crashed.renew(lease))
+        self.assertGreater(LLMSlotLease.objects.get(slot=lease.slot).expires_at, timezone.now() + timedelta(seconds=30))
+        self.assertIsNone(alive._try_take_slot())
+
+        LLMSlotLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNotNone(alive._try_take_slot())
+        self.assertFalse(crashed.renew(lease))
+
+    @override_settings(ADMISSION_SLOT_LEASE_SECONDS=0, RECOMMENDATION_FANOUT_ENABLED=False)
+    def test_stream_renews_its_lease_while_receiving_chunks(self):
+        set_llm_backend(StubBackend(latency_median_ms=0, latency_sigma=0, failure_rate=0, malformed_rate=0, seed=1))
+        self.addCleanup(set_llm_backend, None)
+        slots = self.make_slots()
+        with mock.patch("recommender_api.services.llm_slots", slots), \
+                mock.patch.object(slots, "renew", wraps=slots.renew) as renew:
+            events = [event for event, _data in stream_specs_from_gemini(31700)]
+        self.assertIn("build", events)
+        self.assertNotIn("error", events)
+        self.assertTrue(renew.called)
+        self.assertIsNotNone(renew.call_args.args[0])
+        self.assertFalse(LLMSlotLease.objects.exclude(holder="").exists())
+
+
+@override_settings(RECOMMENDATION_JOB_MAX_ATTEMPTS=2, RECOMMENDATION_JOB_RETRY_BACKOFF_SECONDS=5)
+class RecommendationJobTests(TestCase):
+    @staticmethod
+    def make_job(age_seconds=0, **fields):
+        return RecommendationJob.objects.create(
+            client_key="ip:10.0.0.1", request_payload={"budget": 47000},
+            created_at=timezone.now() - timedelta(seconds=age_seconds), **fields,
+        )
+
+    def test_claim_takes_oldest_ready_job(self):
+        newer = self.make_job(age_seconds=10)
+        self.make_job(age_seconds=20, not_before=timezone.now() + timedelta(minutes=1))
+        job = claim_job("w1")
+        self.assertEqual((job.pk, job.status, job.worker, job.attempts), (newer.pk, "running", "w1", 1))
+        self.assertIsNone(claim_job("w2"))
+
+    def test_expired_lease_is_requeued_until_attempts_run_out(self):
+        expired = timezone.now() - timedelta(seconds=1)
+        retry = self.make_job(status="running", worker="w1", attempts=1, lease_expires_at=expired)
+        give_up = self.make_job(status="running", worker="w1", attempts=2, lease_expires_at=expired)
+        self.assertEqual(requeue_expired_jobs(), (1, 1))
+        retry.refresh_from_db()
+        give_up.refresh_from_db()
+        self.assertEqual((retry.status, retry.worker), ("queued", ""))
+        self.assertEqual(give_up.status, "failed")
+
+    def test_stale_worker_cannot_overwrite_result(self):
+        self.make_job()
+        job = claim_job("w1")
+        stale = RecommendationJob.objects.get(pk=job.pk)
+        RecommendationJob.objects.filter(pk=job.pk).update(worker="w2")  # lease หมดแล้ว worker อื่นดึงต่อ
+        self.assertEqual(_finish_job(stale, status="succeeded"), 0)
+        self.assertEqual(RecommendationJob.objects.get(pk=job.pk).status, "running")
+
+    @override_settings(ADMISSION_ENABLED=True, ADMISSION_ANON_BURST=1, RECOMMENDATION_FANOUT_ENABLED=False)
+    def test_overloaded_job_is_requeued_with_backoff(self):
+        set_llm_backend(StubBackend(latency_median_ms=0, latency_sigma=0, failure_rate=0, malformed_rate=0, seed=1))
+        self.addCleanup(set_llm_backend, None)
+        RateLimitBucket.objects.create(key="llm:ip:10.0.0.1", tokens=0, updated_at=timezone.now())
+        self.make_job()
+        job = claim_job("w1")
+        self.assertEqual(run_job(job), "queued")
+        job.refresh_from_db()
+        self.assertEqual(job.status, "queued")
+        self.assertGreaterEqual((job.not_before - timezone.now()).total_seconds(), 4)
+        self.assertIsNone(claim_job("w1"))  # ไม่ถูกดึงกลับทันที
+
+    @override_settings(RECOMMENDATION_JOB_REQUEUE_INTERVAL_SECONDS=30)
+    def test_worker_requeues_expired_jobs_while_queue_is_busy(self):
+        crashed = self.make_job(
+            age_seconds=30, status="running", worker="dead", attempts=1, lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        fresh = self.make_job()
+        module = "recommender_api.management.commands.run_recommendation_workers"
+        with mock.patch(f"{module}.run_job") as run, mock.patch(f"{module}.signal.signal"), \
+                mock.patch(f"{module}.connection"), mock.patch(f"{module}.close_old_connections"):
+            self.assertEqual(_run_worker(poll_interval=0, once=True), 2)
+        self.assertEqual([call.args[0].pk for call in run.call_args_list], [crashed.pk, fresh.pk])
+
+    @override_settings(ADMISSION_ENABLED=True, ADMISSION_ANON_BURST=1, RECOMMENDATION_FANOUT_ENABLED=False)
+    def test_unlimited_client_stays_unlimited_in_worker(self):
+        set_llm_backend(StubBackend(latency_median_ms=0, latency_sigma=0, failure_rate=0, malformed_rate=0, seed=1))
+        self.addCleanup(set_llm_backend, None)
+        RateLimitBucket.objects.create(key="llm:batch", tokens=0, updated_at=timezone.now())
+        queued = enqueue_recommendation_job(None, Client("batch", False, rate_limited=False), {"budget": 47700}, "gemini")
+        self.assertFalse(queued.rate_limited)
+        job = claim_job("w1")
+        self.assertEqual(run_job(job), "succeeded")
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def make_breaker(self):
+        return CircuitBreaker("test", failure_threshold=2, reset_seconds=60)
+
+    @staticmethod
+    def expire_reset(breaker):
+        breaker._opened_at -= 61
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = self.make_breaker()
+        breaker.check()
+        breaker.record_failure()
+        breaker.record_success()  # สำเร็จคั่นกลาง: นับใหม่
+        breaker.record_failure()
+        self.assertEqual(breaker.stats()["state"], "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.stats()["state"], "open")
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+        self.assertEqual(breaker.stats()["rejected"], 1)
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = self.make_breaker()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.expire_reset(breaker)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.stats()["state"], "half_open")
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.stats()["state"], "closed")
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        breaker = self.make_breaker()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.expire_reset(breaker)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.stats(), {"state": "open", "consecutive_failures": 3, "opened": 2, "rejected": 0})
+        self.assertFalse(breaker.allow())
+
+    def test_release_frees_the_probe_without_a_verdict(self):
+        breaker = self.make_breaker()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.expire_reset(breaker)
+        self.assertTrue(breaker.allow())
+        breaker.release()
+        self.assertEqual(breaker.stats()["state"], "half_open")
+        self.assertTrue(breaker.allow())
+
+    def test_zero_threshold_disables_breaker(self):
+        breaker = CircuitBreaker("test", failure_threshold=0, reset_seconds=60)
+        for _ in range(5):
+            breaker.record_failure()
+        self.assertTrue(breaker.allow())
+
+
+class RetryPolicyTests(SimpleTestCase):
+    def test_backoff_delay_stays_within_cap(self):
+        for attempt in range(8):
+            for _ in range(50):
+                delay = backoff_delay(attempt, 0.5, 4.0)
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, min(4.0, 0.5 * 2 ** attempt))
+
+    def test_only_transient_errors_are_retryable(self):
+        from google.api_core import exceptions as google_exceptions
+
+        for error in (DeadlineExceeded("slow"), TimeoutError(), ConnectionError(),
+                      google_exceptions.TooManyRequests("429"), google_exceptions.ServiceUnavailable("503")):
+            self.assertTrue(is_retryable(error), error)
+        for error in (CassetteNotFound("missing"), ValueError("bad prompt"), google_exceptions.InvalidArgument("400")):
+            self.assertFalse(is_retryable(error), error)
+
+
+class LLMBackendTests(SimpleTestCase):
+    def stub(self, **overrides):
+        options = {"latency_median_ms": 0, "latency_sigma": 0, "failure_rate": 0, "malformed_rate": 0, "seed": 1}
+        options.update(overrides)
+        return StubBackend(**options)
+
+    def test_replay_reads_cassette_by_prompt_hash(self):
+        with tempfile.TemporaryDirectory() as cassette_dir:
+            prompt = "จัดสเปคงบประมาณ 30,000 บาท"
+            with open(os.path.join(cassette_dir, f"{prompt_hash(prompt)}.json"), "w", encoding="utf-8") as f:
+                json.dump({"operation": "specs", "text": "[]", "prompt_tokens": 12, "response_tokens": 1}, f)
+            backend = ReplayBackend(cassette_dir)
+
+            response = backend.generate(prompt, "specs")
+            self.assertEqual(response.text, "[]")
+            self.assertEqual(response.usage_metadata.total_token_count, 13)
+            self.assertEqual("".join(chunk.text for chunk in backend.generate_stream(prompt, "specs")), "[]")
+            with self.assertRaises(CassetteNotFound):
+                backend.generate(prompt + " ", "specs")
+
+    def test_stub_builds_follow_budget_in_prompt(self):
+        response = self.stub().generate("จัดสเปคงบประมาณ 40,000 บาท", "specs")
+        builds = json.loads(response.text)
+
+        self.assertEqual([build["total_price_estimate_thb"] for build in builds], [38000, 32000, 40000])
+        self.assertTrue(all(set(CATEGORY_KEYS) <= set(build) for build in builds))
+
+        tier = json.loads(self.stub().generate("งบประมาณ 40,000 บาท (value)", "specs_tier").text)
+        self.assertEqual([build["build_name"] for build in tier], ["ชุดประหยัด (Stub)"])
+
+    def test_stub_failure_and_malformed_rates(self):
+        with self.assertRaises(LLMBackendError):
+            self.stub(failure_rate=1).generate("งบประมาณ 30,000 บาท", "specs")
+
+        text = self.stub(malformed_rate=1).generate("งบประมาณ 30,000 บาท", "specs").text
+        with self.assertRaises(json.JSONDecodeError):
+            json.loads(text)
+
+    @override_settings(LLM_BACKEND="stub")
+    def test_backend_is_selected_from_settings(self):
+        self.assertIsInstance(build_llm_backend(), StubBackend)
+        self.assertIsInstance(build_llm_backend("replay"), ReplayBackend)
+        with self.assertRaises(ValueError):
+            build_llm_backend("unknown")
+
+
+class SlowBackend:
+    """
+    backend ปลอมที่ attempt แรกช้า (delays[0]) และ attempt ถัดไปตาม delays ที่เหลือ
+    """
+    name = model_name = "slow"
+
+    def __init__(self, *delays):
+        self.delays = list(delays)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, operation, timeout=None):
+        with self._lock:
+            index = self.calls
+            self.calls += 1
+        time.sleep(self.delays[min(index, len(self.delays) - 1)])
+        return SimpleNamespace(text=f"attempt {index}")
+
+
+@override_settings(ADMISSION_ENABLED=True, ADMISSION_SLOT_LEASE_SECONDS=60)
+class HedgedRequestTests(TransactionTestCase):
+    def make_backend(self, inner):
+        latency = LatencyTracker()
+        for _ in range(20):
+            latency.observe("specs", 0.01)
+        return ResilientBackend(
+            inner, CircuitBreaker("test", failure_threshold=5, reset_seconds=30), latency, default_deadline=5,
+            attempt_timeout=5, max_attempts=1, backoff_base=0.1, backoff_cap=1, hedge_enabled=True, hedge_min_delay=0.05,
+        )
+
+    def use_slots(self, max_in_flight):
+        slots = LLMSlots(max_in_flight=max_in_flight, max_waiting=4, max_wait_seconds=0.3, poll_interval=0.01)
+        patcher = mock.patch("recommender_api.llm_backends.llm_slots", slots)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return slots
+
+    def test_hedge_is_skipped_without_a_free_slot(self):
+        slots = self.use_slots(1)
+        caller_slot = slots._try_take_slot()  # slot ของ request ที่เรียก generate
+        inner = SlowBackend(0.3, 0.0)
+        backend = self.make_backend(inner)
+        self.assertEqual(backend.generate("prompt", "specs").text, "attempt 0")
+        self.assertEqual(inner.calls, 1)
+        self.assertEqual(backend.stats()["hedges_skipped"], 1)
+        slots._release_slot(caller_slot)
+
+    def test_hedge_holds_its_own_slot_until_the_loser_finishes(self):
+        slots = self.use_slots(2)
+        caller_slot = slots._try_take_slot()
+        inner = SlowBackend(0.5, 0.0)
+        backend = self.make_backend(inner)
+        self.assertEqual(backend.generate("prompt", "specs").text, "attempt 1")
+        self.assertEqual(backend.stats()["hedge_wins"], 1)
+        self.assertEqual(slots.stats()["in_flight"], 2)  # attempt แรกยังเรียก provider อยู่
+
+        time.sleep(0.7)
+        self.assertEqual(slots.stats()["in_flight"], 1)
+        self.assertEqual(list(LLMSlotLease.objects.exclude(holder="").values_list("holder", flat=True)), [caller_slot.holder])
+        slots._release_slot(caller_slot)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "advisory locks need PostgreSQL")
+class AsyncAdvisoryLockTests(TransactionTestCase):
+    def test_second_holder_waits_for_first(self):
+        async def scenario():
+            async with async_advisory_lock("tests:lock", timeout=5) as first:
+                async with async_advisory_lock("tests:lock", timeout=0.2) as second:
+                    self.assertTrue(first.acquired)
+                    self.assertFalse(second.acquired)
+                    self.assertTrue(second.waited)
+            async with async_advisory_lock("tests:lock", timeout=0.2) as third:
+                self.assertTrue(third.acquired)
+
+        asyncio.run(scenario())
+
+
+CATALOG_ROWS = [
+    {"category": "cpu", "name": "AMD Ryzen 5 7600", "price_thb": 7000, "socket": "AM5", "tdp_watts": 65, "performance_score": 60},
+    {"category": "cpu", "name": "AMD Ryzen 9 7950X", "price_thb": 20000, "socket": "AM5", "tdp_watts": 170, "performance_score": 100},
+    {"category": "cpu", "name": "Intel Core i5 12400F", "price_thb": 4500, "socket": "LGA1700", "tdp_watts": 65, "performance_score": 50},
+    {"category": "gpu", "name": "GTX 1650", "price_thb": 5000, "tdp_watts": 75, "performance_score": 25},
+    {"category": "gpu", "name": "RTX 4060", "price_thb": 11000, "tdp_watts": 115, "performance_score": 60},
+    {"category": "gpu", "name": "RTX 4090", "price_thb": 60000, "tdp_watts": 450, "performance_score": 100},
+    {"category": "motherboard", "name": "ASUS PRIME", "price_thb": 5000, "socket": "AM5", "chipset": "B650", "memory_type": "ddr5", "performance_score": 50},
+    {"category": "motherboard", "name": "MSI PRO WiFi", "price_thb": 9000, "socket": "AM5", "chipset": "X670", "memory_type": "ddr5", "performance_score": 70},
+    {"category": "motherboard", "name": "Gigabyte DS3H", "price_thb": 3500, "socket": "LGA1700", "chipset": "B760", "memory_type": "ddr4", "performance_score": 40},
+    {"category": "ram", "name": "Kingston Fury 16GB DDR4", "price_thb": 1500, "memory_type": "ddr4", "performance_score": 45},
+    {"category": "ram", "name": "Kingston Fury 16GB DDR5", "price_thb": 2000, "memory_type": "ddr5", "performance_score": 50},
+    {"category": "ram", "name": "Corsair Vengeance 32GB DDR5", "price_thb": 3800, "memory_type": "ddr5", "performance_score": 80},
+    {"category": "storage", "name": "WD SN570 1TB NVMe", "price_thb": 2000, "performance_score": 50},
+    {"category": "psu", "name": "Corsair CV450", "price_thb": 1300, "tdp_watts": 450, "performance_score": 40},
+    {"category": "psu", "name": "Corsair RM850x", "price_thb": 3800, "tdp_watts": 850, "performance_score": 70},
+    {"category": "psu", "name": "Thermaltake Smart 1000W", "price_thb": 5000, "tdp_watts": "", "performance_score": 60},
+    {"category": "case", "name": "Montech AIR 100", "price_thb": 1200, "performance_score": 50},
+    {"category": "cooler", "name": "Deepcool AK400", "price_thb": 900, "socket": "AM5,LGA1700", "performance_score": 50},
+]
+PSU_RATED_WATTS = {"Corsair CV450": 450, "Corsair RM850x": 850, "Thermaltake Smart 1000W": 1000}
+
+
+class OptimizerTests(TestCase):
+    def setUp(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "catalog.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(CATALOG_ROWS, f)
+            call_command("load_components", path, stdout=io.StringIO())
+        catalog_snapshot.invalidate()
+        self.addCleanup(catalog_snapshot.invalidate)
+        self.components = {c.name: c for c in Component.objects.all()}
+
+    def assert_compatible(self, build, budget):
+        part = {key: self.components[build[key]["name"]] for key in CATEGORY_KEYS}
+        self.assertLessEqual(build["calculated_total_price_thb"], budget)
+        self.assertEqual(part["cpu"].socket, part["motherboard"].socket)
+        self.assertEqual(part["ram"].memory_type, part["motherboard"].memory_type)
+        required = (part["cpu"].tdp_watts + part["gpu"].tdp_watts + 75) * 1.3
+        self.assertGreaterEqual(PSU_RATED_WATTS[part["psu"].name], required)
+
+    def test_builds_fit_budget_and_are_compatible(self):
+        builds, notes = optimize_builds(35000)
+        self.assertTrue(builds)
+        self.assertEqual(notes, [])
+        for build in builds:
+            self.assert_compatible(build, 35000)
+
+    def test_ram_follows_motherboard_memory_type(self):
+        builds, _notes = optimize_builds(30000, desired_parts={"cpu": "i5 12400F"})
+        self.assertTrue(builds)
+        for build in builds:
+            self.assertEqual(build["motherboard"]["name"], "Gigabyte DS3H")
+            self.assertEqual(build["ram"]["name"], "Kingston Fury 16GB DDR4")
+
+    def test_psu_rated_wattage_comes_from_column_or_name(self):
+        parts = catalog_snapshot.get()
+        psus = {p.name: p for p in parts["psu"]}
+        self.assertEqual(psus["Corsair CV450"].wattage, 450)
+        self.assertEqual(psus["Thermaltake Smart 1000W"].wattage, 1000)
+        self.assertEqual(psus["Corsair RM850x"].tdp, 0)
+
+        builds, _notes = optimize_builds(200000)
+        best = builds[0]
+        self.assertEqual(best["gpu"]["name"], "RTX 4090")
+        self.assertEqual(best["psu"]["name"], "Thermaltake Smart 1000W")
+        for build in builds:
+            self.assert_compatible(build, 200000)
+
+    def test_motherboard_chipset_matches_chipset_field(self):
+        builds, notes = optimize_builds(40000, desired_parts={"cpu": "Ryzen 5 7600", "motherboard_chipset": "X670"})
+        self.assertTrue(builds)
+        self.assertEqual(notes, [])
+        self.assertEqual({b["motherboard"]["name"] for b in builds}, {"MSI PRO WiFi"})
+
+    def test_no_compatible_build_under_budget(self):
+        builds, notes = optimize_builds(15000)
+        self.assertEqual(builds, [])
+        self.assertIn("ไม่พบชุดที่เข้ากันได้ภายใต้งบประมาณนี้ใน catalog", notes)
+
+        response = recommend_from_catalog(15000)
+        self.assertEqual(response["recommendations"], [])
+        self.assertIn("error", response)
+
+
+@override_settings(SIMILAR_QUERY_ENABLED=True, SIMILAR_QUERY_MAX_DISTANCE=0.05, SIMILAR_QUERY_PRICE_TOLERANCE=0.02)
+class SimilarQueryTests(TestCase):
+    def setUp(self):
+        self.index = SimilarQueryIndex(refresh_interval=0)
+
+    @staticmethod
+    def store(budget, games, total):
+        key = canonical_query_key(budget, None, games)
+        recommendation_cache.set(key, canonical_query(budget, None, games), {
+            "budget_thb": float(budget),
+            "recommendations": [{"build_name": "A", "total_price_estimate_thb": total}],
+        })
+        return key
+
+    def test_refresh_only_loads_rows_since_watermark(self):
+        old = self.store(61000, ["valorant"], 60000)
+        RecommendationCacheEntry.objects.filter(cache_key=old).update(refreshed_at=timezone.now() - timedelta(minutes=10))
+        seen = self.store(62000, ["valorant"], 61000)
+        self.index.refresh(force=True)
+        self.assertEqual(self.index.stats()["entries"], 2)
+
+        added = self.store(63000, ["valorant"], 62000)
+        with mock.patch.object(self.index, "_add", wraps=self.index._add) as add:
+            self.index.refresh(force=True)
+        self.assertEqual([row[0] for row in add.call_args.args[0]], [seen, added])
+        self.assertEqual(self.index.stats()["entries"], 3)
+
+    def test_discarded_rows_are_compacted(self):
+        keys = [self.store(budget, ["cs2"], budget - 500) for budget in (64000, 65000, 66000)]
+        self.index.refresh(force=True)
+        self.index.discard(keys[0])
+        self.index.discard(keys[1])
+        self.index.refresh(force=True)
+        self.assertEqual(self.index.stats()["entries"], 1)
+        self.assertEqual([key for key, _, _ in self.index.nearest(66000, None, ["cs2"], 0.05)], [keys[2]])
+
+    def test_only_queries_within_max_distance_match(self):
+        key = self.store(67000, ["valorant"], 66000)
+        self.index.refresh(force=True)
+        matches = self.index.nearest(67500, None, ["valorant"], 0.05)
+        self.assertEqual([match[0] for match in matches], [key])
+        self.assertAlmostEqual(matches[0][1], math.log(67500 / 67000), places=4)
+        self.assertEqual(self.index.nearest(73000, None, ["valorant"], 0.05), [])
+        self.assertEqual(self.index.nearest(67500, None, ["fortnite"], 0.05), [])
+
+    def test_similar_result_is_fitted_to_the_new_budget(self):
+        self.store(69000, ["cs2"], 68500)
+        with mock.patch("recommender_api.similarity.similar_query_index", self.index):
+            data = find_similar_recommendation(68000, None, ["cs2"])
+            self.assertEqual(data["budget_thb"], 68000.0)
+            self.assertEqual(data["similar_query"]["budget_thb"], 69000.0)
+
+            with override_settings(SIMILAR_QUERY_PRICE_TOLERANCE=0.0):
+                self.assertIsNone(find_similar_recommendation(68000, None, ["cs2"]))
+        self.assertEqual(self.index.stats()["price_rejected"], 1)
+
+
+class CacheWarmerTests(TestCase):
+    def log_requests(self, budget, count, games=("valorant",)):
+        RecommendationRequestLog.objects.bulk_create([
+            RecommendationRequestLog(request_payload={"budget": budget, "currency": "THB", "preferred_games": list(games)})
+            for _ in range(count)
+        ])
+        return canonical_query_key(budget, None, list(games))
+
+    @staticmethod
+    def specs(budget, **kwargs):
+        return {"budget_thb": float(budget), "recommendations": [{"build_name": "A", "total_price_estimate_thb": budget}]}
+
+    def warm(self, **overrides):
+        options = {"max_calls": 10, "lookback_seconds": 3600, "top": 10, "min_requests": 2, "refresh_before_seconds": 600}
+        options.update(overrides)
+        return warm_recommendation_cache(**options)
+
+    def test_hot_queries_are_counted_by_canonical_query(self):
+        hottest = self.log_requests(71000, 3)
+        self.log_requests(72000, 2)
+        self.log_requests(73000, 1)
+        RecommendationRequestLog.objects.create(request_payload={"budget": 71000}, outcome="invalid")
+
+        hot = find_hot_queries(3600, top=10, min_requests=2)
+        self.assertEqual([(item.query["budget_bucket"], item.requests) for item in hot], [(71000, 3), (72000, 2)])
+        self.assertEqual(hot[0].key, hottest)
+
+    def test_only_missing_or_expiring_entries_are_warmed_within_call_budget(self):
+        fresh = self.log_requests(74000, 5)
+        recommendation_cache.set(fresh, canonical_query(74000, None, ["valorant"]), self.specs(74000))
+        expiring = self.log_requests(75000, 4)
+        recommendation_cache.set(expiring, canonical_query(75000, None, ["valorant"]), self.specs(75000), ttl_seconds=60)
+        self.log_requests(76000, 3)
+
+        with mock.patch("recommender_api.warmer.get_specs_from_gemini", side_effect=self.specs) as generate:
+            report = self.warm(max_calls=1)
+
+        self.assertEqual((report["fresh"], report["llm_calls"], report["over_budget"]), (1, 1, 1))
+        self.assertEqual(generate.call_args.kwargs["budget"], 75000)
+        self.assertEqual(generate.call_args.kwargs["client"], WARMER_CLIENT)
+        self.assertGreater(RecommendationCacheEntry.objects.get(cache_key=expiring).expires_at,
+                           timezone.now() + timedelta(minutes=10))
+
+    def test_warmer_stops_when_llm_is_unavailable(self):
+        self.log_requests(77000, 3)
+        self.log_requests(78000, 2)
+        unavailable = {"error": "AI service is temporarily unavailable.", "ai_unavailable": True}
+        with mock.patch("recommender_api.warmer.get_specs_from_gemini", return_value=unavailable) as generate:
+            report = self.warm()
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(report["stopped"], unavailable["error"])
+        self.assertEqual(len(report["failed"]), 1)
+
+    def test_dry_run_command_does_not_call_llm(self):
+        self.log_requests(79000, 3)
+        out = io.StringIO()
+        with mock.patch("recommender_api.warmer.get_specs_from_gemini") as generate:
+            call_command("warm_recommendation_cache", "--dry-run", "--min-requests", "2", stdout=out)
+
+        generate.assert_not_called()
+        self.assertIn("budget 79000", out.getvalue())
+        self.assertIn("Planned 1 of 1 hot queries", out.getvalue())
+
+
+@override_settings(ADMISSION_ENABLED=False, RECOMMENDATION_FANOUT_ENABLED=False, SIMILAR_QUERY_ENABLED=False)
+class StaleWhileRevalidateTests(TestCase):
+    @staticmethod
+    def store_expired(budget, expired_seconds):
+        key = canonical_query_key(budget, None, ["valorant"])
+        recommendation_cache.set(key, canonical_query(budget, None, ["valorant"]), {
+            "budget_thb": float(budget), "analysis_notes": "เดิม",
+            "recommendations": [{"build_name": "เดิม", "total_price_estimate_thb": budget - 1000}],
+        }, ttl_seconds=-expired_seconds)
+        return key
+
+    @staticmethod
+    def fresh_specs(budget, *args, **kwargs):
+        return {"budget_thb": float(budget), "recommendations": [{"build_name": "ใหม่", "total_price_estimate_thb": budget}]}
+
+    @override_settings(RECOMMENDATION_CACHE_STALE_WHILE_REVALIDATE_SECONDS=600)
+    def test_recently_expired_entry_is_served_while_refreshing(self):
+        key = self.store_expired(81000, 60)
+        with mock.patch.object(services.recommendation_refresher, "schedule") as schedule, \
+                mock.patch("recommender_api.services.get_specs_from_gemini") as generate:
+            data, cache_status = services.get_recommendations(81000, preferred_games=["valorant"])
+            generate.assert_not_called()
+
+            self.assertEqual(cache_status, "STALE")
+            self.assertTrue(data["stale"])
+            self.assertEqual(data["recommendations"][0]["build_name"], "เดิม")
+            self.assertEqual(schedule.call_args.args[0], key)
+
+            generate.side_effect = self.fresh_specs
+            self.assertTrue(schedule.call_args.args[1]())
+        self.assertEqual(recommendation_cache.get(key)["recommendations"][0]["build_name"], "ใหม่")
+
+    @override_settings(RECOMMENDATION_CACHE_STALE_WHILE_REVALIDATE_SECONDS=600, RECOMMENDATION_CACHE_STALE_IF_ERROR_SECONDS=7200)
+    def test_older_entry_is_only_served_when_llm_fails(self):
+        self.store_expired(82000, 3600)
+        failure = {"error": "AI service is temporarily unavailable.", "ai_unavailable": True}
+        with mock.patch("recommender_api.services.get_specs_from_gemini", return_value=failure) as generate:
+            data, cache_status = services.get_recommendations(82000, preferred_games=["valorant"])
+
+        generate.assert_called_once()
+        self.assertEqual(cache_status, "STALE_IF_ERROR")
+        self.assertTrue(data["stale"])
+        self.assertIn("บริการ AI ขัดข้อง", data["analysis_notes"])
+
+        with override_settings(RECOMMENDATION_CACHE_STALE_IF_ERROR_SECONDS=0), \
+                mock.patch("recommender_api.services.get_specs_from_gemini", return_value=dict(failure)):
+            data, cache_status = services.get_recommendations(82000, preferred_games=["valorant"])
+        self.assertEqual((cache_status, data["error"]), ("MISS", failure["error"]))
+
+    def test_refresher_runs_one_job_per_key(self):
+        refresher = BackgroundRefresher(max_concurrent=2)
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        self.assertTrue(refresher.schedule("a", lambda: release.wait(5)))
+        self.assertFalse(refresher.schedule("a", lambda: True))
+        self.assertTrue(refresher.schedule("b", lambda: release.wait(5)))
+        self.assertFalse(refresher.schedule("c", lambda: True))
+        release.set()
+        deadline = time.monotonic() + 5
+        while refresher.stats()["succeeded"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(refresher.stats()["succeeded"], 2)
+        self.assertEqual(refresher.stats()["skipped"], 2)
+        self.assertTrue(refresher.schedule("a", lambda: True))
+
+
+class AdminSearchTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def make_spec(self, index, gpu):
+        build = {"build_name": f"Build {index}", "cpu": {"name": "Ryzen 5 7600"}, "gpu": {"name": gpu}}
+        return SavedSpecification.objects.create(
+            user=self.admin, build_details=build, **SavedSpecification.build_columns_from(build, {"budget": 30000})
+        )
+
+    def collect_pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+        return ids
+
+    def test_search_pages_through_tied_ranks(self):
+        matching = [self.make_spec(index, "RTX 4060").pk for index in range(7)]
+        self.make_spec(99, "RX 7600")
+        # rank บน SQLite เป็น 0 ทุกแถว: cursor ต้องไม่พึ่ง offset (DRF หยุดนับ offset ที่ offset_cutoff)
+        with mock.patch.object(SavedSpecCursorPagination, "offset_cutoff", 1):
+            ids = self.collect_pages(reverse("admin-saved-spec-list") + "?q=rtx 4060&page_size=3")
+        self.assertEqual(ids, sorted(matching, reverse=True))
+
+    def test_request_log_search_filters_payload(self):
+        RecommendationRequestLog.objects.create(request_payload={"budget": 30000, "preferred_games": ["Valorant"]})
+        RecommendationRequestLog.objects.create(request_payload={"budget": 50000, "preferred_games": ["Cyberpunk"]})
+        response = self.client.get(reverse("admin-request-log-list"), {"q": "valorant"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([log["request_payload"]["budget"] for log in response.data["results"]], [30000])
+
+
+@override_settings(ADMISSION_ENABLED=False, RECOMMENDATION_FANOUT_ENABLED=False, RECOMMENDATION_CACHE_BUDGET_BUCKET_THB=50000)
+class RecommendationBatchTests(TransactionTestCase):
+    def setUp(self):
+        set_llm_backend(StubBackend(latency_median_ms=0, latency_sigma=0, failure_rate=0, malformed_rate=0, seed=1))
+        self.addCleanup(set_llm_backend, None)
+
+    def test_batch_dedups_refits_and_summarizes(self):
+        items = [
+            BatchItem(0, "a", {"budget": 99000}, "gemini"),
+            BatchItem(1, "b", {"budget": 98500}, "gemini"),
+            # bucket เดียวกันแต่ทุก build ของ 99000 เกินงบ: ต้องถูกสร้างใหม่เป็นอีก query
+            BatchItem(2, "c", {"budget": 50000}, "gemini"),
+            BatchItem(3, "d", None, None, error="budget is required"),
+            BatchItem(4, "e", {"budget": 99000, "preferred_games": ["Valorant"]}, "gemini"),
+        ]
+        with mock.patch("recommender_api.batch.get_recommendations_from_source",
+                        wraps=services.get_recommendations_from_source) as generate:
+            # concurrency=1: shared-cache SQLite ของ test lock ทั้งตารางเมื่อสอง thread เขียนพร้อมกัน
+            lines = list(run_batch(items, concurrency=1))
+
+        self.assertEqual(lines[0], {"index": 3, "id": "d", "status": "invalid", "error": "budget is required"})
+        results = {line["index"]: line for line in lines[1:-1]}
+        self.assertEqual(sorted(results), [0, 1, 2, 4])
+        self.assertEqual(results[1]["duplicate_of"], 0)
+        self.assertNotIn("duplicate_of", results[2])
+        for index, budget in ((1, 98500), (2, 50000)):
+            totals = [build["total_price_estimate_thb"] for build in results[index]["result"]["recommendations"]]
+            self.assertTrue(totals)
+            self.assertTrue(all(total <= budget for total in totals), totals)
+        self.assertEqual(sorted(call.kwargs["budget"] for call in generate.call_args_list), [50000, 99000, 99000])
+
+        summary = lines[-1]["summary"]
+        summary.pop("elapsed_ms")
+        self.assertEqual(summary, {"queries": 5, "unique": 3, "succeeded": 4, "failed": 0, "invalid": 1})
+
+
+class ExplanationPrefetchTests(TransactionTestCase):
+    build = {"build_name": "A", "cpu": {"name": "Ryzen 5 7600", "price_thb": 7000}, "gpu": {"name": "RTX 4060", "price_thb": 10500}}
+    query = {"budget": 24000}
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.calls = []
+
+        def generate(selected_build, original_query, deadline, client):
+            self.calls.append(client)
+            self.release.wait(5)
+            return {"explanation": f"อธิบาย {selected_build['build_name']}"}
+
+        patcher = mock.patch("recommender_api.explanations.get_build_explanation_from_gemini", side_effect=generate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_prefetcher(self, max_pending=4):
+        prefetcher = ExplanationPrefetcher(max_threads=2, max_pending=max_pending)
+        self.addCleanup(prefetcher._get_executor().shutdown, wait=True)
+        self.addCleanup(self.release.set)
+        return prefetcher
+
+    def test_request_joins_in_flight_prefetch(self):
+        prefetcher = self.make_prefetcher()
+        self.assertTrue(prefetcher.schedule(self.build, self.query))
+        self.assertFalse(prefetcher.schedule(self.build, self.query))  # กำลังสร้างอยู่แล้ว
+
+        threading.Timer(0.1, self.release.set).start()
+        content_hash = explanation_content_hash(self.build, self.query)
+        self.assertEqual(prefetcher.join(content_hash), "อธิบาย A")
+        self.assertEqual(self.calls, [PREFETCH_CLIENT])
+        self.assertEqual(BuildExplanation.objects.get(content_hash=content_hash).explanation, "อธิบาย A")
+        stats = prefetcher.stats()
+        self.assertEqual((stats["scheduled"], stats["generated"], stats["joined"]), (1, 1, 1))
+
+    def test_prefetch_is_skipped_when_too_many_are_pending(self):
+        prefetcher = self.make_prefetcher(max_pending=1)
+        self.assertTrue(prefetcher.schedule(self.build, self.query))
+        self.assertFalse(prefetcher.schedule({**self.build, "build_name": "B"}, {"budget": 25000}))
+        self.assertEqual(prefetcher.stats()["skipped"], 1)
+
+    def test_cached_explanation_is_not_regenerated(self):
+        content_hash = explanation_content_hash(self.build, self.query)
+        store_explanation(content_hash, "มีอยู่แล้ว")
+        prefetcher = self.make_prefetcher()
+        prefetcher.schedule(self.build, self.query)
+        prefetcher._get_executor().shutdown(wait=True)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(prefetcher.stats()["already_cached"], 1)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def run_concurrently(self, flight, fn, count, timeout=5, is_failure=None):
+        results = [None] * count
+
+        def call(index):
+            results[index] = flight.do("key", fn, timeout, is_failure)
+
+        threads = [threading.Thread(target=call, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.02)  # ให้ thread แรกเป็น leader
+        return threads, results
+
+    def test_waiters_share_the_leader_result(self):
+        flight, release, calls = SingleFlight(), threading.Event(), []
+
+        def fn():
+            calls.append(1)
+            release.wait(5)
+            return {"recommendations": [1]}
+
+        threads, results = self.run_concurrently(flight, fn, 3)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True])
+        self.assertTrue(all(result == {"recommendations": [1]} for result, _ in results))
+        self.assertEqual(flight.stats(), {"leaders": 1, "coalesced": 2, "leader_failures": 0, "timeouts": 0, "in_flight": 0})
+
+    def test_failed_result_is_not_shared(self):
+        flight, release, outcomes = SingleFlight(), threading.Event(), [{"error": "boom"}, {"recommendations": [2]}]
+
+        def fn():
+            release.wait(5)
+            return outcomes.pop(0)
+
+        threads, results = self.run_concurrently(flight, fn, 2, is_failure=lambda result: "error" in result)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [({"error": "boom"}, False), ({"recommendations": [2]}, False)])
+        self.assertEqual(flight.stats()["leader_failures"], 1)
+
+    def test_slow_leader_times_out_waiter(self):
+        flight, release = SingleFlight(), threading.Event()
+        self.addCleanup(release.set)
+        threads, _ = self.run_concurrently(flight, lambda: release.wait(5), 1)
+        self.assertEqual(flight.do("key", lambda: "direct", timeout=0.05), ("direct", False))
+        self.assertEqual(flight.stats()["timeouts"], 1)
+        release.set()
+        threads[0].join()
+
+    def test_async_waiters_share_one_task(self):
+        flight, calls = AsyncSingleFlight(), []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"recommendations": [3]}
+
+        async def scenario():
+            return await asyncio.gather(*(flight.do("key", fn, 5) for _ in range(3)))
+
+        results = asyncio.run(scenario())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([shared for _, shared in results], [False, True, True])
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_async_waiter_retries_after_leader_error(self):
+        flight, attempts = AsyncSingleFlight(), []
+
+        async def fn():
+            attempts.append(1)
+            await asyncio.sleep(0.02)
+            if len(attempts) == 1:
+                raise RuntimeError("boom")
+            return "ok"
+
+        async def scenario():
+            return await asyncio.gather(flight.do("key", fn, 5), flight.do("key", fn, 5), return_exceptions=True)
+
+        leader, waiter = asyncio.run(scenario())
+        self.assertIsInstance(leader, RuntimeError)
+        self.assertEqual(waiter, ("ok", False))
+        self.assertEqual(flight.stats()["leader_failures"], 1)
+
+
+@override_settings(ADMISSION_ENABLED=False, RECOMMENDATION_FANOUT_ENABLED=False)
+class AsyncViewTests(TestCase):
+    build = {"build_name": "A", "cpu": {"name": "Ryzen 5 7600", "price_thb": 7000}, "gpu": {"name": "RTX 4060", "price_thb": 10500}}
+
+    def setUp(self):
+        set_llm_backend(StubBackend(latency_median_ms=0, latency_sigma=0, failure_rate=0, malformed_rate=0, seed=1))
+        self.addCleanup(set_llm_backend, None)
+
+    async def post(self, name, data, **extra):
+        return await self.async_client.post(reverse(name), data, content_type="application/json", **extra)
+
+    async def test_recommend_specs_generates_then_hits_cache(self):
+        first = await self.post("async_recommend_specs", {"budget": 58300})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first["X-Recommendation-Cache"], "MISS")
+        body = first.json()
+        self.assertTrue(body["recommendations"])
+        self.assertEqual(body["source_prompt_for_saving"]["budget"], 58300)
+
+        second = await self.post("async_recommend_specs", {"budget": 58300})
+        self.assertEqual(second["X-Recommendation-Cache"], "HIT")
+
+    async def test_rejects_bad_body_and_bad_token(self):
+        response = await self.async_client.post(reverse("async_recommend_specs"), "not json", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = await self.post("async_recommend_specs", {"budget": 58300}, headers={"Authorization": "Bearer nope"})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_explain_build_is_cached_by_content(self):
+        payload = {"selected_build": self.build, "original_query": {"budget": 58400}}
+        first = await self.post("async_explain_build", payload)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first["X-Explanation-Cache"], "MISS")
+        second = await self.post("async_explain_build", payload)
+        self.assertEqual(second["X-Explanation-Cache"], "HIT")
+        self.assertEqual(second.json()["explanation"], first.json()["explanation"])
+
+
+def make_saved_spec(user, index, gpu="RTX 4060", total=30000, budget=32000):
+    build = {
+        "build_name": f"Build {index}", "cpu": {"name": "Ryzen 5 7600", "price_thb": 7000},
+        "gpu": {"name": gpu, "price_thb": 10500}, "total_price_estimate_thb": total,
+    }
+    query = {"budget": budget}
+    return SavedSpecification.objects.create(
+        user=user, build_details=build, source_prompt_details=query, **SavedSpecification.build_columns_from(build, query)
+    )
+
+
+class SavedSpecPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("owner", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_saved_specs_are_cursor_paginated_per_user(self):
+        own = [make_saved_spec(self.user, index).pk for index in range(5)]
+        make_saved_spec(User.objects.create_user("other", password="x"), 99)
+
+        ids, url = [], reverse("saved_specification-list") + "?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(set(response.data), {"next", "previous", "results"})
+            self.assertLessEqual(len(response.data["results"]), 2)
+            ids.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(ids, sorted(own, reverse=True))
+        self.assertNotIn("page=", self.client.get(reverse("saved_specification-list") + "?page_size=2").data["next"])
+
+    def test_page_size_is_capped(self):
+        for index in range(3):
+            make_saved_spec(self.user, index)
+        with mock.patch.object(SavedSpecCursorPagination, "max_page_size", 2):
+            response = self.client.get(reverse("saved_specification-list"), {"page_size": 50})
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+
+    def test_admin_user_list_is_paginated(self):
+        self.user.is_staff = True
+        self.user.save()
+        for index in range(3):
+            User.objects.create_user(f"user{index}", password="x")
+        response = self.client.get(reverse("admin-user-list"), {"page_size": 2})
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+
+
+class SavedSpecSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("owner", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.spec = make_saved_spec(self.user, 1)
+
+    def test_list_serves_summary_without_build_details(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("saved_specification-list"))
+        item = response.data["results"][0]
+        self.assertNotIn("build_details", item)
+        self.assertEqual((item["build_name"], item["gpu_name"], item["total_price_thb"]), ("Build 1", "RTX 4060", 30000.0))
+        spec_selects = [q["sql"] for q in queries.captured_queries if 'FROM "recommender_api_savedspecification"' in q["sql"]]
+        self.assertTrue(spec_selects)
+        self.assertFalse(any('"build_details"' in sql for sql in spec_selects))
+
+    def test_sparse_fields_and_full_detail(self):
+        response = self.client.get(reverse("saved_specification-list"), {"fields": "id,build_name"})
+        self.assertEqual(set(response.data["results"][0]), {"id", "build_name"})
+        detail = self.client.get(reverse("saved_specification-detail", args=[self.spec.pk]))
+        self.assertEqual(detail.data["build_details"]["build_name"], "Build 1")
+
+
+class SavedSpecColumnsTests(TestCase):
+    build = {
+        "build_name": "ชุดเล่นเกม", "cpu": {"name": "Ryzen 5 7600", "price_thb": 7000},
+        "gpu": {"name": "RTX 4060", "price_thb": 10500}, "calculated_total_price_thb": "24,100",
+        "total_price_estimate_thb": 24000,
+    }
+
+    def setUp(self):
+        self.user = User.objects.create_user("owner", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_columns_are_filled_on_create_and_update(self):
+        response = self.client.post(reverse("saved_specification-list"), {
+            "name": "PC", "build_details": self.build, "source_prompt_details": {"budget": 25000},
+        }, format="json")
+        self.assertEqual(response.status_code, 201)
+        spec = SavedSpecification.objects.get(pk=response.data["id"])
+        self.assertEqual(
+            (spec.build_name, spec.cpu_name, spec.gpu_name, spec.total_price_thb, spec.budget_thb),
+            ("ชุดเล่นเกม", "Ryzen 5 7600", "RTX 4060", 24000, 25000),
+        )
+
+        self.client.patch(reverse("saved_specification-detail", args=[spec.pk]), {
+            "build_details": {**self.build, "gpu": {"name": "RX 7600"}},
+        }, format="json")
+        spec.refresh_from_db()
+        self.assertEqual(spec.gpu_name, "RX 7600")
+
+    def test_filters_use_the_columns(self):
+        make_saved_spec(self.user, 1, gpu="RTX 4060", total=25000)
+        make_saved_spec(self.user, 2, gpu="RTX 4070", total=38000)
+        make_saved_spec(self.user, 3, gpu="RX 7600", total=22000)
+        response = self.client.get(reverse("saved_specification-list"), {"gpu": "rtx", "max_price": 30000})
+        self.assertEqual([item["build_name"] for item in response.data["results"]], ["Build 1"])
+
+    def test_backfill_fills_rows_saved_before_the_columns(self):
+        spec = SavedSpecification.objects.create(user=self.user, build_details=self.build, source_prompt_details={"budget": 25000})
+        self.assertEqual(spec.gpu_name, "")
+        call_command("backfill_saved_spec_columns", batch_size=1, stdout=io.StringIO())
+        spec.refresh_from_db()
+        self.assertEqual((spec.gpu_name, spec.total_price_thb), ("RTX 4060", 24000))
+
+
+@override_settings(ADMISSION_ENABLED=False, RECOMMENDATION_FANOUT_ENABLED=False)
+class LLMCallLogTests(TestCase):
+    def setUp(self):
+        llm_call_writer.flush()  # แถวที่ test ก่อนหน้าค้างไว้ใน buffer
+        LLMCallLog.objects.all().delete()
+
+    def test_call_is_logged_with_usage_and_outcome(self):
+        set_llm_backend(StubBackend(latency_median_ms=0, latency_sigma=0, failure_rate=0, malformed_rate=0, seed=1))
+        self.addCleanup(set_llm_backend, None)
+        get_specs_from_gemini(58700, preferred_games=["Valorant"])
+        llm_call_writer.flush()
+        log = LLMCallLog.objects.get()
+        self.assertEqual((log.operation, log.prompt_variant, log.model_name, log.outcome), ("specs", "parts_games", "stub", "ok"))
+        self.assertGreater(log.prompt_tokens, 0)
+        self.assertGreater(log.response_tokens, 0)
+
+    def test_failures_are_classified(self):
+        cases = [
+            (None, {"error": "no builds"}, "bad_structure"),
+            (json.JSONDecodeError("bad", "", 0), {}, "parse_error"),
+            (DeadlineExceeded("slow"), {}, "timeout"),
+            (CircuitOpenError("open"), {}, "circuit_open"),
+            (Overloaded("busy", 1), {}, "shed"),
+            (RuntimeError("boom"), {}, "api_error"),
+        ]
+        for error, result, outcome in cases:
+            record_llm_call("specs", "budget_only", "stub", time.monotonic(), None, result, error)
+        llm_call_writer.flush()
+        self.assertEqual(list(LLMCallLog.objects.order_by("id").values_list("outcome", flat=True)), [c[2] for c in cases])
+
+    def test_summary_reports_latency_percentiles(self):
+        for latency in (100, 200, 300, 400, 500):
+            LLMCallLog.objects.create(
+                operation="specs", prompt_variant="budget_only", model_name="stub",
+                outcome="ok" if latency < 500 else "api_error", latency_ms=latency, response_tokens=latency // 10,
+            )
+        summary = summarize_llm_calls(["1h"])["1h"]["specs"]
+        self.assertEqual((summary["calls"], summary["errors"], summary["latency_p50_ms"]), (5, 1, 300))
+        self.assertAlmostEqual(summary["latency_p95_ms"], 480)
@@ -2,9 +2,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    SpecsRecommendationView, SavedSpecificationViewSet, ExplainBuildView, 
-    AdminUserViewSet, AdminSavedSpecViewSet, AdminStatsView, 
+    SpecsRecommendationView, SpecsRecommendationStreamView, SpecsRecommendationBatchView, RecommendationJobView, SavedSpecificationViewSet, ExplainBuildView, 
+    AdminUserViewSet, AdminSavedSpecViewSet, AdminRequestLogViewSet, AdminStatsView, AdminRecommendationCacheView,
+    AdminLLMMetricsView,
 )
+from .async_views import AsyncSpecsRecommendationView, AsyncRecommendationJobView, AsyncExplainBuildView
 
 # Router สำหรับ User ทั่วไป
 user_router = DefaultRouter()
@@ -14,15 +16,26 @@ user_router.register(r'saved-specs', SavedSpecificationViewSet, basename='saved_
 admin_router = DefaultRouter()
 admin_router.register(r'users', AdminUserViewSet, basename='admin-user')
 admin_router.register(r'saved-specs', AdminSavedSpecViewSet, basename='admin-saved-spec')
+admin_router.register(r'request-logs', AdminRequestLogViewSet, basename='admin-request-log')
 
 
 urlpatterns = [
     # User-facing APIs
     path('recommend-specs/', SpecsRecommendationView.as_view(), name='recommend_specs'),
+    path('recommend-specs/stream/', SpecsRecommendationStreamView.as_view(), name='recommend_specs_stream'),
+    path('recommend-specs/batch/', SpecsRecommendationBatchView.as_view(), name='recommend_specs_batch'),
+    path('recommend-specs/jobs/<uuid:job_id>/', RecommendationJobView.as_view(), name='recommend_specs_job'),
     path('explain-build/', ExplainBuildView.as_view(), name='explain_build'),
     path('', include(user_router.urls)), 
 
+    # async (ASGI) variants ของ endpoint ที่รอ Gemini นาน
+    path('async/recommend-specs/', AsyncSpecsRecommendationView.as_view(), name='async_recommend_specs'),
+    path('async/recommend-specs/jobs/<uuid:job_id>/', AsyncRecommendationJobView.as_view(), name='async_recommend_specs_job'),
+    path('async/explain-build/', AsyncExplainBuildView.as_view(), name='async_explain_build'),
+
     # Admin APIs 
     path('admin/stats/', AdminStatsView.as_view(), name='admin_stats'),
+    path('admin/recommendation-cache/', AdminRecommendationCacheView.as_view(), name='admin_recommendation_cache'),
+    path('admin/llm-metrics/', AdminLLMMetricsView.as_view(), name='admin_llm_metrics'),
     path('admin/', include(admin_router.urls)), 
 ]
\ No newline at end of file
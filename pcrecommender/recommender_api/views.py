@@ -2,112 +2,503 @@
 from rest_framework import viewsets, permissions, status 
 from rest_framework.views import APIView 
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from django.contrib.auth.models import User 
 from django.utils import timezone 
-from datetime import timedelta 
+from django.conf import settings
+from datetime import datetime, timedelta, timezone as dt_timezone
+import itertools
+import time
 
 from .models import SavedSpecification, RecommendationRequestLog
-from .serializers import AdminUserSerializer, AdminSavedSpecSerializer, SavedSpecificationSerializer 
-from .services import get_specs_from_gemini, GEMINI_API_KEY, get_build_explanation_from_gemini 
+from .serializers import (
+    AdminUserSerializer, AdminSavedSpecSerializer, AdminSavedSpecSummarySerializer, AdminRequestLogSerializer,
+    SavedSpecificationSerializer, SavedSpecificationSummarySerializer,
+)
+from .services import get_recommendations_from_source, is_llm_configured, stream_recommendations
+from .explanations import explanation_prefetcher, get_build_explanation
+from .buffered_writer import request_log_writer, llm_call_writer
+from .llm_metrics import SUMMARY_WINDOWS, summarize_llm_calls
+from .streaming import EventStreamRenderer, format_sse
+from .cache import recommendation_cache, response_age_seconds
+from .similarity import similar_query_index
+from .singleflight import recommendation_flight, recommendation_refresher
+from .pagination import SavedSpecCursorPagination, UserCursorPagination, RequestLogCursorPagination
+from .search import search_saved_specs, search_request_logs
+from .filters import SavedSpecificationFilter, SAVED_SPEC_ORDERING_FIELDS
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.filters import OrderingFilter
+from .stats import PERIODS, get_stats_series, get_totals, bucket_start
+from .resilience import Deadline
+from .admission import client_for, llm_slots, retry_after_header
+from .llm_backends import get_llm_backend
+from .llm_parsing import parse_stats
+from .fanout import specs_fanout
+from .jobs import enqueue_recommendation_job, get_job_for, job_payload, job_queue_stats, wait_for_job
+from .batch import BatchItem, run_batch, to_ndjson
+
+AI_NOT_CONFIGURED_MESSAGE = "บริการ AI ยังไม่ได้ตั้งค่าอย่างถูกต้อง (API Key Missing)"
+RECOMMENDATION_SOURCES = ("gemini", "catalog")
+RESPONSE_MODES = ("sync", "job")
+
+
+def resolve_recommendation_source(data):
+    """
+    คืนค่าแหล่งคำแนะนำจาก "source" ใน body (ค่าเริ่มต้น RECOMMENDATION_DEFAULT_SOURCE) หรือ None ถ้าไม่รู้จัก
+    """
+    source = data.get("source") or settings.RECOMMENDATION_DEFAULT_SOURCE
+    return source if source in RECOMMENDATION_SOURCES else None
+
+
+def available_response_modes():
+    return RESPONSE_MODES if settings.RECOMMENDATION_JOBS_ENABLED else ("sync",)
+
+
+def resolve_response_mode(data):
+    """
+    "mode": "job" ใน body -> บันทึกเป็น RecommendationJob แล้วตอบ 202 ทันที (ค่าเริ่มต้น "sync" รอผลใน request)
+    """
+    mode = data.get("mode") or "sync"
+    return mode if mode in available_response_modes() else None
+
+
+def invalid_mode_message():
+    return f"Invalid mode. Use one of: {', '.join(available_response_modes())}"
+
+
+def job_accepted_payload(request, job, url_name):
+    """
+    คืนค่า (payload, status_url) ของ response 202 หลังสร้าง job
+    """
+    status_url = request.build_absolute_uri(reverse(url_name, args=[job.id]))
+    return {**job_payload(job), "status_url": status_url}, status_url
+
+
+def parse_wait_seconds(value):
+    try:
+        return max(0.0, float(value)) if value not in (None, "") else 0.0
+    except (TypeError, ValueError):
+        return None
+
+
+def ai_unavailable_for(source):
+    return source == "gemini" and not is_llm_configured() and not settings.RECOMMENDATION_CATALOG_FALLBACK
+
+
+def extract_desired_parts(data):
+    return {
+        key: value for key, value in {
+            "cpu": data.get("desired_cpu"),
+            "gpu": data.get("desired_gpu"),
+            "ram": data.get("desired_ram"),
+            "storage_type": data.get("desired_storage_type"),
+            "storage_size": data.get("desired_storage_size"),
+            "motherboard_chipset": data.get("desired_motherboard_chipset"),
+            "psu_wattage": data.get("desired_psu_wattage"),
+        }.items() if value
+    }
+
+
+def build_user_prompt_input(data, desired_parts_filtered):
+    """
+    ตรวจสอบ budget และรวม input ของผู้ใช้เป็น dict เดียว (ใช้ทั้ง sync และ async views)
+    คืนค่า (user_prompt_input, error_message) โดยมีค่าใดค่าหนึ่งเป็น None
+    """
+    budget = data.get("budget")
+    if budget is None: 
+        return None, "Budget is required"
+    try:
+        budget_float = float(budget)
+        if budget_float <=0: raise ValueError()
+    except (TypeError, ValueError):
+        return None, "Invalid budget"
+
+    # เก็บ input ของผู้ใช้ไว้เผื่อจะบันทึกเป็น source_prompt_details 
+    return {
+        "budget": budget_float,
+        "currency": data.get("currency", "THB"),
+        "desired_parts": desired_parts_filtered,
+        "preferred_games": data.get("preferred_games", [])
+    }, None
+
+
+def parse_explain_request(data):
+    """
+    คืนค่า (selected_build, original_query, error_message) จาก body ของ explain-build
+    """
+    selected_build = data.get("selected_build")
+    original_query = data.get("original_query")
+
+    if not selected_build or not isinstance(selected_build, dict):
+        return None, None, "Missing or invalid 'selected_build' data."
+    if not original_query or not isinstance(original_query, dict):
+        return None, None, "Missing or invalid 'original_query' data."
+    return selected_build, original_query, None
+
+
+def parse_batch_item(index, item, default_source=None):
+    """
+    ตรวจหนึ่ง query ของ batch ด้วยกฎเดียวกับ recommend-specs (source เริ่มต้นมาจาก batch ถ้าไม่ระบุในรายการ)
+    """
+    if not isinstance(item, dict):
+        return BatchItem(index, None, None, None, "Each query must be a JSON object.")
+    ref = item.get("id")
+    source = resolve_recommendation_source({"source": item.get("source") or default_source})
+    if source is None:
+        return BatchItem(index, ref, None, None, f"Invalid source. Use one of: {', '.join(RECOMMENDATION_SOURCES)}")
+    user_prompt_input, error_message = build_user_prompt_input(item, extract_desired_parts(item))
+    return BatchItem(index, ref, user_prompt_input, source, error_message)
+
+
+def parse_batch_concurrency(value):
+    """
+    จำนวน query ที่สร้างพร้อมกัน (ค่าเริ่มต้น RECOMMENDATION_BATCH_CONCURRENCY ไม่เกิน RECOMMENDATION_BATCH_MAX_CONCURRENCY)
+    คืนค่า None ถ้าไม่ใช่จำนวนเต็มบวก
+    """
+    if value in (None, ""):
+        return settings.RECOMMENDATION_BATCH_CONCURRENCY
+    try:
+        concurrency = int(value)
+    except (TypeError, ValueError):
+        return None
+    return min(concurrency, settings.RECOMMENDATION_BATCH_MAX_CONCURRENCY) if concurrency > 0 else None
+
+
+def log_recommendation_request(user, payload, outcome, cache_status="", latency_ms=None):
+    """
+    บันทึก RecommendationRequestLog ผ่าน request_log_writer (buffered หรือ sync ตาม REQUEST_LOG_MODE)
+    timestamp ถูกกำหนดตอนนี้ ไม่ใช่ตอน bulk_create ของ writer (rollup ต้องลง bucket ของเวลาที่ request เข้ามา)
+    """
+    request_log_writer.add(RecommendationRequestLog(
+        timestamp=timezone.now(),
+        user=user,
+        request_payload=payload,
+        outcome=outcome,
+        cache_status=cache_status,
+        latency_ms=latency_ms,
+    ))
+
+
+def invalid_request_payload(data, desired_parts_filtered):
+    return {"budget": data.get("budget"), "desired_parts": desired_parts_filtered}
+
+
+def elapsed_ms(started):
+    return int((time.perf_counter() - started) * 1000)
+
+
+def is_truthy(value):
+    return value is True or str(value).lower() in ("true", "1", "yes")
+
+
+def request_deadline():
+    """
+    deadline ของการรอ LLM ใน request นี้ ส่งต่อผ่าน services ลงไปถึง ResilientBackend
+    """
+    return Deadline.after(settings.LLM_REQUEST_DEADLINE_SECONDS)
+
+
+def llm_error_status(data):
+    # ถูก admission control ปฏิเสธ -> 429, circuit open หรือหมด deadline คือบริการไม่พร้อมชั่วคราว -> 503
+    if data.get("overloaded"):
+        return status.HTTP_429_TOO_MANY_REQUESTS
+    return status.HTTP_503_SERVICE_UNAVAILABLE if data.get("ai_unavailable") else status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+def llm_error_headers(data):
+    return {"Retry-After": retry_after_header(data["retry_after"])} if data.get("overloaded") else None
+
+
+def set_cache_age_header(response, data):
+    # Age (RFC 9111) = วินาทีนับจากที่ผลลัพธ์ใน cache ถูกสร้าง ใส่เฉพาะเมื่อผลลัพธ์มาจาก cache
+    age = response_age_seconds(data)
+    if age is not None:
+        response["Age"] = str(age)
+    return response
+
+
+def apply_saved_spec(data, user):
+    """
+    ถ้า body ของ explain-build มี saved_spec_id ให้โหลดสเปคของผู้ใช้คนนั้น และใช้ build_details /
+    source_prompt_details เป็นค่าเริ่มต้นของ selected_build / original_query
+    คืนค่า (saved_spec, data, error_message, error_status)
+    """
+    saved_spec_id = data.get("saved_spec_id")
+    if saved_spec_id in (None, ""):
+        return None, data, None, None
+    if user is None:
+        return None, data, "Login required to use 'saved_spec_id'.", status.HTTP_401_UNAUTHORIZED
+    try:
+        saved_spec = SavedSpecification.objects.filter(pk=saved_spec_id, user=user).first()
+    except (TypeError, ValueError):
+        saved_spec = None
+    if saved_spec is None:
+        return None, data, "Saved specification not found.", status.HTTP_404_NOT_FOUND
+
+    merged_data = {
+        "selected_build": data.get("selected_build") or saved_spec.build_details,
+        "original_query": data.get("original_query") or saved_spec.source_prompt_details or {"currency": "THB"},
+    }
+    return saved_spec, merged_data, None, None
+
 
 class SpecsRecommendationView(APIView):
     # ถ้า user login อยู่ อาจจะแนบ user info ไปให้ get_specs_from_gemini (เผื่ออนาคต)
     # permission_classes = [permissions.IsAuthenticatedOrReadOnly] 
 
     def post(self, request, *args, **kwargs):
-        if not GEMINI_API_KEY:
+        deadline = request_deadline()
+        data = request.data
+        source = resolve_recommendation_source(data)
+        if source is None:
+            return Response({"error": f"Invalid source. Use one of: {', '.join(RECOMMENDATION_SOURCES)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if ai_unavailable_for(source):
             return Response(
-                {"error": "บริการ AI ยังไม่ได้ตั้งค่าอย่างถูกต้อง (API Key Missing)"},
+                {"error": AI_NOT_CONFIGURED_MESSAGE},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
-        data = request.data
-        budget = data.get("budget")
-        currency = data.get("currency", "THB")
-        user = request.user if request.user.is_authenticated else None
-
-        desired_parts_filtered = {
-            key: value for key, value in {
-                "cpu": data.get("desired_cpu"),
-                "gpu": data.get("desired_gpu"),
-                "ram": data.get("desired_ram"),
-                "storage_type": data.get("desired_storage_type"),
-                "storage_size": data.get("desired_storage_size"),
-                "motherboard_chipset": data.get("desired_motherboard_chipset"),
-                "psu_wattage": data.get("desired_psu_wattage"),
-            }.items() if value
-        }
+        mode = resolve_response_mode(data)
+        if mode is None:
+            return Response({"error": invalid_mode_message()}, status=status.HTTP_400_BAD_REQUEST)
 
-        preferred_games = data.get("preferred_games", [])
-        RecommendationRequestLog.objects.create(user=user, request_payload=desired_parts_filtered)
-        if budget is None: 
-            return Response({"error": "Budget is required"}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            budget_float = float(budget)
-            if budget_float <=0: raise ValueError()
-        except ValueError:
-            return Response({"error": "Invalid budget"}, status=status.HTTP_400_BAD_REQUEST)
+        user = request.user if request.user.is_authenticated else None
+        client = client_for(request, request.user)
+        desired_parts_filtered = extract_desired_parts(data)
 
+        user_prompt_input, error_message = build_user_prompt_input(data, desired_parts_filtered)
+        if error_message:
+            log_recommendation_request(user, invalid_request_payload(data, desired_parts_filtered), "invalid")
+            return Response({"error": error_message}, status=status.HTTP_400_BAD_REQUEST)
 
-        # เก็บ input ของผู้ใช้ไว้เผื่อจะบันทึกเป็น source_prompt_details 
-        user_prompt_input = {
-            "budget": budget_float,
-            "currency": currency,
-            "desired_parts": desired_parts_filtered,
-            "preferred_games": preferred_games
-        }
+        if mode == "job":
+            job = enqueue_recommendation_job(user, client, user_prompt_input, source)
+            payload, status_url = job_accepted_payload(request, job, "recommend_specs_job")
+            return Response(payload, status=status.HTTP_202_ACCEPTED, headers={"Location": status_url})
 
-        recommendations_data = get_specs_from_gemini(
-            budget=budget_float,
-            currency=currency,
+        started = time.perf_counter()
+        recommendations_data, cache_status = get_recommendations_from_source(
+            budget=user_prompt_input["budget"],
+            currency=user_prompt_input["currency"],
             desired_parts=desired_parts_filtered,
-            preferred_games=preferred_games
+            preferred_games=user_prompt_input["preferred_games"],
+            source=source,
+            deadline=deadline,
+            client=client,
+        )
+        log_recommendation_request(
+            user, user_prompt_input, "error" if "error" in recommendations_data else "success",
+            cache_status, elapsed_ms(started)
         )
 
         if "error" in recommendations_data:
-            return Response(recommendations_data, status=status.HTTP_500_INTERNAL_SERVER_ERROR) 
+            return Response(
+                recommendations_data, status=llm_error_status(recommendations_data),
+                headers=llm_error_headers(recommendations_data),
+            )
 
         # เพิ่ม user_prompt_input เข้าไปใน response เพื่อให้ frontend นำไปใช้ตอน save
         if "recommendations" in recommendations_data:
             recommendations_data["source_prompt_for_saving"] = user_prompt_input
 
-        return Response(recommendations_data, status=status.HTTP_200_OK)
+        response = Response(recommendations_data, status=status.HTTP_200_OK)
+        response["X-Recommendation-Cache"] = cache_status
+        return set_cache_age_header(response, recommendations_data)
+
+
+class RecommendationJobView(APIView):
+    """
+    สถานะของ recommend-specs job: queued -> running -> succeeded/failed (result คือ response ของ recommend-specs)
+    ?wait=<วินาที> รอจนงานเสร็จก่อนตอบ (long-poll ไม่เกิน RECOMMENDATION_JOB_MAX_WAIT_SECONDS)
+    """
+
+    def get(self, request, job_id, *args, **kwargs):
+        wait_seconds = parse_wait_seconds(request.query_params.get("wait"))
+        if wait_seconds is None:
+            return Response({"error": "Invalid 'wait' value."}, status=status.HTTP_400_BAD_REQUEST)
+        job = get_job_for(job_id, request.user if request.user.is_authenticated else None)
+        if job is None:
+            return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+        if wait_seconds:
+            job = wait_for_job(job, wait_seconds)
+        return Response(job_payload(job), status=status.HTTP_200_OK)
+
+
+class SpecsRecommendationStreamView(APIView):
+    """
+    recommend-specs แบบ Server-Sent Events: ส่ง event "build" ทีละชุดทันทีที่ Gemini สร้างเสร็จ
+    ลำดับ event: meta -> build (หลายครั้ง) -> done (ไม่มี recommendations ซ้ำ) หรือ error
+    client ต้องใช้ fetch() + ReadableStream เพราะเป็น POST (EventSource รองรับแค่ GET)
+    """
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request, *args, **kwargs):
+        deadline = request_deadline()
+        if not is_llm_configured():
+            return Response(
+                {"error": AI_NOT_CONFIGURED_MESSAGE},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        data = request.data
+        user = request.user if request.user.is_authenticated else None
+        desired_parts_filtered = extract_desired_parts(data)
+
+        user_prompt_input, error_message = build_user_prompt_input(data, desired_parts_filtered)
+        if error_message:
+            log_recommendation_request(user, invalid_request_payload(data, desired_parts_filtered), "invalid")
+            return Response({"error": error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+        client = client_for(request, user)
+        started = time.perf_counter()
+        events = stream_recommendations(
+            budget=user_prompt_input["budget"],
+            currency=user_prompt_input["currency"],
+            desired_parts=desired_parts_filtered,
+            preferred_games=user_prompt_input["preferred_games"],
+            deadline=deadline,
+            client=client,
+        )
+        # event แรกมาจาก cache หรือการหัก rate limit (ยังไม่เรียก LLM) ถ้าเป็น error ตอบเป็น HTTP status ปกติได้
+        first_event = next(events)
+        if first_event[0] == "error":
+            log_recommendation_request(user, user_prompt_input, "error", "", elapsed_ms(started))
+            return Response(first_event[1], status=llm_error_status(first_event[1]), headers=llm_error_headers(first_event[1]))
+
+        def event_stream():
+            cache_status = ""
+            for event, event_data in itertools.chain([first_event], events):
+                if event == "meta":
+                    cache_status = event_data["cache_status"]
+                elif event in ("done", "error"):
+                    log_recommendation_request(
+                        user, user_prompt_input, "success" if event == "done" else "error",
+                        cache_status, elapsed_ms(started)
+                    )
+                if event == "done":
+                    event_data = {key: value for key, value in event_data.items() if key != "recommendations"}
+                    event_data["source_prompt_for_saving"] = user_prompt_input
+                yield format_sse(event, event_data)
+
+        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class SpecsRecommendationBatchView(APIView):
+    """
+    recommend-specs หลาย query ในครั้งเดียว (Admin/บัญชีของทีม partner) body:
+    {"queries": [{"id": ..., "budget": ..., "preferred_games": [...], ...}, ...], "source": ..., "concurrency": ...}
+    ตอบเป็น NDJSON ทีละบรรทัดตามลำดับที่แต่ละ query เสร็จ (index, id, status, cache_status, result)
+    บรรทัดสุดท้ายคือ {"summary": {...}} query ที่ซ้ำกันถูกสร้างครั้งเดียว (ผลของรายการที่ซ้ำมี duplicate_of)
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        data = request.data
+        queries = data.get("queries") if isinstance(data, dict) else None
+        if not isinstance(queries, list) or not queries:
+            return Response({"error": "'queries' must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(queries) > settings.RECOMMENDATION_BATCH_MAX_QUERIES:
+            return Response(
+                {"error": f"Too many queries (max {settings.RECOMMENDATION_BATCH_MAX_QUERIES} per batch)."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        concurrency = parse_batch_concurrency(data.get("concurrency"))
+        if concurrency is None:
+            return Response({"error": "'concurrency' must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+        default_source = data.get("source")
+        if default_source and resolve_recommendation_source({"source": default_source}) is None:
+            return Response({"error": f"Invalid source. Use one of: {', '.join(RECOMMENDATION_SOURCES)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = [parse_batch_item(index, item, default_source) for index, item in enumerate(queries)]
+        if any(item.source == "gemini" for item in items) and ai_unavailable_for("gemini"):
+            return Response({"error": AI_NOT_CONFIGURED_MESSAGE}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        # batch ของ admin ไม่หัก token bucket (ถูกจำกัดด้วย concurrency และ admission slot อยู่แล้ว)
+        lines = run_batch(items, concurrency, client_for(request, request.user, rate_limited=False), request.user)
+        response = StreamingHttpResponse((to_ndjson(line) for line in lines), content_type="application/x-ndjson")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+SAVED_SPEC_SUMMARY_FIELDS = (
+    'id', 'user_id', 'name', 'source_prompt_details', 'user_notes', 'saved_at',
+    *SavedSpecification.BUILD_COLUMNS,
+)
+
+
+def summarize_saved_specs(queryset, *extra_fields):
+    """
+    queryset สำหรับ list: ไม่โหลด build_details ทั้งก้อน ใช้คอลัมน์ที่ดึงออกมาแล้วแทน
+    """
+    return queryset.only(*SAVED_SPEC_SUMMARY_FIELDS, *extra_fields)
 
 
 class SavedSpecificationViewSet(viewsets.ModelViewSet):
     serializer_class = SavedSpecificationSerializer
-    permission_classes = [permissions.IsAuthenticated] \
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SavedSpecCursorPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = SavedSpecificationFilter
+    ordering_fields = SAVED_SPEC_ORDERING_FIELDS
+    ordering = ('-saved_at', '-id')
 
     def get_queryset(self):
         """
         ผู้ใช้แต่ละคนจะเห็นเฉพาะสเปคที่ตัวเองบันทึกไว้เท่านั้น
         """
-        return SavedSpecification.objects.filter(user=self.request.user).order_by('-saved_at')
+        queryset = SavedSpecification.objects.filter(user=self.request.user).order_by('-saved_at')
+        if self.action == 'list':
+            return summarize_saved_specs(queryset)
+        return queryset.select_related('explanation')
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return SavedSpecificationSummarySerializer
+        return SavedSpecificationSerializer
 
 class ExplainBuildView(APIView):
     permission_classes = [] # [permissions.IsAuthenticated] สำหรับเปลี่ยนให้ login ก่อน
 
     def post(self, request, *args, **kwargs):
-        if not GEMINI_API_KEY:
+        deadline = request_deadline()
+        if not is_llm_configured():
             return Response(
-                {"error": "บริการ AI ยังไม่ได้ตั้งค่าอย่างถูกต้อง (API Key Missing)"},
+                {"error": AI_NOT_CONFIGURED_MESSAGE},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
-        selected_build = request.data.get("selected_build")
-        original_query = request.data.get("original_query")
+        user = request.user if request.user.is_authenticated else None
+        saved_spec, data, error_message, error_status = apply_saved_spec(request.data, user)
+        if error_message:
+            return Response({"error": error_message}, status=error_status)
 
-        if not selected_build or not isinstance(selected_build, dict):
-            return Response({"error": "Missing or invalid 'selected_build' data."}, status=status.HTTP_400_BAD_REQUEST)
-        if not original_query or not isinstance(original_query, dict):
-            return Response({"error": "Missing or invalid 'original_query' data."}, status=status.HTTP_400_BAD_REQUEST)
+        selected_build, original_query, error_message = parse_explain_request(data)
+        if error_message:
+            return Response({"error": error_message}, status=status.HTTP_400_BAD_REQUEST)
 
-        explanation_data = get_build_explanation_from_gemini(selected_build, original_query)
+        # ส่ง "refresh": true เพื่อบังคับให้สร้างคำอธิบายใหม่แทนการใช้ที่เก็บไว้
+        explanation_data, cache_status = get_build_explanation(
+            selected_build, original_query,
+            refresh=is_truthy(request.data.get("refresh")),
+            saved_spec=saved_spec,
+            deadline=deadline,
+            client=client_for(request, user),
+        )
 
         if "error" in explanation_data:
-            return Response(explanation_data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response(
+                explanation_data, status=llm_error_status(explanation_data), headers=llm_error_headers(explanation_data)
+            )
 
-        return Response(explanation_data, status=status.HTTP_200_OK)
+        response = Response(explanation_data, status=status.HTTP_200_OK)
+        response["X-Explanation-Cache"] = cache_status
+        return response
     
 class AdminUserViewSet(viewsets.ModelViewSet):
     """
@@ -116,38 +507,162 @@ class AdminUserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all().order_by('-date_joined') 
     serializer_class = AdminUserSerializer
     permission_classes = [permissions.IsAdminUser] 
+    pagination_class = UserCursorPagination
 
 
 class AdminSavedSpecViewSet(viewsets.ModelViewSet):
     """
     API endpoint สำหรับ Admin เพื่อจัดการ Saved Specifications.
     Admin สามารถ List และ Delete ได้ (ไม่ควรให้ Admin Create/Update สเปคของ User อื่นโดยตรงผ่าน endpoint นี้)
+    ?q= ค้นหาในชื่อสเปค ชื่อ build, CPU/GPU และ user notes (เรียงตามความเกี่ยวข้อง)
     """
     queryset = SavedSpecification.objects.select_related('user').all().order_by('-saved_at')
     serializer_class = AdminSavedSpecSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = SavedSpecCursorPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = SavedSpecificationFilter
+    ordering_fields = SAVED_SPEC_ORDERING_FIELDS
+    ordering = ('-saved_at', '-id')
     http_method_names = ['get', 'delete', 'head', 'options'] 
 
+    def get_queryset(self):
+        if self.action != 'list':
+            return super().get_queryset()
+        queryset = summarize_saved_specs(super().get_queryset(), 'user__username')
+        query = self.request.query_params.get('q', '').strip()
+        return search_saved_specs(queryset, query) if query else queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return AdminSavedSpecSummarySerializer
+        return AdminSavedSpecSerializer
+
+
+class AdminRequestLogViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint สำหรับ Admin เพื่อดู RecommendationRequestLog
+    ?q= ค้นหาใน request_payload (เรียงตามความเกี่ยวข้อง), ?outcome= และ ?cache_status= สำหรับ filter
+    """
+    queryset = RecommendationRequestLog.objects.select_related('user').order_by('-timestamp')
+    serializer_class = AdminRequestLogSerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = RequestLogCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['outcome', 'cache_status', 'user']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        query = self.request.query_params.get('q', '').strip()
+        return search_request_logs(queryset, query) if query and self.action == 'list' else queryset
+
+
 class AdminStatsView(APIView):
     """
     API endpoint สำหรับ Admin เพื่อดึงข้อมูลสถิติเบื้องต้น
+    อ่านจาก StatsRollup และ StatsCounter ที่รวมไว้ล่วงหน้า ไม่สแกน RecommendationRequestLog หรือ COUNT ทั้งตาราง
+    รองรับ ?start=YYYY-MM-DD&end=YYYY-MM-DD (รวมวัน end, ค่าเริ่มต้นคือ 7 วันล่าสุด) และ ?granularity=day|hour
     """
     permission_classes = [permissions.IsAdminUser]
+    DEFAULT_RANGE_DAYS = 7
+    MAX_HOURLY_RANGE_DAYS = 31
 
     def get(self, request, *args, **kwargs):
-        total_users = User.objects.count()
-        total_saved_specs = SavedSpecification.objects.count()
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in PERIODS:
+            return Response({"error": "granularity must be 'day' or 'hour'."}, status=status.HTTP_400_BAD_REQUEST)
 
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_end = timezone.now().replace(hour=23, minute=59, second=59, microsecond=999999)
+        today_start = bucket_start(timezone.now(), 'day')
+        try:
+            end = self._parse_date(request.query_params.get('end')) or today_start
+            start = self._parse_date(request.query_params.get('start')) or end - timedelta(days=self.DEFAULT_RANGE_DAYS - 1)
+        except ValueError:
+            return Response({"error": "start and end must be dates in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+        end += timedelta(days=1)
+        if start >= end:
+            return Response({"error": "start must not be after end."}, status=status.HTTP_400_BAD_REQUEST)
+        if granularity == 'hour' and end - start > timedelta(days=self.MAX_HOURLY_RANGE_DAYS):
+            return Response(
+                {"error": f"Hourly stats are limited to {self.MAX_HOURLY_RANGE_DAYS} days per request."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        recommendations_today = RecommendationRequestLog.objects.filter(
-            timestamp__gte=today_start, timestamp__lte=today_end
-        ).count()
+        series, totals = get_stats_series(start, end, granularity)
+        today_series, _ = get_stats_series(today_start, today_start + timedelta(days=1), 'day')
+        all_time = get_totals()
 
         stats_data = {
-            "total_users": total_users,
-            "total_saved_specs": total_saved_specs,
-            "recommendations_today": recommendations_today,
+            "total_users": all_time["users"],
+            "total_saved_specs": all_time["saved_specs"],
+            "recommendations_today": today_series[0]["requests"] if today_series else 0,
+            "range": {
+                "start": start.date().isoformat(),
+                "end": (end - timedelta(days=1)).date().isoformat(),
+                "granularity": granularity,
+            },
+            "totals": totals,
+            "series": series,
         }
-        return Response(stats_data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(stats_data, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _parse_date(value):
+        if not value:
+            return None
+        parsed = datetime.strptime(value, '%Y-%m-%d')
+        return parsed.replace(tzinfo=dt_timezone.utc)
+
+
+class AdminRecommendationCacheView(APIView):
+    """
+    API endpoint สำหรับ Admin เพื่อดูสถิติและล้าง recommendation cache
+    GET: hit/miss, single-flight, similar query index และ refresh เบื้องหลัง (stale-while-revalidate) ของ worker นี้
+    และจำนวน entry ในตารางที่แชร์กัน
+    DELETE: ล้าง cache ทั้งหมด หรือเฉพาะ ?key=<cache_key> / ?expired_only=true
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        cache_stats = recommendation_cache.stats()
+        cache_stats["worker"]["single_flight"] = recommendation_flight.stats()
+        cache_stats["worker"]["similar_queries"] = similar_query_index.stats()
+        cache_stats["worker"]["revalidation"] = recommendation_refresher.stats()
+        return Response(cache_stats, status=status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        deleted = recommendation_cache.purge(
+            key=request.query_params.get("key"),
+            expired_only=request.query_params.get("expired_only", "").lower() == "true",
+        )
+        return Response({"deleted_entries": deleted}, status=status.HTTP_200_OK)
+
+
+class AdminLLMMetricsView(APIView):
+    """
+    API endpoint สำหรับ Admin เพื่อดู latency (p50/p95/p99) และ token ต่อการเรียก LLM แยกตาม operation
+    ?windows=1h,24h,7d (ค่าเริ่มต้นคือทั้งหมด) "resilience" คือสถานะ circuit breaker/retry/hedge
+    และ "admission" คือ slot/คิว/จำนวน request ที่ถูกปฏิเสธ ของ worker ที่ตอบ "jobs" คือจำนวน job แยกตามสถานะ
+    "parsing" คือผลการแปลงคำตอบของ LLM (ซ่อม JSON ได้กี่ครั้ง/ล้มเหลวกี่ครั้ง) และ "fanout" คือจำนวน request แบบ fan-out
+    ที่ได้ครบทุก tier/บาง tier "explanation_prefetch" คือจำนวนคำอธิบายที่สร้างไว้ล่วงหน้า/ถูก explain-build รอใช้ ของ worker ที่ตอบ
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        requested = request.query_params.get('windows')
+        windows = [name.strip() for name in requested.split(',') if name.strip()] if requested else list(SUMMARY_WINDOWS)
+        unknown = [name for name in windows if name not in SUMMARY_WINDOWS]
+        if unknown:
+            return Response(
+                {"error": f"Unknown window(s): {', '.join(unknown)}. Use {', '.join(SUMMARY_WINDOWS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({
+            "windows": summarize_llm_calls(windows),
+            "writer": llm_call_writer.stats(),
+            "resilience": get_llm_backend().stats(),
+            "admission": llm_slots.stats(),
+            "jobs": job_queue_stats(),
+            "parsing": parse_stats.stats(),
+            "fanout": specs_fanout.stats(),
+            "explanation_prefetch": explanation_prefetcher.stats(),
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,130 @@
+# recommender_api/warmer.py
+"""
+อุ่น recommendation cache จาก query ที่ถูกขอบ่อยใน RecommendationRequestLog (manage.py warm_recommendation_cache)
+
+1. นับ request ย้อนหลังตาม canonical query (budget bucket, desired_parts, preferred_games) แบบเดียวกับ cache key
+2. query ยอดนิยมที่ยังไม่มีใน cache หรือจะหมดอายุภายใน refresh_before_seconds ถูกสร้างใหม่ เรียงจากที่ถูกขอบ่อยที่สุด
+3. เรียก LLM ได้ไม่เกิน max_calls ครั้งต่อรอบ และหยุดทันทีถ้า LLM ไม่พร้อม (circuit open / ถูก admission control ปฏิเสธ)
+"""
+from collections import Counter
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from .admission import Client
+from .cache import canonical_query, canonical_query_key
+from .models import RecommendationCacheEntry, RecommendationRequestLog
+from .resilience import Deadline
+from .services import cache_recommendations, get_specs_from_gemini
+from .singleflight import advisory_lock
+
+# flow แยกของ warmer ใน admission queue น้ำหนักเท่าผู้ใช้ที่ไม่ได้ login จึงไม่แย่ง slot จากผู้ใช้ที่ login
+WARMER_CLIENT = Client("warmer", False, rate_limited=False)
+
+
+class HotQuery(NamedTuple):
+    key: str
+    query: dict
+    requests: int
+    payload: dict  # request_payload ล่าสุดของ query นี้ (ใช้ currency และชื่อเกม/ชิ้นส่วนตามที่ผู้ใช้พิมพ์)
+
+
+def find_hot_queries(lookback_seconds, top, min_requests):
+    since = timezone.now() - timedelta(seconds=lookback_seconds)
+    rows = (
+        RecommendationRequestLog.objects.filter(timestamp__gte=since).exclude(outcome="invalid")
+        .order_by("timestamp").values_list("request_payload", flat=True)
+    )
+    counts = Counter()
+    latest_payloads = {}
+    for payload in rows.iterator(chunk_size=2000):
+        if not isinstance(payload, dict) or payload.get("budget") is None:
+            continue
+        try:
+            key = canonical_query_key(payload["budget"], payload.get("desired_parts"), payload.get("preferred_games"))
+        except (TypeError, ValueError, AttributeError):
+            continue
+        counts[key] += 1
+        latest_payloads[key] = payload
+
+    hot = []
+    for key, requests in counts.most_common(top):
+        if requests < min_requests:
+            break
+        payload = latest_payloads[key]
+        query = canonical_query(payload["budget"], payload.get("desired_parts"), payload.get("preferred_games"))
+        hot.append(HotQuery(key, query, requests, payload))
+    return hot
+
+
+def stale_hot_queries(hot_queries, refresh_before_seconds):
+    """
+    query ที่ไม่มีใน cache หรือจะหมดอายุภายใน refresh_before_seconds (ลำดับเดิมคือจากถูกขอบ่อยที่สุด)
+    """
+    refresh_at = timezone.now() + timedelta(seconds=refresh_before_seconds)
+    expires = dict(
+        RecommendationCacheEntry.objects.filter(cache_key__in=[hot.key for hot in hot_queries])
+        .values_list("cache_key", "expires_at")
+    )
+    return [hot for hot in hot_queries if expires.get(hot.key) is None or expires[hot.key] <= refresh_at]
+
+
+def _generate(hot):
+    data = get_specs_from_gemini(
+        budget=hot.query["budget_bucket"],
+        currency=hot.payload.get("currency", "THB"),
+        desired_parts=hot.payload.get("desired_parts") or {},
+        preferred_games=hot.payload.get("preferred_games") or [],
+        deadline=Deadline.after(settings.LLM_REQUEST_DEADLINE_SECONDS),
+        client=WARMER_CLIENT,
+    )
+    cache_recommendations(hot.key, hot.query, data)
+    return data
+
+
+def warm_recommendation_cache(max_calls, lookback_seconds, top, min_requests, refresh_before_seconds, dry_run=False):
+    """
+    อุ่น cache หนึ่งรอบ คืนค่า report (จำนวน query แต่ละกลุ่ม และรายการที่สร้างใหม่/ล้มเหลว)
+    """
+    hot_queries = find_hot_queries(lookback_seconds, top, min_requests)
+    stale = stale_hot_queries(hot_queries, refresh_before_seconds)
+    report = {
+        "hot_queries": len(hot_queries),
+        "fresh": len(hot_queries) - len(stale),
+        "llm_calls": 0,
+        "warmed": [],
+        "failed": [],
+        "planned": [],
+        "locked": 0,
+        "over_budget": 0,
+        "stopped": None,
+    }
+
+    for hot in stale:
+        if report["llm_calls"] >= max_calls:
+            report["over_budget"] += 1
+            continue
+        summary = {"key": hot.key[:12], "requests": hot.requests, **hot.query}
+        if dry_run:
+            report["planned"].append(summary)
+            report["llm_calls"] += 1
+            continue
+
+        # request ปกติที่กำลังสร้าง query เดียวกัน (ถือ lock นี้อยู่) จะเติม cache เอง ไม่ต้องรอ
+        with advisory_lock(f"recommendation:{hot.key}", timeout=0) as lock:
+            if not lock.acquired:
+                report["locked"] += 1
+                continue
+            report["llm_calls"] += 1
+            data = _generate(hot)
+
+        if "error" not in data and data.get("recommendations"):
+            report["warmed"].append(summary)
+            continue
+        report["failed"].append({**summary, "error": data.get("error")})
+        if data.get("ai_unavailable") or data.get("overloaded"):
+            report["stopped"] = data.get("error")
+            break
+    return report
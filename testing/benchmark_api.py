@@ -0,0 +1,549 @@
+# benchmark_api.py
+"""
+Benchmark แบบ headless ของ Django API (throughput / latency / จำนวน DB query ต่อ endpoint)
+
+- LLM ใช้ stub backend (LLM_BACKEND=stub) จึงไม่ต้องมี API key และผลซ้ำได้
+- ยิง recommend-specs, explain-build, saved-specs (create/list/retrieve/update/delete) และ endpoint ของ admin
+  ที่ concurrency หลายระดับ แล้วรายงาน RPS, p50/p95/p99 และจำนวน query เฉลี่ย (จาก header X-DB-Query-Count)
+- เปรียบเทียบ server ได้หลายแบบ: runserver, gunicorn-sync, gunicorn-gthread, asgi (gunicorn + uvicorn worker)
+- เขียนผลเป็น JSON (--output) และเทียบกับผลของ commit ก่อนหน้าได้ (--compare)
+
+ตัวอย่าง (รันจากโฟลเดอร์ root ของ repo):
+    python testing/benchmark_api.py --servers runserver,gunicorn-sync,gunicorn-gthread,asgi \
+        --concurrency 1,8,32 --requests 200 --output bench.json --compare bench-previous.json
+
+ใช้ stdlib อย่างเดียว ส่วน server ที่ถูก spawn ใช้ environment ของ backend ตามปกติ
+ถ้าไม่ตั้ง DATABASE_URL จะใช้ SQLite ชั่วคราว (ซึ่ง lock ทั้งไฟล์ตอนเขียน ตัวเลขของ endpoint ที่เขียนข้อมูล
+จะต่ำกว่า PostgreSQL มาก ควรตั้ง DATABASE_URL ไปที่ฐานข้อมูลทดสอบเมื่อต้องการตัวเลขที่ใช้เทียบกับ production)
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(REPO_ROOT, "pcrecommender")
+SERVERS = ("runserver", "gunicorn-sync", "gunicorn-gthread", "asgi")
+PERCENTILES = (50, 95, 99)
+
+BENCH_USER = "bench_user"
+BENCH_ADMIN = "bench_admin"
+SETUP_SCRIPT = """
+import json
+from django.contrib.auth.models import User
+from rest_framework_simplejwt.tokens import AccessToken
+tokens = {}
+for username, is_staff in ((%r, False), (%r, True)):
+    user, _ = User.objects.get_or_create(username=username, defaults={"email": username + "@example.com"})
+    user.is_staff = is_staff
+    user.set_unusable_password()
+    user.save()
+    tokens[username] = str(AccessToken.for_user(user))
+print("BENCH_TOKENS=" + json.dumps(tokens))
+""" % (BENCH_USER, BENCH_ADMIN)
+
+
+# --- สถิติ ---
+
+def percentile(sorted_values, fraction):
+    # linear interpolation แบบเดียวกับ percentile_cont ของ PostgreSQL
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(samples, wall_seconds):
+    latencies = sorted(sample["latency_ms"] for sample in samples)
+    queries = [sample["db_queries"] for sample in samples if sample["db_queries"] is not None]
+    query_time = [sample["db_time_ms"] for sample in samples if sample["db_time_ms"] is not None]
+    status_codes, cache = {}, {}
+    for sample in samples:
+        status_codes[str(sample["status"])] = status_codes.get(str(sample["status"]), 0) + 1
+        if sample["cache"]:
+            cache[sample["cache"]] = cache.get(sample["cache"], 0) + 1
+    result = {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if not 200 <= sample["status"] < 300),
+        "rps": round(len(samples) / wall_seconds, 2) if wall_seconds > 0 else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "max": round(latencies[-1], 2) if latencies else None,
+        },
+        "db_queries_mean": round(sum(queries) / len(queries), 2) if queries else None,
+        "db_queries_max": max(queries) if queries else None,
+        "db_time_ms_mean": round(sum(query_time) / len(query_time), 2) if query_time else None,
+        "status_codes": status_codes,
+    }
+    for p in PERCENTILES:
+        value = percentile(latencies, p / 100)
+        result["latency_ms"][f"p{p}"] = round(value, 2) if value is not None else None
+    if cache:
+        result["cache"] = cache
+    return result
+
+
+# --- HTTP client (หนึ่ง connection ต่อ thread, keep-alive ถ้า server รองรับ) ---
+
+class Client:
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _reset(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+        self._local.connection = None
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Accept": "application/json"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+
+        for attempt in range(2):
+            started = time.perf_counter()
+            try:
+                connection = self._connection()
+                connection.request(method, self.prefix + path, body=payload, headers=headers)
+                response = connection.getresponse()
+                raw = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # server ปิด keep-alive connection ระหว่าง request: ลองใหม่หนึ่งครั้งด้วย connection ใหม่
+                self._reset()
+                if attempt:
+                    return self._failed(started)
+                continue
+            except (OSError, http.client.HTTPException):
+                self._reset()
+                return self._failed(started)
+            latency_ms = (time.perf_counter() - started) * 1000
+            if response.getheader("Connection", "").lower() == "close":
+                self._reset()
+            try:
+                data = json.loads(raw) if raw else None
+            except ValueError:
+                data = None
+            return {
+                "status": response.status,
+                "latency_ms": latency_ms,
+                "db_queries": _int_header(response, "X-DB-Query-Count"),
+                "db_time_ms": _float_header(response, "X-DB-Query-Time-Ms"),
+                "cache": response.getheader("X-Recommendation-Cache") or response.getheader("X-Explanation-Cache"),
+                "data": data,
+            }
+
+    @staticmethod
+    def _failed(started):
+        return {
+            "status": 0, "latency_ms": (time.perf_counter() - started) * 1000,
+            "db_queries": None, "db_time_ms": None, "cache": None, "data": None,
+        }
+
+
+def _int_header(response, name):
+    value = response.getheader(name)
+    return int(value) if value and value.isdigit() else None
+
+
+def _float_header(response, name):
+    try:
+        return float(response.getheader(name))
+    except (TypeError, ValueError):
+        return None
+
+
+# --- scenario: แต่ละตัวคืนค่า (method, path, body, token) สำหรับ request ที่ i ---
+
+def sample_build(budget):
+    parts = ["cpu", "gpu", "ram", "storage", "motherboard", "psu", "case", "cooler"]
+    build = {"build_name": f"Bench build {int(budget)}"}
+    for index, key in enumerate(parts):
+        build[key] = {"name": f"Bench {key.upper()} {index}", "price_thb": round(budget / len(parts))}
+    build["total_price_estimate_thb"] = sum(build[key]["price_thb"] for key in parts)
+    return build
+
+
+class Scenarios:
+    """
+    สถานะที่ใช้ร่วมกันระหว่าง scenario: token, id ของ saved spec ที่สร้าง และ budget ของแต่ละรอบ
+    budget ของ recommend-specs ไม่ซ้ำกันระหว่างรอบ (run_index) เพื่อไม่ให้รอบหลังได้ cache จากรอบก่อน
+    """
+    ORDER = (
+        "recommend_specs", "explain_build",
+        "saved_specs_create", "saved_specs_list", "saved_specs_retrieve", "saved_specs_update",
+        "admin_stats", "admin_saved_specs", "admin_users", "admin_request_logs", "admin_llm_metrics",
+        "saved_specs_delete",
+    )
+
+    def __init__(self, tokens, run_index, distinct_budgets, async_llm_paths):
+        self.user_token = tokens[BENCH_USER]
+        self.admin_token = tokens[BENCH_ADMIN]
+        self.run_index = run_index
+        self.distinct_budgets = distinct_budgets
+        self.llm_prefix = "/api/async" if async_llm_paths else "/api"
+        self.saved_ids = []
+        self._lock = threading.Lock()
+
+    def budget(self, i):
+        return 20000 + ((self.run_index * self.distinct_budgets) + i % self.distinct_budgets) * 1000
+
+    def saved_id(self, i):
+        with self._lock:
+            return self.saved_ids[i % len(self.saved_ids)] if self.saved_ids else None
+
+    def recommend_specs(self, i):
+        body = {"budget": self.budget(i), "currency": "THB", "preferred_games": ["Valorant"]}
+        return "POST", f"{self.llm_prefix}/recommend-specs/", body, self.user_token
+
+    def explain_build(self, i):
+        budget = self.budget(i)
+        body = {"selected_build": sample_build(budget), "original_query": {"budget": budget, "currency": "THB"}}
+        return "POST", f"{self.llm_prefix}/explain-build/", body, self.user_token
+
+    def saved_specs_create(self, i):
+        budget = self.budget(i)
+        body = {
+            "name": f"bench-{self.run_index}-{i}",
+            "build_details": sample_build(budget),
+            "source_prompt_details": {"budget": budget, "currency": "THB"},
+            "user_notes": "benchmark",
+        }
+        return "POST", "/api/saved-specs/", body, self.user_token
+
+    def saved_specs_list(self, i):
+        return "GET", "/api/saved-specs/", None, self.user_token
+
+    def saved_specs_retrieve(self, i):
+        return "GET", f"/api/saved-specs/{self.saved_id(i)}/", None, self.user_token
+
+    def saved_specs_update(self, i):
+        return "PATCH", f"/api/saved-specs/{self.saved_id(i)}/", {"user_notes": f"benchmark {i}"}, self.user_token
+
+    def saved_specs_delete(self, i):
+        # แต่ละ id ถูกลบได้ครั้งเดียว จำนวน request ของ scenario นี้จึงถูกจำกัดด้วยจำนวนที่สร้างไว้
+        return "DELETE", f"/api/saved-specs/{self.saved_ids[i]}/", None, self.user_token
+
+    def admin_stats(self, i):
+        return "GET", "/api/admin/stats/", None, self.admin_token
+
+    def admin_saved_specs(self, i):
+        return "GET", "/api/admin/saved-specs/", None, self.admin_token
+
+    def admin_users(self, i):
+        return "GET", "/api/admin/users/", None, self.admin_token
+
+    def admin_request_logs(self, i):
+        return "GET", "/api/admin/request-logs/", None, self.admin_token
+
+    def admin_llm_metrics(self, i):
+        return "GET", "/api/admin/llm-metrics/", None, self.admin_token
+
+    def after(self, name, sample):
+        if name == "saved_specs_create" and sample["status"] == 201 and isinstance(sample["data"], dict):
+            with self._lock:
+                self.saved_ids.append(sample["data"]["id"])
+
+    def request_count(self, name, requested):
+        if name in ("saved_specs_retrieve", "saved_specs_update") and not self.saved_ids:
+            return 0
+        if name == "saved_specs_delete":
+            return len(self.saved_ids)
+        return requested
+
+
+def run_scenario(client, scenarios, name, requests, concurrency):
+    build = getattr(scenarios, name)
+
+    def one(i):
+        method, path, body, token = build(i)
+        sample = client.request(method, path, body, token)
+        scenarios.after(name, sample)
+        sample.pop("data", None)
+        return sample
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one, range(requests)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+# --- การเปิด server ---
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server, port, workers, threads):
+    bind = f"127.0.0.1:{port}"
+    gunicorn = [sys.executable, "-m", "gunicorn", "--bind", bind, "--workers", str(workers), "--timeout", "120"]
+    if server == "runserver":
+        return [sys.executable, "manage.py", "runserver", bind, "--noreload"]
+    if server == "gunicorn-sync":
+        return gunicorn + ["pcrecommender.wsgi:application"]
+    if server == "gunicorn-gthread":
+        return gunicorn + ["--worker-class", "gthread", "--threads", str(threads), "pcrecommender.wsgi:application"]
+    if server == "asgi":
+        return gunicorn + ["--worker-class", "uvicorn.workers.UvicornWorker", "pcrecommender.asgi:application"]
+    raise ValueError(f"Unknown server '{server}'. Use one of: {', '.join(SERVERS)}")
+
+
+def server_env(args):
+    env = dict(os.environ)
+    env.update({
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_LATENCY_MEDIAN_MS": str(args.stub_latency_ms),
+        "LLM_STUB_LATENCY_SIGMA": str(args.stub_latency_sigma),
+        "LLM_STUB_FAILURE_RATE": str(args.stub_failure_rate),
+        "LLM_STUB_SEED": str(args.seed),
+        "DB_QUERY_COUNT_HEADER": "true",
+        "DJANGO_SETTINGS_MODULE": "pcrecommender.settings",
+    })
+    env.setdefault("SECRET_KEY", "benchmark-only-secret-key")
+    # ผู้ใช้ benchmark คนเดียวยิงหลายร้อยครั้ง ปิด token bucket ไว้ (slot/คิวยังทำงานตามปกติ)
+    env.setdefault("ADMISSION_USER_BURST", "0")
+    env.setdefault("ADMISSION_ANON_BURST", "0")
+    if not env.get("DATABASE_URL"):
+        env["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='pcbench-'), 'bench.sqlite3')}"
+        print(f"DATABASE_URL not set, using {env['DATABASE_URL']}")
+    return env
+
+
+def prepare_database(env):
+    subprocess.run([sys.executable, "manage.py", "migrate", "--noinput", "-v", "0"], cwd=BACKEND_DIR, env=env, check=True)
+    output = subprocess.run(
+        [sys.executable, "manage.py", "shell", "-c", SETUP_SCRIPT],
+        cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    for line in output.splitlines():
+        if line.startswith("BENCH_TOKENS="):
+            return json.loads(line[len("BENCH_TOKENS="):])
+    raise RuntimeError(f"Could not create benchmark users: {output}")
+
+
+def wait_until_ready(client, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        if client.request("GET", "/api/admin/stats/")["status"]:
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+
+def stop_server(process):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+# --- รายงาน ---
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(run):
+    print(f"\n== {run['server']} | concurrency {run['concurrency']} ==")
+    print(f"{'endpoint':<22}{'req':>6}{'err':>6}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'queries':>9}")
+    for name, row in run["endpoints"].items():
+        latency = row["latency_ms"]
+        print(
+            f"{name:<22}{row['requests']:>6}{row['errors']:>6}{_fmt(row['rps']):>10}"
+            f"{_fmt(latency['p50']):>10}{_fmt(latency['p95']):>10}{_fmt(latency['p99']):>10}"
+            f"{_fmt(row['db_queries_mean']):>9}"
+        )
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def compare(previous, current, threshold):
+    """
+    เทียบ p95 และ RPS ของแต่ละ (server, concurrency, endpoint) กับผลก่อนหน้า
+    คืนค่า list ของ regression ที่ p95 แย่ลง หรือ RPS ลดลงเกิน threshold (สัดส่วน เช่น 0.2 = 20%)
+    รวมถึง endpoint ที่จำนวน query เพิ่มขึ้น
+    """
+    previous_rows = {
+        (run["server"], run["concurrency"], name): row
+        for run in previous.get("runs", []) for name, row in run["endpoints"].items()
+    }
+    regressions = []
+    print(f"\n== compared with {previous.get('meta', {}).get('git_commit') or 'previous run'} ==")
+    for run in current["runs"]:
+        for name, row in run["endpoints"].items():
+            old = previous_rows.get((run["server"], run["concurrency"], name))
+            if not old:
+                continue
+            p95, old_p95 = row["latency_ms"]["p95"], old["latency_ms"]["p95"]
+            rps, old_rps = row["rps"], old["rps"]
+            queries, old_queries = row["db_queries_mean"], old["db_queries_mean"]
+            notes = []
+            if p95 and old_p95 and p95 > old_p95 * (1 + threshold):
+                notes.append(f"p95 {old_p95:.1f} -> {p95:.1f} ms")
+            if rps and old_rps and rps < old_rps * (1 - threshold):
+                notes.append(f"rps {old_rps:.1f} -> {rps:.1f}")
+            if queries is not None and old_queries is not None and queries > old_queries + 0.5:
+                notes.append(f"queries {old_queries:.1f} -> {queries:.1f}")
+            label = f"{run['server']} c={run['concurrency']} {name}"
+            if notes:
+                regressions.append({"endpoint": label, "changes": notes})
+                print(f"REGRESSION {label}: {'; '.join(notes)}")
+            elif p95 and old_p95:
+                print(f"ok         {label}: p95 {old_p95:.1f} -> {p95:.1f} ms")
+    return regressions
+
+
+# --- main ---
+
+def benchmark_target(client, tokens, args, server, run_index_start):
+    runs = []
+    for offset, concurrency in enumerate(args.concurrency):
+        scenarios = Scenarios(tokens, run_index_start + offset, args.distinct_budgets, async_llm_paths=server == "asgi")
+        endpoints = {}
+        for name in Scenarios.ORDER:
+            if name not in args.scenarios:
+                continue
+            count = scenarios.request_count(name, args.requests)
+            if count:
+                endpoints[name] = run_scenario(client, scenarios, name, count, concurrency)
+        run = {"server": server, "concurrency": concurrency, "endpoints": endpoints}
+        print_table(run)
+        runs.append(run)
+    return runs
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput/latency benchmark of the pcrecommender API with a stub LLM.")
+    parser.add_argument("--servers", default="runserver",
+                        help=f"Comma-separated servers to spawn: {', '.join(SERVERS)}")
+    parser.add_argument("--base-url", help="Benchmark an already running server instead of spawning one "
+                                           "(must run with LLM_BACKEND=stub and DB_QUERY_COUNT_HEADER=true)")
+    parser.add_argument("--tokens", help='JSON {"bench_user": "...", "bench_admin": "..."} access tokens for --base-url')
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint per concurrency level")
+    parser.add_argument("--scenarios", default=",".join(Scenarios.ORDER))
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gthread worker")
+    parser.add_argument("--distinct-budgets", type=int, default=20,
+                        help="Distinct budgets per run; requests beyond this hit the recommendation cache")
+    parser.add_argument("--stub-latency-ms", type=int, default=300)
+    parser.add_argument("--stub-latency-sigma", type=float, default=0.5)
+    parser.add_argument("--stub-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=0.2)
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if a regression is found")
+    args = parser.parse_args(argv)
+    args.servers = [server.strip() for server in args.servers.split(",") if server.strip()]
+    args.concurrency = [int(value) for value in args.concurrency.split(",") if value.strip()]
+    args.scenarios = {name.strip() for name in args.scenarios.split(",") if name.strip()}
+    unknown = args.scenarios - set(Scenarios.ORDER)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.base_url and not args.tokens:
+        parser.error("--base-url requires --tokens")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    results = {
+        "meta": {
+            "git_commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "requests_per_endpoint": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "threads": args.threads,
+            "stub_latency_ms": args.stub_latency_ms,
+            "stub_latency_sigma": args.stub_latency_sigma,
+            "stub_failure_rate": args.stub_failure_rate,
+        },
+        "runs": [],
+    }
+
+    if args.base_url:
+        client = Client(args.base_url, args.timeout)
+        results["runs"] += benchmark_target(client, json.loads(args.tokens), args, "external", 0)
+    else:
+        env = server_env(args)
+        results["meta"]["database"] = env["DATABASE_URL"].split(":", 1)[0]
+        tokens = prepare_database(env)
+        # เพิ่ม run_index ต่อ server เพื่อให้ budget ของแต่ละ server ไม่ได้ cache ที่ server ก่อนหน้าสร้างไว้
+        for server_index, server in enumerate(args.servers):
+            port = free_port()
+            client = Client(f"http://127.0.0.1:{port}", args.timeout)
+            process = subprocess.Popen(
+                server_command(server, port, args.workers, args.threads), cwd=BACKEND_DIR, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_until_ready(client, process, timeout=60)
+                results["runs"] += benchmark_target(client, tokens, args, server, server_index * len(args.concurrency))
+            finally:
+                stop_server(process)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.regression_threshold)
+        results["regressions"] = regressions
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())